@@ -11,13 +11,115 @@ Shaper Rigs / Burlington Interactive Solutions
 These tools are usable from commandline for the purposing of integrating them into your own 
 toolkits. Read the docstrings to understand how to integrate the given functions into your pipeline.
 
+Importing the package is near-instant: submodules, and pymel, load on first use.  Under Python 2,
+import submodules explicitly, ie "from sr_biped import fkik".
+
 Email matt@shaperrigs.com for more info.
 '''
 
-import fkik
-import attributes
-import spaces
-import transforms
+import importlib
+import sys
+
+import diagnostics
+
+# Submodules are imported the first time they're asked for, ie sr_biped.fkik, so importing the
+# package doesn't pull in pymel.  Submodules load pymel themselves only once they are used, see
+# lazy.py.
+SUBMODULES = (
+    'attributes',
+    'backend',
+    'bindings',
+    'callbacks',
+    'constants',
+    'curves',
+    'diagnostics',
+    'ez_switch',
+    'farm',
+    'fkik',
+    'humanik',
+    'incremental',
+    'lazy',
+    'limb_solver',
+    'metrics',
+    'modify_command',
+    'namespaces',
+    'naming',
+    'pose',
+    'pose_library',
+    'registry',
+    'sampling',
+    'scheduler',
+    'scene',
+    'spaces',
+    'suite',
+    'transforms',
+    'verify',
+)
+
+__all__ = list(SUBMODULES)
+
+
+def __getattr__(name):
+    if(name in SUBMODULES):
+        return _submodule(name)
+
+    raise AttributeError("module 'sr_biped' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(SUBMODULES))
+
+
+def _submodule(name):
+    # The submodules import each other by their bare names, ie "import backend", so the bare name
+    # is the one imported here.  It's registered under the package name too, so
+    # "import sr_biped.backend" finds the same module instead of running the file again with
+    # caches and a backend of it's own.
+    module = importlib.import_module(name)
+    qualified = __name__ + '.' + name
+    if(sys.modules.setdefault(qualified, module) is not module):
+        raise ImportError(
+            "{0} and {1} were loaded as two different modules.  Import it through the package, "
+            "ie 'from {2} import {1}', before anything imports {0} directly.".format(
+                qualified, name, __name__))
+    globals()[name] = module
+
+    return module
+
+
+class _SubmoduleFinder(object):
+    '''
+    Import hook making "import sr_biped.backend" give the module _submodule() does, rather than
+    loading the file a second time under the package name.
+    '''
+
+    def __init__(self):
+        self.specs = {}
+
+    def find_spec(self, fullname, path=None, target=None):
+        package, _, name = fullname.rpartition('.')
+        if(package != __name__ or name not in SUBMODULES):
+            return None
+
+        return importlib.util.spec_from_loader(fullname, self)
+
+    def create_module(self, spec):
+        module = _submodule(spec.name.rpartition('.')[2])
+        self.specs[spec.name] = module.__spec__
+
+        return module
+
+    def exec_module(self, module):
+        # The import gave the module our spec, the one of it's bare name goes back so reloading
+        # the module reloads it's file.
+        module.__spec__ = self.specs.pop(module.__spec__.name)
+
+
+if(sys.version_info[0] >= 3):
+    import importlib.util
+
+    if(not any(type(finder).__name__ == '_SubmoduleFinder' for finder in sys.meta_path)):
+        sys.meta_path.insert(0, _SubmoduleFinder())
 
-print ("sr_biped module loaded.")
 
+diagnostics.get_logger('init').debug("sr_biped module loaded.")
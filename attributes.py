@@ -3,12 +3,122 @@ attributes.py
 
 Module for manipulating attributes,
 macros, converting attribute types between picker and channel box, etc.
+
+Writes that go together, ie every space weight of every control a picker switches, are gathered in
+an AttrBatch and applied at once as a single undo step.
+
+usage:
+with attributes.AttrBatch('switch_spaces') as batch:
+    for ctrl in ctrls:
+        attributes.multi_as_enum(ctrl, 'cog_Space', space_attrs, batch=batch)
 '''
 
-from inspect import Attribute
-import pymel.core as pm
+from collections import OrderedDict
+import backend
+import callbacks
+import constants as cons
+import diagnostics as diag
+import lazy
+import naming
+import registry
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('attributes')
+pm = diag.counted_module(pm)
+
+# Naming profile name to it's DefaultTable.
+_default_tables = {}
+
+# Namespace to the full names of it's controls, see rig_controls().
+_controls = {}
+
 
-def multi_as_enum(node=None, switch_on=None, attr_list=None):
+class AttrBatch(object):
+    '''
+    Attribute writes held back and applied together through the current backend, as one undo step.
+    A plug written twice only keeps it's last value.  Used as a context manager, the writes are
+    applied at the end of the block, or dropped if the block raised.
+
+    undo_name - Name of the undo step.
+    '''
+
+    def __init__(self, undo_name='sr_biped_attrs'):
+        self.undo_name = undo_name
+        self._writes = OrderedDict()
+
+    def __len__(self):
+        return len(self._writes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if(exc_type is None):
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+    def set(self, plug, value):
+        '''
+        Queue a write.  plug is a name such as 'char01:L_ArmSetting_Ctrl.ikBlend'.
+        '''
+
+        self._writes[str(plug)] = value
+
+        return
+
+    def set_many(self, values):
+        '''
+        Queue many writes, from a dict or (plug, value) pairs.
+        '''
+
+        if(isinstance(values, dict)):
+            values = values.items()
+        for plug, value in values:
+            self.set(plug, value)
+
+        return
+
+    def get(self, plug):
+        '''
+        Value of a plug, as it will be once the batch is applied.
+        '''
+
+        plug = str(plug)
+        if(plug in self._writes):
+            return self._writes[plug]
+
+        return backend.get().get_attr(plug)
+
+    def commit(self):
+        '''
+        Apply every queued write.
+
+        Return value: number of plugs written.
+        '''
+
+        if(not self._writes):
+            return 0
+
+        writes = list(self._writes.items())
+        self._writes.clear()
+        with diag.span('write'):
+            backend.get().set_attrs(writes, self.undo_name)
+        log.debug("Wrote %s attributes as '%s'.", len(writes), self.undo_name)
+
+        return len(writes)
+
+    def discard(self):
+        self._writes.clear()
+
+        return
+
+
+@diag.operation('multi_as_enum')
+def multi_as_enum(node=None, switch_on=None, attr_list=None, batch=None):
     '''
     space_as_enum
 
@@ -20,6 +130,9 @@ def multi_as_enum(node=None, switch_on=None, attr_list=None):
 
     usage:
     multi_as_enum()
+
+    batch - An AttrBatch to add the writes to, for switching many nodes at once.  If None they're
+        applied straight away, as one undo step.
     '''
 
     if(node == None):
@@ -39,36 +152,259 @@ def multi_as_enum(node=None, switch_on=None, attr_list=None):
         node_string = node
 
     # Run through all attrs provided in list, switching them all off except desired one.
+    writes = batch if batch is not None else AttrBatch('multi_as_enum')
+    prefix = node_string + '.'
     for attribute in attr_list:
-        if(attribute != switch_on):
-            pm.setAttr("{}.{}".format(node_string, attribute), 0)
-            print ("Set {}.{} to 0.".format(node_string, attribute))
-        else:
-            pm.setAttr("{}.{}".format(node_string, attribute), 1)
-            print ("Set {}.{} to 1.".format(node_string, attribute))
+        writes.set(prefix + attribute, 1 if attribute == switch_on else 0)
+    log.debug("Switching %s to %s.", node_string, switch_on)
+
+    if(batch is None):
+        writes.commit()
 
     return
 
 
-def zero_attributes(node, ignore_list=[]):
+@diag.operation('zero_attributes')
+def zero_attributes(node, ignore_list=None):
     '''
     Zero's out the relevant-to-animation attributes that exist on the given control of a rig.
-    
+    To reset whole characters, reset_rig() is much faster.
+
     node - transform node of the control to operate on.
+    ignore_list - attribute names to leave alone.
     '''
 
-    attr_list = pm.listAttr(node, v=True, u=True, k=True,)
+    # Some attributes are not-zero as a default ('zero out' is an industry wide misnomer!)  They
+    # come from the variant's DefaultTable, so Maya is only asked the first time round.
+    node_string = str(node)
+    namespace = _with_colon(node_string.split('|')[-1].rpartition(':')[0])
+    table = default_table(namespace)
+    with diag.span('query'):
+        table.update(namespace, [node_string])
+    with AttrBatch('zero_attributes') as batch:
+        batch.set_many(table.plugs([node_string], ignore=ignore_list))
+        log.debug("Resetting %s attributes of %s.", len(batch), node_string)
 
-    for attr in attr_list:
+    return
+
+
+def control_defaults(node):
+    '''
+    Default value of every keyable, unlocked attribute of a control, queried from Maya.
+
+    Return value: dict of attribute name to default.
+    '''
+
+    defaults = {}
+    for attr in pm.listAttr(node, keyable=True, unlocked=True, visible=True) or []:
         if(attr == "index"):
             continue
-        if(attr in ignore_list):
-            continue
+        defaults[attr] = pm.attributeQuery(attr, node=node, listDefault=True)[0]
+
+    return defaults
+
+
+class DefaultTable(object):
+    '''
+    Default values of the keyable attributes of one rig variant's controls, by short name, with
+    the side and limb each control belongs to.  Made the first time a character of the variant is
+    reset, and topped up when a later one has controls the table hasn't seen yet, so Maya is only
+    queried once per control per variant.
+
+    profile - the naming.Profile the variant uses.
+    '''
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.defaults = {}
+        self.sides = {}
+        self.limbs = {}
+
+    def __repr__(self):
+        return "DefaultTable('{}', {} controls)".format(self.profile.name, len(self.defaults))
+
+    def update(self, namespace, controls):
+        '''
+        Query the defaults of any of controls, full names in namespace, not in the table yet.
+        '''
+
+        missing = [name for name in controls if _short_name(name) not in self.defaults]
+        if(not missing):
+            return
+
+        self._find_limbs(namespace)
+        for name in missing:
+            short_name = _short_name(name)
+            self.defaults[short_name] = control_defaults(name)
+            self.sides[short_name] = self._side(short_name)
+
+        log.debug("Default table %s now has %s controls.", self, len(self.defaults))
+
+        return
+
+    def plugs(self, controls, sides=None, limbs=None, ignore=None):
+        '''
+        (plug, default) pairs to reset controls, full names that must be in the table.
+
+        sides - side letters to limit the reset to, ie ['L'].  Controls without a side, such as the
+            cog, are only reset when sides is None.
+        limbs - limbs to limit the reset to, ie ['arm'].  Controls on no limb are only reset when
+            limbs is None.
+        ignore - attribute names, or short control names, to leave alone.
+        '''
+
+        ignore = set(ignore or [])
+        pairs = []
+        for name in controls:
+            short_name = _short_name(name)
+            if(short_name in ignore):
+                continue
+            if(sides is not None and self.sides.get(short_name) not in sides):
+                continue
+            if(limbs is not None and self.limbs.get(short_name) not in limbs):
+                continue
+            for attr, value in sorted(self.defaults[short_name].items()):
+                if(attr not in ignore):
+                    pairs.append((name + '.' + attr, value))
+
+        return pairs
+
+    def _find_limbs(self, namespace):
+        # Controls under a limb's null belong to that limb.
+        for limb, names in self.profile.limbs.items():
+            if('null' not in names):
+                continue
+            for side in self.profile.sides:
+                null = naming.lookup(namespace, side, limb, 'null')
+                if(null is None or not pm.objExists(null)):
+                    continue
+                for child in pm.listRelatives(null, allDescendents=True) or []:
+                    self.limbs[_short_name(str(child))] = limb
+
+        return
+
+    def _side(self, short_name):
+        for side, token in self.profile.sides.items():
+            if(short_name.startswith(token)):
+                return side
+
+        return None
+
+
+def rig_controls(namespace, refresh=False):
+    '''
+    Full names of every animation control of the character in namespace, found by
+    constants.CONTROL_PATTERNS.  They're looked up once and kept until nodes of the namespace are
+    added, renamed or deleted.
+
+    refresh - look them up again regardless.
+    '''
+
+    namespace = _with_colon(namespace)
+    controls = _controls.get(namespace)
+    if(controls is None or refresh):
+        controls = _controls[namespace] = [str(node) for node in pm.ls(
+            *[namespace + pattern for pattern in cons.CONTROL_PATTERNS])]
+        callbacks.add_listener(forget_controls)
+
+    return list(controls)
+
+
+def forget_controls(node_name=None):
+    '''
+    Drop looked up controls, for callbacks.py.  With a node name, only that node's namespace is
+    looked up again.
+    '''
+
+    if(node_name is None):
+        _controls.clear()
+        return
+
+    _controls.pop(_with_colon(node_name.split('|')[-1].rpartition(':')[0]), None)
+
+    return
+
+
+def default_table(namespace):
+    '''
+    The DefaultTable for the naming profile the character in namespace uses.
+    '''
+
+    profile = naming.profile_for(namespace)
+    table = _default_tables.get(profile.name)
+    if(table is None):
+        table = _default_tables[profile.name] = DefaultTable(profile)
+        callbacks.add_listener(forget_defaults)
+
+    return table
+
+
+def forget_defaults(node_name=None):
+    '''
+    Drop the default tables when a new scene comes in, for callbacks.py.
+    '''
+
+    if(node_name is None):
+        _default_tables.clear()
+
+    return
+
+
+@diag.operation('reset_rig')
+def reset_rig(namespaces=None, sides=None, limbs=None, ignore=None, batch=None):
+    '''
+    Put every control of one or more characters back to it's default values, in a single batched
+    write.
+
+    usage:
+    reset_rig(['char01:', 'char02:'], sides=['L'], limbs=['arm'], ignore=['visibility'])
+
+    namespaces - namespace strings, ie ['char01:'], or one as a string.  If None, the characters
+        of the selected controls are reset.
+    sides, limbs, ignore - limit what's reset, see DefaultTable.plugs().
+    batch - An AttrBatch to add the writes to.  If None they're applied straight away.
+
+    Return value: the number of attributes reset.
+    '''
+
+    if(namespaces is None):
+        namespaces = []
+        for node in pm.ls(sl=True):
+            rig = registry.rig_for(node)
+            if(rig is not None and rig.namespace not in namespaces):
+                namespaces.append(rig.namespace)
+        if(not namespaces):
+            pm.warning("Select a control of each character to reset.")
+            return 0
+    elif(isinstance(namespaces, str)):
+        namespaces = [namespaces]
+
+    writes = batch if batch is not None else AttrBatch('reset_rig')
+    count = 0
+    for namespace in namespaces:
+        namespace = _with_colon(namespace)
+        with diag.span('query'):
+            controls = rig_controls(namespace)
+            table = default_table(namespace)
+            table.update(namespace, controls)
+        pairs = table.plugs(controls, sides=sides, limbs=limbs, ignore=ignore)
+        writes.set_many(pairs)
+        count += len(pairs)
+
+    diag.annotate(characters=len(namespaces), attributes=count)
+    if(batch is None):
+        writes.commit()
+
+    return count
+
+
+def _short_name(name):
+    return name.split('|')[-1].split(':')[-1]
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
 
-        attribute = eval("node.{}".format(attr))
-        # Some attributes are not-zero as a default ('zero out' is an industry wide misnomer!)
-        default_value = pm.attributeQuery(attr, n=node, listDefault=True)[0]
-        attribute.set(default_value)
-        print("resetting {} to {}.".format(attribute, default_value))
-        
-# EOF
\ No newline at end of file
+# EOF
@@ -0,0 +1,707 @@
+'''
+backend.py
+Shaper Rigs / Burlington Interactive Solutions
+
+The few scene reads and writes the matching and baking paths make over and over: world matrices,
+world transforms, plain attributes and keys.  fkik, spaces, transforms and humanik make them
+through the current backend rather than through pymel directly, so the implementation can be
+swapped without touching the tools.
+
+PymelBackend is the plain pymel version.  OpenMayaBackend reads through OpenMaya 2 with cached
+MDagPaths and MPlugs, which skips pymel's per-call wrapping.  OpenMaya 2 writes made outside a
+command can't be undone, so it's batched writes and keys run through the srBipedModify command
+(see modify_command.py) as one undo step, and it's other writes go to pymel, unless built with
+undoable=False as a batch session would.  Anything implementing the same methods can stand in, ie
+mock_maya.MockBackend.
+
+The default is OpenMayaBackend where maya.api.OpenMaya is available, or the name in the
+SR_BIPED_BACKEND environment variable.
+
+usage:
+backend.get().world_position('char01:L_ArmUprFK_CTRL')
+backend.set_backend('pymel')
+with backend.using(backend.OpenMayaBackend(undoable=False)):
+    fkik.bake_ik_to_fk(side='L', limb='arm')
+'''
+
+import os
+import callbacks
+import lazy
+import modify_command
+
+pm = lazy.module('pymel.core')
+om = lazy.module('maya.api.OpenMaya')
+oma = lazy.module('maya.api.OpenMayaAnim')
+
+
+ENV_VARIABLE = 'SR_BIPED_BACKEND'
+
+_current = None
+
+
+class Backend(object):
+    '''
+    The interface every backend gives.  Nodes may be PyNodes or names, plugs are names such as
+    'L_ArmUprFK_CTRL.worldMatrix[0]'.  Values are in Maya's UI units, like pymel's.  time is a
+    frame number, None meaning the current time.
+    '''
+
+    name = None
+
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+    def world_matrix(self, node, time=None):
+        '''
+        World matrix of a node, as anything dt.Matrix takes.
+        '''
+
+        return self.matrix(str(node) + '.worldMatrix[0]', time)
+
+    def matrix(self, plug, time=None):
+        '''
+        Value of a matrix plug, as anything dt.Matrix takes.
+        '''
+
+        raise NotImplementedError
+
+    def matrices(self, plugs, time=None):
+        '''
+        Values of many matrix plugs, all read at the same time in one pass.
+
+        Return value: list of matrices, in the order of plugs.
+        '''
+
+        return [self.matrix(plug, time) for plug in plugs]
+
+    def world_matrices(self, nodes, time=None):
+        '''
+        World matrices of many nodes, all read at the same time in one pass.
+        '''
+
+        return self.matrices([str(node) + '.worldMatrix[0]' for node in nodes], time)
+
+    def world_position(self, node):
+        '''
+        World translation of a node, as [x, y, z].
+        '''
+
+        raise NotImplementedError
+
+    def world_rotation(self, node):
+        '''
+        World rotation of a node in degrees, in it's own rotate order, as [x, y, z].
+        '''
+
+        raise NotImplementedError
+
+    def set_world_position(self, node, position):
+        raise NotImplementedError
+
+    def set_world_rotation(self, node, rotation):
+        raise NotImplementedError
+
+    def rotate_by(self, node, rotation):
+        '''
+        Rotate a node relatively, in object space, by rotation in degrees.
+        '''
+
+        raise NotImplementedError
+
+    def match_transform(self, node, target, position=True, rotation=True, pivots=False):
+        '''
+        Move and/or rotate node onto target in world space, as pm.matchTransform().
+        '''
+
+        raise NotImplementedError
+
+    def get_attr(self, plug, time=None):
+        '''
+        Value of a numeric plug, a tuple for compounds such as 'translate'.
+        '''
+
+        raise NotImplementedError
+
+    def get_attrs(self, plugs, time=None):
+        '''
+        Values of many numeric plugs, read in one pass.
+
+        Return value: list of values, in the order of plugs.
+        '''
+
+        return [self.get_attr(plug, time) for plug in plugs]
+
+    def set_attr(self, plug, value):
+        '''
+        Set a numeric plug, value being a sequence for compounds such as 'translate'.
+        '''
+
+        raise NotImplementedError
+
+    def set_attrs(self, values, undo_name='sr_biped'):
+        '''
+        Set many plugs together, as one undo step.
+
+        values - list of (plug, value) pairs, see set_attr().
+        undo_name - Name of the undo step.
+        '''
+
+        raise NotImplementedError
+
+    def set_key(self, nodes, attributes=None):
+        '''
+        Key the current values of attributes (all keyable ones if None) on nodes at the current
+        time.
+        '''
+
+        raise NotImplementedError
+
+    def set_keys(self, node, attribute, times, values):
+        '''
+        Write one key per time on a single attribute of node, values given alongside times.  The
+        whole curve is written in one pass, not a command per key.
+        '''
+
+        raise NotImplementedError
+
+
+class PymelBackend(Backend):
+    '''
+    Everything through pymel.core.  Always available, and undoable.
+    '''
+
+    name = 'pymel'
+
+    def matrix(self, plug, time=None):
+        if(time is None):
+            return pm.getAttr(plug)
+
+        return pm.getAttr(plug, time=time)
+
+    def world_position(self, node):
+        return pm.xform(node, query=True, worldSpace=True, translation=True)
+
+    def world_rotation(self, node):
+        return pm.xform(node, query=True, worldSpace=True, rotation=True)
+
+    def set_world_position(self, node, position):
+        pm.xform(node, worldSpace=True, translation=list(position))
+
+    def set_world_rotation(self, node, rotation):
+        pm.xform(node, worldSpace=True, rotation=list(rotation))
+
+    def rotate_by(self, node, rotation):
+        pm.xform(node, relative=True, objectSpace=True, rotation=list(rotation))
+
+    def match_transform(self, node, target, position=True, rotation=True, pivots=False):
+        # Only the flags asked for are passed, matchTransform matches everything if given none.
+        flags = {}
+        if(position):
+            flags['pos'] = True
+        if(rotation):
+            flags['rot'] = True
+        if(pivots):
+            flags['piv'] = True
+        pm.matchTransform(node, target, **flags)
+
+    def get_attr(self, plug, time=None):
+        if(time is None):
+            return pm.getAttr(plug)
+
+        return pm.getAttr(plug, time=time)
+
+    def set_attr(self, plug, value):
+        pm.setAttr(plug, value)
+
+    def set_attrs(self, values, undo_name='sr_biped'):
+        # A single setAttr is an undo step by itself.
+        if(len(values) == 1):
+            return pm.setAttr(values[0][0], values[0][1])
+
+        pm.undoInfo(openChunk=True, chunkName=undo_name)
+        try:
+            for plug, value in values:
+                pm.setAttr(plug, value)
+        finally:
+            pm.undoInfo(closeChunk=True)
+
+    def set_key(self, nodes, attributes=None):
+        if(attributes is None):
+            pm.setKeyframe(nodes)
+        else:
+            pm.setKeyframe(nodes, attribute=attributes)
+
+    def set_keys(self, node, attribute, times, values):
+        # One setKeyframe makes a key on every time, then the values are written with one setAttr
+        # of the curve's keyTimeValue array, rather than a setKeyframe per key.
+        times = list(times)
+        if(not times):
+            return
+        pm.setKeyframe(node, attribute=attribute, time=times)
+        curve = pm.keyframe(node, attribute=attribute, query=True, name=True)[0]
+        curve_times = pm.keyframe(node, attribute=attribute, query=True, timeChange=True)
+        curve_values = pm.keyframe(node, attribute=attribute, query=True, valueChange=True)
+
+        new_values = dict((round(time, 6), value) for time, value in zip(times, values))
+        key_time_values = []
+        for time, value in zip(curve_times, curve_values):
+            key_time_values += [time, new_values.get(round(time, 6), value)]
+        pm.setAttr('{}.keyTimeValue[0:{}]'.format(curve, len(curve_times) - 1), *key_time_values)
+
+
+class OpenMayaBackend(Backend):
+    '''
+    Reads through OpenMaya 2.  Nodes and plugs are looked up once and kept until callbacks.py says
+    the scene changed.
+
+    undoable - If True, writes land on the undo queue: set_attr(), set_attrs() and set_keys() as
+        one srBipedModify command each, the others through pymel.  If False everything goes
+        through MFnTransform, MDGModifier and MFnAnimCurve, and can't be undone.
+    '''
+
+    name = 'openmaya'
+
+    def __init__(self, undoable=True):
+        self.undoable = undoable
+        self._fallback = PymelBackend()
+        self._paths = {}
+        self._plugs = {}
+        callbacks.add_listener(self.invalidate)
+
+    def __repr__(self):
+        return 'OpenMayaBackend(undoable={})'.format(self.undoable)
+
+    @staticmethod
+    def available():
+        '''
+        True if OpenMaya 2 can be imported, ie inside Maya or mayapy.
+        '''
+
+        try:
+            return hasattr(om, 'MFnTransform')
+        except ImportError:
+            return False
+
+    def invalidate(self, node_name=None):
+        '''
+        Forget looked up nodes and plugs, for callbacks.py.  All of them if node_name is None.
+        '''
+
+        if(node_name is None):
+            self._paths.clear()
+            self._plugs.clear()
+            return
+
+        short_name = node_name.split('|')[-1]
+        for key in [key for key in self._paths if key.split('|')[-1] == short_name]:
+            del self._paths[key]
+        for key in [key for key in self._plugs
+                    if key.split('.')[0].split('|')[-1] == short_name]:
+            del self._plugs[key]
+
+        return
+
+    # Reads
+
+    def world_matrix(self, node, time=None):
+        if(time is not None):
+            return Backend.world_matrix(self, node, time)
+
+        return _rows(self._path(node).inclusiveMatrix())
+
+    def matrix(self, plug, time=None):
+        mplug = self._plug(plug)
+        with _Context(time):
+            data = om.MFnMatrixData(mplug.asMObject())
+
+        return _rows(data.matrix())
+
+    def matrices(self, plugs, time=None):
+        # One context for every plug, rather than one per plug.
+        mplugs = [self._plug(plug) for plug in plugs]
+        with _Context(time):
+            return [_rows(om.MFnMatrixData(mplug.asMObject()).matrix()) for mplug in mplugs]
+
+    def world_position(self, node):
+        translation = om.MFnTransform(self._path(node)).translation(om.MSpace.kWorld)
+
+        return [om.MDistance.internalToUI(value) for value in translation]
+
+    def world_rotation(self, node):
+        path = self._path(node)
+        rotation = om.MTransformationMatrix(path.inclusiveMatrix()).rotation()
+        rotation.reorderIt(_euler_order(path))
+
+        return [om.MAngle.internalToUI(value) for value in (rotation.x, rotation.y, rotation.z)]
+
+    def get_attr(self, plug, time=None):
+        mplug = self._plug(plug)
+        with _Context(time):
+            if(mplug.isCompound):
+                return tuple(
+                    _plug_value(mplug.child(i)) for i in range(mplug.numChildren()))
+            return _plug_value(mplug)
+
+    def get_attrs(self, plugs, time=None):
+        # One context switch for the lot, rather than one per plug.
+        values = []
+        with _Context(time):
+            for plug in plugs:
+                mplug = self._plug(plug)
+                if(mplug.isCompound):
+                    values.append(tuple(
+                        _plug_value(mplug.child(i)) for i in range(mplug.numChildren())))
+                else:
+                    values.append(_plug_value(mplug))
+
+        return values
+
+    # Writes
+
+    def set_world_position(self, node, position):
+        if(self.undoable):
+            return self._fallback.set_world_position(node, position)
+
+        vector = om.MVector([om.MDistance.uiToInternal(value) for value in position])
+        om.MFnTransform(self._path(node)).setTranslation(vector, om.MSpace.kWorld)
+
+    def set_world_rotation(self, node, rotation):
+        if(self.undoable):
+            return self._fallback.set_world_rotation(node, rotation)
+
+        path = self._path(node)
+        euler = om.MEulerRotation(
+            [om.MAngle.uiToInternal(value) for value in rotation], _euler_order(path))
+        om.MFnTransform(path).setRotation(euler.asQuaternion(), om.MSpace.kWorld)
+
+    def rotate_by(self, node, rotation):
+        if(self.undoable):
+            return self._fallback.rotate_by(node, rotation)
+
+        path = self._path(node)
+        euler = om.MEulerRotation(
+            [om.MAngle.uiToInternal(value) for value in rotation], _euler_order(path))
+        om.MFnTransform(path).rotateBy(euler, om.MSpace.kObject)
+
+    def match_transform(self, node, target, position=True, rotation=True, pivots=False):
+        if(self.undoable):
+            return self._fallback.match_transform(node, target, position, rotation, pivots)
+
+        path = self._path(node)
+        target_path = self._path(target)
+        transform = om.MFnTransform(path)
+        target_transform = om.MFnTransform(target_path)
+        if(pivots):
+            transform.setRotatePivot(
+                target_transform.rotatePivot(om.MSpace.kWorld), om.MSpace.kWorld, False)
+            transform.setScalePivot(
+                target_transform.scalePivot(om.MSpace.kWorld), om.MSpace.kWorld, False)
+        goal = om.MTransformationMatrix(target_path.inclusiveMatrix())
+        if(position):
+            transform.setTranslation(goal.translation(om.MSpace.kWorld), om.MSpace.kWorld)
+        if(rotation):
+            transform.setRotation(goal.rotation(asQuaternion=True), om.MSpace.kWorld)
+
+    def set_attr(self, plug, value):
+        if(self.undoable):
+            return self.set_attrs([(plug, value)])
+
+        mplug = self._plug(plug)
+        if(mplug.isCompound):
+            for i, child_value in enumerate(value):
+                _set_plug_value(mplug.child(i), child_value)
+        else:
+            _set_plug_value(mplug, value)
+
+    def set_attrs(self, values, undo_name='sr_biped'):
+        # Every value goes in one modifier, so the graph is dirtied once for the lot.
+        edit = modify_command.Edit()
+        for plug, value in values:
+            mplug = self._plug(plug)
+            if(mplug.isCompound):
+                for i, child_value in enumerate(value):
+                    _modify_plug_value(edit.modifier, mplug.child(i), child_value)
+            else:
+                _modify_plug_value(edit.modifier, mplug, value)
+        self._apply(edit, undo_name)
+
+    def set_key(self, nodes, attributes=None):
+        # Working out every keyable attribute is left to pymel.
+        if(self.undoable or attributes is None):
+            return self._fallback.set_key(nodes, attributes)
+
+        if(not isinstance(nodes, (list, tuple))):
+            nodes = [nodes]
+        # Values are all read before anything is keyed, as setKeyframe would.
+        now = oma.MAnimControl.currentTime()
+        keys = []
+        for node in nodes:
+            for attribute in attributes:
+                for mplug in _leaf_plugs(self._plug(str(node) + '.' + attribute)):
+                    keys.append((mplug, mplug.asDouble()))
+        for mplug, value in keys:
+            _add_key(_anim_curve(mplug), now, value)
+
+    def set_keys(self, node, attribute, times, values):
+        # The whole curve in one addKeys, the keys already on it in one go as well.
+        edit = modify_command.Edit()
+        curve = _anim_curve(self._plug(str(node) + '.' + attribute), edit.modifier)
+        edit.keys.append(lambda change: _write_keys(curve, times, values, change))
+        self._apply(edit, 'sr_biped_keys')
+
+    def _apply(self, edit, undo_name):
+        if(self.undoable):
+            return modify_command.run(edit, undo_name)
+
+        edit.modifier.doIt()
+        for key_edit in edit.keys:
+            key_edit(None)
+
+    # Lookups
+
+    def _path(self, node):
+        name = str(node)
+        path = self._paths.get(name)
+        if(path is None or not path.isValid()):
+            selection = om.MSelectionList()
+            selection.add(name)
+            path = selection.getDagPath(0)
+            self._paths[name] = path
+
+        return path
+
+    def _plug(self, plug):
+        name = str(plug)
+        mplug = self._plugs.get(name)
+        if(mplug is None or mplug.isNull):
+            selection = om.MSelectionList()
+            selection.add(name)
+            mplug = selection.getPlug(0)
+            self._plugs[name] = mplug
+
+        return mplug
+
+
+class _Context(object):
+    '''
+    Evaluate at a given frame for the duration of a with block, without moving the current time.
+    None leaves the current context alone.
+    '''
+
+    def __init__(self, time):
+        self.time = time
+        self.previous = None
+
+    def __enter__(self):
+        if(self.time is not None):
+            context = om.MDGContext(om.MTime(self.time, om.MTime.uiUnit()))
+            self.previous = context.makeCurrent()
+        return self
+
+    def __exit__(self, *exc_info):
+        if(self.previous is not None):
+            self.previous.makeCurrent()
+            self.previous = None
+        return False
+
+
+def _rows(matrix):
+    return [[matrix.getElement(row, column) for column in range(4)] for row in range(4)]
+
+
+def _euler_order(path):
+    # MTransformationMatrix counts rotate orders from 1 (kXYZ), MEulerRotation from 0.
+    return om.MFnTransform(path).rotationOrder() - 1
+
+
+def _unit_type(mplug):
+    attribute = mplug.attribute()
+    if(attribute.hasFn(om.MFn.kUnitAttribute)):
+        return om.MFnUnitAttribute(attribute).unitType()
+
+    return None
+
+
+def _plug_value(mplug):
+    unit_type = _unit_type(mplug)
+    if(unit_type == om.MFnUnitAttribute.kAngle):
+        return mplug.asMAngle().asUnits(om.MAngle.uiUnit())
+    if(unit_type == om.MFnUnitAttribute.kDistance):
+        return mplug.asMDistance().asUnits(om.MDistance.uiUnit())
+
+    return mplug.asDouble()
+
+
+def _set_plug_value(mplug, value):
+    unit_type = _unit_type(mplug)
+    if(unit_type == om.MFnUnitAttribute.kAngle):
+        mplug.setMAngle(om.MAngle(value, om.MAngle.uiUnit()))
+    elif(unit_type == om.MFnUnitAttribute.kDistance):
+        mplug.setMDistance(om.MDistance(value, om.MDistance.uiUnit()))
+    else:
+        mplug.setDouble(float(value))
+
+
+def _modify_plug_value(modifier, mplug, value):
+    unit_type = _unit_type(mplug)
+    if(unit_type == om.MFnUnitAttribute.kAngle):
+        modifier.newPlugValueMAngle(mplug, om.MAngle(value, om.MAngle.uiUnit()))
+    elif(unit_type == om.MFnUnitAttribute.kDistance):
+        modifier.newPlugValueMDistance(mplug, om.MDistance(value, om.MDistance.uiUnit()))
+    else:
+        modifier.newPlugValueDouble(mplug, float(value))
+
+
+def _leaf_plugs(mplug):
+    if(mplug.isCompound):
+        return [mplug.child(i) for i in range(mplug.numChildren())]
+
+    return [mplug]
+
+
+def _anim_curve(mplug, modifier=None):
+    '''
+    The anim curve driving a plug, made and connected if there isn't one yet.  With a modifier,
+    a new curve is only connected once the modifier is done.
+    '''
+
+    found = oma.MAnimUtil.findAnimation(mplug)
+    curve = oma.MFnAnimCurve()
+    if(len(found)):
+        curve.setObject(found[0])
+    elif(modifier is not None):
+        curve.create(mplug, modifier=modifier)
+    else:
+        curve.create(mplug)
+
+    return curve
+
+
+def _add_key(curve, time, value):
+    # value is in internal units, radians for rotations.
+    index = curve.find(time)
+    if(index is None):
+        curve.addKey(time, value)
+    else:
+        curve.setValue(index, value)
+
+
+def _write_keys(curve, times, values, change=None):
+    '''
+    Key a curve on every one of times, values in UI units.  Keys already on one of the times take
+    the new value, the rest are added with a single addKeys.
+    '''
+
+    unit = om.MTime.uiUnit()
+    new_times = []
+    new_values = []
+    for time, value in zip(times, values):
+        mtime = om.MTime(time, unit)
+        value = _to_internal(curve, value)
+        index = curve.find(mtime)
+        if(index is None):
+            new_times.append(mtime)
+            new_values.append(value)
+        else:
+            curve.setValue(index, value, change=change)
+    if(new_times):
+        curve.addKeys(new_times, new_values, keepExistingKeys=True, change=change)
+
+
+def _to_internal(curve, value):
+    curve_type = curve.animCurveType
+    if(curve_type in (oma.MFnAnimCurve.kAnimCurveTA, oma.MFnAnimCurve.kAnimCurveUA)):
+        return om.MAngle.uiToInternal(value)
+    if(curve_type in (oma.MFnAnimCurve.kAnimCurveTL, oma.MFnAnimCurve.kAnimCurveUL)):
+        return om.MDistance.uiToInternal(value)
+
+    return value
+
+
+BACKENDS = {
+    'pymel': PymelBackend,
+    'openmaya': OpenMayaBackend,
+}
+
+
+def register(name, factory):
+    '''
+    Make a backend selectable by name.
+
+    factory - a class or function taking no arguments that returns the backend.
+    '''
+
+    BACKENDS[name] = factory
+
+    return
+
+
+def get():
+    '''
+    The current backend, made on first use.
+    '''
+
+    global _current
+
+    if(_current is None):
+        _current = BACKENDS[_default_name()]()
+
+    return _current
+
+
+def set_backend(backend):
+    '''
+    Replace the current backend.
+
+    backend - a name from BACKENDS, a backend instance, or None to go back to the default.
+
+    Return value: the backend that was current before.
+    '''
+
+    global _current
+
+    previous = _current
+    if(backend is not None and not isinstance(backend, Backend) and backend in BACKENDS):
+        backend = BACKENDS[backend]()
+    elif(isinstance(backend, str)):
+        raise KeyError("No backend called '{}', there is: {}".format(
+            backend, ', '.join(sorted(BACKENDS))))
+    _current = backend
+
+    return previous
+
+
+class using(object):
+    '''
+    Use a backend for the duration of a with block.
+
+    usage:
+    with backend.using('pymel'):
+        fkik.fk_to_ik(side='L', limb='arm')
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = set_backend(self.backend)
+        return get()
+
+    def __exit__(self, *exc_info):
+        set_backend(self.previous)
+        return False
+
+
+def _default_name():
+    name = os.environ.get(ENV_VARIABLE)
+    if(name):
+        if(name not in BACKENDS):
+            raise KeyError("{} names no backend '{}', there is: {}".format(
+                ENV_VARIABLE, name, ', '.join(sorted(BACKENDS))))
+        return name
+
+    if(OpenMayaBackend.available()):
+        return 'openmaya'
+
+    return 'pymel'
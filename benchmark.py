@@ -0,0 +1,491 @@
+'''
+benchmark.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Performance benchmarks for sr_biped, run against the in-memory scene in mock_maya.py so they need
+no Maya.  Each benchmark reports frames per second and calls into Maya per frame, and the run fails
+when either regresses past the stored baseline (benchmark_baseline.json).
+
+The tools run through mock_maya.MockBackend by default.  It stands in for the OpenMaya backend Maya
+uses, where every backend method is one call, ie a batched write is one srBipedModify command.
+Calls are the pymel commands made plus the backend methods.  --backend pymel runs the same
+benchmarks through the pymel backend instead, for comparison; they aren't held to the baseline.
+
+Call counts are deterministic, so they are held to a tight tolerance.  Speed depends on the
+machine, so only a large drop in frames per second fails.  Single-shot tools (ik_fk_toggle, the
+t-pose, namespace lookups) count each call as a "frame".
+
+Importing sr_biped is held to a fixed budget instead (IMPORT_BUDGET).  The import is timed in a
+fresh interpreter with no Maya, and fails if it takes too long or loads pymel, maya or numpy.
+
+usage:
+python benchmark.py                  # Run and compare against the baseline.
+python benchmark.py --update         # Store this run as the new baseline.
+python benchmark.py --frames 240 --only bake_ik_to_fk_stepping
+python benchmark.py --backend pymel
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import types
+from timeit import default_timer as _clock
+
+import mock_maya
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(PACKAGE_DIR, 'benchmark_baseline.json')
+
+DEFAULT_FRAMES = 120
+DEFAULT_REPEATS = 3
+
+# Backends the benchmarks can run through, the first being the one the baseline is for.
+BACKENDS = ('mock', 'pymel')
+
+# Fractions a result may move in the bad direction before it counts as a regression.
+CALLS_TOLERANCE = 0.05
+FPS_TOLERANCE = 0.5
+
+# First frame of the synthetic animation and of every bake.
+START_FRAME = 1.0
+
+# Seconds importing the package, and then every submodule, may take in a fresh interpreter.
+IMPORT_BUDGET = 0.05
+SUBMODULES_IMPORT_BUDGET = 0.5
+
+# None of these may be imported by importing sr_biped or any of it's submodules.
+HEAVY_MODULES = ('pymel', 'pymel.core', 'maya', 'maya.cmds', 'numpy')
+
+# Run in a fresh interpreter by check_import_time().  Prints the timings as JSON.
+IMPORT_SCRIPT = '''
+import importlib, importlib.util, json, sys
+from timeit import default_timer as clock
+package_dir, heavy = sys.argv[1], sys.argv[2].split(',')
+sys.path.insert(0, package_dir)
+start = clock()
+spec = importlib.util.spec_from_file_location(
+    'sr_biped', package_dir + '/__init__.py', submodule_search_locations=[package_dir])
+package = importlib.util.module_from_spec(spec)
+sys.modules['sr_biped'] = package
+spec.loader.exec_module(package)
+package_seconds = clock() - start
+for name in package.SUBMODULES:
+    getattr(package, name)
+print(json.dumps({
+    'package_seconds': package_seconds,
+    'submodules_seconds': clock() - start,
+    'heavy_modules': [name for name in heavy if name in sys.modules],
+}))
+'''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark sr_biped against a mock Maya.')
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--only', nargs='*', help='names of the benchmarks to run')
+    parser.add_argument('--backend', choices=BACKENDS, default=BACKENDS[0])
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--calls-tolerance', type=float, default=CALLS_TOLERANCE)
+    parser.add_argument('--fps-tolerance', type=float, default=FPS_TOLERANCE)
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET)
+    args = parser.parse_args(argv)
+
+    import_failures = []
+    if(not args.only or 'import_time' in args.only):
+        import_result = check_import_time(repeats=args.repeats)
+        print(report_import_time(import_result))
+        import_failures = compare_import_time(import_result, args.import_budget)
+        for failure in import_failures:
+            print('REGRESSION: ' + failure)
+
+    results = run(frames=args.frames, repeats=args.repeats, only=args.only,
+                  backend_name=args.backend)
+    if(results):
+        print(report(results))
+    if(args.backend != BACKENDS[0]):
+        print('Not compared, the baseline is for the {} backend.'.format(BACKENDS[0]))
+        return 1 if import_failures else 0
+
+    if(args.update):
+        baseline = load_baseline(args.baseline) if args.only else {}
+        baseline.update(results)
+        save_baseline(baseline, args.baseline)
+        print('Baseline written to {}'.format(args.baseline))
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if(not baseline):
+        print('No baseline at {}, run with --update to make one.'.format(args.baseline))
+        return 1 if import_failures else 0
+
+    failures = compare(results, baseline, args.calls_tolerance, args.fps_tolerance)
+    for failure in failures:
+        print('REGRESSION: ' + failure)
+
+    return 1 if failures or import_failures else 0
+
+
+def run(frames=DEFAULT_FRAMES, repeats=DEFAULT_REPEATS, only=None, backend_name=BACKENDS[0]):
+    '''
+    Run the benchmarks.
+
+    frames - Length of the baked range, or the number of calls for single-shot tools.
+    repeats - Each benchmark runs this many times; the fastest is kept.
+    only - List of benchmark names to limit the run to, or None for all of them.
+    backend_name - One of BACKENDS.
+
+    Return value: dict of benchmark name to a dict of 'frames', 'seconds', 'fps', 'api_calls' and
+        'calls_per_frame'.
+    '''
+
+    modules = load_package(backend_name)
+    results = {}
+
+    for name, setup in BENCHMARKS:
+        if(only and name not in only):
+            continue
+
+        best = None
+        calls = None
+        for repeat in range(repeats):
+            work = setup(modules, frames)
+            mock_maya.scene.reset_counts()
+            start = _clock()
+            work()
+            seconds = _clock() - start
+            if(best is None or seconds < best):
+                best = seconds
+            calls = sum(mock_maya.scene.calls.values())
+
+        results[name] = {
+            'frames': frames,
+            'seconds': round(best, 6),
+            'fps': round(frames / best, 2) if best else 0.0,
+            'api_calls': calls,
+            'calls_per_frame': round(float(calls) / frames, 3),
+        }
+
+    return results
+
+
+def compare(results, baseline, calls_tolerance=CALLS_TOLERANCE, fps_tolerance=FPS_TOLERANCE):
+    '''
+    Compare results with a baseline.
+
+    Return value: list of strings describing every regression, empty if there are none.
+    '''
+
+    failures = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if(expected is None):
+            continue
+
+        allowed_calls = expected['calls_per_frame'] * (1.0 + calls_tolerance)
+        if(result['calls_per_frame'] > allowed_calls):
+            failures.append('{}: {} calls per frame, baseline {}'.format(
+                name, result['calls_per_frame'], expected['calls_per_frame']))
+
+        allowed_fps = expected['fps'] * (1.0 - fps_tolerance)
+        if(result['fps'] < allowed_fps):
+            failures.append('{}: {} frames per second, baseline {}'.format(
+                name, result['fps'], expected['fps']))
+
+    return failures
+
+
+def check_import_time(repeats=DEFAULT_REPEATS):
+    '''
+    Time importing sr_biped, then all of it's submodules, in fresh interpreters without the mock.
+
+    Return value: dict of 'package_seconds' and 'submodules_seconds', the fastest of the repeats,
+        and 'heavy_modules', the HEAVY_MODULES that got imported.
+    '''
+
+    best = None
+    for repeat in range(repeats):
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT, PACKAGE_DIR, ','.join(HEAVY_MODULES)],
+            universal_newlines=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        if(best is None or result['package_seconds'] < best['package_seconds']):
+            best = result
+
+    return best
+
+
+def compare_import_time(result, budget=IMPORT_BUDGET, submodules_budget=SUBMODULES_IMPORT_BUDGET):
+    '''
+    Return value: list of strings describing how the import broke it's budget, empty if it didn't.
+    '''
+
+    failures = []
+    if(result['package_seconds'] > budget):
+        failures.append('import sr_biped took {:.3f}s, budget {}s'.format(
+            result['package_seconds'], budget))
+    if(result['submodules_seconds'] > submodules_budget):
+        failures.append('importing every submodule took {:.3f}s, budget {}s'.format(
+            result['submodules_seconds'], submodules_budget))
+    if(result['heavy_modules']):
+        failures.append('importing sr_biped loaded {}'.format(', '.join(result['heavy_modules'])))
+
+    return failures
+
+
+def report_import_time(result):
+    return 'import sr_biped: {:.4f}s, every submodule: {:.4f}s\n'.format(
+        result['package_seconds'], result['submodules_seconds'])
+
+
+def report(results):
+    '''
+    Results as a table for the terminal.
+    '''
+
+    lines = ['{:<32}{:>10}{:>12}{:>14}{:>16}'.format(
+        'benchmark', 'frames', 'seconds', 'frames/sec', 'calls/frame')]
+    for name, result in sorted(results.items()):
+        lines.append('{:<32}{:>10}{:>12.4f}{:>14.1f}{:>16.2f}'.format(
+            name, result['frames'], result['seconds'], result['fps'], result['calls_per_frame']))
+
+    return '\n'.join(lines)
+
+
+def load_baseline(path=BASELINE_PATH):
+    if(not os.path.exists(path)):
+        return {}
+    with open(path, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w') as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def load_package(backend_name=BACKENDS[0]):
+    '''
+    Install the mock and import the modules under test.  ez_switch imports through the package
+    name, so 'sr_biped' is pointed at this directory if it isn't importable as such already.
+
+    backend_name - One of BACKENDS, for the tools to run through.
+
+    Return value: dict of module name to module.
+    '''
+
+    mock_maya.install()
+
+    if(PACKAGE_DIR not in sys.path):
+        sys.path.insert(0, PACKAGE_DIR)
+    if('sr_biped' not in sys.modules):
+        package = types.ModuleType('sr_biped')
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules['sr_biped'] = package
+
+    import attributes
+    import backend
+    import fkik
+    import humanik
+    import incremental
+    import metrics
+    import namespaces
+    import pose
+    import pose_library
+    import scheduler
+    import spaces
+    import verify
+    from sr_biped import ez_switch
+
+    backend.set_backend(mock_maya.MockBackend() if backend_name == 'mock' else backend_name)
+
+    return {'attributes': attributes, 'fkik': fkik, 'humanik': humanik,
+            'incremental': incremental, 'metrics': metrics, 'namespaces': namespaces,
+            'pose': pose, 'pose_library': pose_library, 'scheduler': scheduler,
+            'spaces': spaces, 'verify': verify, 'ez_switch': ez_switch}
+
+
+def _fresh_scene(frames, namespace='', variant='shaper'):
+    '''
+    New scene with an animated biped and the time slider range set for a bake of frames.
+    '''
+
+    scene = mock_maya.new_scene()
+    mock_maya.build_biped(
+        scene, namespace=namespace, variant=variant,
+        frames=(START_FRAME, START_FRAME + frames))
+    scene.range_selection = (START_FRAME, START_FRAME + frames)
+    scene.set_time(START_FRAME)
+
+    return scene
+
+
+def _bake(direction, limb, sampled):
+    def setup(modules, frames):
+        _fresh_scene(frames)
+        bake = getattr(modules['fkik'], 'bake_' + direction)
+        return lambda: bake(side='L', limb=limb, sampled=sampled)
+    return setup
+
+
+def _humanik_bake(bulk):
+    def setup(modules, frames):
+        scene = _fresh_scene(frames, namespace='char01')
+        mock_maya.build_hik_skeleton(scene, frames=(START_FRAME, START_FRAME + frames))
+        scene.selection = ['char01:Cog_Ctrl']
+        return lambda: modules['humanik'].bake(bulk=bulk)
+    return setup
+
+
+def _ik_fk_toggle(modules, frames):
+    _fresh_scene(1, variant='ssc')
+    toggle = modules['ez_switch'].ik_fk_toggle
+
+    def work():
+        for index in range(frames):
+            toggle('L', 'arm' if index % 4 < 2 else 'leg')
+
+    return work
+
+
+def _namespace_lookup(modules, frames):
+    scene = mock_maya.new_scene()
+    for index in range(8):
+        mock_maya.build_biped(scene, namespace='char{:02d}'.format(index))
+    from_selection = modules['namespaces'].from_selection
+
+    def work():
+        for index in range(frames):
+            scene.selection = ['char{:02d}:L_armWristIK_Ctrl'.format(index % 8)]
+            from_selection()
+
+    return work
+
+
+def _reset_rig(modules, frames):
+    scene = mock_maya.new_scene()
+    for index in range(4):
+        mock_maya.build_biped(scene, namespace='char{:02d}'.format(index))
+    reset_rig = modules['attributes'].reset_rig
+
+    def work():
+        for index in range(frames):
+            reset_rig('char{:02d}:'.format(index % 4), ignore=['visibility'])
+
+    return work
+
+
+def _space_switch(modules, frames):
+    _fresh_scene(frames)
+    switch_space = modules['spaces'].switch_space
+
+    return lambda: switch_space('L_ArmPV_Ctrl', 'cog_Space')
+
+
+def _limb_check(modules, frames):
+    _fresh_scene(frames)
+    check_clip = modules['metrics'].check_clip
+    modules['metrics'].rest_lengths('', time=START_FRAME - 1, refresh=True)
+
+    return lambda: check_clip('', frame_range=(START_FRAME, START_FRAME + frames))
+
+
+def _verify_limbs(modules, frames):
+    _fresh_scene(frames)
+    verify_limbs = modules['verify'].verify_limbs
+
+    return lambda: verify_limbs(frame_range=(START_FRAME, START_FRAME + frames))
+
+
+def _chunked_bake(modules, frames):
+    _fresh_scene(frames)
+    bake = modules['scheduler'].ik_to_fk_bake(
+        side='L', limb='arm', frame_range=(START_FRAME, START_FRAME + frames), chunk_size=25,
+        save_scene=False, sampled=True)
+    bake.checkpoint = os.path.join(tempfile.mkdtemp(prefix='sr_biped_bench'), 'bake.json')
+
+    return lambda: bake.start(deferred=False)
+
+
+def _incremental_rebake(modules, frames):
+    # A full bake to start from, then one fk key in the middle of the range is changed.
+    scene = _fresh_scene(frames)
+    rebake = modules['incremental'].bake_ik_to_fk
+    rebake(side='L', limb='arm', sampled=True)
+    curve = scene.get(modules['fkik'].bake_sources('ik_to_fk', 'L', 'arm')[1]).curves['rotateZ']
+    curve.values[len(curve.values) // 2] += 20.0
+
+    return lambda: rebake(side='L', limb='arm', sampled=True)
+
+
+def _pose_blend(modules, frames):
+    scene = mock_maya.new_scene()
+    for index in range(4):
+        mock_maya.build_biped(scene, namespace='char{:02d}'.format(index))
+    pose_library = modules['pose_library']
+    path = os.path.join(tempfile.mkdtemp(prefix='sr_biped_bench'), 'poses.srpose')
+    library = pose_library.library_for_rig(path, 'char00:')
+    pose_library.capture(library, 'rest', 'char00:')
+    mock_maya.MockBackend().set_attrs(
+        [('char00:' + name, 10.0) for name in library.channels[:40]])
+    pose_library.capture(library, 'raised', 'char00:')
+    namespaces = ['char{:02d}:'.format(index) for index in range(4)]
+
+    def work():
+        for index in range(frames):
+            pose_library.apply(library, {'rest': 1.0, 'raised': index % 4}, namespaces)
+
+    return work
+
+
+def _t_pose(modules, frames):
+    _fresh_scene(1)
+    arm_targets = {
+        'shoulder_ctrl': 'armUprIK_Ctrl',
+        'elbow_pv_ctrl': 'ArmElbow_Ctrl',
+        'wrist_ctrl': 'armWristIK_Ctrl',
+        'shoulder_joint': 'armUprFK_drv',
+        'elbow_joint': 'armLwrFK_drv',
+        'wrist_joint': 'armWristFK_drv',
+    }
+    controls_to_t_pose = modules['pose'].controls_to_t_pose
+
+    def work():
+        for index in range(frames):
+            controls_to_t_pose(arm_targets=arm_targets)
+
+    return work
+
+
+# Name and setup function of every benchmark.  A setup builds the scene and returns the work to
+# time.
+BENCHMARKS = (
+    ('bake_ik_to_fk_stepping', _bake('ik_to_fk', 'arm', False)),
+    ('bake_ik_to_fk_sampled', _bake('ik_to_fk', 'arm', True)),
+    ('bake_ik_to_fk_leg_stepping', _bake('ik_to_fk', 'leg', False)),
+    ('bake_ik_to_fk_leg_sampled', _bake('ik_to_fk', 'leg', True)),
+    ('bake_fk_to_ik_stepping', _bake('fk_to_ik', 'arm', False)),
+    ('bake_fk_to_ik_sampled', _bake('fk_to_ik', 'arm', True)),
+    ('humanik_bake', _humanik_bake(True)),
+    ('humanik_bake_stepping', _humanik_bake(False)),
+    ('ik_fk_toggle', _ik_fk_toggle),
+    ('namespace_lookup', _namespace_lookup),
+    ('pose_t_pose', _t_pose),
+    ('space_switch', _space_switch),
+    ('reset_rig', _reset_rig),
+    ('pose_blend', _pose_blend),
+    ('limb_check', _limb_check),
+    ('verify_limbs', _verify_limbs),
+    ('chunked_bake', _chunked_bake),
+    ('incremental_rebake', _incremental_rebake),
+)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
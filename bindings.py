@@ -0,0 +1,178 @@
+'''
+bindings.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Resolved node handles for a limb on a character, so repeated matches and bakes don't rebuild the
+same names and PyNodes over and over.  A LimbBinding is built the first time a given namespace,
+side and limb are asked for, and is cached until the scene changes underneath it (see
+callbacks.py).
+
+usage:
+binding = bindings.get_binding('char01', 'L', 'arm', bones_dict, ctrls_dict)
+pm.matchTransform(binding.ctrl('wrist'), binding.bone('wrist'))
+'''
+
+import constants as cons
+import callbacks
+import lazy
+
+pm = lazy.module('pymel.core')
+
+
+_cache = {}
+
+# id of a bones or ctrls dict to (the dict, a copy of it, it's key), so a dict is sorted into a key
+# once rather than on every lookup.  The dict is kept so it's id can't be reused while it's here.
+_dict_keys = {}
+_DICT_KEYS_MAX = 64
+
+
+class LimbBinding(object):
+    '''
+    Node handles for one limb of one character.  Bones and controls are looked up through the keys
+    of the dicts the binding was built from, ie 'shoulder' or 'knee_pv'.  PyNodes are made the
+    first time a key is asked for and kept from then on.
+    '''
+
+    def __init__(self, namespace, side_token, limb, bones_dict, ctrls_dict):
+        self.namespace = namespace
+        self.side_token = side_token
+        self.limb = limb
+        self.prefix = name_prefix(namespace, side_token)
+
+        # Full names are built once, here.
+        self.bone_names = dict(
+            (key, self.prefix + name) for key, name in bones_dict.items())
+        self.ctrl_names = dict(
+            (key, self.prefix + name) for key, name in ctrls_dict.items())
+
+        self._names = set(self.bone_names.values()) | set(self.ctrl_names.values())
+        self._bones = {}
+        self._ctrls = {}
+
+    def __repr__(self):
+        return "LimbBinding('{}', '{}', '{}')".format(self.namespace, self.side_token, self.limb)
+
+    def bone(self, key):
+        '''
+        PyNode of the bone listed under key.
+        '''
+
+        if(key not in self._bones):
+            self._bones[key] = pm.PyNode(self.bone_names[key])
+
+        return self._bones[key]
+
+    def ctrl(self, key):
+        '''
+        PyNode of the control listed under key.
+        '''
+
+        if(key not in self._ctrls):
+            self._ctrls[key] = pm.PyNode(self.ctrl_names[key])
+
+        return self._ctrls[key]
+
+    def has_ctrl(self, key):
+        '''
+        True if key is listed and it's control exists in the scene.
+        '''
+
+        if(key in self._ctrls):
+            return True
+
+        return key in self.ctrl_names and pm.objExists(self.ctrl_names[key])
+
+    def uses(self, node_name):
+        '''
+        True if the given node name is one this binding resolves.
+        '''
+
+        return node_name in self._names
+
+
+def get_binding(namespace, side, limb, bones_dict, ctrls_dict):
+    '''
+    Get the cached LimbBinding for a limb, building it if this is the first time it's asked for.
+
+    namespace - namespace string, with or without the trailing ':', or "" for none.
+    side - any side string the fkik functions accept, ie 'L', 'right' or None.
+    limb - 'arm', 'leg', 'revFrleg' or 'revBkleg'
+    bones_dict - dict of key to bone name, see constants.py.
+    ctrls_dict - dict of key to control name, see constants.py.
+
+    Return value: LimbBinding
+    '''
+
+    namespace = namespace.rstrip(':')
+    token = side_token(side)
+    cache_key = (namespace, token, limb, _dict_key(bones_dict), _dict_key(ctrls_dict))
+
+    binding = _cache.get(cache_key)
+    if(binding is None):
+        binding = LimbBinding(namespace, token, limb, bones_dict, ctrls_dict)
+        _cache[cache_key] = binding
+        callbacks.add_listener(invalidate)
+
+    return binding
+
+
+def invalidate(node_name=None):
+    '''
+    Drop cached bindings.  With a node name, only the bindings using that node are dropped.
+    '''
+
+    if(node_name is None):
+        _cache.clear()
+        _dict_keys.clear()
+        return
+
+    for cache_key, binding in list(_cache.items()):
+        if(binding.uses(node_name)):
+            del _cache[cache_key]
+
+    return
+
+
+def side_token(side):
+    '''
+    Resolve the loose side strings the matching functions accept into one of the side tokens in
+    constants.py.  None, or anything unrecognized, gives '' for a centre or asymmetrical limb.
+    '''
+
+    if(side is None):
+        return ''
+    if(side.upper() in ['L', 'LEFT', 'L_', 'LFT', 'LT']):
+        return cons.INTERNAL_SIDE_TOKENS['left']
+    elif(side.upper() in ['R', 'RIGHT', 'R_', 'RGT', 'RT']):
+        return cons.INTERNAL_SIDE_TOKENS['right']
+    elif(side.upper() in ['C', 'CENTRE', 'CENTER', 'C_', 'CNT', 'CT']):
+        return cons.INTERNAL_SIDE_TOKENS['centre']
+
+    return ''
+
+
+def name_prefix(namespace, token):
+    '''
+    Namespace plus side token, ready to go in front of a name from the dicts.
+    '''
+
+    namespace = namespace.rstrip(':')
+    if(namespace != ""):
+        namespace = (namespace + ":")
+
+    return namespace + token
+
+
+def _dict_key(names_dict):
+    # Comparing against the copy catches a dict that was edited since, without sorting it again.
+    entry = _dict_keys.get(id(names_dict))
+    if(entry is not None and entry[0] is names_dict and entry[1] == names_dict):
+        return entry[2]
+
+    if(len(_dict_keys) >= _DICT_KEYS_MAX):
+        _dict_keys.clear()
+    key = tuple(sorted(names_dict.items()))
+    _dict_keys[id(names_dict)] = (names_dict, dict(names_dict), key)
+
+    return key
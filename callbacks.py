@@ -0,0 +1,126 @@
+'''
+callbacks.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Scene change notifications for the caches in sr_biped.  Anything that holds on to resolved nodes
+between calls registers a listener here, and gets told when a scene is opened, a reference is
+loaded, or a transform or joint is added, renamed or deleted.
+
+Listeners are called with a node name when a single node changed, or with None when the whole
+scene should be considered stale.
+
+usage:
+callbacks.add_listener(my_cache_flush)
+'''
+
+import lazy
+
+om = lazy.module('maya.api.OpenMaya')
+
+
+_listeners = []
+_callback_ids = []
+
+# Scene level messages after which nothing resolved before can be trusted.
+SCENE_MESSAGES = (
+    'kAfterOpen',
+    'kAfterNew',
+    'kAfterImport',
+    'kAfterCreateReference',
+    'kAfterLoadReference',
+    'kAfterUnloadReference',
+    'kAfterRemoveReference',
+)
+
+# Node type whose additions and removals are watched, derived types included.
+NODE_TYPE = 'transform'
+
+
+def add_listener(listener):
+    '''
+    Register a function to be called on scene changes.  Installs the Maya callbacks on first use.
+
+    listener - function taking a single argument, the changed node's name or None.
+    '''
+
+    if(listener not in _listeners):
+        _listeners.append(listener)
+
+    install()
+
+    return
+
+
+def remove_listener(listener):
+    '''
+    Stop notifying the given function.
+    '''
+
+    if(listener in _listeners):
+        _listeners.remove(listener)
+
+    return
+
+
+def install():
+    '''
+    Install the Maya callbacks if they aren't already.  Safe to call repeatedly.
+    '''
+
+    if(_callback_ids):
+        return
+
+    for message in SCENE_MESSAGES:
+        _callback_ids.append(
+            om.MSceneMessage.addCallback(getattr(om.MSceneMessage, message), _on_scene_changed))
+
+    # A null MObject watches every node in the scene.
+    _callback_ids.append(om.MNodeMessage.addNameChangedCallback(om.MObject(), _on_name_changed))
+    # Only transforms, joints among them, are held by the caches.  Watching every dependency node
+    # would call the listeners for each anim curve a bake makes or a cutKey deletes.
+    _callback_ids.append(om.MDGMessage.addNodeAddedCallback(_on_node_added, NODE_TYPE))
+    _callback_ids.append(om.MDGMessage.addNodeRemovedCallback(_on_node_removed, NODE_TYPE))
+
+    return
+
+
+def uninstall():
+    '''
+    Remove every Maya callback installed by this module.  Listeners stay registered.
+    '''
+
+    if(_callback_ids):
+        om.MMessage.removeCallbacks(_callback_ids)
+    del _callback_ids[:]
+
+    return
+
+
+def notify(node_name=None):
+    '''
+    Tell every listener something changed.  Also usable by hand to flush all caches.
+    '''
+
+    for listener in list(_listeners):
+        listener(node_name)
+
+    return
+
+
+def _on_scene_changed(*args):
+    notify(None)
+
+
+def _on_name_changed(node, previous_name, *args):
+    # Caches are keyed by the old name, that's the one that has gone stale.  The new name is passed
+    # on too, for anything that indexes nodes by what they're called now, ie the rig registry.
+    notify(previous_name)
+    notify(om.MFnDependencyNode(node).name())
+
+
+def _on_node_added(node, *args):
+    notify(om.MFnDependencyNode(node).name())
+
+
+def _on_node_removed(node, *args):
+    notify(om.MFnDependencyNode(node).name())
@@ -264,3 +264,12 @@ HIK_ATTRIBUTE_SETTINGS={
     'R_LegPV_Ctrl.IK_Foot_Crl_space':1,
 }
 
+
+# Every rig has one of these at the top of it's hierarchy, in the rig's namespace.
+RIG_ROOT = 'DO_NOT_TOUCH_GRP'
+
+# Limbs only a quadruped has.
+QUAD_LIMBS = ['revFrleg', 'revBkleg']
+
+# Names of animation controls, whichever naming profile the rig uses.
+CONTROL_PATTERNS = ['*_Ctrl', '*_CTRL']
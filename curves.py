@@ -0,0 +1,263 @@
+'''
+curves.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Clean-up of baked animation curves: Euler filtering and key reduction.
+
+The bakes in fkik and humanik key every channel on every frame.  optimize_curves() runs after them
+to put rotations back on a continuous path and drop the keys that add nothing within a tolerance.
+
+The maths, euler_filter() and simplify(), is pure NumPy and works on arrays of sampled values, so it
+can be run and checked anywhere numpy is available.
+
+usage:
+fkik.bake_ik_to_fk(side='L', limb='arm', optimize=True)
+curves.optimize_curves(['char01:L_armWristIK_Ctrl'], tolerance=0.01, rotate_tolerance=0.05)
+'''
+
+import diagnostics as diag
+import lazy
+
+np = lazy.module('numpy')
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('curves')
+pm = diag.counted_module(pm)
+
+# Default tolerances, in scene units for translate and degrees for rotate.
+DEFAULT_TOLERANCE = 0.01
+DEFAULT_ROTATE_TOLERANCE = 0.05
+
+AXES = ['X', 'Y', 'Z']
+
+# Indexed by the value of a transform's rotateOrder attribute.
+ROTATE_ORDERS = ('XYZ', 'YZX', 'ZXY', 'XZY', 'YXZ', 'ZYX')
+
+
+def euler_filter(rotations, rotate_order='XYZ'):
+    '''
+    Make a run of Euler rotations continuous.  Each frame is moved onto whichever equivalent
+    solution is closest to the frame before: whole turns added or taken off each channel, or the
+    flipped solution (first axis + 180, 180 - second axis, third axis + 180) for the rotate order.
+    The orientation on every frame is unchanged.
+
+    rotations - (N, 3) angles in degrees, ordered x, y, z.
+    rotate_order - Rotate order the angles are in, ie 'XYZ'.
+
+    Return value: (N, 3) array of filtered angles.
+    '''
+
+    rotations = np.asarray(rotations, dtype=float).reshape(-1, 3)
+    filtered = rotations.copy()
+    if(len(rotations) < 2):
+        return filtered
+
+    order = [AXES.index(axis) for axis in rotate_order.upper()]
+
+    # Every frame's flipped counterpart is worked out up front.
+    flipped = rotations.copy()
+    flipped[:, order[0]] += 180.0
+    flipped[:, order[1]] = 180.0 - flipped[:, order[1]]
+    flipped[:, order[2]] += 180.0
+    candidates = np.stack([rotations, flipped], axis=1)
+
+    # Which candidate is closest depends on the frame before, once it has been filtered.
+    for frame in range(1, len(rotations)):
+        previous = filtered[frame - 1]
+        wrapped = candidates[frame] + 360.0 * np.round((previous - candidates[frame]) / 360.0)
+        distance = np.abs(wrapped - previous).sum(axis=1)
+        filtered[frame] = wrapped[np.argmin(distance)]
+
+    return filtered
+
+
+def simplify(times, values, tolerance):
+    '''
+    Find the keys of a sampled curve that can go while keeping it within tolerance: a
+    Ramer-Douglas-Peucker reduction.  Rather than recursing, every pass looks at all segments
+    between kept keys at once, and keeps the sample furthest from its segment's straight line in
+    every segment that is still out of tolerance.
+
+    The error is measured against straight lines between the kept keys, so the tolerance only
+    holds once they have linear tangents, as optimize_curves() gives them.
+
+    times - (N,) key times, ascending.
+    values - (N,) values, or (N, C) for C channels reduced independently.
+    tolerance - Largest allowed difference, a single value or one per channel.
+
+    Return value: boolean array shaped like values, True for the keys to keep.
+    '''
+
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    columns = values.reshape(len(times), -1)
+    tolerances = np.broadcast_to(
+        np.asarray(tolerance, dtype=float), (columns.shape[1],))
+
+    keep = np.column_stack([
+        _simplify_channel(times, columns[:, channel], tolerances[channel])
+        for channel in range(columns.shape[1])])
+
+    return keep.reshape(values.shape)
+
+
+def _simplify_channel(times, values, tolerance):
+    count = len(times)
+    keep = np.zeros(count, dtype=bool)
+    if(count <= 2):
+        keep[:] = True
+        return keep
+
+    keep[0] = keep[-1] = True
+    indices = np.arange(count)
+
+    while(True):
+        # The kept keys either side of every sample.
+        before = np.maximum.accumulate(np.where(keep, indices, 0))
+        after = np.minimum.accumulate(np.where(keep, indices, count - 1)[::-1])[::-1]
+
+        span = times[after] - times[before]
+        weight = np.where(span > 0, (times - times[before]) / np.where(span > 0, span, 1.0), 0.0)
+        line = values[before] + (values[after] - values[before]) * weight
+        error = np.where(keep, 0.0, np.abs(values - line))
+
+        # Largest error in each segment, where a segment starts at a kept key.
+        segment = np.cumsum(keep) - 1
+        largest = np.zeros(segment[-1] + 1)
+        np.maximum.at(largest, segment, error)
+
+        split = (error > tolerance) & (error == largest[segment])
+        if(not split.any()):
+            return keep
+
+        # Only one split per segment, in case of a tie.
+        split_indices = indices[split]
+        segments, first = np.unique(segment[split_indices], return_index=True)
+        keep[split_indices[first]] = True
+
+
+@diag.operation('optimize_curves')
+def optimize_curves(nodes, tolerance=DEFAULT_TOLERANCE, rotate_tolerance=DEFAULT_ROTATE_TOLERANCE,
+                    euler=True, reduce_keys=True, time_range=None, attributes=None):
+    '''
+    Euler filter and reduce the translate and rotate curves of the given nodes.
+
+    nodes - list of node names or PyNodes.
+    tolerance - Largest change allowed on translate channels, in scene units.
+    rotate_tolerance - Largest change allowed on rotate channels, in degrees.
+    euler - Run the Euler filter on the rotate channels first.
+    reduce_keys - Remove redundant keys.  The keys kept are given linear tangents, so the curve
+        between them is the straight line simplify() measured against and stays within tolerance.
+    time_range - (start, end) to limit the clean-up to, ie the range just baked.  None for every
+        key.
+    attributes - Compound attributes to clean, defaults to ['translate', 'rotate'].
+
+    Return value: tuple of the key count before and after.
+    '''
+
+    if(attributes is None):
+        attributes = ['translate', 'rotate']
+
+    range_kwargs = {}
+    if(time_range is not None):
+        range_kwargs['time'] = (time_range[0], time_range[1])
+
+    total_before = 0
+    total_after = 0
+    for node in nodes:
+        node = str(node)
+        for attribute in attributes:
+            channels = [attribute + axis for axis in AXES]
+
+            with diag.span('query'):
+                curves = {}
+                for channel in channels:
+                    times = pm.keyframe(node, attribute=channel, q=True, timeChange=True,
+                                        **range_kwargs)
+                    if(times):
+                        values = pm.keyframe(node, attribute=channel, q=True, valueChange=True,
+                                             **range_kwargs)
+                        curves[channel] = (np.array(times, dtype=float),
+                                           np.array(values, dtype=float))
+            if(not curves):
+                continue
+
+            if(euler and attribute == 'rotate'):
+                with diag.span('solve'):
+                    filtered = _filter_rotate_curves(node, curves)
+                with diag.span('write'):
+                    for channel, (times, values) in filtered.items():
+                        changed = np.abs(values - curves[channel][1]) > 1e-6
+                        for time, value in zip(times[changed], values[changed]):
+                            pm.keyframe(node, attribute=channel, edit=True, time=(time, time),
+                                        valueChange=value)
+                        curves[channel] = (times, values)
+
+            for channel, (times, values) in curves.items():
+                total_before += len(times)
+                if(not reduce_keys):
+                    total_after += len(times)
+                    continue
+
+                with diag.span('solve'):
+                    channel_tolerance = rotate_tolerance if attribute == 'rotate' else tolerance
+                    keep = simplify(times, values, channel_tolerance)
+                total_after += int(keep.sum())
+
+                with diag.span('write'):
+                    for start, end in _dropped_runs(times, keep):
+                        pm.cutKey(node, attribute=channel, time=(start, end), clear=True)
+                    # Spline tangents would bow the curve away from the lines it was checked
+                    # against, by more than the tolerance on fast moves.
+                    pm.keyTangent(node, attribute=channel, time=(times[0], times[-1]),
+                                  inTangentType='linear', outTangentType='linear')
+
+    log.info("Curve clean-up: %d keys down to %d.", total_before, total_after)
+    diag.annotate(keys_before=total_before, keys_after=total_after)
+
+    return total_before, total_after
+
+
+def _filter_rotate_curves(node, curves):
+    '''
+    Euler filter a node's rotate curves, when all three share the same key times.
+    '''
+
+    channels = ['rotate' + axis for axis in AXES]
+    if(any(channel not in curves for channel in channels)):
+        log.debug("%s isn't keyed on all rotate channels, skipping the Euler filter.", node)
+        return {}
+
+    times = curves[channels[0]][0]
+    if(any(not np.array_equal(curves[channel][0], times) for channel in channels[1:])):
+        log.debug("%s has rotate keys on different frames, skipping the Euler filter.", node)
+        return {}
+
+    rotate_order = ROTATE_ORDERS[int(pm.getAttr(node + '.rotateOrder'))]
+    rotations = np.column_stack([curves[channel][1] for channel in channels])
+    filtered = euler_filter(rotations, rotate_order)
+
+    return dict(
+        (channel, (times, filtered[:, index])) for index, channel in enumerate(channels))
+
+
+def _dropped_runs(times, keep):
+    '''
+    (start, end) times of each run of consecutive keys not kept, so each run is one cutKey.
+    '''
+
+    runs = []
+    start = None
+    for time, kept in zip(times, keep):
+        if(not kept and start is None):
+            start = time
+        if(not kept):
+            end = time
+        elif(start is not None):
+            runs.append((start, end))
+            start = None
+    if(start is not None):
+        runs.append((start, end))
+
+    return runs
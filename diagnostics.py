@@ -0,0 +1,282 @@
+'''
+diagnostics.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Logging and timing for sr_biped.
+
+Every module logs through a child of the 'sr_biped' logger.  The default level is WARNING, so the
+per-node and per-frame chatter on the matching and baking paths stays silent unless asked for:
+
+diagnostics.set_level('debug')
+
+Operations (a match, a bake) can also be timed.  While recording, each operation keeps how long it
+spent in each stage (resolve, query, solve, write, key) and how many times it called into pymel.
+The records dump to JSON:
+
+diagnostics.start_recording()
+fkik.bake_ik_to_fk(side='L', limb='arm', sampled=True)
+diagnostics.dump_json('/tmp/bake_profile.json')
+'''
+
+import json
+import logging
+import time
+from timeit import default_timer as _clock
+
+
+# Stages an operation's time is split into.  Anything not inside a span counts as 'other'.
+STAGES = ('resolve', 'query', 'solve', 'write', 'key')
+
+ROOT_LOGGER = 'sr_biped'
+DEFAULT_LEVEL = logging.WARNING
+
+# Records are capped so a session left recording doesn't grow forever.
+MAX_RECORDS = 1000
+
+_recording = False
+_records = []
+_active = None
+
+
+def get_logger(name):
+    '''
+    Logger for a module of sr_biped, ie get_logger('fkik') gives 'sr_biped.fkik'.
+    '''
+
+    _setup_root()
+
+    return logging.getLogger('{}.{}'.format(ROOT_LOGGER, name))
+
+
+def set_level(level):
+    '''
+    Set the level for all of sr_biped's logging.
+
+    level - a logging level, or it's name as a string, ie 'debug', 'info', 'warning'.
+    '''
+
+    if(isinstance(level, str)):
+        level = getattr(logging, level.upper())
+
+    _setup_root()
+    logging.getLogger(ROOT_LOGGER).setLevel(level)
+
+    return
+
+
+def start_recording(clear=True):
+    '''
+    Start keeping timing records for every operation.
+    '''
+
+    global _recording
+
+    if(clear):
+        del _records[:]
+    _recording = True
+
+    return
+
+
+def stop_recording():
+    '''
+    Stop keeping timing records.  Records made so far are kept until the next start or reset().
+    '''
+
+    global _recording
+
+    _recording = False
+
+    return
+
+
+def reset():
+    '''
+    Throw away all records.
+    '''
+
+    del _records[:]
+
+    return
+
+
+def records():
+    '''
+    List of the records made while recording, oldest first.  Each one is a dict.
+    '''
+
+    return list(_records)
+
+
+def dump_json(path=None, indent=2):
+    '''
+    Dump the records as JSON.
+
+    path - file to write to.  If None, the JSON is only returned.
+
+    Return value: JSON string.
+    '''
+
+    dumped = json.dumps(_records, indent=indent, sort_keys=True)
+
+    if(path is not None):
+        with open(path, 'w') as json_file:
+            json_file.write(dumped)
+
+    return dumped
+
+
+def operation(name):
+    '''
+    Decorator marking a function as a timed operation.  Calls made while another operation is
+    already running (ie ik_to_fk() inside a bake) are folded into the outer one.
+
+    usage:
+    @diagnostics.operation('ik_to_fk')
+    def ik_to_fk(...):
+    '''
+
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if(not _recording or _active is not None):
+                return function(*args, **kwargs)
+            with _Operation(name):
+                return function(*args, **kwargs)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__module__ = function.__module__
+
+        return wrapper
+
+    return decorator
+
+
+class span(object):
+    '''
+    Context manager timing a stage of the running operation.  Does nothing outside of one.
+
+    usage:
+    with diagnostics.span('query'):
+        pos = pm.xform(node, q=True, ws=True, t=True)
+    '''
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        if(_active is not None):
+            self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        if(self.start is not None and _active is not None):
+            stages = _active.record['stages']
+            stages[self.stage] = stages.get(self.stage, 0.0) + (_clock() - self.start)
+        return False
+
+
+def annotate(**values):
+    '''
+    Attach extra values to the running operation's record, ie annotate(frames=240).
+    '''
+
+    if(_active is not None):
+        _active.record.update(values)
+
+    return
+
+
+def counted_module(module):
+    '''
+    Wrap a module (pymel.core) so calls into it are counted against the running operation.  Outside
+    of a recorded operation the module's own functions are handed back untouched.
+
+    usage:
+    pm = diagnostics.counted_module(pymel.core)
+    '''
+
+    return _CountingModule(module)
+
+
+class _Operation(object):
+    '''
+    The record of one running operation.
+    '''
+
+    def __init__(self, name):
+        self.record = {
+            'operation': name,
+            'started': time.time(),
+            'seconds': 0.0,
+            'stages': {},
+            'api_calls': {},
+        }
+        self.start = None
+
+    def __enter__(self):
+        global _active
+
+        _active = self
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+
+        _active = None
+        self.record['seconds'] = _clock() - self.start
+        self.record['stages']['other'] = max(
+            0.0, self.record['seconds'] - sum(self.record['stages'].values()))
+        self.record['api_calls_total'] = sum(self.record['api_calls'].values())
+        if(exc_info[0] is not None):
+            self.record['error'] = repr(exc_info[1])
+
+        _records.append(self.record)
+        if(len(_records) > MAX_RECORDS):
+            del _records[0]
+
+        return False
+
+
+class _CountingModule(object):
+    '''
+    Stand-in for a module that counts calls into it while an operation is recording.
+    '''
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        attribute = getattr(self._module, name)
+
+        # Classes go back untouched so isinstance(node, pm.PyNode) still works.
+        if(_active is None or isinstance(attribute, type) or not callable(attribute)):
+            return attribute
+
+        def counted(*args, **kwargs):
+            if(_active is not None):
+                calls = _active.record['api_calls']
+                calls[name] = calls.get(name, 0) + 1
+            return attribute(*args, **kwargs)
+
+        return counted
+
+
+def _setup_root():
+    '''
+    Give the package logger a handler and the quiet default level the first time it's used.
+    '''
+
+    root = logging.getLogger(ROOT_LOGGER)
+    if(root.handlers):
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(DEFAULT_LEVEL)
+    root.propagate = False
+
+    return
@@ -8,106 +8,51 @@ FK / IK match UI
 Supports SSC quad and biped rigs.
 
 Usage:
-Run 'show_ui()' to launch tool.
+Run 'show_ui()' to launch tool.  Importing the module doesn't open it.
 Select any part of the arm or leg rig, and click the button to switch between FK and IK.
+Several limbs, or several characters, can be selected at once and are switched in one undo.
+
+From script:
+switch_characters(['char01:', 'char02:'], 'fk')
 '''
 
 
-import pymel.core as pm
+from sr_biped import attributes
+from sr_biped import backend
+from sr_biped import callbacks
+from sr_biped import diagnostics as diag
 from sr_biped import fkik
+from sr_biped import lazy
+from sr_biped import naming
+from sr_biped import registry
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('ez_switch')
 
 # Constants
-ik_bones_dict = {
-    'shoulder': 'armUprIK_drv',
-    'elbow': 'armLwrIK_drv',
-    'wrist': 'armWristIK_drv',
-    'hip': 'legUprIK_drv',
-    'knee': 'legLwrIK_drv',
-    'ankle': 'legAnkleIK_drv',
-
-    'rev_bk_hip': 'revBkLegUprIK_drv',
-    'rev_bk_knee': 'revBkLegLwr01IK_drv',
-    'rev_bk_ankle': 'revBkLegLwr02IK_drv',
-    'rev_bk_foot': 'revBkLegAnkleIK_drv',
-
-    'rev_fr_hip': 'revFrLegUprIK_drv',
-    'rev_fr_knee': 'revFrLegLwr01IK_drv',
-    'rev_fr_ankle': 'revFrLegLwr02IK_drv',
-    'rev_fr_foot': 'revFrLegAnkleIK_drv',
-}
-
-fk_bones_dict = {
-    'shoulder': 'armUprFK_drv',
-    'elbow': 'armLwrFK_drv',
-    'wrist': 'armWristFK_drv',
-    'hip': 'legUprFK_drv',
-    'knee': 'legLwrFK_drv',
-    'ankle': 'legAnkleFK_drv',
-
-    'rev_bk_hip': 'revBkLegUprFK_drv',
-    'rev_bk_knee': 'revBkLegLwr01FK_drv',
-    'rev_bk_knee2': 'revBkLegLwr02FK_drv',
-    'rev_bk_ankle': 'revBkLegAnkleFK_drv',
-
-    'rev_fr_hip': 'revFrLegUprFK_drv',
-    'rev_fr_knee': 'revFrLegLwr01FK_drv',
-    'rev_fr_knee2': 'revFrLegLwr02FK_drv',
-    'rev_fr_ankle': 'revFrLegAnkleFK_drv',
-}
-
-ik_ctrls_dict = {
-    'shoulder': 'ArmUprIK_CTRL',
-    'elbow': 'ArmElbow_CTRL',
-    'elbow_pv': 'ArmPV_CTRL',
-    'wrist': 'ArmWristIK_CTRL',
-    'pv_offset_elbow': 'ArmPV_nOffset',
-
-    'hip': 'LegUprIK_CTRL',
-    'knee_pv': 'LegPV_CTRL',
-    'knee': 'LegKnee_CTRL',
-    'ankle': 'LegAnkleIK_CTRL',
-    'toe': 'toe_CTRL',
-    'ball': 'ball_CTRL',
-    'heel': 'heel_CTRL',
-
-    'rev_bk_hip': 'revBkLegUprIK_CTRL',
-    'rev_bk_knee': 'RevBklegknee01_CTRL',
-    'rev_bk_knee2': 'RevBklegknee02_CTRL',
-    'rev_bk_ankle': 'revBkLegAnkleIK_CTRL',
-    'rev_bk_knee_pv': 'RevBklegPV_CTRL',
-
-    'rev_fr_hip': 'revFrLegUprIK_CTRL',
-    'rev_fr_knee': 'RevFrlegknee01_CTRL',
-    'rev_fr_knee2': 'RevFrlegknee02_CTRL',
-    'rev_fr_ankle': 'revFrLegAnkleIK_CTRL',
-    'rev_fr_knee_pv': 'RevFrlegPV_CTRL',
-}
-
-fk_ctrls_dict = {
-    'shoulder': 'ArmUprFK_CTRL',
-    'elbow': 'ArmLwrFK_CTRL',
-    'wrist': 'ArmWristFK_CTRL',
-    'hip': 'LegUprFK_CTRL',
-    'knee': 'LegLwrFK_CTRL',
-    'ankle': 'LegAnkleFK_CTRL',
-
-    'rev_bk_hip': 'revBkLegUprFK_CTRL',
-    'rev_bk_knee': 'revBkLegLwr01FK_CTRL',
-    'rev_bk_ankle': 'revBkLegLwr02FK_CTRL',
-    'rev_bk_foot': 'revBkLegAnkleFK_CTRL',
-
-    'rev_fr_hip': 'revFrLegUprFK_CTRL',
-    'rev_fr_knee': 'revFrLegLwr01FK_CTRL',
-    'rev_fr_ankle': 'revFrLegLwr02FK_CTRL',
-    'rev_fr_foot': 'revFrLegAnkleFK_CTRL'
-}
-
-settings_ctrls_dict = {
-    'leg': 'LegSetting_CTRL',
-    'arm': 'ArmSetting_CTRL',
-    'revFrleg': 'RevFrlegSetting_CTRL',
-    'revBkleg': 'RevBklegSetting_CTRL'
-}
+# The SSC names, from it's naming profile.  Characters are switched with whichever profile they're
+# detected as using, see naming.py; these are kept for scripts that pass them on to fkik.
+SSC_PROFILE = naming.get_profile('ssc')
+ik_bones_dict = SSC_PROFILE.role_dict('ik_bone')
+fk_bones_dict = SSC_PROFILE.role_dict('fk_bone')
+ik_ctrls_dict = SSC_PROFILE.role_dict('ik_ctrl')
+fk_ctrls_dict = SSC_PROFILE.role_dict('fk_ctrl')
+
+# The group each part's controls live under, checked in this order.
+PART_NULLS = [
+    ('leg', 'Leg_null'),
+    ('arm', 'Arm_null'),
+    ('revFrleg', 'RevFrleg_null'),
+    ('revBkleg', 'RevBkleg_null'),
+]
+
+settings_ctrls_dict = dict(
+    (limb, names['settings']) for limb, names in SSC_PROFILE.limbs.items())
+
+# (namespace, side, part) to the limb's ikBlend plug name.
+_ik_blend_plugs = {}
 
 
 # Main
@@ -123,57 +68,206 @@ def show_ui():
     win.show()
 
 
-def switch_ik_blend_attr(side, part, value, namespace=''):
-    pm.setAttr('{}{}_{}.ikBlend'.format(namespace, side, settings_ctrls_dict[part]), value)
+def ik_blend_plug(side, part, namespace=''):
+    '''
+    Name of the ikBlend plug of a limb, made once per limb.
+    '''
+
+    key = (namespace, side, part)
+    plug = _ik_blend_plugs.get(key)
+    if plug is None:
+        plug = naming.lookup(namespace, side, part, 'settings') + '.ikBlend'
+        _ik_blend_plugs[key] = plug
+        callbacks.add_listener(_forget_plugs)
+
+    return plug
+
+
+def switch_ik_blend_attr(side, part, value, namespace='', batch=None):
+    '''
+    Set a limb's ikBlend.  If a batch is given, the write is added to it instead of made now.
+    '''
+
+    if batch is not None:
+        batch.set(ik_blend_plug(side, part, namespace), value)
+    else:
+        backend.get().set_attr(ik_blend_plug(side, part, namespace), value)
 
     return
 
 
 def get_ik_blend_attr(side, part, namespace=''):
-    value = pm.getAttr('{}{}_{}.ikBlend'.format(namespace, side, settings_ctrls_dict[part]))
+    value = backend.get().get_attr(ik_blend_plug(side, part, namespace))
 
     return value
 
 
+def _forget_plugs(node_name=None):
+    # Plug names follow the naming profiles, which change when probe nodes do; it's cheap to redo.
+    _ik_blend_plugs.clear()
+
+
 def toggle_selected(*args):
     sels = pm.selected()
 
-    for sel in pm.selected():
-        side = str(sel).split(':')[-1][0]
+    # Two controls picked on the same limb still only switch it once.
+    switch_targets(targets_from_selection(sels))
 
-        if 'CTRL' in str(sel) and side in ['L', 'R']:
-            if 'Leg_null' in sel.longName():
-                part = 'leg'
-
-            elif 'Arm_null' in sel.longName():
-                part = 'arm'
+    pm.select(sels)
 
-            elif 'RevFrleg_null' in sel.longName():
-                part = 'revFrleg'
 
-            elif 'RevBkleg_null' in sel.longName():
-                part = 'revBkleg'
+def target_from_node(node):
+    '''
+    The (namespace, side, part) a control belongs to, or None if it isn't part of a switchable limb.
+    '''
 
-            print("namespace " + sel.namespace())
-            ik_fk_toggle(side, part, sel.namespace())
+    side = str(node).split(':')[-1][0]
+    if 'CTRL' not in str(node) or side not in ['L', 'R']:
+        return None
 
-    pm.select(sels)
+    long_name = node.longName()
+    for part, null in PART_NULLS:
+        if null in long_name:
+            return (node.namespace(), side, part)
+
+    return None
 
 
+def targets_from_selection(selection=None):
+    '''
+    Unique (namespace, side, part) targets for the selected controls, in selection order.
+    '''
+
+    if selection is None:
+        selection = pm.selected()
+
+    targets = []
+    for sel in selection:
+        target = target_from_node(sel)
+        if target is not None and target not in targets:
+            log.debug("namespace %s", target[0])
+            targets.append(target)
+
+    return targets
+
+
+@diag.operation('switch_targets')
+def switch_targets(targets, mode='toggle'):
+    '''
+    Switch many limbs, possibly across many characters, as one undoable step.
+
+    All the ikBlend values are read first, then every limb is matched from one read of the scene,
+    then all the new control and ikBlend values are written together.
+
+    targets - iterable of (namespace, side, part) tuples, ie ('char01:', 'L', 'arm').  Duplicates
+        are only switched once.
+    mode - 'toggle' to flip each limb, 'fk' or 'ik' to put every limb in that mode.  Limbs already
+        in the requested mode are left alone.
+
+    Return value: list of (namespace, side, part, new ikBlend value) for the limbs switched.
+    '''
+
+    if mode not in ['toggle', 'fk', 'ik']:
+        pm.warning("mode must be 'toggle', 'fk' or 'ik', got '{}'.".format(mode))
+        return []
+
+    unique_targets = []
+    for target in targets:
+        if target not in unique_targets:
+            unique_targets.append(target)
+
+    # Read everything before anything is written.
+    with diag.span('query'):
+        current = [get_ik_blend_attr(side, part, namespace)
+                   for namespace, side, part in unique_targets]
+
+    switches = []
+    for (namespace, side, part), blend in zip(unique_targets, current):
+        if mode == 'toggle':
+            value = 1 - blend
+        else:
+            value = 1 if mode == 'ik' else 0
+            if (blend >= 0.5) == (value == 1):
+                continue
+        switches.append((namespace, side, part, 0 if value < 0.5 else 1))
+
+    if not switches:
+        return []
+
+    pm.undoInfo(openChunk=True, chunkName='ez_switch')
+    try:
+        # Every limb is matched from one read of the scene, and every control and ikBlend goes in
+        # together.
+        batch = attributes.AttrBatch('ez_switch')
+        matches = [_match(side, part, value, namespace)
+                   for namespace, side, part, value in switches]
+        made = fkik.match_limbs(matches, batch, amp_pv=40, pole_direction=1)
+        switches = [switch for switch, match in zip(switches, matches) if match in made]
+
+        with diag.span('write'):
+            for namespace, side, part, value in switches:
+                switch_ik_blend_attr(side, part, value, namespace, batch=batch)
+            batch.commit()
+    finally:
+        pm.undoInfo(closeChunk=True)
+
+    return switches
+
+
+def switch_characters(namespaces, mode, parts=None, sides=None):
+    '''
+    Put every limb of the given characters into fk or ik.
+
+    namespaces - list of namespace strings, ie ['char01:', 'char02:'].  Use '' for no namespace.
+        None for every rig in the scene.
+    mode - 'fk' or 'ik'
+    parts - limbs to switch, defaults to every part in settings_ctrls_dict the character has.
+    sides - defaults to ['L', 'R'].
+
+    Return value: see switch_targets().
+    '''
+
+    if parts is None:
+        parts = list(settings_ctrls_dict)
+    if sides is None:
+        sides = ['L', 'R']
+
+    # The registry already knows which limbs every rig has.
+    rig_registry = registry.get_registry()
+    if namespaces is None:
+        namespaces = [rig.namespace for rig in rig_registry.rigs()]
+
+    targets = []
+    for namespace in namespaces:
+        rig = rig_registry.get(namespace)
+        if rig is None:
+            pm.warning("No rig in namespace '{}'.".format(namespace))
+            continue
+        for part in parts:
+            for side in sides:
+                if rig.has_limb(side, part):
+                    targets.append((rig.namespace, side, part))
+
+    return switch_targets(targets, mode=mode)
+
+
+@diag.operation('ik_fk_toggle')
 def ik_fk_toggle(side, part, namespace=''):
-    value = 1 - get_ik_blend_attr(side, part, namespace)
-    pole_direction = 1
+    switch_targets([(namespace, side, part)])
 
-    if value < 0.5:
-        switch_ik_blend_attr(side, part, 0, namespace)
-        fkik.fk_to_ik(side, part, ik_bones_dict, fk_ctrls_dict, key=False, namespace=namespace)
+    return
 
-    else:
-        switch_ik_blend_attr(side, part, 1, namespace)
-        fkik.ik_to_fk(side, part, fk_bones_dict, ik_ctrls_dict, amp_pv=40,
-                      pole_direction=pole_direction, key=False, namespace=namespace)
 
-    return
+def _match(side, part, value, namespace=''):
+    '''
+    The fkik.match_limbs() match that holds the limb's pose when ikBlend goes to value.
+    '''
+
+    profile = naming.profile_for(namespace)
 
+    if value < 0.5:
+        return ('fk_to_ik', namespace, side, part, profile.role_dict('ik_bone'),
+                profile.role_dict('fk_ctrl'))
 
-show_ui()
+    return ('ik_to_fk', namespace, side, part, profile.role_dict('fk_bone'),
+            profile.role_dict('ik_ctrl'))
@@ -0,0 +1,439 @@
+'''
+farm.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Batch HumanIK retargeting of many mocap takes over a pool of headless mayapy processes.
+
+A job opens a rig scene, sets it up for HIK, merges an FBX take onto the duplicate skeleton, bakes
+it onto the rig's controls and saves the result.  Jobs are spread over N worker processes.  Each
+finished job appends a metrics record to a JSON lines file: status, frames baked, wall time,
+frames per second and whether the baked limbs passed metrics.check_clip().
+
+The scheduling and aggregation here need neither Maya nor pymel.  The default worker keeps one
+mayapy running in each pool process and hands it one job after another, so Maya starts once per
+worker rather than once per job.  Any picklable function taking a job dict can stand in for it,
+ie dry_run_worker, which is how the pool is exercised without Maya.
+
+usage:
+jobs = farm.jobs_from_lists(['/rigs/hero.ma'], takes, '/renders/retarget', namespace='hero:')
+results = farm.run_jobs(jobs, workers=8, metrics_path='/renders/retarget/metrics.jsonl')
+
+command line:
+python farm.py --rig /rigs/hero.ma --takes /mocap/*.fbx --out /renders/retarget --workers 8
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+from timeit import default_timer as _clock
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import diagnostics as diag
+import sampling as smp
+
+
+log = diag.get_logger('farm')
+
+# mayapy to launch, unless the MAYAPY environment variable says otherwise.
+DEFAULT_MAYAPY = 'mayapy'
+
+# A worker process prints it's result on a line starting with this.
+RESULT_PREFIX = 'SR_BIPED_FARM_RESULT '
+
+# The mayapy this pool process hands it's jobs to, started on the first job.
+_mayapy = None
+
+
+def make_job(rig, take, output, namespace='', frame_range=None, step=1, job_id=None):
+    '''
+    A job, as the dict the workers are handed.
+
+    rig - Maya scene with the rig to retarget onto.
+    take - FBX file with the animation, on a skeleton named like the HIK duplicate (fbIk_*).
+    output - Maya scene to save the baked result as.
+    namespace - namespace of the rig in the scene, with it's ':'.
+    frame_range - (start, end) to bake, end not included.  None for the take's playback range.
+    step - Bake every step frames.
+    '''
+
+    if(job_id is None):
+        job_id = os.path.splitext(os.path.basename(output))[0]
+
+    return {
+        'job_id': job_id,
+        'rig': rig,
+        'take': take,
+        'output': output,
+        'namespace': namespace,
+        'frame_range': list(frame_range) if frame_range is not None else None,
+        'step': step,
+    }
+
+
+def jobs_from_lists(rigs, takes, out_dir, namespace='', frame_range=None, step=1):
+    '''
+    Pair up rig scenes and takes into jobs.  A single rig is used for every take, otherwise there
+    must be one rig per take.  Output scenes are named after the take (and the rig, when there are
+    several) inside out_dir.
+
+    Return value: list of job dicts.
+    '''
+
+    if(len(rigs) == 1):
+        rigs = list(rigs) * len(takes)
+    elif(len(rigs) != len(takes)):
+        raise ValueError("Give one rig for every take, or a single rig for all of them.")
+
+    several_rigs = len(set(rigs)) > 1
+    jobs = []
+    for rig, take in zip(rigs, takes):
+        name = os.path.splitext(os.path.basename(take))[0]
+        if(several_rigs):
+            name = os.path.splitext(os.path.basename(rig))[0] + '_' + name
+        jobs.append(make_job(
+            rig, take, os.path.join(out_dir, name + '.ma'), namespace=namespace,
+            frame_range=frame_range, step=step))
+
+    return jobs
+
+
+def run_jobs(jobs, workers=None, worker=None, metrics_path=None):
+    '''
+    Run jobs over a pool of worker processes.
+
+    jobs - list of job dicts, see make_job().
+    workers - number of processes.  Defaults to the number of CPUs.
+    worker - function run for every job in a pool process.  It takes the job dict and returns a dict
+        with at least 'frames'.  Defaults to mayapy_worker.
+    metrics_path - JSON lines file every job's record is appended to as soon as it finishes.
+
+    Return value: list of job records, in the order they finished.
+    '''
+
+    if(worker is None):
+        worker = mayapy_worker
+    if(workers is None):
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(jobs)))
+
+    start = _clock()
+    results = []
+
+    metrics_file = None
+    if(metrics_path is not None):
+        metrics_dir = os.path.dirname(metrics_path)
+        if(metrics_dir and not os.path.isdir(metrics_dir)):
+            os.makedirs(metrics_dir)
+        metrics_file = open(metrics_path, 'a')
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for record in pool.imap_unordered(_run_job, [(worker, job) for job in jobs]):
+            results.append(record)
+            if(metrics_file is not None):
+                metrics_file.write(json.dumps(record, sort_keys=True) + '\n')
+                metrics_file.flush()
+            log.info("%s %s: %d frames in %.2fs.", record['job_id'], record['status'],
+                     record['frames'], record['wall_time'])
+    finally:
+        pool.close()
+        pool.join()
+        if(metrics_file is not None):
+            metrics_file.close()
+
+    summary = summarize(results, elapsed=_clock() - start)
+    log.info("%d of %d jobs done, %d frames at %.1f frames/sec over %d workers.",
+             summary['succeeded'], summary['jobs'], summary['frames'], summary['fps'], workers)
+    if(summary['limbs_flagged']):
+        log.warning("%d takes have limbs out of tolerance, see 'limb_issues' in their records.",
+                    summary['limbs_flagged'])
+
+    return results
+
+
+def summarize(results, elapsed=None):
+    '''
+    Totals for a list of job records.
+
+    elapsed - wall time of the whole run, for the overall frame rate.  Without it, the job wall
+        times are summed, as if they ran one after the other.
+
+    Return value: dict.
+    '''
+
+    succeeded = [record for record in results if record['status'] == 'ok']
+    flagged = [record for record in succeeded if not record.get('limbs_ok', True)]
+    frames = sum(record['frames'] for record in succeeded)
+    job_time = sum(record['wall_time'] for record in results)
+    if(elapsed is None):
+        elapsed = job_time
+
+    return {
+        'jobs': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'limbs_flagged': len(flagged),
+        'frames': frames,
+        'job_time': job_time,
+        'elapsed': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def read_metrics(path):
+    '''
+    Read the job records back from a JSON lines metrics file.
+    '''
+
+    with open(path, 'r') as metrics_file:
+        return [json.loads(line) for line in metrics_file if line.strip()]
+
+
+def _run_job(args):
+    '''
+    Run one job in a pool process and turn whatever happens into a record.
+    '''
+
+    worker, job = args
+    record = {
+        'job_id': job['job_id'],
+        'rig': job['rig'],
+        'take': job['take'],
+        'output': job['output'],
+        'pid': os.getpid(),
+        'started': time.time(),
+        'status': 'ok',
+        'frames': 0,
+    }
+
+    start = _clock()
+    try:
+        record.update(worker(job))
+    except Exception as exc:
+        record['status'] = 'failed'
+        record['error'] = '{}: {}'.format(type(exc).__name__, exc)
+    record['wall_time'] = _clock() - start
+    record['fps'] = record['frames'] / record['wall_time'] if record['wall_time'] > 0 else 0.0
+
+    return record
+
+
+def mayapy_worker(job):
+    '''
+    Worker handing a job to the mayapy kept running for this pool process, starting it if there
+    isn't one yet or the last one died.  The mayapy used is the MAYAPY environment variable, or
+    'mayapy' on the PATH.  A job may set 'timeout' in seconds, a mayapy that runs over it is
+    killed and the next job starts a new one.
+    '''
+
+    global _mayapy
+
+    if(_mayapy is None or not _mayapy.alive()):
+        _mayapy = MayapyProcess(os.environ.get('MAYAPY', DEFAULT_MAYAPY))
+
+    return _mayapy.run(job, timeout=job.get('timeout'))
+
+
+class MayapyProcess(object):
+    '''
+    A mayapy running this file with --serve, doing the jobs it's sent one after another.  It exits
+    when it's stdin closes, ie when the pool process that started it does.
+
+    mayapy - Path of the mayapy to run.
+    '''
+
+    def __init__(self, mayapy):
+        self.process = subprocess.Popen(
+            [mayapy, os.path.abspath(__file__), '--serve'], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        # Read on a thread, so a job can time out while mayapy prints nothing.
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._read)
+        reader.daemon = True
+        reader.start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, job, timeout=None):
+        '''
+        Do a job and wait for it's result.
+
+        Return value: the result dict run_job_in_maya() returned.
+        '''
+
+        self.process.stdin.write(json.dumps(job) + '\n')
+        self.process.stdin.flush()
+
+        output = []
+        deadline = None if timeout is None else _clock() + timeout
+        while(True):
+            try:
+                line = self.lines.get(
+                    timeout=None if deadline is None else max(0.0, deadline - _clock()))
+            except queue.Empty:
+                self.stop()
+                raise RuntimeError("Timed out after {}s.".format(timeout))
+            if(line is None):
+                raise RuntimeError("mayapy exited with {} and no result:\n{}".format(
+                    self.process.wait(), '\n'.join(output)[-2000:]))
+            if(line.startswith(RESULT_PREFIX)):
+                result = json.loads(line[len(RESULT_PREFIX):])
+                if('error' in result):
+                    raise RuntimeError(result['error'])
+                return result
+            output.append(line)
+
+    def stop(self):
+        if(self.alive()):
+            self.process.kill()
+        self.process.wait()
+
+    def _read(self):
+        for line in iter(self.process.stdout.readline, ''):
+            self.lines.put(line.rstrip('\n'))
+        self.lines.put(None)
+
+
+def dry_run_worker(job):
+    '''
+    Stand-in worker for exercising the pool without Maya.  Takes job['seconds'] (default 0) and
+    reports the frames of job['frame_range'] (default 1 to 101) at job['step'] as baked.  A job
+    with 'fail' set raises.
+    '''
+
+    if(job.get('fail')):
+        raise RuntimeError("Dry run failure for {}.".format(job['job_id']))
+
+    time.sleep(job.get('seconds', 0.0))
+    frame_range = job.get('frame_range') or (1, 101)
+
+    return {'frames': len(smp.every(job.get('step', 1)).resolve(frame_range))}
+
+
+def serve():
+    '''
+    Do jobs read from stdin, one JSON dict a line, inside this process, which must be mayapy.  Maya
+    is started once for all of them.  Each job's result, or it's error, is printed on a line
+    starting with RESULT_PREFIX.  Returns when stdin closes.
+    '''
+
+    import maya.standalone
+    maya.standalone.initialize(name='python')
+
+    try:
+        for line in iter(sys.stdin.readline, ''):
+            if(not line.strip()):
+                continue
+            try:
+                result = run_job_in_maya(json.loads(line))
+            except Exception as exc:
+                result = {'error': '{}: {}'.format(type(exc).__name__, exc)}
+            print(RESULT_PREFIX + json.dumps(result))
+            sys.stdout.flush()
+
+    finally:
+        maya.standalone.uninitialize()
+
+    return
+
+
+def run_job_in_maya(job):
+    '''
+    Do a job inside this process, which must be mayapy with maya.standalone initialized, see
+    serve().  The rig scene is opened over whatever the last job left.
+
+    Return value: dict with 'frames' and 'bake_seconds'.
+    '''
+
+    import pymel.core as pm
+    import maya.mel as mel
+    import backend
+    import humanik
+    import metrics
+
+    # Nothing is undone in a batch session, so writes can skip pymel too.
+    backend.set_backend(backend.OpenMayaBackend(undoable=False))
+
+    namespace = job.get('namespace', '')
+    pm.openFile(job['rig'], force=True)
+
+    humanik.setup(ns=namespace)
+    # Measured before the take comes in, while the rig is still at rest.
+    metrics.rest_lengths(namespace, refresh=True)
+
+    # Merge the take's animation onto the existing duplicate skeleton by name.
+    pm.loadPlugin('fbxmaya', quiet=True)
+    mel.eval('FBXImportMode -v exmerge')
+    mel.eval('FBXImport -f "{}"'.format(job['take'].replace('\\', '/')))
+
+    frame_range = job.get('frame_range')
+    if(frame_range is None):
+        frame_range = (pm.playbackOptions(q=True, minTime=True),
+                       pm.playbackOptions(q=True, maxTime=True) + 1)
+    sampling = smp.every(job.get('step', 1))
+
+    start = _clock()
+    humanik.bake(ns=namespace, frame_range=frame_range, sampling=sampling)
+    bake_seconds = _clock() - start
+    limbs = metrics.check_clip(namespace, frame_range=frame_range, sampling=sampling)
+
+    output_dir = os.path.dirname(job['output'])
+    if(output_dir and not os.path.isdir(output_dir)):
+        os.makedirs(output_dir)
+    pm.saveAs(job['output'], force=True)
+
+    return {
+        'frames': len(sampling.resolve(frame_range)),
+        'bake_seconds': bake_seconds,
+        'limbs_ok': limbs['ok'],
+        'limb_issues': dict((name, limb) for name, limb in limbs['limbs'].items()
+                            if not limb['ok']),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch HumanIK retargeting with mayapy.')
+    parser.add_argument('--rig', nargs='+', help='rig scene, or one per take')
+    parser.add_argument('--takes', nargs='+', help='FBX takes to retarget')
+    parser.add_argument('--out', help='directory for the baked scenes')
+    parser.add_argument('--namespace', default='')
+    parser.add_argument('--step', type=float, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--metrics', help='JSON lines file, defaults to metrics.jsonl in --out')
+    parser.add_argument('--dry-run', action='store_true', help='use the stand-in worker')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Inside a mayapy started by mayapy_worker.
+    if(args.serve):
+        serve()
+        return 0
+
+    if(not (args.rig and args.takes and args.out)):
+        parser.error('--rig, --takes and --out are needed.')
+
+    jobs = jobs_from_lists(
+        args.rig, args.takes, args.out, namespace=args.namespace, step=args.step)
+    metrics_path = args.metrics or os.path.join(args.out, 'metrics.jsonl')
+    worker = dry_run_worker if args.dry_run else mayapy_worker
+    start = _clock()
+    results = run_jobs(jobs, workers=args.workers, worker=worker, metrics_path=metrics_path)
+
+    summary = summarize(results, elapsed=_clock() - start)
+    print(json.dumps(summary, indent=2, sort_keys=True))
+
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
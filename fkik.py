@@ -11,12 +11,50 @@ pole-vector aligned to the plane defined by upper arm and lower-arm.
 For format requirements of the dict, see constants.py
 '''
 
-import pymel.core as pm
-import pymel.core.datatypes as dt
+import math
+import backend
+import bindings
 import constants as cons
+import curves
+import diagnostics as diag
+import lazy
+import limb_solver
+import sampling as smp
 import suite as su
+import transforms
 
+np = lazy.module('numpy')
+pm = lazy.module('pymel.core')
+dt = lazy.module('pymel.core.datatypes')
 
+
+log = diag.get_logger('fkik')
+pm = diag.counted_module(pm)
+
+
+# Chain keys the sampled bakes walk, from the root of the limb down.
+FK_CHAIN_KEYS = {
+    'leg': ['hip', 'knee', 'ankle'],
+    'arm': ['shoulder', 'elbow', 'wrist'],
+    'revFrleg': ['rev_fr_hip', 'rev_fr_knee', 'rev_fr_ankle', 'rev_fr_foot'],
+    'revBkleg': ['rev_bk_hip', 'rev_bk_knee', 'rev_bk_ankle', 'rev_bk_foot'],
+}
+
+# Top, end, middle and pole vector keys, in the same order ik_to_fk() uses them.
+IK_TARGET_KEYS = {
+    'leg': ['hip', 'ankle', 'knee', 'knee_pv'],
+    'arm': ['shoulder', 'wrist', 'elbow', 'elbow_pv'],
+    'revFrleg': ['rev_fr_hip', 'rev_fr_ankle', 'rev_fr_knee', 'rev_fr_knee_pv'],
+    'revBkleg': ['rev_bk_hip', 'rev_bk_ankle', 'rev_bk_knee', 'rev_bk_knee_pv'],
+}
+
+TRANSFORM_CHANNELS = ['translateX', 'translateY', 'translateZ', 'rotateX', 'rotateY', 'rotateZ']
+
+# Indexed by the value of a transform's rotateOrder attribute.
+ROTATE_ORDERS = ('XYZ', 'YZX', 'ZXY', 'XZY', 'YXZ', 'ZYX')
+
+
+@diag.operation('fk_to_ik')
 def fk_to_ik(side=None, limb=None, ik_bones_dict=None, fk_ctrls_dict=None, key=True, namespace=""):
     '''
     Match fk controls to ik, but executing match xforms of the controllers to the bones.  Generic
@@ -27,82 +65,44 @@ def fk_to_ik(side=None, limb=None, ik_bones_dict=None, fk_ctrls_dict=None, key=T
     fk_ctrls_dict - dictionary containing keys 'shoulder' and 'elbow' etc, listing fk controls.
     '''
 
-    # Prep the namespace
-    if(namespace != ""):
-        namespace = (namespace + ":")
-
     # Based on the limb string incoming, the following keys will be used in the dictionary.
-    if(limb == 'leg'):
-        targets_list = ['hip', 'knee', 'ankle']
-    elif(limb == 'arm'):
-        targets_list = ['shoulder', 'elbow', 'wrist']
-    elif(limb == 'revFrleg'):
-        targets_list = ['rev_fr_hip', 'rev_fr_knee', 'rev_fr_ankle', 'rev_fr_foot']
-    elif(limb == 'revBkleg'):
-        targets_list = ['rev_bk_hip', 'rev_bk_knee', 'rev_bk_ankle', 'rev_bk_foot']
-
-    else:
+    if(limb not in FK_CHAIN_KEYS):
         pm.warning("Must specific a limb with either 'leg' or 'arm'!")
         return
+    targets_list = FK_CHAIN_KEYS[limb]
 
-    # Assign defaults like so to dodge the mutable default argument issue:
+    # Defaults are applied like so to dodge the mutable default argument issue.  The binding is
+    # cached, so names and nodes are only resolved the first time round for this limb.
     if(ik_bones_dict is None):
-        local_ik_bones_dict = cons.INTERNAL_DEF_IK_JNTS.copy()
-    else:
-        local_ik_bones_dict = ik_bones_dict.copy()
-
+        ik_bones_dict = cons.INTERNAL_DEF_IK_JNTS
     if(fk_ctrls_dict is None):
-        local_fk_ctrls_dict = cons.INTERNAL_DEF_FK_CTRLS.copy()
-    else:
-        local_fk_ctrls_dict = fk_ctrls_dict.copy()
-
-    if(side is not None):
-        if(side.upper() in ['L', 'LEFT', 'L_', 'LFT', 'LT']):
-            side_token = cons.INTERNAL_SIDE_TOKENS['left']
-        elif(side.upper() in ['R', 'RIGHT', 'R_', 'RGT', 'RT']):
-            side_token = cons.INTERNAL_SIDE_TOKENS['right']
-        elif(side.upper() in ['C', 'CENTRE', 'CENTER', 'C_', 'CNT', 'CT']):
-            side_token = cons.INTERNAL_SIDE_TOKENS['centre']
-    else:
-        print("No side token given, assuming this is a centre-positioned or asymmetrical limb.")
-        side_token = ''
-
-    print ("working with namespace {}".format(namespace))
-    # Append the side token to all strings.
-    for bone in local_ik_bones_dict:
-        local_ik_bones_dict[bone] = (namespace + side_token + local_ik_bones_dict[bone])
-    print ("Side tokens added, joint references are:\n {}".format(local_ik_bones_dict))
-
-    for ctrl in local_fk_ctrls_dict:
-        local_fk_ctrls_dict[ctrl] = (namespace + side_token + local_fk_ctrls_dict[ctrl])
-    print ("Side tokens added, ctrl targets are:\n {}".format(local_ik_bones_dict))
+        fk_ctrls_dict = cons.INTERNAL_DEF_FK_CTRLS
+    with diag.span('resolve'):
+        binding = bindings.get_binding(namespace, side, limb, ik_bones_dict, fk_ctrls_dict)
 
     # Iterate through the list of key names, perform the xform matching.
-    for target_key in targets_list:
-        print (target_key)
-        print (local_ik_bones_dict[target_key])
-        print (local_fk_ctrls_dict[target_key])
-        print("Matching transforms of {} to {}...".format(
-            (namespace + side_token + local_fk_ctrls_dict[target_key]),
-            local_ik_bones_dict[target_key]
-        ))
-
-        # PyNode these up:
-        target_node = pm.PyNode(local_fk_ctrls_dict[target_key])
-        copy_node = pm.PyNode(local_ik_bones_dict[target_key])
-        pm.matchTransform(target_node, copy_node, rot=True, pos=True, piv=True)
+    scene = backend.get()
+    with diag.span('write'):
+        for target_key in targets_list:
+            log.debug(
+                "Matching transforms of %s to %s...",
+                binding.ctrl_names[target_key], binding.bone_names[target_key])
+            scene.match_transform(
+                binding.ctrl(target_key), binding.bone(target_key), pivots=True)
 
     # Put keyframes on all the FK controls if key is true.
     if(key):
-        for target_key in targets_list:
-            pm.setKeyframe(local_fk_ctrls_dict[target_key], at=['translate', 'rotate'])
-            print ("Keying {}".format(local_fk_ctrls_dict[ctrl]))
+        with diag.span('key'):
+            for target_key in targets_list:
+                scene.set_key(binding.ctrl(target_key), ['translate', 'rotate'])
+                log.debug("Keying %s", binding.ctrl_names[target_key])
 
-    print ("Done.")
+    log.debug("Done.")
 
     return
 
 
+@diag.operation('ik_to_fk')
 def ik_to_fk(side=None, limb=None, fk_bones_dict=None, ik_ctrls_dict=None, key=True,
              foot_rot_comp=None, amp_pv=40.0, stump=False, namespace="", pole_direction=1):
     '''
@@ -125,130 +125,47 @@ def ik_to_fk(side=None, limb=None, fk_bones_dict=None, ik_ctrls_dict=None, key=T
         have it added as a prefix
     '''
 
-    # Prep the namespace
-    if(namespace != ""):
-        namespace = (namespace + ":")
-
     # Interally apply the constant due to the "mutable default args problem".
     if(fk_bones_dict is None):
-        local_fk_bones_dict = cons.INTERNAL_DEF_FK_JNTS.copy()
-    else:
-        local_fk_bones_dict = fk_bones_dict.copy()
-
+        fk_bones_dict = cons.INTERNAL_DEF_FK_JNTS
     if(ik_ctrls_dict is None):
-        local_ik_ctrls_dict = cons.INTERNAL_DEF_IK_CTRLS.copy()
-    else:
-        local_ik_ctrls_dict = ik_ctrls_dict.copy()
+        ik_ctrls_dict = cons.INTERNAL_DEF_IK_CTRLS
 
     if(foot_rot_comp is None):
         foot_rot_comp = (0, 0, 90)
 
     # Based on the limb string incoming, the following keys will be used in the dictionary.
-    if(limb == 'leg'):
-        targets_list = ['hip', 'ankle', 'knee', 'knee_pv']
-        clean_list = ['toe', 'ball', 'heel']
-        amp_pv *= 1.2  # Little extra distance for legs.
-    elif(limb == 'arm'):
-        clean_list = []
-        targets_list = ['shoulder', 'wrist', 'elbow', 'elbow_pv']
-    elif(limb == 'revFrleg'):
-        targets_list = ['rev_fr_hip', 'rev_fr_ankle', 'rev_fr_knee', 'rev_fr_knee_pv']
-    elif(limb == 'revBkleg'):
-        targets_list = ['rev_bk_hip', 'rev_bk_ankle', 'rev_bk_knee', 'rev_bk_knee_pv']
-    else:
+    if(limb not in IK_TARGET_KEYS):
         pm.warning("Must specific a limb with either 'leg' or 'arm'!")
         return
+    targets_list = IK_TARGET_KEYS[limb]
+    if(limb == 'leg'):
+        amp_pv *= 1.2  # Little extra distance for legs.
 
-    # Append the side flags
-
-    if(side is not None):
-        if(side.upper() in ['L', 'LEFT', 'L_', 'LFT', 'LT']):
-            side_token = cons.INTERNAL_SIDE_TOKENS['left']
-        elif(side.upper() in ['R', 'RIGHT', 'R_', 'RGT', 'RT']):
-            side_token = cons.INTERNAL_SIDE_TOKENS['right']
-        elif(side.upper() in ['C', 'CENTRE', 'CENTER', 'C_', 'CNT', 'CT']):
-            side_token = cons.INTERNAL_SIDE_TOKENS['centre']
-    else:
-        print("No side token given, assuming this is a centre-positioned or asymmetrical limb.")
-        side_token = ''
+    # Names and nodes come from the cached binding for this limb, only resolved the first time.
+    with diag.span('resolve'):
+        binding = bindings.get_binding(namespace, side, limb, fk_bones_dict, ik_ctrls_dict)
+        side_token = binding.side_token
 
     # Special check for difficult space check:
-    if(limb == 'arm'):
-        if(pm.objExists(namespace + side_token + local_ik_ctrls_dict['wrist'])):
-            wrist_node = pm.PyNode(namespace + side_token + local_ik_ctrls_dict['elbow_pv'])
-            print(dir(wrist_node))
-            if(wrist_node.IK_Hand_Crl_space.get() == True):
-                result = pm.confirmDialog(
-                    title='SR_Biped',
-                    message=("When Pole Vector\'s Space is set to IK_Hand_Crl_space, "
-                             "calculated result is not-exact."),
-                    button=['Match Anyway', 'Cancel'],
-                    defaultButton='OK',
-                    cancelButton='Cancel',
-                    dismissString='Cancel')
-
-                if result == 'Match Anyway':
-                    pass
-                else:
-                    pm.warning('User stopped the operation.')
-                    return
-
-    elif(limb == 'leg'):
-        if(pm.objExists(namespace + side_token + local_ik_ctrls_dict['ankle'])):
-            wrist_node = pm.PyNode(namespace + side_token + local_ik_ctrls_dict['knee_pv'])
-            print(dir(wrist_node))
-
-            # If the wrist node (in this case an ankle) has IK_Foot_Crl_space, then we warn about 
-            # match accuracy:
-            if(pm.hasAttr(wrist_node, 'IK_Foot_Crl')):
-                if(wrist_node.IK_Foot_Crl_space.get()):
-                    result = pm.confirmDialog(
-                        title='SR_Biped',
-                        message=("When Pole Vector\'s Space is set to IK_Foot_Crl_space, "
-                                 "calculated result is not-exact."),
-                        button=['Match Anyway', 'Cancel'],
-                        defaultButton='Match Anyway',
-                        cancelButton='Cancel',
-                        dismissString='Cancel')
-
-                    if result == 'Match Anyway':
-                        pass
-                    else:
-                        pm.warning('User stopped the operation.')
-                        return
-
-            else:
-                print("This doesn't appear to be a normal human foot.  Skipping toe alignment.")
-
-    # If we are dealing with a 'stump' we end calculation at the wrist joint or the ankle joint, no
-    # heel, toes, ball, etc.  We do this by getting rid of them from the dict so they won't be
-    # iterated over.
-    if(stump):
-        for key in ['ball', 'toe', 'heel']:
-            print("Ignoring {}".format(key))
-            local_ik_ctrls_dict.pop(key)
-
-    # Append the side token to all strings.
-    for bone in local_fk_bones_dict:
-        local_fk_bones_dict[bone] = (namespace + side_token + local_fk_bones_dict[bone])
-    print ("Side tokens added, joint references are:\n {}".format(local_fk_bones_dict))
-
-    for ctrl in local_ik_ctrls_dict:
-        local_ik_ctrls_dict[ctrl] = (namespace + side_token + local_ik_ctrls_dict[ctrl])
-    print ("Side tokens added, ctrl targets are:\n {}".format(local_ik_ctrls_dict))
+    if(not _confirm_pole_space(binding, limb)):
+        return
 
     # Get our nodes prepped.
-    topmost_target = pm.PyNode(local_fk_bones_dict[targets_list[0]])
-    endmost_target = pm.PyNode(local_fk_bones_dict[targets_list[1]])
-    middle_target = pm.PyNode(local_fk_bones_dict[targets_list[2]])
+    with diag.span('resolve'):
+        topmost_target = binding.bone(targets_list[0])
+        endmost_target = binding.bone(targets_list[1])
+        middle_target = binding.bone(targets_list[2])
 
-    topmost_ctrl = pm.PyNode(local_ik_ctrls_dict[targets_list[0]])
-    middle_ctrl = pm.PyNode(local_ik_ctrls_dict[targets_list[2]])
-    pole_vector = pm.PyNode(local_ik_ctrls_dict[targets_list[3]])
-    endmost_ctrl = pm.PyNode(local_ik_ctrls_dict[targets_list[1]])
+        topmost_ctrl = binding.ctrl(targets_list[0])
+        middle_ctrl = binding.ctrl(targets_list[2])
+        pole_vector = binding.ctrl(targets_list[3])
+        endmost_ctrl = binding.ctrl(targets_list[1])
 
     # Step one, match ik shoulder 1:1
-    pm.matchTransform(topmost_ctrl, topmost_target, pos=True, piv=True)
+    scene = backend.get()
+    with diag.span('write'):
+        scene.match_transform(topmost_ctrl, topmost_target, rotation=False, pivots=True)
 
     # Based on the calc style chosen, calculate where the PV should go based on the position of the
     # given FK bones.
@@ -257,25 +174,17 @@ def ik_to_fk(side=None, limb=None, fk_bones_dict=None, ik_ctrls_dict=None, key=T
     # then do the PV last.
 
     # Get the positions of these objects as dt.Vectors.
-    top_pos = dt.Vector(pm.xform(topmost_target, query=True, worldSpace=True, translation=True))
-    mid_pos = dt.Vector(pm.xform(middle_target, query=True, worldSpace=True, translation=True))
-    end_pos = dt.Vector(pm.xform(endmost_target, query=True, worldSpace=True, translation=True))
-
-    # Derive PV position using two vectors crossing, added together.
-    # Get directional vectors shooting from shoulder and wrist back at elbow.
-    line_a = end_pos - mid_pos
-    line_b = top_pos - mid_pos
-
-    # Normalize these values:
-    line_a.normalize()
-    line_b.normalize()
-
-    # Apply amplification value:
-    line_a *= amp_pv
-    line_b *= amp_pv
-
-    # A good positional vector for the pv is calculated.
-    pv_pos = (mid_pos - (line_a + line_b) * pole_direction)
+    with diag.span('query'):
+        top_pos = dt.Vector(scene.world_position(topmost_target))
+        mid_pos = dt.Vector(scene.world_position(middle_target))
+        end_pos = dt.Vector(scene.world_position(endmost_target))
+
+    # Derive PV position using two vectors crossing, added together.  The limb solver takes whole
+    # clips, here it's handed a single frame.
+    with diag.span('solve'):
+        pv_pos = dt.Vector(list(limb_solver.pole_vector_positions(
+            list(top_pos), list(mid_pos), list(end_pos),
+            amp_pv=amp_pv, pole_direction=pole_direction)[0]))
 
     # To stop these vectors from ever aiming inside by mistake, we can aim towards the middle_ctrl
     # and add some of that amplitude to make sure it moves out.
@@ -284,99 +193,255 @@ def ik_to_fk(side=None, limb=None, fk_bones_dict=None, ik_ctrls_dict=None, key=T
     # print(line_c)  '
 
     # pv_pos = (pv_pos + (line_c * amp_pv))
-    pm.xform(pole_vector, t=(pv_pos), ws=True)
+    with diag.span('write'):
+        scene.set_world_position(pole_vector, pv_pos)
 
-    # Last step: Put the rotation on the wrist.
-    # If not a leg, regular matchTransform is safe, as rig is likely build 1:1 with the parts.
-    if(limb == 'leg'):
-        pm.matchTransform(endmost_ctrl, endmost_target, pos=True, rot=True)
-
-        # Clean transforms off of toe, ball and heel, since the bones represent the match, and these
-        # handles will dirty the result.  If this is a stump, we don't bother with either.
-
-        if(stump is False):
-            print('Cleaning foot IK...')
-            print("clean list is {}.".format(clean_list))
-            print("Ik_ctrls dict is {}".format(local_ik_ctrls_dict))
-            for handle in clean_list:
-                print ("Getting node {}".format(local_ik_ctrls_dict[handle]))
-                clean_node = pm.PyNode(local_ik_ctrls_dict[handle])
-                clean_node.translate.set(0, 0, 0)
-                clean_node.rotate.set(0, 0, 0)
+        # Last step: Put the rotation on the wrist.
+        # If not a leg, regular matchTransform is safe, as rig is likely build 1:1 with the parts.
+        if(limb == 'leg'):
+            scene.match_transform(endmost_ctrl, endmost_target)
 
-        else:
-            print("This is a stump with no heel, ball or toe.")
-            pm.matchTransform(endmost_ctrl, endmost_target, pos=True, rot=True)
-
-        # Perform relative transform from new position against the joint-orient of the target, since
-        # the IK foot control is likely in world-space.
-        print ("Counter-rotating feet...")
-        if(side_token == cons.INTERNAL_SIDE_TOKENS['left']):
-            pm.xform(endmost_ctrl, r=True, os=True, ro=foot_rot_comp)
-        elif(side_token == cons.INTERNAL_SIDE_TOKENS['right']):
-            pass
-            pm.xform(
-                endmost_ctrl, r=True, os=True,
-                ro=(foot_rot_comp[0] - 180, foot_rot_comp[1], foot_rot_comp[2] % 360))
-        else:
-            pm.xform(endmost_ctrl, r=True, os=True, ro=foot_rot_comp)
-
-    elif 'rev' in limb:
-        print ("Counter-rotating reverse feet...")
-        if(side_token == cons.INTERNAL_SIDE_TOKENS['left']):
-            target_loc = pm.spaceLocator()
-            pm.parent(target_loc, endmost_target, r=1)
-            pm.xform(target_loc, r=1, ro=[0, 0, 90])
-            pm.matchTransform(endmost_ctrl, target_loc, pos=1, rot=1)
-            pm.delete(target_loc)
-            print("Left foot is counter rotated.")
-
-        elif(side_token == cons.INTERNAL_SIDE_TOKENS['right']):
-            target_loc = pm.spaceLocator()
-            pm.parent (target_loc, endmost_target, r=1)
-            pm.xform (target_loc, r=1, ro=[180, 0, 90])
-            pm.matchTransform(endmost_ctrl, target_loc, pos=1, rot=1)
-            pm.delete(target_loc)
-            print("Left foot is counter rotated.")
+            # Clean transforms off of toe, ball and heel, since the bones represent the match, and
+            # these handles will dirty the result.  If this is a stump, we don't bother with either.
 
-        else:
-           pm.xform(endmost_ctrl, r=True, os=True, ro=foot_rot_comp)
-           print("The foot is neither left or right, trying our best to comp it.")
+            if(stump is False):
+                log.debug('Cleaning foot IK...')
+                for handle in ['toe', 'ball', 'heel']:
+                    clean_name = binding.ctrl_names[handle]
+                    scene.set_attr(clean_name + '.translate', (0, 0, 0))
+                    scene.set_attr(clean_name + '.rotate', (0, 0, 0))
+
+            else:
+                log.debug("This is a stump with no heel, ball or toe.")
+                scene.match_transform(endmost_ctrl, endmost_target)
+
+            # Perform relative transform from new position against the joint-orient of the target,
+            # since the IK foot control is likely in world-space.
+            log.debug("Counter-rotating feet...")
+            scene.rotate_by(
+                endmost_ctrl, limb_solver.end_compensation(limb, side_token, foot_rot_comp))
+
+        elif 'rev' in limb:
+            log.debug("Counter-rotating reverse feet...")
+            if(side_token == cons.INTERNAL_SIDE_TOKENS['left']):
+                target_loc = pm.spaceLocator()
+                pm.parent(target_loc, endmost_target, r=1)
+                pm.xform(target_loc, r=1, ro=[0, 0, 90])
+                pm.matchTransform(endmost_ctrl, target_loc, pos=1, rot=1)
+                pm.delete(target_loc)
+                log.debug("Left foot is counter rotated.")
+
+            elif(side_token == cons.INTERNAL_SIDE_TOKENS['right']):
+                target_loc = pm.spaceLocator()
+                pm.parent (target_loc, endmost_target, r=1)
+                pm.xform (target_loc, r=1, ro=[180, 0, 90])
+                pm.matchTransform(endmost_ctrl, target_loc, pos=1, rot=1)
+                pm.delete(target_loc)
+                log.debug("Right foot is counter rotated.")
 
-    else:
-        pm.matchTransform(endmost_ctrl, endmost_target, pos=True, rot=True)
+            else:
+               scene.rotate_by(endmost_ctrl, foot_rot_comp)
+               log.info("The foot is neither left or right, trying our best to comp it.")
+
+        else:
+            scene.match_transform(endmost_ctrl, endmost_target)
 
 
-    # Last step is to get the orientation of the elbow control
-    pm.matchTransform(middle_ctrl, middle_target, rot=True)
+        # Last step is to get the orientation of the elbow control
+        scene.match_transform(middle_ctrl, middle_target, position=False)
 
-    # Put keyframes on all the IK controls if key is true.
+    # Put keyframes on all the IK controls if key is true.  Only the pole vector and end control
+    # carry the match, the rest are left as they were.
     if(key):
-        if (limb == 'leg'):
-            pm.setKeyframe(local_ik_ctrls_dict['knee_pv'], at=['translate'])
-            pm.setKeyframe(local_ik_ctrls_dict['ankle'], at=['translate', 'rotate'])
+        with diag.span('key'):
+            scene.set_key(pole_vector, ['translate'])
+            scene.set_key(endmost_ctrl, ['translate', 'rotate'])
+            log.debug("Keying %s and %s", pole_vector, endmost_ctrl)
 
-        elif (limb == 'arm'):
-            pm.setKeyframe(local_ik_ctrls_dict['elbow_pv'], at=['translate'])
-            pm.setKeyframe(local_ik_ctrls_dict['wrist'], at=['translate', 'rotate'])
+    log.debug("Done.")
 
-        elif (limb == 'revFrleg'):
-            pm.setKeyframe(local_ik_ctrls_dict['rev_fr_knee_pv'], at=['translate'])
-            pm.setKeyframe(local_ik_ctrls_dict['rev_fr_ankle'], at=['translate', 'rotate'])
+    return
 
-        elif (limb == 'revBkleg'):
-            pm.setKeyframe(local_ik_ctrls_dict['rev_bk_knee_pv'], at=['translate'])
-            pm.setKeyframe(local_ik_ctrls_dict['rev_bk_ankle'], at=['translate', 'rotate'])
 
-        print ("Keying {}".format(local_ik_ctrls_dict[ctrl]))
+@diag.operation('match_limbs')
+def match_limbs(matches, batch, foot_rot_comp=None, amp_pv=40.0, stump=False, pole_direction=1):
+    '''
+    Match many limbs, of any number of characters, on the current frame.  The bones and control
+    spaces of every limb are read in one query, every limb is solved, and the new translate and
+    rotate values go on batch, to be written together with whatever else it holds.
+
+    usage:
+    with attributes.AttrBatch('switch') as batch:
+        match_limbs([('ik_to_fk', 'char01:', 'L', 'arm', fk_bones, ik_ctrls)], batch)
 
-    print("Done.")
+    matches - list of (direction, namespace, side, limb, bones_dict, ctrls_dict) tuples.  direction
+        is 'fk_to_ik' to match as fk_to_ik() does, the dicts being the ik bones and fk controls, or
+        'ik_to_fk' to match as ik_to_fk() does, with the fk bones and ik controls.
+    batch - An attributes.AttrBatch to add the writes to.
+    foot_rot_comp, amp_pv, stump, pole_direction - See ik_to_fk().
 
-    return
+    The controls' own pivots, rotate axes and joint orients are taken to be zero, as they are on
+    the rig's controls.  Reverse legs are matched straight away by ik_to_fk(), their feet are
+    counter-rotated through locators.
 
+    Return value: the matches made, without any the user stopped.
+    '''
+
+    if(foot_rot_comp is None):
+        foot_rot_comp = (0, 0, 90)
 
+    # Each limb lists the plugs it reads, then solves from the matrices read for them.
+    plugs = []
+    solvers = []
+    made = []
+
+    def read(plug):
+        plugs.append(plug)
+        return len(plugs) - 1
+
+    with diag.span('resolve'):
+        for match in matches:
+            direction, namespace, side, limb, bones_dict, ctrls_dict = match
+            chain = FK_CHAIN_KEYS if direction == 'fk_to_ik' else IK_TARGET_KEYS
+            if(limb not in chain):
+                pm.warning("Must specific a limb with either 'leg' or 'arm'!")
+                continue
+            binding = bindings.get_binding(namespace, side, limb, bones_dict, ctrls_dict)
+
+            if(direction == 'fk_to_ik'):
+                solvers.append(_fk_to_ik_solver(binding, limb, read))
+            elif(not _confirm_pole_space(binding, limb)):
+                continue
+            elif('rev' in limb):
+                ik_to_fk(side, limb, bones_dict, ctrls_dict, key=False, foot_rot_comp=foot_rot_comp,
+                         amp_pv=amp_pv, stump=stump, namespace=namespace,
+                         pole_direction=pole_direction)
+            else:
+                solvers.append(_ik_to_fk_solver(
+                    binding, limb, read, foot_rot_comp, amp_pv, stump, pole_direction))
+            made.append(match)
+
+    if(not solvers):
+        return made
+
+    scene = backend.get()
+    with diag.span('query'):
+        matrices = _as_array(scene.matrices(plugs))
+
+        # The rotate order and rotation of every control that's turned, for the closest solution.
+        turned = sorted(set(ctrl for solver in solvers for ctrl in solver.turned))
+        values = scene.get_attrs(
+            [ctrl + attr for ctrl in turned for attr in ('.rotateOrder', '.rotate')])
+        rotations = dict(
+            (ctrl, (int(values[index * 2]), list(values[index * 2 + 1])))
+            for index, ctrl in enumerate(turned))
+
+    with diag.span('solve'):
+        for solver in solvers:
+            batch.set_many(solver(matrices, rotations))
+
+    return made
+
+
+def _fk_to_ik_solver(binding, limb, read):
+    # Each fk control onto it's ik bone.  A control parented under the one before it in the chain
+    # gets it's parent space from where that one is matched to.
+    keys = FK_CHAIN_KEYS[limb]
+    ctrls = [binding.ctrl(key) for key in keys]
+    names = [ctrl.name() for ctrl in ctrls]
+    chained = [False] + [
+        ctrls[i].longName().startswith(ctrls[i - 1].longName() + '|')
+        for i in range(1, len(ctrls))]
+
+    bones = [read(binding.bone_names[key] + '.worldMatrix[0]') for key in keys]
+    parents = [read(name + '.parentMatrix[0]') for name in names]
+    above = [read(names[i - 1] + '.worldMatrix[0]') if chained[i] else None
+             for i in range(len(names))]
+
+    def solve(matrices, rotations):
+        values = []
+        solved = []
+        for i, name in enumerate(names):
+            world = matrices[bones[i]]
+            parent = matrices[parents[i]]
+            if(chained[i]):
+                parent = parent.dot(np.linalg.inv(matrices[above[i]])).dot(solved[i - 1])
+            solved.append(world)
+            values.extend(_local_values(name, world.dot(np.linalg.inv(parent)), rotations))
+
+        return values
+
+    solve.turned = names
+
+    return solve
+
+
+def _ik_to_fk_solver(binding, limb, read, foot_rot_comp, amp_pv, stump, pole_direction):
+    # The top ik control onto the top bone, the pole vector out from the bones, the end control
+    # onto the end bone, counter-rotated, and the middle control turned like the middle bone.
+    top_key, end_key, mid_key, pv_key = IK_TARGET_KEYS[limb]
+    top, end, mid, pv = [binding.ctrl(key) for key in (top_key, end_key, mid_key, pv_key)]
+    if(limb == 'leg'):
+        amp_pv *= 1.2  # Little extra distance for legs, same as ik_to_fk().
+    compensation = limb_solver.end_compensation(limb, binding.side_token, foot_rot_comp)
+
+    bones = [read(binding.bone_names[key] + '.worldMatrix[0]')
+             for key in (top_key, mid_key, end_key)]
+    top_world = read(top.name() + '.worldMatrix[0]')
+    parents = [read(ctrl.name() + '.parentMatrix[0]') for ctrl in (top, mid, pv, end)]
+
+    # Controls under the top one move with it.
+    under_top = [ctrl.longName().startswith(top.longName() + '|') for ctrl in (top, mid, pv, end)]
+    cleaned = []
+    if(limb == 'leg' and not stump):
+        cleaned = [binding.ctrl_names[handle] for handle in ['toe', 'ball', 'heel']]
+
+    def solve(matrices, rotations):
+        top_bone, mid_bone, end_bone = [matrices[index] for index in bones]
+        moved = matrices[top_world].copy()
+        moved[3, :3] = top_bone[3, :3]
+        follow = np.linalg.inv(matrices[top_world]).dot(moved)
+        top_parent, mid_parent, pv_parent, end_parent = [
+            matrices[index].dot(follow) if under else matrices[index]
+            for index, under in zip(parents, under_top)]
+
+        pv_pos, end_worlds = limb_solver.solve_limb(
+            top_bone[3, :3], mid_bone[3, :3], end_bone, amp_pv=amp_pv,
+            pole_direction=pole_direction, compensation=compensation)
+
+        values = [
+            (top.name() + '.translate',
+             limb_solver.local_points(top_bone[3, :3], top_parent)[0].tolist()),
+            (pv.name() + '.translate', limb_solver.local_points(pv_pos, pv_parent)[0].tolist()),
+        ]
+        values.extend(_local_values(
+            end.name(), limb_solver.local_matrices(end_worlds, end_parent)[0], rotations))
+        values.extend(_local_values(
+            mid.name(), mid_bone.dot(np.linalg.inv(mid_parent)), rotations)[1:])
+        for name in cleaned:
+            values.append((name + '.translate', [0.0, 0.0, 0.0]))
+            values.append((name + '.rotate', [0.0, 0.0, 0.0]))
+
+        return values
+
+    solve.turned = [end.name(), mid.name()]
+
+    return solve
+
+
+def _local_values(name, local, rotations):
+    # translate and rotate writes for a local matrix, rotated the closest way to the control's
+    # current rotation.
+    rotate_order, previous = rotations[name]
+    rotate = transforms.euler_from_matrices(local, rotate_order, previous=previous)[0]
+
+    return [(name + '.translate', local[3, :3].tolist()), (name + '.rotate', rotate.tolist())]
+
+
+@diag.operation('bake_ik_to_fk')
 def bake_ik_to_fk(
-    side=None, limb=None, fk_bones_dict=None, ik_ctrls_dict=None, namespace="", stump=False
+    side=None, limb=None, fk_bones_dict=None, ik_ctrls_dict=None, namespace="", stump=False,
+    sampled=False, fast=True, optimize=False, sampling=None, frame_range=None
     ):
     '''
     bake_ik_to_fk
@@ -384,7 +449,18 @@ def bake_ik_to_fk(
     Matches the ik position to the fk animation, keying it over the selected frames.
 
     usage:
-    bake_ik_to_fk
+    bake_ik_to_fk(side=string(token), limb=string(token))
+    Use with a frame range selected.
+
+    sampled - When True, reads the whole range with time-context evaluation and writes the keys at
+        the end instead of stepping the time slider.  See sampled_ik_to_fk().
+    fast - Bake inside a suite.bake_session().  False bakes with the scene left as it is, which is
+        slower but gives the session something to measure it's savings against.
+    optimize - Euler filter and reduce the baked keys afterwards, see curves.optimize_curves().
+    sampling - Which frames to bake, a sampling.Sampling.  Defaults to every frame.  On keys samples
+        where the fk controls are keyed.
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
     '''
 
     # Interally apply the constant due to the "mutable default args problem".
@@ -393,32 +469,54 @@ def bake_ik_to_fk(
     if(ik_ctrls_dict is None):
         ik_ctrls_dict = cons.INTERNAL_DEF_IK_CTRLS.copy()
 
-    frame_range = su.frame_selection()
-    if(frame_range is False):
-        pm.error("Nothing was specified in the frame slider selection.")
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return
+    sources = bake_sources('ik_to_fk', side, limb, namespace)
+    frames = bake_frames(frame_range, sampling, sources=sources)
+    if(not frames):
+        pm.warning("The sampling gave no frames to bake.")
         return
+    diag.annotate(limb=limb, side=side, sampled=sampled, frames=len(frames),
+                  sampling=repr(sampling))
+
+    with su.bake_session('bake_ik_to_fk', frames=len(frames), evaluation=su.BAKE_EVALUATION,
+                         enabled=fast):
+        if(sampled):
+            sampled_ik_to_fk(
+                side=side, limb=limb, frames=frames,
+                fk_bones_dict=fk_bones_dict, ik_ctrls_dict=ik_ctrls_dict, namespace=namespace,
+                stump=stump)
 
-    # Move the time slider to the beginning of the selected range.
-    pm.currentTime(frame_range[0], edit=True)
+        else:
+            log.debug("Bones dict is %s", fk_bones_dict)
 
-    print("DEBUG: dict is {}".format(fk_bones_dict))
+            # Visit each frame the sampling gives.
+            for frame in frames:
+                pm.currentTime(frame, edit=True)
 
-    # Iterate through the frame range selected.
-    while(pm.currentTime(q=True) < frame_range[1]):
+                # Bake the ik controllers to the position the fk controls are on this frame:
+                ik_to_fk(
+                    side=side, limb=limb, key=True, fk_bones_dict=fk_bones_dict,
+                    ik_ctrls_dict=ik_ctrls_dict, namespace=namespace, stump=stump)
+                pm.refresh(cv=True)
 
-        # Bake the ik controllers to the position the fk controls are on this frame:
-        ik_to_fk(
-            side=side, limb=limb, key=True, fk_bones_dict=fk_bones_dict,
-            ik_ctrls_dict=ik_ctrls_dict, namespace=namespace, stump=stump)
-        next_frame = (pm.currentTime(q=True) + 1)
-        pm.currentTime(next_frame, edit=True)
-        pm.refresh(cv=True)
+        if(optimize and limb in IK_TARGET_KEYS):
+            # Only the pole vector and end control carry keys from the match.
+            binding = bindings.get_binding(namespace, side, limb, fk_bones_dict, ik_ctrls_dict)
+            curves.optimize_curves(
+                [binding.ctrl(IK_TARGET_KEYS[limb][3]), binding.ctrl(IK_TARGET_KEYS[limb][1])],
+                time_range=(frames[0], frames[-1]))
 
-    print ("Done.")
+    log.debug("Done.")
 
 
+@diag.operation('bake_fk_to_ik')
 def bake_fk_to_ik(
-    side=None, limb=None, ik_bones_dict=None, fk_ctrls_dict=None, namespace="", stump=False
+    side=None, limb=None, ik_bones_dict=None, fk_ctrls_dict=None, namespace="", stump=False,
+    sampled=False, fast=True, optimize=False, sampling=None, frame_range=None
     ):
     '''
     bake_fk_to_ik
@@ -428,6 +526,16 @@ def bake_fk_to_ik(
     usage:
     bake_fk_to_ik(side=string(token), limb=string(token))
     Use with a frame range selected.
+
+    sampled - When True, reads the whole range with time-context evaluation and writes the keys at
+        the end instead of stepping the time slider.  See sampled_fk_to_ik().
+    fast - Bake inside a suite.bake_session().  False bakes with the scene left as it is, which is
+        slower but gives the session something to measure it's savings against.
+    optimize - Euler filter and reduce the baked keys afterwards, see curves.optimize_curves().
+    sampling - Which frames to bake, a sampling.Sampling.  Defaults to every frame.  On keys samples
+        where the ik controls are keyed.
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
     '''
 
     # Assign defaults like so to dodge the mutable default argument issue:
@@ -436,30 +544,415 @@ def bake_fk_to_ik(
     if(fk_ctrls_dict is None):
         fk_ctrls_dict = cons.INTERNAL_DEF_FK_CTRLS.copy()
 
-    frame_range = su.frame_selection()
-    if(frame_range is False):
-        pm.error("Nothing was specified in the frame slider selection.")
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return
+    sources = bake_sources('fk_to_ik', side, limb, namespace)
+    frames = bake_frames(frame_range, sampling, sources=sources)
+    if(not frames):
+        pm.warning("The sampling gave no frames to bake.")
+        return
+    diag.annotate(limb=limb, side=side, sampled=sampled, frames=len(frames),
+                  sampling=repr(sampling))
+
+    with su.bake_session('bake_fk_to_ik', frames=len(frames), evaluation=su.BAKE_EVALUATION,
+                         enabled=fast):
+        if(sampled):
+            sampled_fk_to_ik(
+                side=side, limb=limb, frames=frames,
+                ik_bones_dict=ik_bones_dict, fk_ctrls_dict=fk_ctrls_dict, namespace=namespace)
+
+        else:
+            # Visit each frame the sampling gives.
+            for frame in frames:
+                pm.currentTime(frame, edit=True)
+
+                # Bake the fk controllers to the position the fk controls are on this frame:
+                # (fk_to_ik has no notion of stumps, so that flag isn't passed along.)
+                fk_to_ik(
+                    side=side, limb=limb, key=True, ik_bones_dict=ik_bones_dict, 
+                    fk_ctrls_dict=fk_ctrls_dict, namespace=namespace)
+                pm.refresh(cv=True)
+
+        if(optimize and limb in FK_CHAIN_KEYS):
+            binding = bindings.get_binding(namespace, side, limb, ik_bones_dict, fk_ctrls_dict)
+            curves.optimize_curves(
+                [binding.ctrl(key) for key in FK_CHAIN_KEYS[limb]],
+                time_range=(frames[0], frames[-1]))
+
+    log.debug("Done.")
+
+    return
+
+
+def bake_frames(frame_range, sampling=None, sources=None):
+    '''
+    bake_frames
+
+    The frames a bake visits for a given range.  Stepping and sampled bakes both use this, so both
+    modes key the same frames.
+
+    frame_range - (start, end) tuple as returned by suite.frame_selection(), end one past the last
+        highlighted frame.
+    sampling - a sampling.Sampling, defaults to every frame up to the last highlighted one.
+    sources - nodes whose keys an on keys sampling reads, when it doesn't name it's own.
+
+    Return value: list of frame numbers.
+    '''
+
+    if(sampling is None):
+        sampling = smp.every(1)
+
+    return sampling.resolve(frame_range, sources=sources)
+
+
+def bake_sources(direction, side=None, limb=None, namespace=""):
+    '''
+    bake_sources
+
+    The controls carrying the animation a bake matches, whose keys an on keys sampling reads: the
+    fk controls for 'ik_to_fk' and the ik controls for 'fk_to_ik'.
+
+    Return value: list of control names.
+    '''
+
+    if(direction == 'ik_to_fk'):
+        return _source_ctrls(
+            namespace, side, FK_CHAIN_KEYS.get(limb, []), cons.INTERNAL_DEF_FK_CTRLS)
+
+    return _source_ctrls(namespace, side, IK_TARGET_KEYS.get(limb, []), cons.INTERNAL_DEF_IK_CTRLS)
+
+
+def bake_targets(direction, side=None, limb=None, namespace=""):
+    '''
+    bake_targets
+
+    The controls a bake keys: the pole vector and end ik controls for 'ik_to_fk' and the fk
+    controls for 'fk_to_ik'.
+
+    Return value: list of control names, the pole vector first for 'ik_to_fk'.
+    '''
+
+    if(direction == 'ik_to_fk'):
+        keys = [IK_TARGET_KEYS[limb][3], IK_TARGET_KEYS[limb][1]] if limb in IK_TARGET_KEYS else []
+        return _source_ctrls(namespace, side, keys, cons.INTERNAL_DEF_IK_CTRLS)
+
+    return _source_ctrls(namespace, side, FK_CHAIN_KEYS.get(limb, []), cons.INTERNAL_DEF_FK_CTRLS)
+
+
+def sample_matrices(plugs, frames):
+    '''
+    sample_matrices
+
+    Read matrix plugs on every given frame using time-context evaluation, so the current time never
+    moves and the viewport never redraws.  Every plug is read in one context per frame, rather
+    than one per plug per frame.
+
+    plugs - list of matrix plug names, ie 'L_armUprFK_drv.worldMatrix[0]'
+    frames - list of frame numbers.
+
+    Return value: dict of plug name to a list of dt.Matrix, one per frame.
+    '''
+
+    samples = dict((plug, []) for plug in plugs)
+    scene = backend.get()
+
+    for frame in frames:
+        for plug, matrix in zip(plugs, scene.matrices(plugs, time=frame)):
+            samples[plug].append(dt.Matrix(matrix))
+
+    return samples
+
+
+@diag.operation('sampled_fk_to_ik')
+def sampled_fk_to_ik(side=None, limb=None, frames=None, ik_bones_dict=None, fk_ctrls_dict=None,
+                     namespace=""):
+    '''
+    sampled_fk_to_ik
+
+    The sampled counterpart of fk_to_ik() over a list of frames.  The ik bones and the parents of
+    the fk controls are read on every frame in one evaluation pass, every frame is solved, and then
+    all the keys are written at the end.  The current time is never changed.
+
+    An fk control parented under the previous control in the chain gets its parent space from the
+    solved result of that control, with the offset between them read once on the first frame.
+    Offset groups between fk controls are expected not to be animated.
+
+    usage:
+    sampled_fk_to_ik(side=string(token), limb=string(token), frames=[list of frames])
+    '''
+
+    if(not frames):
+        pm.warning("No frames were given to bake.")
+        return
+
+    if(limb not in FK_CHAIN_KEYS):
+        pm.warning("Must specific a limb with either 'leg' or 'arm'!")
+        return
+
+    if(ik_bones_dict is None):
+        ik_bones_dict = cons.INTERNAL_DEF_IK_JNTS
+    if(fk_ctrls_dict is None):
+        fk_ctrls_dict = cons.INTERNAL_DEF_FK_CTRLS
+
+    with diag.span('resolve'):
+        binding = bindings.get_binding(namespace, side, limb, ik_bones_dict, fk_ctrls_dict)
+        targets_list = FK_CHAIN_KEYS[limb]
+        bones = [binding.bone(key) for key in targets_list]
+        ctrls = [binding.ctrl(key) for key in targets_list]
+
+    # Each control is either parented under the one before it in the chain, or it's parent is left
+    # alone by this bake and can simply be sampled.
+    chained = [False] + [
+        ctrls[i].longName().startswith(ctrls[i - 1].longName() + '|')
+        for i in range(1, len(ctrls))]
+
+    with diag.span('query'):
+        plugs = [bone.name() + '.worldMatrix[0]' for bone in bones]
+        plugs += [ctrl.name() + '.parentMatrix[0]' for ctrl in ctrls]
+        samples = sample_matrices(plugs, frames)
+
+        # Static offsets from each chained control's parent to the control above it.
+        offsets = {}
+        above = [ctrls[i - 1].name() + '.worldInverseMatrix[0]'
+                 for i in range(len(ctrls)) if chained[i]]
+        inverses = iter(backend.get().matrices(above, time=frames[0]) if above else [])
+        for i, ctrl in enumerate(ctrls):
+            if(chained[i]):
+                parent_matrix = samples[ctrl.name() + '.parentMatrix[0]'][0]
+                offsets[i] = parent_matrix * dt.Matrix(next(inverses))
+
+    # Solve every frame before writing anything.
+    with diag.span('solve'):
+        channels = dict((ctrl.name(), []) for ctrl in ctrls)
+        rotate_orders = [ctrl.rotateOrder.get() for ctrl in ctrls]
+        previous = [None] * len(ctrls)
+
+        for frame_index in range(len(frames)):
+            solved_world = []
+            for i, ctrl in enumerate(ctrls):
+                world = samples[bones[i].name() + '.worldMatrix[0]'][frame_index]
+                if(chained[i]):
+                    parent = offsets[i] * solved_world[i - 1]
+                else:
+                    parent = samples[ctrl.name() + '.parentMatrix[0]'][frame_index]
+                solved_world.append(world)
+
+                translate, rotate = _local_channels(
+                    world * parent.inverse(), rotate_orders[i], previous[i])
+                previous[i] = rotate
+                channels[ctrl.name()].append(list(translate) + _degrees(rotate))
+
+    with diag.span('key'):
+        for ctrl in ctrls:
+            _key_channels(ctrl, TRANSFORM_CHANNELS, frames, channels[ctrl.name()])
+
+    log.debug("Done.")
+
+    return
+
+
+@diag.operation('sampled_ik_to_fk')
+def sampled_ik_to_fk(side=None, limb=None, frames=None, fk_bones_dict=None, ik_ctrls_dict=None,
+                     foot_rot_comp=None, amp_pv=40.0, stump=False, namespace="", pole_direction=1):
+    '''
+    sampled_ik_to_fk
+
+    The sampled counterpart of ik_to_fk() over a list of frames.  The fk bones and the parents of
+    the ik controls are read on every frame in one evaluation pass, the pole vector and end control
+    are solved for every frame, and then all the keys are written at the end.  The current time is
+    never changed.
+
+    Only the channels ik_to_fk() keys are written: translate on the pole vector, translate and
+    rotate on the end control.  The parents of those controls are expected not to be driven by the
+    limb being baked-- the same IK_Hand_Crl_space/IK_Foot_Crl_space caveat ik_to_fk() warns about.
+
+    usage:
+    sampled_ik_to_fk(side=string(token), limb=string(token), frames=[list of frames])
+    '''
+
+    if(not frames):
+        pm.warning("No frames were given to bake.")
         return
 
-    # Move the time slider to the beginning of the selected range.
-    pm.currentTime(frame_range[0], edit=True)
+    if(limb not in IK_TARGET_KEYS):
+        pm.warning("Must specific a limb with either 'leg' or 'arm'!")
+        return
 
-    # Iterate through the frame range selected.
-    while(pm.currentTime(q=True) < frame_range[1]):
+    if(fk_bones_dict is None):
+        fk_bones_dict = cons.INTERNAL_DEF_FK_JNTS
+    if(ik_ctrls_dict is None):
+        ik_ctrls_dict = cons.INTERNAL_DEF_IK_CTRLS
+    if(foot_rot_comp is None):
+        foot_rot_comp = (0, 0, 90)
 
-        # Bake the fk controllers to the position the fk controls are on this frame:
-        fk_to_ik(
-            side=side, limb=limb, key=True, ik_bones_dict=ik_bones_dict, 
-            fk_ctrls_dict=fk_ctrls_dict, namespace=namespace, stump=stump)
-        next_frame = (pm.currentTime(q=True) + 1)
-        pm.currentTime(next_frame, edit=True)
-        pm.refresh(cv=True)
+    if(limb == 'leg'):
+        amp_pv *= 1.2  # Little extra distance for legs, same as ik_to_fk().
+
+    with diag.span('resolve'):
+        binding = bindings.get_binding(namespace, side, limb, fk_bones_dict, ik_ctrls_dict)
+        top_key, end_key, mid_key, pv_key = IK_TARGET_KEYS[limb]
+
+        top_bone = binding.bone(top_key)
+        mid_bone = binding.bone(mid_key)
+        end_bone = binding.bone(end_key)
+        pole_vector = binding.ctrl(pv_key)
+        end_ctrl = binding.ctrl(end_key)
+
+    # Heel, ball and toe would dirty the result, they are cleaned once up front.
+    with diag.span('write'):
+        if(limb == 'leg' and not stump):
+            for handle in ['toe', 'ball', 'heel']:
+                clean_node = binding.ctrl(handle)
+                clean_node.translate.set(0, 0, 0)
+                clean_node.rotate.set(0, 0, 0)
 
-    print ("Done.")
+    compensation = limb_solver.end_compensation(limb, binding.side_token, foot_rot_comp)
+
+    with diag.span('query'):
+        plugs = [bone.name() + '.worldMatrix[0]' for bone in [top_bone, mid_bone, end_bone]]
+        plugs += [ctrl.name() + '.parentMatrix[0]' for ctrl in [pole_vector, end_ctrl]]
+        samples = sample_matrices(plugs, frames)
+
+    # Solve every frame in one go before writing anything.
+    with diag.span('solve'):
+        pv_pos, end_worlds = limb_solver.solve_limb(
+            _as_array(samples[top_bone.name() + '.worldMatrix[0]'])[:, 3, :3],
+            _as_array(samples[mid_bone.name() + '.worldMatrix[0]'])[:, 3, :3],
+            _as_array(samples[end_bone.name() + '.worldMatrix[0]']),
+            amp_pv=amp_pv, pole_direction=pole_direction, compensation=compensation)
+
+        pv_channels = limb_solver.local_points(
+            pv_pos, _as_array(samples[pole_vector.name() + '.parentMatrix[0]'])).tolist()
+        end_locals = limb_solver.local_matrices(
+            end_worlds, _as_array(samples[end_ctrl.name() + '.parentMatrix[0]']))
+
+        end_channels = []
+        end_rotate_order = end_ctrl.rotateOrder.get()
+        previous = None
+        for local in end_locals:
+            translate, rotate = _local_channels(
+                dt.Matrix(local.tolist()), end_rotate_order, previous)
+            previous = rotate
+            end_channels.append(list(translate) + _degrees(rotate))
+
+    with diag.span('key'):
+        _key_channels(pole_vector, TRANSFORM_CHANNELS[:3], frames, pv_channels)
+        _key_channels(end_ctrl, TRANSFORM_CHANNELS, frames, end_channels)
+
+    log.debug("Done.")
 
     return
 
 
+def _confirm_pole_space(binding, limb):
+    '''
+    Ask the user whether to go on when the limb's pole vector follows the end control, the one
+    space an ik match can't land exactly.
+
+    Return value: False if the user stopped the match.
+    '''
+
+    if(limb == 'arm'):
+        if(binding.has_ctrl('wrist')):
+            wrist_node = binding.ctrl('elbow_pv')
+            if(wrist_node.IK_Hand_Crl_space.get() == True):
+                result = pm.confirmDialog(
+                    title='SR_Biped',
+                    message=("When Pole Vector\'s Space is set to IK_Hand_Crl_space, "
+                             "calculated result is not-exact."),
+                    button=['Match Anyway', 'Cancel'],
+                    defaultButton='OK',
+                    cancelButton='Cancel',
+                    dismissString='Cancel')
+
+                if result == 'Match Anyway':
+                    pass
+                else:
+                    pm.warning('User stopped the operation.')
+                    return False
+
+    elif(limb == 'leg'):
+        if(binding.has_ctrl('ankle')):
+            wrist_node = binding.ctrl('knee_pv')
+
+            # If the wrist node (in this case an ankle) has IK_Foot_Crl_space, then we warn about 
+            # match accuracy:
+            if(pm.hasAttr(wrist_node, 'IK_Foot_Crl')):
+                if(wrist_node.IK_Foot_Crl_space.get()):
+                    result = pm.confirmDialog(
+                        title='SR_Biped',
+                        message=("When Pole Vector\'s Space is set to IK_Foot_Crl_space, "
+                                 "calculated result is not-exact."),
+                        button=['Match Anyway', 'Cancel'],
+                        defaultButton='Match Anyway',
+                        cancelButton='Cancel',
+                        dismissString='Cancel')
+
+                    if result == 'Match Anyway':
+                        pass
+                    else:
+                        pm.warning('User stopped the operation.')
+                        return False
+
+            else:
+                log.debug(
+                    "This doesn't appear to be a normal human foot.  Skipping toe alignment.")
+
+    return True
+
+
+def _source_ctrls(namespace, side, keys, ctrls_dict):
+    '''
+    Names of the controls a bake reads it's animation from, for on keys sampling.
+    '''
+
+    prefix = bindings.name_prefix(namespace, bindings.side_token(side))
+
+    return [prefix + ctrls_dict[key] for key in keys if key in ctrls_dict]
+
+
+def _as_array(matrices):
+    '''
+    Stack a list of dt.Matrix samples into an (N, 4, 4) array for the limb solver.
+    '''
+
+    return np.array([[list(row) for row in matrix] for matrix in matrices], dtype=float)
+
+
+def _local_channels(matrix, rotate_order, previous=None):
+    '''
+    Decompose a local matrix into translate and an EulerRotation in the given rotate order, picking
+    the solution closest to the previous frame's rotation when there is one.
+    '''
+
+    transformation = dt.TransformationMatrix(matrix)
+    translate = transformation.getTranslation('transform')
+    rotate = transformation.eulerRotation()
+    rotate.reorderIt(ROTATE_ORDERS[rotate_order])
+    if(previous is not None):
+        rotate = rotate.closestSolution(previous)
+
+    return translate, rotate
+
+
+def _degrees(rotate):
+    return [math.degrees(rotate.x), math.degrees(rotate.y), math.degrees(rotate.z)]
+
+
+def _key_channels(node, attributes, frames, values):
+    '''
+    Write one key per frame on each attribute.  values is a list per frame, ordered like attributes.
+    '''
+
+    scene = backend.get()
+    for channel_index, attribute in enumerate(attributes):
+        scene.set_keys(
+            node, attribute, frames, [frame_values[channel_index] for frame_values in values])
+
+
 def safe_snap(subject_node, target_node, trans=True, rot=True):
     '''
     safe_snap
@@ -472,16 +965,17 @@ def safe_snap(subject_node, target_node, trans=True, rot=True):
     safe_snap(subject_node=PyNode, target_node=PyNode)
     '''
 
-    print ("Performing a hard match of {} to {}.".format(subject_node, target_node))
+    log.debug("Performing a hard match of %s to %s.", subject_node, target_node)
 
     # Get details from the target_node.
-    target_rot = pm.xform(target_node, q=True, ws=True, ro=True)
-    target_trans = pm.xform(target_node, q=True, ws=True, t=True)
+    scene = backend.get()
+    target_rot = scene.world_rotation(target_node)
+    target_trans = scene.world_position(target_node)
 
     # I've been warned about the ws flags behaving deceptively.
     if(trans):
-        pm.xform(subject_node, ws=True, t=target_trans)
+        scene.set_world_position(subject_node, target_trans)
     if(rot):
-        pm.xform(subject_node, ws=True, ro=target_rot)
+        scene.set_world_rotation(subject_node, target_rot)
 
     return
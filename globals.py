@@ -7,7 +7,8 @@ Global settings to be read across modules.
 srsu_version = "0.1.04pre"
 
 
-# Thinking of depricating this-- The stuff in the constants module is better.
+# Thinking of depricating this-- The stuff in the constants module is better, and the names of
+# each rig variant are in the naming profiles now (see naming.py).
 NAME_STANDARD = {
     'ik_arm':{
         'shoulder_ctrl':'shoulder_Ctrl',
@@ -4,27 +4,47 @@ humanik.py
 For automated interactions between HumanIK and our rigging standard.
 '''
 
-import pymel.core as pm
-import pymel.core.datatypes as dt
+import attributes
+import backend
 import constants as cns
+import curves
+import diagnostics as diag
+import lazy
 import namespaces as nm
-import maya.mel as mel
+import registry
+import sampling as smp
+import suite as su
 
+pm = lazy.module('pymel.core')
+dt = lazy.module('pymel.core.datatypes')
+mel = lazy.module('maya.mel')
 
-def duplicate_skeleton(prefix='hik_', ns=''):
+
+log = diag.get_logger('humanik')
+pm = diag.counted_module(pm)
+
+
+def duplicate_skeleton(prefix='hik_', ns=None):
     '''
     Duplicates the entire skeleton of the in-scene rig with new prefixes. (Initially for the purpose
     of making HIK-characterizable skeletons.
+
+    ns - namespace of the rig, with it's ':', '' for a rig without one.  If None, it's taken from
+        the selection.
     '''
 
     # Adjust namespace as a string.
-    if(ns == ''):
-        if(len(pm.ls(sl=True)) == 1):
-            if(':' not in pm.ls(sl=True)[0]):
+    if(ns is None):
+        selection = pm.ls(sl=True)
+        if(len(selection) == 1):
+            rig = registry.rig_for(selection[0])
+            if(rig is None):
+                pm.error('The selection is not part of a rig in the scene.')
+                return
+            ns = rig.namespace
+            if(ns == ''):
                 pm.warning("You are working without a namespace right now...")
-            else:
-                ns = pm.ls(sl=True)[0].name().split(':')[0] + ':'
-                print('name space is:{}'.format(ns))
+            log.debug('name space is:%s', ns)
         else:
             pm.error('A selection is required to isolate the rig we are running on.')
             return
@@ -67,12 +87,17 @@ def characterize_skeleton():
     # ToggleCharacterControls;
     # hikCreateDefinition;
     # hikOnSwitchContextualTabs;
-    mel.eval ('loadPlugin "mayaHIK";ToggleCharacterControls;hikCreateDefinition;'
-        'hikOnSwitchContextualTabs;')
+    # The character controls and contextual tabs are UI, and aren't there in a batch session.
+    if(pm.about(batch=True)):
+        mel.eval('loadPlugin "mayaHIK";hikCreateDefinition;')
+    else:
+        mel.eval('loadPlugin "mayaHIK";ToggleCharacterControls;hikCreateDefinition;'
+            'hikOnSwitchContextualTabs;')
 
-    for joint_name, fbIkIndex in cns.HIK_CHARACTERIZE_MAP.iteritems():
-        print("joint name: {}\nfbIkIndex: {}\nCurrent Character:{}".format(
-            joint_name, fbIkIndex, mel.eval('hikGetCurrentCharacter();')))
+    for joint_name, fbIkIndex in cns.HIK_CHARACTERIZE_MAP.items():
+        log.debug(
+            "joint name: %s\nfbIkIndex: %s\nCurrent Character:%s",
+            joint_name, fbIkIndex, mel.eval('hikGetCurrentCharacter();'))
         mel.eval('setCharacterObject("{}","{}",{},0);'.format(
             cns.HIK_PREFIX + joint_name, mel.eval('hikGetCurrentCharacter();'), fbIkIndex))
 
@@ -81,7 +106,8 @@ def constrain_skeleton(ns=''):
     '''
     constrain the existing HIK skeleton (likely created from a duplication.)
 
-    Constraint mapping is data driven, function runs in place.
+    Constraint mapping is data driven, function runs in place.  If a constraint can't be made, the
+    ones made before it are deleted before the error is raised.
     '''
 
     # First do a quick check to see if at least a trajectory joint exists with the prefix.
@@ -94,23 +120,31 @@ def constrain_skeleton(ns=''):
 
     constraints_list = []
 
-    for body_part in cns.CONSTRAINT_MAPPING.items():
-        mirror = False
-        print("Setting up constraints on {}...".format(body_part[0]))
-        if(body_part[0] in ['arm', 'leg']):
-            print("{} is a mirrored bodypart.".format(body_part[0]))
-            mirror = True
-        else:
-            print("{} is not a mirrored body part.".format(body_part[0]))
+    try:
+        for body_part in cns.CONSTRAINT_MAPPING.items():
             mirror = False
-        
-        if(mirror):
-            for side in ['L_', 'R_']:
+            log.debug("Setting up constraints on %s...", body_part[0])
+            if(body_part[0] in ['arm', 'leg']):
+                log.debug("%s is a mirrored bodypart.", body_part[0])
+                mirror = True
+            else:
+                log.debug("%s is not a mirrored body part.", body_part[0])
+                mirror = False
+
+            if(mirror):
+                for side in ['L_', 'R_']:
+                    for ctrl in body_part[1].items():
+                        constraints_list.append(constraint_by_mapping(ctrl, side=side, ns=ns))
+            else:
                 for ctrl in body_part[1].items():
-                    constraints_list.append(constraint_by_mapping(ctrl, side=side, ns=ns))
-        else:
-            for ctrl in body_part[1].items():
-                constraints_list.append(constraint_by_mapping(ctrl, side='C_', ns=ns))
+                    constraints_list.append(constraint_by_mapping(ctrl, side='C_', ns=ns))
+
+    except Exception:
+        # Left behind, the constraints made so far would go on driving their controls.
+        log.debug("Deleting the constraints made before the failure: %s", constraints_list)
+        if(constraints_list):
+            pm.delete(constraints_list)
+        raise
 
     return constraints_list
                     
@@ -132,7 +166,7 @@ def constraint_by_mapping(map_dict, side='', ns=''):
         side = ''
     target = (cns.HIK_PREFIX + side + map_dict[1]['target'])
 
-    print('c_type is {} from {} to {}.  Building...'.format(c_type, ctrl, target))
+    log.debug('c_type is %s from %s to %s.  Building...', c_type, ctrl, target)
 
     if(c_type == 'parent'):
         new_constraint = pm.parentConstraint(target, ctrl, mo=False)
@@ -148,85 +182,152 @@ def constraint_by_mapping(map_dict, side='', ns=''):
         pm.error("A bad type value was given: {}".format(c_type))
         return
 
-    print("Controls constrained.")
+    log.debug("Controls constrained.")
 
     return new_constraint
 
 
-def setup():
+def setup(ns=None):
     '''
     set up the HIK bind process.
+
+    ns - namespace of the rig, with it's ':'.  If None, it's taken from the selection.
     '''
 
-    ns = nm.from_selection()
+    if(ns is None):
+        ns = nm.from_selection()
 
-    # Change the rig attrs:
-    for attr in cns.HIK_ATTRIBUTE_SETTINGS.items():
-        pm.setAttr(ns + attr[0], attr[1])
+    # Change the rig attrs, all in one go:
+    with attributes.AttrBatch('hik_setup') as batch:
+        for plug, value in cns.HIK_ATTRIBUTE_SETTINGS.items():
+            batch.set(ns + plug, value)
 
-    print('Making a duplicate skeleton...')
+    log.info('Making a duplicate skeleton...')
     duplicate_skeleton(ns=ns)
-    print('Duplicate has been created in scene.')
-    print('Characterizing skeleton...')
+    log.info('Duplicate has been created in scene.')
+    log.info('Characterizing skeleton...')
     characterize_skeleton()
-    print('Duplicate skeleton has been characterized for HIK.\nBring in your animation FBX and '
+    log.info('Duplicate skeleton has been characterized for HIK.\nBring in your animation FBX and '
         'position it now.')
 
     return
 
 
-def bake():
+def mapped_controls(ns=''):
     '''
-    Bake the HIK animation onto the controllers of the rig selected.
+    Names of every control the constraint mapping in constants drives, ready to key.
     '''
 
-    ns = nm.from_selection()
-    constraints_list = constrain_skeleton(ns=ns)
-
-    playBackSlider = mel.eval('$tmpVar=$gPlayBackSlider')
-    frame_range = pm.timeControl(playBackSlider, q=True, ra=True)
-
-    # Move the time slider to the beginning of the selected range.
-    pm.currentTime(frame_range[0], edit=True)
-
     ctrl_to_key = []
-    mirror = False
     for body_part in cns.CONSTRAINT_MAPPING.items():
-        mirror = False
         if(body_part[0] in ['arm', 'leg']):
-            print("{} is a mirrored bodypart.".format(body_part[0]))
-            mirror = True
-        else:
-            print("{} is not a mirrored body part.".format(body_part[0]))
-            mirror = False
-        
-        if(mirror):
+            log.debug("%s is a mirrored bodypart.", body_part[0])
             for side in ['L_', 'R_']:
                 for ctrl in body_part[1].items():
                     ctrl_to_key.append(ns + side + ctrl[0])
         else:
+            log.debug("%s is not a mirrored body part.", body_part[0])
             for ctrl in body_part[1].items():
                 if(ctrl[0] != 'Cog_Ctrl'):
                     ctrl_to_key.append(ns + "C_" + ctrl[0])
                 else:
                     ctrl_to_key.append(ns + ctrl[0])
-                
-    print("Control list: {}".format(ctrl_to_key))
 
-    # Iterate through the frame range selected.
-    while(pm.currentTime(q=True) < frame_range[1]):
+    return ctrl_to_key
 
-        for ctrl in ctrl_to_key:
-            # Key things!
-            pm.setKeyframe(ctrl_to_key, at=['translate', 'rotate'])
 
-        next_frame = (pm.currentTime(q=True) + 1)
-        pm.currentTime(next_frame, edit=True)
-        pm.refresh(cv=True)
+def mapped_targets():
+    '''
+    Names of the HIK skeleton joints the constraint mapping drives the controls from.
+    '''
 
-    print("Deleting constraints: {}".format(constraints_list))
-    pm.delete(constraints_list)
+    targets = []
+    for body_part, mapping in cns.CONSTRAINT_MAPPING.items():
+        sides = ['L_', 'R_'] if body_part in ['arm', 'leg'] else ['']
+        for side in sides:
+            for ctrl in mapping.items():
+                targets.append(cns.HIK_PREFIX + side + ctrl[1]['target'])
 
-    
+    return targets
+
+
+@diag.operation('humanik_bake')
+def bake(bulk=True, step=1, optimize=False, ns=None, frame_range=None, sampling=None,
+         constraints=None):
+    '''
+    Bake the HIK animation onto the controllers of the rig selected.
+
+    bulk - Key the whole range in one bakeResults call, and a second for the last frame when the
+        step doesn't land on it.  False steps the time slider and keys frame by frame, as the tool
+        used to.  Samplings that aren't evenly spaced always step.
+    step - Bake every step frames.  Ignored when a sampling is given.
+    optimize - Euler filter and reduce the baked keys afterwards, see curves.optimize_curves().
+    ns - namespace of the rig, with it's ':'.  If None, it's taken from the selection.
+    frame_range - (start, end) to bake, end not included.  If None, the time slider's selected
+        range is used.  Batch sessions have no time slider, so they must give one.
+    sampling - Which frames to bake, a sampling.Sampling.  On keys samples where the HIK skeleton
+        is keyed.
+    constraints - The constraints from constrain_skeleton() when the rig is already constrained,
+        ie for many bakes in a row.  They're left for the caller to delete.  If None, the rig is
+        constrained for this bake only.
+    '''
 
+    if(ns is None):
+        ns = nm.from_selection()
 
+    if(frame_range is None):
+        playBackSlider = mel.eval('$tmpVar=$gPlayBackSlider')
+        frame_range = pm.timeControl(playBackSlider, q=True, ra=True)
+
+    if(sampling is None):
+        sampling = smp.every(step)
+
+    frames = sampling.resolve(frame_range, sources=mapped_targets())
+    if(not frames):
+        pm.warning("The sampling gave no frames to bake.")
+        return
+    uniform_step = smp.uniform_step(frames)
+    tail = smp.tail(frames, uniform_step)
+
+    ctrl_to_key = mapped_controls(ns)
+    log.debug("Control list: %s", ctrl_to_key)
+    diag.annotate(bulk=bulk, sampling=repr(sampling), frames=len(frames),
+                  controls=len(ctrl_to_key))
+
+    constraints_list = []
+    try:
+        if(constraints is None):
+            constraints_list = constrain_skeleton(ns=ns)
+        with su.bake_session('humanik_bake', frames=len(frames),
+                             evaluation=su.BAKE_EVALUATION):
+            if(bulk and uniform_step is not None):
+                flags = dict(at=['translate', 'rotate'], simulation=False,
+                             preserveOutsideKeys=True, disableImplicitControl=True)
+                with diag.span('key'):
+                    pm.bakeResults(ctrl_to_key, t=(frames[0], frames[-1 - len(tail)]),
+                                   sampleBy=uniform_step, **flags)
+                    # The end of the range, if the step doesn't land on it.
+                    for frame in tail:
+                        pm.bakeResults(ctrl_to_key, t=(frame, frame), **flags)
+
+            else:
+                scene = backend.get()
+                for frame in frames:
+                    pm.currentTime(frame, edit=True)
+
+                    # Key things!  Every control in one call.
+                    with diag.span('key'):
+                        scene.set_key(ctrl_to_key, ['translate', 'rotate'])
+
+                    pm.refresh(cv=True)
+
+    finally:
+        # The constraints made here go whether or not the bake made it to the end.
+        log.debug("Deleting constraints: %s", constraints_list)
+        if(constraints_list):
+            pm.delete(constraints_list)
+
+    if(optimize):
+        curves.optimize_curves(ctrl_to_key, time_range=(frames[0], frames[-1]))
+
+    return
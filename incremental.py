@@ -0,0 +1,292 @@
+'''
+incremental.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Re-bakes that only redo the frames whose source animation changed, for iterating on a take.
+
+Each bake run through here remembers, per limb and range, a fingerprint of the curves it read,
+the keys on the source controls and on their parents, and of the keys it wrote.  When it's run
+again the fingerprints are compared.  A source key that was added, moved, removed or changed
+reshapes the curve out to the second key either side of it, as spline tangents follow their
+neighbours, so only the frames in those intervals are cut and baked again.  If the baked keys
+were edited by hand, or the range, sampling or bake options changed, the limb is baked in full.
+
+Fingerprints last for the Maya session and are dropped when the scene changes (see callbacks.py).
+Animation that reaches a limb some other way, ie through constraints or a space switch, isn't
+seen, so bake with full=True after changing that.
+
+usage:
+incremental.bake_ik_to_fk(side='L', limb='arm', frame_range=(1, 2001), namespace='char01:')
+... edit a few fk keys ...
+incremental.bake_ik_to_fk(side='L', limb='arm', frame_range=(1, 2001), namespace='char01:')
+'''
+
+import backend
+import callbacks
+import diagnostics as diag
+import fkik
+import lazy
+import sampling as smp
+import suite as su
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('incremental')
+pm = diag.counted_module(pm)
+
+# How many keys either side of a changed key the curve can change over.
+SPLINE_REACH = 2
+
+SOURCE_CHANNELS = fkik.TRANSFORM_CHANNELS + ['scaleX', 'scaleY', 'scaleZ']
+
+# (direction, namespace, side, limb, frame_range) to what the last bake of it read and wrote.
+_records = {}
+
+
+@diag.operation('incremental_ik_to_fk')
+def bake_ik_to_fk(side=None, limb=None, namespace="", frame_range=None, sampling=None,
+                  full=False, **bake_args):
+    '''
+    fkik.bake_ik_to_fk(), redoing only the frames the fk animation changed on since the last time
+    this limb and range were baked.
+
+    usage:
+    bake_ik_to_fk(side='L', limb='arm', frame_range=(1, 2001), namespace='char01:')
+
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
+    sampling - Which frames to bake, a sampling.Sampling.  Defaults to every frame.
+    full - Bake every frame regardless, and start the fingerprints over.
+    bake_args - Passed on to fkik.bake_ik_to_fk(), ie sampled=True or stump=True.
+
+    Return value: the number of frames baked, 0 if nothing changed.
+    '''
+
+    return _bake('ik_to_fk', fkik.bake_ik_to_fk, side, limb, namespace, frame_range, sampling,
+                 full, bake_args)
+
+
+@diag.operation('incremental_fk_to_ik')
+def bake_fk_to_ik(side=None, limb=None, namespace="", frame_range=None, sampling=None,
+                  full=False, **bake_args):
+    '''
+    fkik.bake_fk_to_ik(), redoing only the frames the ik animation changed on since the last time
+    this limb and range were baked.  See bake_ik_to_fk().
+
+    Return value: the number of frames baked, 0 if nothing changed.
+    '''
+
+    return _bake('fk_to_ik', fkik.bake_fk_to_ik, side, limb, namespace, frame_range, sampling,
+                 full, bake_args)
+
+
+def curve_fingerprint(plugs):
+    '''
+    What the animation on plugs is, in a form that can be compared later: the time, value and
+    tangent angles of every key, or the value of a plug that isn't keyed.
+
+    plugs - list of plug names, ie 'L_armUprFK_Ctrl.rotateX'.
+
+    Return value: dict of plug to a tuple of (time, value, ...) keys, or to ('static', value).
+    '''
+
+    fingerprint = {}
+    static = []
+    for plug in plugs:
+        node, attribute = plug.rsplit('.', 1)
+        times = pm.keyframe(node, attribute=attribute, q=True, timeChange=True)
+        if(not times):
+            static.append(plug)
+            continue
+        values = pm.keyframe(node, attribute=attribute, q=True, valueChange=True)
+        angles = pm.keyTangent(node, attribute=attribute, q=True, inAngle=True, outAngle=True)
+        if(not angles or len(angles) != len(times) * 2):
+            angles = [None] * (len(times) * 2)
+        fingerprint[plug] = tuple(
+            (times[index], values[index], angles[index * 2], angles[index * 2 + 1])
+            for index in range(len(times)))
+
+    if(static):
+        for plug, value in zip(static, backend.get().get_attrs(static)):
+            fingerprint[plug] = ('static', value)
+
+    return fingerprint
+
+
+def changed_intervals(old, new, span, reach=SPLINE_REACH):
+    '''
+    The time intervals where the curves fingerprinted in old and new can differ.
+
+    old, new - dicts as returned by curve_fingerprint().
+    span - (first, last) times the intervals are clipped to.  A plug that is keyed in one and not
+        the other, or whose static value changed, affects all of it.
+    reach - How many keys either side of a changed key are affected.
+
+    Return value: sorted list of (start, end) intervals, inclusive and not overlapping.
+    '''
+
+    intervals = []
+    for plug in set(old) | set(new):
+        before = old.get(plug)
+        after = new.get(plug)
+        if(before == after):
+            continue
+        if(before is None or after is None or before[0] == 'static' or after[0] == 'static'):
+            intervals.append(tuple(span))
+            continue
+
+        keys_before = dict((key[0], key) for key in before)
+        keys_after = dict((key[0], key) for key in after)
+        times = sorted(set(keys_before) | set(keys_after))
+        for index, time in enumerate(times):
+            if(keys_before.get(time) == keys_after.get(time)):
+                continue
+            start = times[index - reach] if index >= reach else span[0]
+            end = times[index + reach] if index + reach < len(times) else span[1]
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        start = max(start, span[0])
+        end = min(end, span[1])
+        if(start > end):
+            continue
+        if(merged and start <= merged[-1][1]):
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def forget(node_name=None):
+    '''
+    Drop remembered bakes, for callbacks.py.  With a node name, only the bakes that read or wrote
+    that node are baked in full next time.
+    '''
+
+    if(node_name is None):
+        _records.clear()
+        return
+
+    for key, record in list(_records.items()):
+        if(node_name in record['nodes']):
+            del _records[key]
+
+    return
+
+
+def _bake(direction, bake, side, limb, namespace, frame_range, sampling, full, bake_args):
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return
+    frame_range = (frame_range[0], frame_range[1])
+
+    sources = fkik.bake_sources(direction, side, limb, namespace)
+    targets = fkik.bake_targets(direction, side, limb, namespace)
+    nodes = pm.ls(*(sources + targets))
+    if(not targets or len(nodes) < len(set(sources + targets))):
+        pm.warning("sr_biped error: The {} {} controls weren't all found in '{}'.".format(
+            side, limb, namespace))
+        return 0
+
+    # The sources and everything above them or the targets move what the bake matches.  The
+    # targets are left out, their keys are the bake's results.
+    watched = []
+    for node in nodes:
+        for name in node.longName().split('|')[1:]:
+            if(name not in watched and name not in targets):
+                watched.append(name)
+    source_plugs = [name + '.' + channel for name in watched for channel in SOURCE_CHANNELS]
+    target_plugs = _target_plugs(direction, targets)
+
+    key = (direction, _with_colon(namespace), side, limb, frame_range)
+    options = repr(sampling) + repr(sorted(bake_args.items()))
+    frames = fkik.bake_frames(frame_range, sampling, sources=sources)
+    if(not frames):
+        pm.warning("The sampling gave no frames to bake.")
+        return 0
+
+    changed = None
+    with diag.span('query'):
+        fingerprint = curve_fingerprint(source_plugs)
+        record = _records.get(key)
+        if(full or record is None or record['options'] != options):
+            log.debug("Baking the %s %s in full.", side, limb)
+        elif(curve_fingerprint(target_plugs) != record['results']):
+            log.info("The baked keys of the %s %s were edited, baking it in full.", side, limb)
+        else:
+            changed = _changed_frames(record, fingerprint, frames)
+
+    if(changed is None):
+        redo = frames
+        bake(side=side, limb=limb, namespace=namespace, frame_range=frame_range,
+             sampling=sampling, **bake_args)
+    else:
+        redo, intervals = changed
+        if(redo):
+            # The old keys go first, the frames baked again may not be all the frames they're on.
+            with diag.span('key'):
+                for start, end in intervals:
+                    for target in targets:
+                        pm.cutKey(target, attribute=_target_channels(direction, targets, target),
+                                  time=(start, end), clear=True)
+            bake(side=side, limb=limb, namespace=namespace, frame_range=frame_range,
+                 sampling=smp.explicit(redo), **bake_args)
+        else:
+            log.info("No source animation of the %s %s changed, nothing to bake.", side, limb)
+
+    with diag.span('query'):
+        results = curve_fingerprint(target_plugs)
+    _records[key] = {
+        'frames': frames,
+        'options': options,
+        'sources': fingerprint,
+        'results': results,
+        'nodes': set(watched + targets),
+    }
+    callbacks.add_listener(forget)
+
+    diag.annotate(limb=limb, side=side, frames=len(redo), full=changed is None,
+                  intervals=len(changed[1]) if changed else 0)
+
+    return len(redo)
+
+
+def _changed_frames(record, fingerprint, frames):
+    # The frames to bake again and the intervals they lie in, or None if it has to be a full bake.
+    span = (min(frames[0], record['frames'][0]), max(frames[-1], record['frames'][-1]))
+    intervals = changed_intervals(record['sources'], fingerprint, span)
+
+    def inside(frame):
+        return any(start <= frame <= end for start, end in intervals)
+
+    # An on keys sampling gives different frames as keys come and go, but only inside the
+    # intervals those keys changed.  Anywhere else, the old keys would be left behind.
+    if([frame for frame in frames if not inside(frame)] !=
+       [frame for frame in record['frames'] if not inside(frame)]):
+        return None
+
+    return [frame for frame in frames if inside(frame)], intervals
+
+
+def _target_plugs(direction, targets):
+    return [target + '.' + channel for target in targets
+            for channel in _target_channels(direction, targets, target)]
+
+
+def _target_channels(direction, targets, target):
+    # An ik_to_fk bake only keys the translate of the pole vector, the first of it's targets.
+    if(direction == 'ik_to_fk' and target == targets[0]):
+        return fkik.TRANSFORM_CHANNELS[:3]
+
+    return fkik.TRANSFORM_CHANNELS
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
@@ -0,0 +1,67 @@
+'''
+lazy.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Modules that are only imported the first time something is looked up on them.  pymel.core alone
+takes seconds to import, so sr_biped's modules hold a lazy stand-in for it (and for maya and
+numpy) instead, and importing them costs next to nothing until a tool actually runs.
+
+usage:
+pm = lazy.module('pymel.core')
+pm.ls(sl=True)                  # pymel.core is imported here.
+'''
+
+import importlib
+import sys
+
+
+class LazyModule(object):
+    '''
+    Stand-in for a module that imports it on first attribute access, and passes everything on to
+    it from then on.
+    '''
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return "<lazy module '{}', {}>".format(self.__dict__['_name'], state)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if(module is None):
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+
+        return module
+
+
+def module(name):
+    '''
+    A lazy stand-in for the named module.  If it has been imported already, the module itself is
+    handed back.
+    '''
+
+    if(name in sys.modules):
+        return sys.modules[name]
+
+    return LazyModule(name)
+
+
+def is_loaded(stand_in):
+    '''
+    True if a module, or a lazy stand-in for one, has been imported.
+    '''
+
+    if(isinstance(stand_in, LazyModule)):
+        return stand_in.__dict__['_module'] is not None
+
+    return True
@@ -0,0 +1,295 @@
+'''
+limb_solver.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Pure NumPy limb maths for fk/ik matching, vectorized so a whole clip solves in one call.  Nothing
+in here touches Maya, so it can be imported and validated anywhere numpy is available.
+
+Conventions:
+Positions are (N, 3) arrays.  Matrices are (N, 4, 4) arrays in Maya's row-vector layout, so the
+translation sits in the last row and a child's world matrix is local * parent.  Rotations are in
+degrees, like the channel box.
+'''
+
+import constants as cons
+import lazy
+
+np = lazy.module('numpy')
+
+
+def pole_vector_positions(top_pos, mid_pos, end_pos, amp_pv=40.0, pole_direction=1):
+    '''
+    Place the pole vector for every frame of a three joint limb.  This is the construction
+    ik_to_fk() has always used: the directions from the middle joint back towards the top and end
+    joints are normalized, amplified and added, and the pole vector sits opposite that sum.
+
+    top_pos - (N, 3) shoulder or hip positions.
+    mid_pos - (N, 3) elbow or knee positions.
+    end_pos - (N, 3) wrist or ankle positions.
+    amp_pv - How much to amplify the vectors projecting the pole vector.
+    pole_direction - 1 or -1 to flip which side of the limb the pole vector lands on.
+
+    Return value: (N, 3) array of pole vector positions.
+    '''
+
+    top_pos = np.atleast_2d(np.asarray(top_pos, dtype=float))
+    mid_pos = np.atleast_2d(np.asarray(mid_pos, dtype=float))
+    end_pos = np.atleast_2d(np.asarray(end_pos, dtype=float))
+
+    line_a = _normalized(end_pos - mid_pos) * amp_pv
+    line_b = _normalized(top_pos - mid_pos) * amp_pv
+
+    return mid_pos - (line_a + line_b) * pole_direction
+
+
+def end_compensation(limb, side_token, foot_rot_comp=None):
+    '''
+    The object-space counter-rotation ik_to_fk() applies to the end control of a limb, since the ik
+    foot controls are oriented to world rather than to the ankle bone.
+
+    limb - 'arm', 'leg', 'revFrleg' or 'revBkleg'
+    side_token - One of the tokens in constants.INTERNAL_SIDE_TOKENS, or '' for no side.
+    foot_rot_comp - The compensation for a left or centre foot.  Defaults to (0, 0, 90).
+
+    Return value: tuple of three angles in degrees, or None if the end control matches 1:1.
+    '''
+
+    if(foot_rot_comp is None):
+        foot_rot_comp = (0, 0, 90)
+
+    if(limb == 'leg'):
+        # The right foot control is flipped over relative to the left.
+        if(side_token == cons.INTERNAL_SIDE_TOKENS['right']):
+            return (foot_rot_comp[0] - 180, foot_rot_comp[1], foot_rot_comp[2] % 360)
+        return tuple(foot_rot_comp)
+
+    elif('rev' in limb):
+        if(side_token == cons.INTERNAL_SIDE_TOKENS['left']):
+            return (0, 0, 90)
+        elif(side_token == cons.INTERNAL_SIDE_TOKENS['right']):
+            return (180, 0, 90)
+        return tuple(foot_rot_comp)
+
+    return None
+
+
+def euler_matrices(rotations, rotate_order='XYZ'):
+    '''
+    Build rotation matrices from Euler angles the way Maya evaluates a transform's rotate channels.
+
+    rotations - (3,) or (N, 3) angles in degrees.
+    rotate_order - One of Maya's rotate order strings, ie 'XYZ' or 'ZXY'.
+
+    Return value: (N, 4, 4) array.
+    '''
+
+    radians = np.radians(np.atleast_2d(np.asarray(rotations, dtype=float)))
+    count = radians.shape[0]
+    cos = np.cos(radians)
+    sin = np.sin(radians)
+
+    axis_matrices = {}
+    for axis_index, axis in enumerate('XYZ'):
+        matrix = np.zeros((count, 4, 4))
+        matrix[:, 3, 3] = 1.0
+        # The axis itself stays put, the other two rotate about it.
+        first, second = [index for index in range(3) if index != axis_index]
+        matrix[:, axis_index, axis_index] = 1.0
+        matrix[:, first, first] = cos[:, axis_index]
+        matrix[:, second, second] = cos[:, axis_index]
+        if(axis == 'Y'):
+            # Y runs Z -> X, so the signs swap relative to X and Z.
+            matrix[:, first, second] = -sin[:, axis_index]
+            matrix[:, second, first] = sin[:, axis_index]
+        else:
+            matrix[:, first, second] = sin[:, axis_index]
+            matrix[:, second, first] = -sin[:, axis_index]
+        axis_matrices[axis] = matrix
+
+    # Row vectors: the first axis in the order is applied first, so it sits leftmost.
+    result = axis_matrices[rotate_order[0].upper()]
+    for axis in rotate_order[1:]:
+        result = np.matmul(result, axis_matrices[axis.upper()])
+
+    return result
+
+
+def compensate(end_matrices, rotation):
+    '''
+    Apply an object-space counter-rotation to every end matrix, as `xform -r -os -ro` would.
+
+    end_matrices - (N, 4, 4) world matrices of the end bone.
+    rotation - Three angles in degrees, as returned by end_compensation(), or None.
+
+    Return value: (N, 4, 4) array of compensated world matrices.
+    '''
+
+    end_matrices = np.asarray(end_matrices, dtype=float).reshape(-1, 4, 4)
+    if(rotation is None):
+        return end_matrices.copy()
+
+    return np.matmul(euler_matrices(rotation)[0], end_matrices)
+
+
+def solve_limb(top_pos, mid_pos, end_matrices, amp_pv=40.0, pole_direction=1, compensation=None):
+    '''
+    Solve the ik side of a limb match for N frames in one call.
+
+    top_pos - (N, 3) shoulder or hip positions.
+    mid_pos - (N, 3) elbow or knee positions.
+    end_matrices - (N, 4, 4) world matrices of the wrist or ankle bone.
+    amp_pv, pole_direction - See pole_vector_positions().
+    compensation - Counter-rotation for the end control, see end_compensation().
+
+    Return value: tuple of (N, 3) pole vector positions and (N, 4, 4) end control world matrices.
+    '''
+
+    end_matrices = np.asarray(end_matrices, dtype=float).reshape(-1, 4, 4)
+    pv_pos = pole_vector_positions(
+        top_pos, mid_pos, end_matrices[:, 3, :3], amp_pv=amp_pv, pole_direction=pole_direction)
+
+    return pv_pos, compensate(end_matrices, compensation)
+
+
+def straight_limb_positions(top_pos, mid_pos, end_pos, roots, directions, bends,
+                            pole_distance=None):
+    '''
+    Lay N three joint limbs out straight, ie for a T-pose.  Each limb keeps the lengths of it's
+    two segments and runs from it's root down it's direction, with the pole vector out from the
+    straightened middle joint along bend.
+
+    top_pos, mid_pos, end_pos - (N, 3) joint positions the segment lengths are measured from.
+    roots - (N, 3) where each straightened limb starts.
+    directions - (N, 3) directions to lay the limbs along.
+    bends - (N, 3) directions from the middle joint to the pole vector.
+    pole_distance - How far the pole vectors sit from the middle joints.  Defaults to half of each
+        limb's length.
+
+    Return value: tuple of (N, 3) end positions and (N, 3) pole vector positions.
+    '''
+
+    top_pos = np.atleast_2d(np.asarray(top_pos, dtype=float))
+    mid_pos = np.atleast_2d(np.asarray(mid_pos, dtype=float))
+    end_pos = np.atleast_2d(np.asarray(end_pos, dtype=float))
+    upper = np.linalg.norm(mid_pos - top_pos, axis=1)[:, np.newaxis]
+    lower = np.linalg.norm(end_pos - mid_pos, axis=1)[:, np.newaxis]
+    if(pole_distance is None):
+        pole_distance = (upper + lower) * 0.5
+
+    roots = np.atleast_2d(np.asarray(roots, dtype=float))
+    directions = _normalized(np.atleast_2d(np.asarray(directions, dtype=float)))
+    bends = _normalized(np.atleast_2d(np.asarray(bends, dtype=float)))
+
+    ends = roots + directions * (upper + lower)
+    poles = roots + directions * upper + bends * pole_distance
+
+    return ends, poles
+
+
+def segment_lengths(top_pos, mid_pos, end_pos):
+    '''
+    Lengths of the upper and lower segments of N three joint limbs.
+
+    Return value: (N, 2) array.
+    '''
+
+    top_pos = np.atleast_2d(np.asarray(top_pos, dtype=float))
+    mid_pos = np.atleast_2d(np.asarray(mid_pos, dtype=float))
+    end_pos = np.atleast_2d(np.asarray(end_pos, dtype=float))
+
+    return np.stack([np.linalg.norm(mid_pos - top_pos, axis=1),
+                     np.linalg.norm(end_pos - mid_pos, axis=1)], axis=1)
+
+
+def bend_offsets(top_matrices, mid_pos, end_pos):
+    '''
+    How far the middle joint of N limbs sits off the line from the top joint to the end joint,
+    as a vector in the top joint's space.  A hinge such as the elbow only bends one way in that
+    space, so the offset keeps it's direction as the limb bends and flips as it hyperextends.
+
+    top_matrices - (N, 4, 4) world matrices of the top joints.
+    mid_pos, end_pos - (N, 3) world positions of the middle and end joints.
+
+    Return value: (N, 3) array, in world units.
+    '''
+
+    top_matrices = np.asarray(top_matrices, dtype=float).reshape(-1, 4, 4)
+    mid_pos = np.atleast_2d(np.asarray(mid_pos, dtype=float))
+    end_pos = np.atleast_2d(np.asarray(end_pos, dtype=float))
+    top_pos = top_matrices[:, 3, :3]
+
+    line = _normalized(end_pos - top_pos)
+    reach = mid_pos - top_pos
+    offset = reach - line * np.sum(reach * line, axis=1, keepdims=True)
+
+    # The axes are unscaled so the offset stays in world units; their inverse is their transpose.
+    axes = top_matrices[:, :3, :3]
+    axes = axes / np.linalg.norm(axes, axis=2, keepdims=True)
+
+    return np.einsum('ni,nji->nj', offset, axes)
+
+
+def match_residuals(matrices, targets):
+    '''
+    How far apart N pairs of world matrices are, ie a matched joint and the joint it was matched
+    to.  Scale is divided out before the rotations are compared.
+
+    matrices, targets - (N, 4, 4) arrays.
+
+    Return value: tuple of (N,) distances and (N,) angles in degrees.
+    '''
+
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    targets = np.asarray(targets, dtype=float).reshape(-1, 4, 4)
+
+    distances = np.linalg.norm(matrices[:, 3, :3] - targets[:, 3, :3], axis=1)
+
+    rotations = matrices[:, :3, :3] / np.linalg.norm(matrices[:, :3, :3], axis=2, keepdims=True)
+    target_rotations = targets[:, :3, :3] / np.linalg.norm(
+        targets[:, :3, :3], axis=2, keepdims=True)
+    # The trace of one rotation times the other's inverse gives the angle between them.
+    traces = np.einsum('nij,nij->n', rotations, target_rotations)
+    angles = np.degrees(np.arccos(np.clip((traces - 1.0) * 0.5, -1.0, 1.0)))
+
+    return distances, angles
+
+
+def local_points(points, parent_matrices):
+    '''
+    Bring world-space points into the space of their parents, ie to get a translate value.
+
+    points - (N, 3) world positions.
+    parent_matrices - (N, 4, 4) world matrices of the parent space.
+
+    Return value: (N, 3) array.
+    '''
+
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    homogeneous = np.concatenate([points, np.ones((points.shape[0], 1))], axis=1)
+    inverse = np.linalg.inv(np.asarray(parent_matrices, dtype=float).reshape(-1, 4, 4))
+
+    return np.matmul(homogeneous[:, np.newaxis, :], inverse)[:, 0, :3]
+
+
+def local_matrices(world_matrices, parent_matrices):
+    '''
+    world * parent^-1 for every frame.
+
+    Return value: (N, 4, 4) array.
+    '''
+
+    world_matrices = np.asarray(world_matrices, dtype=float).reshape(-1, 4, 4)
+    parent_matrices = np.asarray(parent_matrices, dtype=float).reshape(-1, 4, 4)
+
+    return np.matmul(world_matrices, np.linalg.inv(parent_matrices))
+
+
+def _normalized(vectors):
+    '''
+    Normalize rows, leaving zero-length rows at zero rather than dividing by it.
+    '''
+
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    safe = np.where(lengths > 0.0, lengths, 1.0)
+
+    return vectors / safe
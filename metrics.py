@@ -0,0 +1,365 @@
+'''
+metrics.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Limb length QA over whole clips, ie as a gate on baked takes.
+
+The rest lengths of every limb are measured from it's driver joints once per character, on a frame
+where the rig is at rest, and kept until the scene changes (see callbacks.py).  They're never
+measured unasked, as a stretched pose on the current frame would become the rest to check against.
+A clip is then checked by reading the joints for every frame in one query and working out each
+limb's segment lengths and bend in one vectorized pass.  Frames are flagged where a segment is
+stretched or compressed past a tolerance, or where the elbow or knee has bent the wrong way, past
+straight.
+
+usage:
+metrics.rest_lengths('char01:', time=0)               # a frame the rig is at rest on
+report = metrics.check_clip('char01:', frame_range=(1, 241))
+report = metrics.check_clip('char02:', frame_range=(1, 241), rest_time=0)
+report['ok']
+'''
+
+import backend
+import callbacks
+import diagnostics as diag
+import lazy
+import limb_solver
+import naming
+import sampling as smp
+import suite as su
+
+pm = lazy.module('pymel.core')
+np = lazy.module('numpy')
+
+
+log = diag.get_logger('metrics')
+pm = diag.counted_module(pm)
+
+# Keys of the top, middle and end joints of each limb in the naming profiles.
+LIMB_JOINTS = {
+    'arm': ('shoulder', 'elbow', 'wrist'),
+    'leg': ('hip', 'knee', 'ankle'),
+}
+
+# How far a segment may stray from it's rest length, as a fraction of it, before it's flagged.
+STRETCH_TOLERANCE = 0.01
+
+# How far past straight the middle joint may bend, as a fraction of the limb's length.
+HYPEREXTENSION_TOLERANCE = 0.001
+
+# (namespace, chain) to a dict of (side, limb) to RestLimb.
+_rest = {}
+
+
+class RestLimb(object):
+    '''
+    The rest measurements of one limb.
+
+    joints - full names of the top, middle and end joints.
+    lengths - (2,) rest lengths of the upper and lower segments.
+    bend - (3,) unit direction the middle joint bends towards at rest, in the top joint's space,
+        or None if the limb is straight at rest and the bend can't be told.
+    '''
+
+    def __init__(self, side, limb, joints, lengths, bend):
+        self.side = side
+        self.limb = limb
+        self.joints = joints
+        self.lengths = lengths
+        self.bend = bend
+
+    def __repr__(self):
+        return "RestLimb('{}', '{}', {:.3f}, {:.3f})".format(
+            self.side, self.limb, self.lengths[0], self.lengths[1])
+
+
+class LimbMetrics(object):
+    '''
+    Segment lengths and bend of one limb over a clip.
+
+    frames - the frames measured.
+    rest - the limb's RestLimb.
+    lengths - (N, 2) upper and lower segment lengths.
+    bends - (N,) how far the middle joint sits towards it's rest bend, as a fraction of the limb's
+        rest length.  Below zero the limb is bent past straight.  NaN if the rest bend is unknown.
+    '''
+
+    def __init__(self, rest, frames, lengths, bends):
+        self.side = rest.side
+        self.limb = rest.limb
+        self.rest = rest
+        self.frames = frames
+        self.lengths = lengths
+        self.bends = bends
+
+    def __repr__(self):
+        return "LimbMetrics('{}', '{}', {} frames)".format(self.side, self.limb, len(self.frames))
+
+    @property
+    def ratios(self):
+        '''
+        (N, 2) segment lengths over their rest lengths.
+        '''
+
+        return self.lengths / self.rest.lengths
+
+    def stretched(self, tolerance=STRETCH_TOLERANCE):
+        return self._flagged(np.any(self.ratios > 1.0 + tolerance, axis=1))
+
+    def compressed(self, tolerance=STRETCH_TOLERANCE):
+        return self._flagged(np.any(self.ratios < 1.0 - tolerance, axis=1))
+
+    def hyperextended(self, tolerance=HYPEREXTENSION_TOLERANCE):
+        with np.errstate(invalid='ignore'):
+            return self._flagged(self.bends < -tolerance)
+
+    def summary(self, stretch_tolerance=STRETCH_TOLERANCE,
+                hyperextension_tolerance=HYPEREXTENSION_TOLERANCE):
+        '''
+        The limb's results as a dict that can be written out as JSON.
+        '''
+
+        ratios = self.ratios
+        stretched = self.stretched(stretch_tolerance)
+        compressed = self.compressed(stretch_tolerance)
+        hyperextended = self.hyperextended(hyperextension_tolerance)
+
+        return {
+            'rest_lengths': [float(length) for length in self.rest.lengths],
+            'max_ratio': float(ratios.max()) if len(ratios) else 1.0,
+            'min_ratio': float(ratios.min()) if len(ratios) else 1.0,
+            'stretched': stretched,
+            'compressed': compressed,
+            'hyperextended': hyperextended,
+            'ok': not (stretched or compressed or hyperextended),
+        }
+
+    def _flagged(self, mask):
+        return [self.frames[index] for index in np.flatnonzero(mask)]
+
+
+def limb_joints(namespace, side, limb, chain='fk_bone'):
+    '''
+    Full names of a limb's top, middle and end joints, or None if the naming profile has no such
+    limb.
+
+    chain - the naming group of the joints, 'fk_bone' or 'ik_bone'.
+    '''
+
+    names = [naming.lookup(namespace, side, limb, chain + '.' + key) for key in LIMB_JOINTS[limb]]
+    if(None in names):
+        return None
+
+    return names
+
+
+def rest_lengths(namespace, chain='fk_bone', time=None, refresh=False):
+    '''
+    Measure the rest lengths of every arm and leg of a character, the first time it's asked for.
+    The rig must be at rest on the frame measured, check_clip() and limb_metrics() use these as
+    they are.
+
+    namespace - namespace of the character.
+    chain - the driver joints to measure, 'fk_bone' or 'ik_bone'.
+    time - frame to measure on, None for the current frame.
+    refresh - measure again even if the character has been measured already.
+
+    Return value: dict of (side, limb) to RestLimb.
+    '''
+
+    namespace = _with_colon(namespace)
+    key = (namespace, chain)
+    if(key in _rest and not refresh):
+        return _rest[key]
+
+    limbs = _find_limbs(namespace, chain)
+    scene = backend.get()
+    with diag.span('query'):
+        names = [name for side, limb, joints in limbs for name in joints]
+        matrices = np.array([_rows(matrix) for matrix in scene.world_matrices(names, time=time)],
+                            dtype=float).reshape(-1, 3, 4, 4)
+
+    with diag.span('solve'):
+        lengths = limb_solver.segment_lengths(
+            matrices[:, 0, 3, :3], matrices[:, 1, 3, :3], matrices[:, 2, 3, :3])
+        offsets = limb_solver.bend_offsets(
+            matrices[:, 0], matrices[:, 1, 3, :3], matrices[:, 2, 3, :3])
+
+    measured = {}
+    for index, (side, limb, joints) in enumerate(limbs):
+        total = lengths[index].sum()
+        offset = np.linalg.norm(offsets[index])
+        bend = offsets[index] / offset if offset > total * HYPEREXTENSION_TOLERANCE else None
+        if(bend is None):
+            log.warning("The %s %s of %s is straight at rest, it's bend can't be checked.",
+                        side, limb, namespace or 'the scene')
+        measured[(side, limb)] = RestLimb(side, limb, joints, lengths[index], bend)
+
+    _rest[key] = measured
+    callbacks.add_listener(forget_rest_lengths)
+    log.debug("Measured %s limbs of '%s'.", len(measured), namespace)
+
+    return measured
+
+
+def forget_rest_lengths(node_name=None):
+    '''
+    Drop measured rest lengths, for callbacks.py.  With a node name, only the characters using
+    that node are measured again.
+    '''
+
+    if(node_name is None):
+        _rest.clear()
+        return
+
+    for key, limbs in list(_rest.items()):
+        if(any(node_name in rest.joints for rest in limbs.values())):
+            del _rest[key]
+
+    return
+
+
+def limb_metrics(namespace, frames, chain='fk_bone'):
+    '''
+    Segment lengths and bend of every arm and leg of a character on every one of frames.  The
+    rest lengths must have been measured, see rest_lengths().
+
+    Return value: list of LimbMetrics.
+    '''
+
+    namespace = _with_colon(namespace)
+    rest = _measured(namespace, chain)
+    if(rest is None):
+        return []
+    limbs = [rest[key] for key in sorted(rest)]
+    if(not limbs or not frames):
+        return []
+
+    scene = backend.get()
+    with diag.span('query'):
+        # One read of every joint per frame, then limbs first.
+        names = [name for limb in limbs for name in limb.joints]
+        matrices = np.array(
+            [[_rows(matrix) for matrix in scene.world_matrices(names, time=frame)]
+             for frame in frames], dtype=float).reshape(len(frames), len(limbs), 3, 4, 4)
+        matrices = matrices.transpose(1, 0, 2, 3, 4)
+
+    with diag.span('solve'):
+        flat = matrices.reshape(-1, 3, 4, 4)
+        lengths = limb_solver.segment_lengths(
+            flat[:, 0, 3, :3], flat[:, 1, 3, :3], flat[:, 2, 3, :3]).reshape(len(limbs), -1, 2)
+        offsets = limb_solver.bend_offsets(
+            flat[:, 0], flat[:, 1, 3, :3], flat[:, 2, 3, :3]).reshape(len(limbs), -1, 3)
+
+    results = []
+    for index, limb in enumerate(limbs):
+        if(limb.bend is None):
+            bends = np.full(len(frames), np.nan)
+        else:
+            bends = offsets[index].dot(limb.bend) / limb.lengths.sum()
+        results.append(LimbMetrics(limb, list(frames), lengths[index], bends))
+
+    return results
+
+
+@diag.operation('check_limbs')
+def check_clip(namespace='', frame_range=None, sampling=None, chain='fk_bone', rest_time=None,
+               stretch_tolerance=STRETCH_TOLERANCE,
+               hyperextension_tolerance=HYPEREXTENSION_TOLERANCE):
+    '''
+    Check a character's limbs over a clip for stretch, compression and hyperextension.
+
+    usage:
+    check_clip('char01:', frame_range=(1, 241))
+
+    namespace - namespace of the character.  It's rest lengths must have been measured with
+        rest_lengths(), or rest_time given.
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
+    sampling - Which frames to check, a sampling.Sampling.  Defaults to every frame.  On keys
+        samples where the fk controls are keyed.
+    chain - the driver joints to check, 'fk_bone' or 'ik_bone'.
+    rest_time - A frame the rig is at rest on, to measure the rest lengths on first.  None uses
+        the ones measured already.
+    stretch_tolerance, hyperextension_tolerance - See STRETCH_TOLERANCE and
+        HYPEREXTENSION_TOLERANCE.
+
+    Return value: dict with 'ok', 'frames' and 'limbs', a dict of 'L_arm' and so on to each limb's
+        LimbMetrics.summary().
+    '''
+
+    namespace = _with_colon(namespace)
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return
+    if(sampling is None):
+        sampling = smp.every(1)
+
+    if(rest_time is not None):
+        rest_lengths(namespace, chain, time=rest_time, refresh=True)
+    elif(_measured(namespace, chain) is None):
+        return
+
+    sources = [naming.lookup(namespace, side, limb, 'fk_ctrl.' + key)
+               for side, limb, joints in _find_limbs(namespace, chain)
+               for key in LIMB_JOINTS[limb]]
+    frames = sampling.resolve(frame_range, sources=[name for name in sources if name])
+
+    report = {'ok': True, 'frames': len(frames), 'limbs': {}}
+    for result in limb_metrics(namespace, frames, chain):
+        summary = result.summary(stretch_tolerance, hyperextension_tolerance)
+        report['limbs']['{}_{}'.format(result.side, result.limb)] = summary
+        report['ok'] = report['ok'] and summary['ok']
+
+    flagged = sorted(name for name, summary in report['limbs'].items() if not summary['ok'])
+    diag.annotate(frames=len(frames), limbs=len(report['limbs']), flagged=len(flagged))
+    if(flagged):
+        log.info("Limbs of '%s' out of tolerance: %s.", namespace, ', '.join(flagged))
+
+    return report
+
+
+def _measured(namespace, chain):
+    # The rest lengths measured for a character.  They're never measured on whatever frame the
+    # scene is on, which may be anything but the rest pose.
+    measured = _rest.get((namespace, chain))
+    if(measured is None):
+        pm.error("sr_biped error: The rest lengths of '{}' haven't been measured.  Measure them "
+                 "with metrics.rest_lengths() on a frame the rig is at rest, or give check_clip() "
+                 "a rest_time.".format(namespace))
+        return
+
+    return measured
+
+
+def _find_limbs(namespace, chain):
+    # Every arm and leg of the character whose joints are in the scene.
+    candidates = []
+    profile = naming.profile_for(namespace)
+    for limb in sorted(LIMB_JOINTS):
+        if(limb not in profile.limbs):
+            continue
+        for side in sorted(profile.sides):
+            joints = limb_joints(namespace, side, limb, chain)
+            if(joints is not None):
+                candidates.append((side, limb, joints))
+    if(not candidates):
+        return []
+
+    existing = set(str(node) for node in pm.ls(
+        *[name for side, limb, joints in candidates for name in joints]))
+
+    return [(side, limb, joints) for side, limb, joints in candidates
+            if existing.issuperset(joints)]
+
+
+def _rows(matrix):
+    return [list(row) for row in matrix]
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
@@ -0,0 +1,1866 @@
+'''
+mock_maya.py
+Shaper Rigs / Burlington Interactive Solutions
+
+An in-memory stand-in for the parts of Maya that sr_biped uses, so the package can be exercised and
+measured without a live Maya (CI, farm nodes, a laptop).
+
+It covers the pymel.core calls the package makes (PyNode, ls, listRelatives, xform,
+matchTransform, setKeyframe, currentTime, getAttr/setAttr and friends), a small
+pymel.core.datatypes, maya.mel and the OpenMaya message classes used by callbacks.py.  Nodes hold
+real transforms and animation curves, so matches and bakes produce meaningful numbers, and every
+call is counted.  MockBackend is a backend.py backend that works on the scene directly.
+
+It is not a rig evaluator: driver joints simply follow their controls like a parent constraint
+would, which is all the fk/ik tools need to see.
+
+usage:
+import mock_maya
+scene = mock_maya.install()
+mock_maya.build_biped(scene, namespace='char01')
+import fkik  # Imported after install(), so it gets the mock.
+'''
+
+import bisect
+import fnmatch
+import math
+import sys
+import types
+from collections import Counter
+
+import numpy as np
+
+import backend
+
+
+ROTATE_ORDERS = ('XYZ', 'YZX', 'ZXY', 'XZY', 'YXZ', 'ZYX')
+
+COMPOUND_CHANNELS = {
+    'translate': ('translateX', 'translateY', 'translateZ'),
+    'rotate': ('rotateX', 'rotateY', 'rotateZ'),
+    'scale': ('scaleX', 'scaleY', 'scaleZ'),
+    'jointOrient': ('jointOrientX', 'jointOrientY', 'jointOrientZ'),
+}
+
+TRANSFORM_DEFAULTS = {
+    'translateX': 0.0, 'translateY': 0.0, 'translateZ': 0.0,
+    'rotateX': 0.0, 'rotateY': 0.0, 'rotateZ': 0.0,
+    'scaleX': 1.0, 'scaleY': 1.0, 'scaleZ': 1.0,
+    'visibility': 1.0,
+    'rotateOrder': 0,
+}
+
+# The one scene install() sets up.  Functions of the fake modules act on it.
+scene = None
+
+
+# ------------------------------------------------------------------------------------------------
+# Maths
+# ------------------------------------------------------------------------------------------------
+
+def euler_to_matrix(angles, rotate_order='XYZ'):
+    '''
+    3x3 rotation matrix (row-vector layout, like Maya) from angles in radians.
+    '''
+
+    axes = {}
+    for index, axis in enumerate('XYZ'):
+        cos = math.cos(angles[index])
+        sin = math.sin(angles[index])
+        if(axis == 'X'):
+            axes[axis] = np.array([[1, 0, 0], [0, cos, sin], [0, -sin, cos]])
+        elif(axis == 'Y'):
+            axes[axis] = np.array([[cos, 0, -sin], [0, 1, 0], [sin, 0, cos]])
+        else:
+            axes[axis] = np.array([[cos, sin, 0], [-sin, cos, 0], [0, 0, 1]])
+
+    order = rotate_order.upper()
+
+    return axes[order[0]].dot(axes[order[1]]).dot(axes[order[2]])
+
+
+def matrix_to_euler(rotation, rotate_order='XYZ'):
+    '''
+    Angles in radians, ordered x, y, z, such that euler_to_matrix() gives back the rotation.  The
+    axes are permuted so every order can use the XYZ formula, flipping signs for odd permutations.
+    '''
+
+    order = [('XYZ').index(axis) for axis in rotate_order.upper()]
+    permutation = np.zeros((3, 3))
+    for new_index, old_index in enumerate(order):
+        permutation[new_index, old_index] = 1.0
+    parity = 1.0 if np.linalg.det(permutation) > 0 else -1.0
+
+    matrix = permutation.dot(rotation).dot(permutation.T)
+    sin_b = max(-1.0, min(1.0, -matrix[0, 2]))
+    b = math.asin(sin_b)
+    if(abs(sin_b) < 0.999999):
+        a = math.atan2(matrix[1, 2], matrix[2, 2])
+        c = math.atan2(matrix[0, 1], matrix[0, 0])
+    else:
+        # Gimbal locked, put everything on the first axis.
+        a = math.atan2(-matrix[2, 1], matrix[1, 1])
+        c = 0.0
+
+    angles = [0.0, 0.0, 0.0]
+    for value, old_index in zip((a, b, c), order):
+        angles[old_index] = value * parity
+
+    return angles
+
+
+def closest_euler(angles, target, rotate_order='XYZ'):
+    '''
+    Of the equivalent Euler solutions for angles, the one closest to target.  Radians.
+    '''
+
+    order = [('XYZ').index(axis) for axis in rotate_order.upper()]
+    flipped = list(angles)
+    flipped[order[0]] += math.pi
+    flipped[order[1]] = math.pi - flipped[order[1]]
+    flipped[order[2]] += math.pi
+
+    best = None
+    for candidate in (angles, flipped):
+        wrapped = [
+            value + 2.0 * math.pi * round((goal - value) / (2.0 * math.pi))
+            for value, goal in zip(candidate, target)]
+        distance = sum(abs(value - goal) for value, goal in zip(wrapped, target))
+        if(best is None or distance < best[0]):
+            best = (distance, wrapped)
+
+    return best[1]
+
+
+def compose(translate, rotate_degrees, scale=(1, 1, 1), rotate_order='XYZ', joint_orient=None):
+    '''
+    4x4 local matrix the way Maya composes a transform (or a joint with a joint orient).
+    '''
+
+    rotation = euler_to_matrix([math.radians(value) for value in rotate_degrees], rotate_order)
+    if(joint_orient is not None):
+        rotation = rotation.dot(euler_to_matrix([math.radians(v) for v in joint_orient]))
+
+    matrix = np.identity(4)
+    matrix[:3, :3] = np.diag(scale).dot(rotation)
+    matrix[3, :3] = translate
+
+    return matrix
+
+
+def decompose(matrix, rotate_order='XYZ'):
+    '''
+    translate, rotate in degrees and scale from a 4x4 matrix.
+    '''
+
+    matrix = np.asarray(matrix, dtype=float)
+    scale = np.linalg.norm(matrix[:3, :3], axis=1)
+    rotation = matrix[:3, :3] / np.where(scale > 0, scale, 1.0)[:, np.newaxis]
+    rotate = [math.degrees(value) for value in matrix_to_euler(rotation, rotate_order)]
+
+    return list(matrix[3, :3]), rotate, list(scale)
+
+
+# ------------------------------------------------------------------------------------------------
+# pymel.core.datatypes
+# ------------------------------------------------------------------------------------------------
+
+class Vector(object):
+    '''
+    Stand-in for pymel.core.datatypes.Vector.
+    '''
+
+    def __init__(self, *args):
+        if(len(args) == 1):
+            values = list(args[0])
+        else:
+            values = list(args)
+        values = (values + [0.0, 0.0, 0.0])[:3]
+        self._values = np.array(values, dtype=float)
+
+    x = property(lambda self: float(self._values[0]))
+    y = property(lambda self: float(self._values[1]))
+    z = property(lambda self: float(self._values[2]))
+
+    def __iter__(self):
+        return iter(float(value) for value in self._values)
+
+    def __len__(self):
+        return 3
+
+    def __getitem__(self, index):
+        return float(self._values[index])
+
+    def __repr__(self):
+        return '{}({}, {}, {})'.format(type(self).__name__, self.x, self.y, self.z)
+
+    def __eq__(self, other):
+        try:
+            return bool(np.allclose(self._values, list(other)))
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __add__(self, other):
+        return type(self)(self._values + np.asarray(list(other), dtype=float))
+
+    def __sub__(self, other):
+        return type(self)(self._values - np.asarray(list(other), dtype=float))
+
+    def __neg__(self):
+        return type(self)(-self._values)
+
+    def __mul__(self, other):
+        if(isinstance(other, Matrix)):
+            return type(self)(self._values.dot(other._matrix[:3, :3]))
+        return type(self)(self._values * other)
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        return type(self)(self._values / other)
+
+    __truediv__ = __div__
+
+    def length(self):
+        return float(np.linalg.norm(self._values))
+
+    def normal(self):
+        length = self.length()
+        return type(self)(self._values / length if length else self._values)
+
+    def normalize(self):
+        self._values = self.normal()._values
+
+    def cross(self, other):
+        return type(self)(np.cross(self._values, list(other)))
+
+    def dot(self, other):
+        return float(self._values.dot(list(other)))
+
+
+class Point(Vector):
+    '''
+    Stand-in for pymel.core.datatypes.Point, transformed with translation by a matrix.
+    '''
+
+    def __mul__(self, other):
+        if(isinstance(other, Matrix)):
+            return Point(np.append(self._values, 1.0).dot(other._matrix)[:3])
+        return Point(self._values * other)
+
+
+class Matrix(object):
+    '''
+    Stand-in for pymel.core.datatypes.Matrix.  Row-vector layout, translation in the last row.
+    '''
+
+    def __init__(self, *args):
+        if(len(args) == 0):
+            matrix = np.identity(4)
+        elif(len(args) == 1 and isinstance(args[0], Matrix)):
+            matrix = args[0]._matrix.copy()
+        elif(len(args) == 1):
+            matrix = np.asarray(
+                [list(row) if hasattr(row, '__iter__') else row for row in args[0]], dtype=float)
+        else:
+            matrix = np.asarray([list(row) for row in args], dtype=float)
+        self._matrix = matrix.reshape(4, 4)
+
+    def __getitem__(self, index):
+        return [float(value) for value in self._matrix[index]]
+
+    def __iter__(self):
+        return iter(self[index] for index in range(4))
+
+    def __mul__(self, other):
+        return Matrix(self._matrix.dot(other._matrix))
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and bool(np.allclose(self._matrix, other._matrix))
+
+    def __repr__(self):
+        return 'Matrix({})'.format(self._matrix.tolist())
+
+    def inverse(self):
+        return Matrix(np.linalg.inv(self._matrix))
+
+    def formated(self):
+        return '\n'.join(' '.join('{: .4f}'.format(v) for v in row) for row in self._matrix)
+
+    def tolist(self):
+        return self._matrix.tolist()
+
+
+class EulerRotation(object):
+    '''
+    Stand-in for pymel.core.datatypes.EulerRotation.  Angles are kept in radians.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        if(len(args) == 1):
+            values = list(args[0])
+        else:
+            values = list(args) or [0.0, 0.0, 0.0]
+        if(kwargs.get('unit', 'radians') == 'degrees'):
+            values = [math.radians(value) for value in values]
+        self.values = [float(value) for value in values[:3]]
+        self.order = kwargs.get('order', 'XYZ')
+
+    x = property(lambda self: self.values[0])
+    y = property(lambda self: self.values[1])
+    z = property(lambda self: self.values[2])
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self):
+        return 'EulerRotation({}, {}, {}, order={})'.format(*(self.values + [self.order]))
+
+    def asMatrix(self):
+        matrix = np.identity(4)
+        matrix[:3, :3] = euler_to_matrix(self.values, self.order)
+        return Matrix(matrix)
+
+    def reorderIt(self, order):
+        self.values = matrix_to_euler(euler_to_matrix(self.values, self.order), order)
+        self.order = order
+
+    def reorder(self, order):
+        result = EulerRotation(self.values, order=self.order)
+        result.reorderIt(order)
+        return result
+
+    def closestSolution(self, other):
+        return EulerRotation(
+            closest_euler(self.values, list(other), self.order), order=self.order)
+
+
+class TransformationMatrix(object):
+    '''
+    Stand-in for pymel.core.datatypes.TransformationMatrix.
+    '''
+
+    def __init__(self, matrix=None):
+        self._matrix = Matrix() if matrix is None else Matrix(matrix)
+
+    def getTranslation(self, space='transform'):
+        return Vector(self._matrix._matrix[3, :3])
+
+    def eulerRotation(self):
+        translate, rotate, scale = decompose(self._matrix._matrix)
+        return EulerRotation(rotate, unit='degrees')
+
+    def asMatrix(self):
+        return Matrix(self._matrix)
+
+
+def _degrees(value):
+    return math.degrees(value)
+
+
+# ------------------------------------------------------------------------------------------------
+# Scene
+# ------------------------------------------------------------------------------------------------
+
+class MayaNodeError(Exception):
+    pass
+
+
+class MayaAttributeError(AttributeError):
+    pass
+
+
+class Node(object):
+    '''
+    A transform or joint in the mock scene.
+    '''
+
+    def __init__(self, scene, name, node_type='transform', parent=None):
+        self.scene = scene
+        self.name = name
+        self.type = node_type
+        self.parent = parent
+        self.children = []
+        self.values = dict(TRANSFORM_DEFAULTS)
+        self.defaults = dict(TRANSFORM_DEFAULTS)
+        self.keyable = set(k for k in TRANSFORM_DEFAULTS if k != 'rotateOrder')
+        self.curves = {}
+        self.overrides = {}
+        self.constraint = None
+        if(node_type == 'joint'):
+            for channel in COMPOUND_CHANNELS['jointOrient']:
+                self.values[channel] = 0.0
+                self.defaults[channel] = 0.0
+        if(parent is not None):
+            parent.children.append(self)
+
+    def long_name(self):
+        names = []
+        node = self
+        while(node is not None):
+            names.append(node.name)
+            node = node.parent
+        return '|' + '|'.join(reversed(names))
+
+    def add_attr(self, name, value=0.0, keyable=True):
+        self.values[name] = value
+        self.defaults[name] = value
+        if(keyable):
+            self.keyable.add(name)
+
+    def value(self, channel, time=None):
+        '''
+        Value of a channel at a time, None meaning the current time.
+        '''
+
+        if(time is None):
+            time = self.scene.time
+        if(time == self.scene.time and channel in self.overrides):
+            return self.overrides[channel]
+        if(self.constraint is not None and channel in _TRANSFORM_CHANNELS):
+            return self.constrained_channels(time)[channel]
+        if(channel in self.curves):
+            return self.curves[channel].evaluate(time)
+        if(channel not in self.values):
+            raise MayaAttributeError("'{}' has no attribute '{}'".format(self.name, channel))
+        return self.values[channel]
+
+    def set_value(self, channel, value):
+        if(channel not in self.values):
+            raise MayaAttributeError("'{}' has no attribute '{}'".format(self.name, channel))
+        if(channel in self.curves):
+            self.overrides[channel] = value
+        else:
+            self.values[channel] = value
+        self.scene.dirty()
+
+    def local_matrix(self, time=None):
+        if(self.constraint is not None):
+            return self.constraint.local_matrix(time)
+        order = ROTATE_ORDERS[int(self.value('rotateOrder', time))]
+        joint_orient = None
+        if(self.type == 'joint'):
+            joint_orient = [self.value(c, time) for c in COMPOUND_CHANNELS['jointOrient']]
+        return compose(
+            [self.value(c, time) for c in COMPOUND_CHANNELS['translate']],
+            [self.value(c, time) for c in COMPOUND_CHANNELS['rotate']],
+            [self.value(c, time) for c in COMPOUND_CHANNELS['scale']],
+            order, joint_orient)
+
+    def parent_matrix(self, time=None):
+        if(self.parent is None):
+            return np.identity(4)
+        return self.parent.world_matrix(time)
+
+    def world_matrix(self, time=None):
+        if(time is None):
+            time = self.scene.time
+        key = (self.name, time)
+        cached = self.scene.cache.get(key)
+        if(cached is None):
+            cached = self.local_matrix(time).dot(self.parent_matrix(time))
+            self.scene.cache[key] = cached
+        return cached
+
+    def set_world_matrix(self, matrix, translate=True, rotate=True):
+        '''
+        Set the channels so the world matrix becomes matrix (scale is left alone).
+        '''
+
+        local = np.asarray(matrix).dot(np.linalg.inv(self.parent_matrix()))
+        if(self.type == 'joint'):
+            joint_orient = euler_to_matrix(
+                [math.radians(self.value(c)) for c in COMPOUND_CHANNELS['jointOrient']])
+            local = local.copy()
+            norms = np.linalg.norm(local[:3, :3], axis=1)[:, np.newaxis]
+            local[:3, :3] = (local[:3, :3] / norms).dot(joint_orient.T) * norms
+        order = ROTATE_ORDERS[int(self.value('rotateOrder'))]
+        new_translate, new_rotate, scale = decompose(local, order)
+        if(rotate):
+            previous = [math.radians(self.value(c)) for c in COMPOUND_CHANNELS['rotate']]
+            new_rotate = [
+                math.degrees(v) for v in closest_euler(
+                    [math.radians(r) for r in new_rotate], previous, order)]
+            for channel, value in zip(COMPOUND_CHANNELS['rotate'], new_rotate):
+                self.set_value(channel, value)
+        if(translate):
+            for channel, value in zip(COMPOUND_CHANNELS['translate'], new_translate):
+                self.set_value(channel, value)
+
+    def constrained_channels(self, time):
+        key = ('channels', self.name, time)
+        cached = self.scene.cache.get(key)
+        if(cached is not None):
+            return cached
+        order = ROTATE_ORDERS[int(self.values['rotateOrder'])]
+        translate, rotate, scale = decompose(self.constraint.local_matrix(time), order)
+        channels = dict(zip(COMPOUND_CHANNELS['translate'], translate))
+        channels.update(zip(COMPOUND_CHANNELS['rotate'], rotate))
+        channels.update(zip(COMPOUND_CHANNELS['scale'], scale))
+        self.scene.cache[key] = channels
+        return channels
+
+
+_TRANSFORM_CHANNELS = set(
+    COMPOUND_CHANNELS['translate'] + COMPOUND_CHANNELS['rotate'] + COMPOUND_CHANNELS['scale'])
+
+
+class AnimCurve(object):
+    '''
+    Linear animation curve, holding flat outside it's keys.
+    '''
+
+    def __init__(self):
+        self.times = []
+        self.values = []
+
+    def set_key(self, time, value):
+        index = bisect.bisect_left(self.times, time)
+        if(index < len(self.times) and self.times[index] == time):
+            self.values[index] = value
+        else:
+            self.times.insert(index, time)
+            self.values.insert(index, value)
+
+    def evaluate(self, time):
+        if(time <= self.times[0]):
+            return self.values[0]
+        if(time >= self.times[-1]):
+            return self.values[-1]
+        index = bisect.bisect_right(self.times, time)
+        t0, t1 = self.times[index - 1], self.times[index]
+        v0, v1 = self.values[index - 1], self.values[index]
+        return v0 + (v1 - v0) * (time - t0) / (t1 - t0)
+
+
+class Constraint(object):
+    '''
+    Parent, point or orient constraint of a node to a target, optionally keeping the offset.
+    '''
+
+    def __init__(self, scene, name, kind, target, node, offset=None):
+        self.scene = scene
+        self.name = name
+        self.kind = kind
+        self.target = target
+        self.node = node
+        self.offset = np.identity(4) if offset is None else offset
+
+    def local_matrix(self, time):
+        node = self.node
+        world = self.offset.dot(self.target.world_matrix(time))
+        if(self.kind != 'parent'):
+            # Keep the half of the node's own transform the constraint doesn't drive.
+            node.constraint = None
+            own = node.local_matrix(time).dot(node.parent_matrix(time))
+            node.constraint = self
+            if(self.kind == 'point'):
+                own = own.copy()
+                own[3, :3] = world[3, :3]
+                world = own
+            elif(self.kind == 'orient'):
+                world = world.copy()
+                world[3, :3] = own[3, :3]
+        return world.dot(np.linalg.inv(node.parent_matrix(time)))
+
+
+class Scene(object):
+    '''
+    All the state of the mock session.
+    '''
+
+    def __init__(self):
+        self.nodes = {}
+        self.constraints = {}
+        self.time = 1.0
+        self.range_selection = None
+        self.selection = []
+        self.cache = {}
+        self.calls = Counter()
+        self.warnings = []
+        self.callbacks = {'scene': {}, 'name': {}, 'removed': {}, 'added': {}}
+        self.next_callback_id = 1
+        self.deferred = []
+        self.progress = {}
+        self.scene_name = ''
+        self.settings = {
+            'autoKeyframe': False, 'refreshSuspended': False, 'evaluation': 'parallel'}
+
+    def dirty(self):
+        self.cache.clear()
+
+    def reset_counts(self):
+        self.calls.clear()
+
+    def add_node(self, name, node_type='transform', parent=None, translate=None, rotate=None):
+        if(isinstance(parent, str)):
+            parent = self.nodes[parent]
+        node = Node(self, name, node_type, parent)
+        self.nodes[name] = node
+        if(translate is not None):
+            for channel, value in zip(COMPOUND_CHANNELS['translate'], translate):
+                node.values[channel] = float(value)
+        if(rotate is not None):
+            for channel, value in zip(COMPOUND_CHANNELS['rotate'], rotate):
+                node.values[channel] = float(value)
+        for callback in list(self.callbacks['added'].values()):
+            callback(MObject(name), None)
+        self.dirty()
+        return node
+
+    def get(self, name):
+        name = str(name)
+        if('|' in name):
+            name = name.split('|')[-1]
+        node = self.nodes.get(name)
+        if(node is None):
+            raise MayaNodeError("No object matches name: {}".format(name))
+        return node
+
+    def remove(self, name):
+        node = self.nodes.pop(name)
+        for child in list(node.children):
+            self.remove(child.name)
+        if(node.parent is not None):
+            node.parent.children.remove(node)
+        for callback in list(self.callbacks['removed'].values()):
+            callback(MObject(name), None)
+        self.dirty()
+
+    def rename(self, node, new_name):
+        old_name = node.name
+        del self.nodes[old_name]
+        node.name = new_name
+        self.nodes[new_name] = node
+        for callback in list(self.callbacks['name'].values()):
+            callback(MObject(new_name), old_name, None)
+        self.dirty()
+
+    def set_time(self, time):
+        if(time != self.time):
+            self.overrides_clear()
+        self.time = float(time)
+
+    def overrides_clear(self):
+        for node in self.nodes.values():
+            node.overrides.clear()
+        self.dirty()
+
+    def key(self, node, channel, time=None, value=None):
+        if(time is None):
+            time = self.time
+        if(value is None):
+            value = node.value(channel, time)
+        curve = node.curves.get(channel)
+        if(curve is None):
+            curve = node.curves[channel] = AnimCurve()
+        curve.set_key(float(time), float(value))
+        if(time == self.time):
+            node.overrides.pop(channel, None)
+        self.dirty()
+
+    def fire_scene_callbacks(self):
+        for callback in list(self.callbacks['scene'].values()):
+            callback(None)
+
+
+# ------------------------------------------------------------------------------------------------
+# pymel.core
+# ------------------------------------------------------------------------------------------------
+
+def _api(function):
+    '''
+    Count calls to a function of the fake pymel.core.
+    '''
+
+    name = function.__name__
+
+    def counted(*args, **kwargs):
+        scene.calls[name] += 1
+        return function(*args, **kwargs)
+
+    counted.__name__ = name
+    counted.__doc__ = function.__doc__
+
+    return counted
+
+
+class PyNode(object):
+    '''
+    Stand-in for pymel's PyNode, for transforms and joints.
+    '''
+
+    def __init__(self, name):
+        scene.calls['PyNode'] += 1
+        if(isinstance(name, PyNode)):
+            node = name._node
+        else:
+            node = scene.get(name)
+        object.__setattr__(self, '_node', node)
+
+    def __getattr__(self, name):
+        node = object.__getattribute__(self, '_node')
+        if(name in COMPOUND_CHANNELS or name in node.values):
+            return Attribute(node, name)
+        raise MayaAttributeError("'{}' has no attribute '{}'".format(node.name, name))
+
+    def __str__(self):
+        return self._node.name
+
+    def __repr__(self):
+        return "nt.Transform('{}')".format(self._node.name)
+
+    def __eq__(self, other):
+        if(isinstance(other, PyNode)):
+            return self._node is other._node
+        return self._node.name == str(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._node)
+
+    def __contains__(self, text):
+        return text in self._node.name
+
+    def name(self):
+        return self._node.name
+
+    def nodeName(self):
+        return self._node.name
+
+    def longName(self):
+        return self._node.long_name()
+
+    def namespace(self):
+        if(':' in self._node.name):
+            return self._node.name.rsplit(':', 1)[0] + ':'
+        return ''
+
+    def type(self):
+        return self._node.type
+
+    def nodeType(self):
+        return self._node.type
+
+    def rename(self, new_name):
+        scene.rename(self._node, new_name)
+        return self
+
+    def getParent(self):
+        if(self._node.parent is None):
+            return None
+        return PyNode(self._node.parent.name)
+
+    def hasAttr(self, attribute):
+        return attribute in self._node.values or attribute in COMPOUND_CHANNELS
+
+
+class Attribute(object):
+    '''
+    Stand-in for a pymel Attribute on a mock node.
+    '''
+
+    def __init__(self, node, name):
+        self.node = node
+        self.attr_name = name
+
+    def __str__(self):
+        return '{}.{}'.format(self.node.name, self.attr_name)
+
+    def __getattr__(self, axis):
+        if(self.attr_name in COMPOUND_CHANNELS and axis in ('x', 'y', 'z')):
+            return Attribute(self.node, self.attr_name + axis.upper())
+        raise MayaAttributeError(axis)
+
+    def name(self):
+        return str(self)
+
+    def get(self, **kwargs):
+        return _get_plug(self.node, self.attr_name, kwargs.get('time'))
+
+    def set(self, *values):
+        _set_plug(self.node, self.attr_name, values)
+
+
+def _split_plug(plug):
+    node_name, attribute = str(plug).split('.', 1)
+    return scene.get(node_name), attribute.split('[')[0]
+
+
+def _get_plug(node, attribute, time=None):
+    if(attribute in ('worldMatrix', 'matrix', 'parentMatrix', 'worldInverseMatrix')):
+        if(attribute == 'worldMatrix'):
+            return Matrix(node.world_matrix(time))
+        if(attribute == 'worldInverseMatrix'):
+            return Matrix(np.linalg.inv(node.world_matrix(time)))
+        if(attribute == 'parentMatrix'):
+            return Matrix(node.parent_matrix(time))
+        return Matrix(node.local_matrix(time))
+    if(attribute in COMPOUND_CHANNELS):
+        return Vector([node.value(c, time) for c in COMPOUND_CHANNELS[attribute]])
+    return node.value(attribute, time)
+
+
+def _set_plug(node, attribute, values):
+    if(len(values) == 1 and hasattr(values[0], '__iter__')):
+        values = list(values[0])
+    if(attribute in COMPOUND_CHANNELS):
+        for channel, value in zip(COMPOUND_CHANNELS[attribute], values):
+            node.set_value(channel, float(value))
+    else:
+        node.set_value(attribute, values[0])
+
+
+def _nodes(args):
+    '''
+    Flatten the node arguments of a command into mock nodes.
+    '''
+
+    result = []
+    for arg in args:
+        if(isinstance(arg, (list, tuple))):
+            result.extend(_nodes(arg))
+        elif(isinstance(arg, PyNode)):
+            result.append(arg._node)
+        elif(isinstance(arg, Constraint)):
+            result.append(arg)
+        else:
+            result.append(scene.get(str(arg).split('.')[0]))
+    return result
+
+
+def _channels(attributes):
+    channels = []
+    for attribute in attributes:
+        channels.extend(COMPOUND_CHANNELS.get(attribute, (attribute,)))
+    return channels
+
+
+@_api
+def ls(*patterns, **kwargs):
+    if(kwargs.get('sl') or kwargs.get('selection')):
+        return [PyNode(name) for name in scene.selection if name in scene.nodes]
+    node_type = kwargs.get('type')
+    names = sorted(scene.nodes)
+    if(patterns):
+        names = [n for n in names if any(fnmatch.fnmatchcase(n, str(p)) for p in patterns)]
+    if(node_type is not None):
+        names = [n for n in names if scene.nodes[n].type == node_type]
+    return [PyNode(name) for name in names]
+
+
+@_api
+def selected():
+    return [PyNode(name) for name in scene.selection if name in scene.nodes]
+
+
+@_api
+def select(*nodes, **kwargs):
+    if(kwargs.get('clear') or kwargs.get('cl')):
+        scene.selection = []
+        return
+    scene.selection = [node.name for node in _nodes(nodes)]
+
+
+@_api
+def listRelatives(node, **kwargs):
+    node = _nodes([node])[0]
+    if(kwargs.get('p') or kwargs.get('parent')):
+        return [PyNode(node.parent.name)] if node.parent is not None else []
+    if(kwargs.get('ad') or kwargs.get('allDescendents')):
+        found = []
+        stack = list(node.children)
+        while(stack):
+            child = stack.pop()
+            found.append(child)
+            stack.extend(child.children)
+    else:
+        found = list(node.children)
+    node_type = kwargs.get('type')
+    if(node_type is not None):
+        found = [child for child in found if child.type == node_type]
+    return [PyNode(child.name) for child in found]
+
+
+@_api
+def objExists(name):
+    try:
+        scene.get(str(name).split('.')[0])
+    except MayaNodeError:
+        return False
+    return True
+
+
+@_api
+def hasAttr(node, attribute):
+    return PyNode(node).hasAttr(attribute)
+
+
+@_api
+def listAttr(node, **kwargs):
+    node = _nodes([node])[0]
+    names = sorted(node.values)
+    if(kwargs.get('k') or kwargs.get('keyable')):
+        names = [name for name in names if name in node.keyable]
+    return names
+
+
+@_api
+def attributeQuery(attribute, **kwargs):
+    node = _nodes([kwargs.get('n', kwargs.get('node'))])[0]
+    if(kwargs.get('ld') or kwargs.get('listDefault')):
+        return [node.defaults[attribute]]
+    if(kwargs.get('ex') or kwargs.get('exists')):
+        return attribute in node.values
+    return None
+
+
+@_api
+def getAttr(plug, **kwargs):
+    node, attribute = _split_plug(plug)
+    return _get_plug(node, attribute, kwargs.get('time', kwargs.get('t')))
+
+
+@_api
+def setAttr(plug, *values, **kwargs):
+    if('.ktv[' in str(plug) or '.keyTimeValue[' in str(plug)):
+        _set_key_time_values(plug, values)
+        return
+    node, attribute = _split_plug(plug)
+    _set_plug(node, attribute, values)
+
+
+def _curve_name(node, channel):
+    # Maya's name for a curve made by setKeyframe.
+    return '{}_{}'.format(node.name, channel)
+
+
+def _set_key_time_values(plug, values):
+    # 'curve.ktv[first:last]' takes a time and a value for each key from first to last.
+    name, indices = str(plug).rstrip(']').split('[', 1)
+    node_name, channel = name.split('.')[0].rsplit('_', 1)
+    curve = scene.get(node_name).curves[channel]
+    first = int(indices.split(':')[0])
+    for offset in range(len(values) // 2):
+        time, value = float(values[offset * 2]), float(values[offset * 2 + 1])
+        if(first + offset < len(curve.times)):
+            curve.times[first + offset] = time
+            curve.values[first + offset] = value
+        else:
+            curve.set_key(time, value)
+    scene.dirty()
+
+
+@_api
+def xform(node, **kwargs):
+    node = _nodes([node])[0]
+    world = kwargs.get('ws', kwargs.get('worldSpace', False))
+    query = kwargs.get('q', kwargs.get('query', False))
+    translate = kwargs.get('t', kwargs.get('translation'))
+    rotate = kwargs.get('ro', kwargs.get('rotation'))
+    matrix = kwargs.get('m', kwargs.get('matrix'))
+    order = ROTATE_ORDERS[int(node.value('rotateOrder'))]
+
+    if(query):
+        source = node.world_matrix() if world else node.local_matrix()
+        if(rotate):
+            return decompose(source, order)[1]
+        if(matrix):
+            return [float(v) for v in np.asarray(source).flatten()]
+        return [float(v) for v in source[3, :3]]
+
+    if(matrix is not None):
+        values = matrix.tolist() if isinstance(matrix, Matrix) else matrix
+        new_translate, new_rotate, new_scale = decompose(
+            np.asarray(values, dtype=float).reshape(4, 4), order)
+        for compound, values in (('translate', new_translate), ('rotate', new_rotate),
+                                 ('scale', new_scale)):
+            for channel, value in zip(COMPOUND_CHANNELS[compound], values):
+                node.set_value(channel, value)
+
+    relative = kwargs.get('r') or kwargs.get('relative')
+    if(translate is not None and translate is not True):
+        translate = list(translate)
+        if(world):
+            _set_world_translate(node, translate)
+        else:
+            if(relative):
+                translate = [
+                    node.value(c) + v for c, v in zip(COMPOUND_CHANNELS['translate'], translate)]
+            for channel, value in zip(COMPOUND_CHANNELS['translate'], translate):
+                node.set_value(channel, float(value))
+
+    if(rotate is not None and rotate is not True):
+        if(relative or world):
+            _set_world_rotate(node, rotate, relative)
+        else:
+            for channel, value in zip(COMPOUND_CHANNELS['rotate'], rotate):
+                node.set_value(channel, float(value))
+
+
+def _set_world_translate(node, translate):
+    parent_inverse = np.linalg.inv(node.parent_matrix())
+    translate = list(np.append(list(translate), 1.0).dot(parent_inverse)[:3])
+    for channel, value in zip(COMPOUND_CHANNELS['translate'], translate):
+        node.set_value(channel, float(value))
+
+
+def _set_world_rotate(node, rotate, relative=False):
+    order = ROTATE_ORDERS[int(node.value('rotateOrder'))]
+    rotation = euler_to_matrix([math.radians(v) for v in rotate], order)
+    current = node.world_matrix()
+    target = current.copy()
+    scale = np.linalg.norm(current[:3, :3], axis=1)[:, np.newaxis]
+    if(relative):
+        # Object space relative rotation sits on the left of the current matrix.
+        target[:3, :3] = rotation.dot(current[:3, :3] / scale) * scale
+    else:
+        target[:3, :3] = rotation * scale
+    node.set_world_matrix(target, translate=False)
+
+
+@_api
+def matchTransform(node, target, **kwargs):
+    node, target = _nodes([node, target])
+    position = kwargs.get('pos', kwargs.get('position', False))
+    rotation = kwargs.get('rot', kwargs.get('rotation', False))
+    if(not position and not rotation):
+        position = rotation = True
+    _match(node, target, position, rotation)
+
+
+def _match(node, target, position, rotation):
+    goal = target.world_matrix().copy()
+    current = node.world_matrix()
+    scale = np.linalg.norm(current[:3, :3], axis=1)[:, np.newaxis]
+    goal_scale = np.linalg.norm(goal[:3, :3], axis=1)[:, np.newaxis]
+    goal[:3, :3] = goal[:3, :3] / goal_scale * scale
+    node.set_world_matrix(goal, translate=bool(position), rotate=bool(rotation))
+
+
+@_api
+def setKeyframe(*nodes, **kwargs):
+    attributes = kwargs.get('at', kwargs.get('attribute'))
+    if(isinstance(attributes, str)):
+        attributes = [attributes]
+    time = kwargs.get('t', kwargs.get('time'))
+    value = kwargs.get('v', kwargs.get('value'))
+    if(isinstance(time, list)):
+        # A list of times keys each of them, a (start, end) range only it's start.
+        for each in time:
+            _key_nodes(_nodes(nodes), attributes, each, value)
+        return len(time)
+    if(isinstance(time, tuple)):
+        time = time[0]
+    _key_nodes(_nodes(nodes), attributes, time, value)
+    return 1
+
+
+def _key_nodes(nodes, attributes, time=None, value=None):
+    # Values are all read before anything is keyed, as Maya evaluates once for the whole command.
+    keys = []
+    for node in nodes:
+        channels = _channels(attributes) if attributes else sorted(node.keyable)
+        for channel in channels:
+            if(value is None):
+                keys.append((node, channel, node.value(channel, time)))
+            else:
+                keys.append((node, channel, value))
+    for node, channel, key_value in keys:
+        scene.key(node, channel, time, key_value)
+
+
+@_api
+def bakeResults(*nodes, **kwargs):
+    start, end = kwargs.get('t', kwargs.get('time'))
+    step = kwargs.get('sampleBy', kwargs.get('sb', 1))
+    attributes = kwargs.get('at', kwargs.get('attribute'))
+    frames = []
+    frame = float(start)
+    while(frame <= end + 1e-6):
+        frames.append(frame)
+        frame += step
+    keys = []
+    for node in _nodes(nodes):
+        channels = _channels(attributes) if attributes else sorted(node.keyable)
+        for frame in frames:
+            for channel in channels:
+                keys.append((node, channel, frame, node.value(channel, frame)))
+    for node, channel, frame, value in keys:
+        scene.key(node, channel, frame, value)
+    return len(frames)
+
+
+@_api
+def cutKey(*nodes, **kwargs):
+    attributes = kwargs.get('at', kwargs.get('attribute'))
+    if(isinstance(attributes, str)):
+        attributes = [attributes]
+    time_range = kwargs.get('t', kwargs.get('time'))
+    for node in _nodes(nodes):
+        channels = _channels(attributes) if attributes else list(node.curves)
+        for channel in channels:
+            curve = node.curves.get(channel)
+            if(curve is None):
+                continue
+            if(time_range is None):
+                del node.curves[channel]
+                continue
+            kept = [(t, v) for t, v in zip(curve.times, curve.values)
+                    if not time_range[0] <= t <= time_range[1]]
+            if(not kept):
+                del node.curves[channel]
+                continue
+            curve.times = [t for t, v in kept]
+            curve.values = [v for t, v in kept]
+    scene.dirty()
+
+
+@_api
+def keyframe(*nodes, **kwargs):
+    attributes = kwargs.get('at', kwargs.get('attribute'))
+    if(isinstance(attributes, str)):
+        attributes = [attributes]
+    time_range = kwargs.get('t', kwargs.get('time'))
+    query = kwargs.get('q', kwargs.get('query', False))
+    results = []
+    for node in _nodes(nodes):
+        channels = _channels(attributes) if attributes else sorted(node.curves)
+        for channel in channels:
+            curve = node.curves.get(channel)
+            if(curve is None):
+                continue
+            if(query and (kwargs.get('n') or kwargs.get('name'))):
+                results.append(_curve_name(node, channel))
+                continue
+            for index, time in enumerate(curve.times):
+                if(time_range is not None and not time_range[0] <= time <= time_range[1]):
+                    continue
+                if(query):
+                    if(kwargs.get('vc') or kwargs.get('valueChange')):
+                        results.append(curve.values[index])
+                    else:
+                        results.append(time)
+                elif('vc' in kwargs or 'valueChange' in kwargs):
+                    curve.values[index] = float(kwargs.get('vc', kwargs.get('valueChange')))
+    scene.dirty()
+    if(query):
+        return results
+    return len(results)
+
+
+@_api
+def keyTangent(*nodes, **kwargs):
+    # Mock curves are linear, there are no tangents to query or edit.
+    if(kwargs.get('q') or kwargs.get('query')):
+        return []
+    return 0
+
+
+@_api
+def currentTime(*args, **kwargs):
+    if(args and not kwargs.get('q') and not kwargs.get('query')):
+        scene.set_time(args[0])
+    return scene.time
+
+
+@_api
+def refresh(*args, **kwargs):
+    if('suspend' in kwargs):
+        scene.settings['refreshSuspended'] = bool(kwargs['suspend'])
+    return None
+
+
+@_api
+def timeControl(*args, **kwargs):
+    if(kwargs.get('ra') or kwargs.get('rangeArray')):
+        if(scene.range_selection is None):
+            return [scene.time, scene.time + 1.0]
+        return list(scene.range_selection)
+    return None
+
+
+@_api
+def playbackOptions(*args, **kwargs):
+    if(kwargs.get('q') or kwargs.get('query')):
+        start, end = scene.range_selection or (scene.time, scene.time + 1.0)
+        if(kwargs.get('min') or kwargs.get('minTime') or kwargs.get('ast')):
+            return start
+        return end
+    return None
+
+
+@_api
+def autoKeyframe(*args, **kwargs):
+    if(kwargs.get('q') or kwargs.get('query')):
+        return scene.settings['autoKeyframe']
+    if('state' in kwargs):
+        scene.settings['autoKeyframe'] = kwargs['state']
+
+
+@_api
+def evaluationManager(*args, **kwargs):
+    if(kwargs.get('q') or kwargs.get('query')):
+        return [scene.settings['evaluation']]
+    if('mode' in kwargs):
+        scene.settings['evaluation'] = kwargs['mode']
+
+
+@_api
+def about(*args, **kwargs):
+    if(kwargs.get('batch')):
+        return scene.settings.get('batch', False)
+    return ''
+
+
+@_api
+def undoInfo(*args, **kwargs):
+    return None
+
+
+@_api
+def evalDeferred(*args, **kwargs):
+    # Queued until run_deferred(), which stands in for Maya going idle.
+    scene.deferred.append(args[0])
+    return None
+
+
+@_api
+def progressBar(*args, **kwargs):
+    progress = scene.progress
+    if(kwargs.get('q') or kwargs.get('query')):
+        if(kwargs.get('isCancelled') or kwargs.get('ic')):
+            return bool(progress.get('cancelled'))
+        return progress.get('progress', 0)
+    if(kwargs.get('beginProgress') or kwargs.get('bp')):
+        progress.clear()
+        progress['active'] = True
+    if(kwargs.get('endProgress') or kwargs.get('ep')):
+        progress['active'] = False
+        progress['cancelled'] = False
+    for flag in ('progress', 'status', 'maxValue'):
+        if(flag in kwargs):
+            progress[flag] = kwargs[flag]
+    return None
+
+
+@_api
+def sceneName(*args, **kwargs):
+    return scene.scene_name
+
+
+@_api
+def warning(message):
+    scene.warnings.append(message)
+
+
+@_api
+def error(message):
+    raise RuntimeError(message)
+
+
+@_api
+def confirmDialog(*args, **kwargs):
+    return kwargs.get('button', ['OK'])[0]
+
+
+@_api
+def spaceLocator(*args, **kwargs):
+    index = 1
+    while('locator{}'.format(index) in scene.nodes):
+        index += 1
+    return PyNode(scene.add_node('locator{}'.format(index)).name)
+
+
+@_api
+def parent(*args, **kwargs):
+    nodes = _nodes([arg for arg in args if arg is not None])
+    if(kwargs.get('w') or kwargs.get('world')):
+        children, new_parent = nodes, None
+    else:
+        children, new_parent = nodes[:-1], nodes[-1]
+    for child in children:
+        world = child.world_matrix().copy()
+        if(child.parent is not None):
+            child.parent.children.remove(child)
+        child.parent = new_parent
+        if(new_parent is not None):
+            new_parent.children.append(child)
+        scene.dirty()
+        if(not (kwargs.get('r') or kwargs.get('relative'))):
+            child.set_world_matrix(world)
+
+
+@_api
+def delete(*args, **kwargs):
+    for item in _nodes(args):
+        if(isinstance(item, Constraint)):
+            item.node.constraint = None
+            scene.constraints.pop(item.name, None)
+            scene.dirty()
+        elif(item.name in scene.nodes):
+            scene.remove(item.name)
+
+
+@_api
+def duplicate(*args, **kwargs):
+    # Copies keep their local values and hang under the copy of their parent when it was
+    # duplicated too.  Names get the lowest free number on the end, as Maya's do.
+    originals = _nodes(args)
+    copies = {}
+    for node in sorted(originals, key=lambda node: node.long_name().count('|')):
+        base = node.name.split(':')[-1].rstrip('0123456789')
+        index = 1
+        while('{}{}'.format(base, index) in scene.nodes):
+            index += 1
+        parent = node.parent
+        if(parent is not None):
+            parent = copies.get(parent.name, parent)
+        copy = scene.add_node('{}{}'.format(base, index), node.type, parent)
+        copy.values = dict(node.values)
+        copies[node.name] = copy
+
+    return [PyNode(copies[node.name].name) for node in originals]
+
+
+def _constraint(kind):
+    def constraint(target, node, **kwargs):
+        target, node = _nodes([target, node])
+        offset = None
+        if(kwargs.get('mo') or kwargs.get('maintainOffset')):
+            offset = node.world_matrix().dot(np.linalg.inv(target.world_matrix()))
+        name = '{}_{}Constraint{}'.format(node.name, kind, len(scene.constraints) + 1)
+        node.constraint = Constraint(scene, name, kind, target, node, offset)
+        scene.constraints[name] = node.constraint
+        scene.dirty()
+        return node.constraint
+    constraint.__name__ = kind + 'Constraint'
+    return _api(constraint)
+
+
+parentConstraint = _constraint('parent')
+pointConstraint = _constraint('point')
+orientConstraint = _constraint('orient')
+
+
+@_api
+def window(*args, **kwargs):
+    if(kwargs.get('exists')):
+        return False
+    return _Widget()
+
+
+@_api
+def deleteUI(*args, **kwargs):
+    return None
+
+
+@_api
+def rowColumnLayout(*args, **kwargs):
+    return _Widget()
+
+
+@_api
+def button(*args, **kwargs):
+    return _Widget()
+
+
+class _Widget(object):
+    def setCommand(self, command):
+        self.command = command
+
+    def show(self):
+        return None
+
+
+# ------------------------------------------------------------------------------------------------
+# backend
+# ------------------------------------------------------------------------------------------------
+
+def _backend_api(function):
+    '''
+    Count calls to a method of MockBackend as 'backend.<method>'.
+    '''
+
+    name = 'backend.' + function.__name__
+
+    def counted(*args, **kwargs):
+        scene.calls[name] += 1
+        return function(*args, **kwargs)
+
+    counted.__name__ = function.__name__
+    counted.__doc__ = function.__doc__
+
+    return counted
+
+
+class MockBackend(backend.Backend):
+    '''
+    A backend.Backend working on the mock scene directly, with none of pymel's flag handling in
+    between.  Results match the pymel backend on the same scene.
+
+    usage:
+    backend.set_backend(mock_maya.MockBackend())
+    '''
+
+    name = 'mock'
+
+    @_backend_api
+    def matrix(self, plug, time=None):
+        node, attribute = _split_plug(plug)
+        return _get_plug(node, attribute, time)
+
+    @_backend_api
+    def matrices(self, plugs, time=None):
+        values = []
+        for plug in plugs:
+            node, attribute = _split_plug(plug)
+            values.append(_get_plug(node, attribute, time))
+        return values
+
+    @_backend_api
+    def world_position(self, node):
+        return [float(v) for v in _nodes([node])[0].world_matrix()[3, :3]]
+
+    @_backend_api
+    def world_rotation(self, node):
+        node = _nodes([node])[0]
+        order = ROTATE_ORDERS[int(node.value('rotateOrder'))]
+        return decompose(node.world_matrix(), order)[1]
+
+    @_backend_api
+    def set_world_position(self, node, position):
+        _set_world_translate(_nodes([node])[0], position)
+
+    @_backend_api
+    def set_world_rotation(self, node, rotation):
+        _set_world_rotate(_nodes([node])[0], rotation)
+
+    @_backend_api
+    def rotate_by(self, node, rotation):
+        _set_world_rotate(_nodes([node])[0], rotation, relative=True)
+
+    @_backend_api
+    def match_transform(self, node, target, position=True, rotation=True, pivots=False):
+        # Mock nodes have no pivots to match.
+        node, target = _nodes([node, target])
+        _match(node, target, position, rotation)
+
+    @_backend_api
+    def get_attr(self, plug, time=None):
+        node, attribute = _split_plug(plug)
+        value = _get_plug(node, attribute, time)
+        return tuple(value) if attribute in COMPOUND_CHANNELS else value
+
+    @_backend_api
+    def get_attrs(self, plugs, time=None):
+        values = []
+        for plug in plugs:
+            node, attribute = _split_plug(plug)
+            value = _get_plug(node, attribute, time)
+            values.append(tuple(value) if attribute in COMPOUND_CHANNELS else value)
+        return values
+
+    @_backend_api
+    def set_attr(self, plug, value):
+        node, attribute = _split_plug(plug)
+        _set_plug(node, attribute, [value])
+
+    @_backend_api
+    def set_attrs(self, values, undo_name='sr_biped'):
+        for plug, value in values:
+            node, attribute = _split_plug(plug)
+            _set_plug(node, attribute, [value])
+
+    @_backend_api
+    def set_key(self, nodes, attributes=None):
+        if(isinstance(attributes, str)):
+            attributes = [attributes]
+        _key_nodes(_nodes([nodes]), attributes)
+
+    @_backend_api
+    def set_keys(self, node, attribute, times, values):
+        node = _nodes([node])[0]
+        for channel_index, channel in enumerate(_channels([attribute])):
+            for time, value in zip(times, values):
+                if(hasattr(value, '__iter__')):
+                    value = list(value)[channel_index]
+                scene.key(node, channel, time, value)
+
+
+# ------------------------------------------------------------------------------------------------
+# maya.mel and OpenMaya
+# ------------------------------------------------------------------------------------------------
+
+def mel_eval(command):
+    scene.calls['mel.eval'] += 1
+    if('gPlayBackSlider' in command):
+        return 'timeControl1'
+    if('gMainProgressBar' in command):
+        return 'MainProgressBar'
+    return ''
+
+
+class MObject(object):
+    def __init__(self, name=None):
+        self.name = name
+
+
+class MFnDependencyNode(object):
+    def __init__(self, mobject):
+        self.mobject = mobject
+
+    def name(self):
+        return self.mobject.name
+
+
+class MSceneMessage(object):
+    kAfterOpen = 'kAfterOpen'
+    kAfterNew = 'kAfterNew'
+    kAfterImport = 'kAfterImport'
+    kAfterCreateReference = 'kAfterCreateReference'
+    kAfterLoadReference = 'kAfterLoadReference'
+    kAfterUnloadReference = 'kAfterUnloadReference'
+    kAfterRemoveReference = 'kAfterRemoveReference'
+
+    @staticmethod
+    def addCallback(message, function, *args):
+        return _add_callback('scene', function)
+
+
+class MNodeMessage(object):
+    @staticmethod
+    def addNameChangedCallback(mobject, function, *args):
+        return _add_callback('name', function)
+
+
+class MDGMessage(object):
+    @staticmethod
+    def addNodeAddedCallback(function, node_type='dependNode', *args):
+        return _add_callback('added', function)
+
+    @staticmethod
+    def addNodeRemovedCallback(function, node_type='dependNode', *args):
+        return _add_callback('removed', function)
+
+
+class MMessage(object):
+    @staticmethod
+    def removeCallbacks(ids):
+        for callback_id in ids:
+            for table in scene.callbacks.values():
+                table.pop(callback_id, None)
+
+
+def _add_callback(kind, function):
+    callback_id = scene.next_callback_id
+    scene.next_callback_id += 1
+    scene.callbacks[kind][callback_id] = function
+    return callback_id
+
+
+# ------------------------------------------------------------------------------------------------
+# Installing
+# ------------------------------------------------------------------------------------------------
+
+def install():
+    '''
+    Put the fake modules in sys.modules and start a fresh scene.  Modules of sr_biped imported
+    afterwards get the mock instead of Maya.
+
+    Return value: Scene
+    '''
+
+    global scene
+
+    scene = Scene()
+    this = sys.modules[__name__]
+
+    datatypes = types.ModuleType('pymel.core.datatypes')
+    for name in ('Vector', 'Point', 'Matrix', 'EulerRotation', 'TransformationMatrix'):
+        setattr(datatypes, name, getattr(this, name))
+
+    core = types.ModuleType('pymel.core')
+    core.datatypes = datatypes
+    core.PyNode = PyNode
+    core.Attribute = Attribute
+    core.MayaNodeError = MayaNodeError
+    core.MayaAttributeError = MayaAttributeError
+    for name in ('ls', 'selected', 'select', 'listRelatives', 'objExists', 'hasAttr', 'listAttr',
+                 'attributeQuery', 'getAttr',
+                 'setAttr', 'xform', 'matchTransform', 'setKeyframe', 'bakeResults', 'cutKey',
+                 'keyframe', 'keyTangent', 'currentTime', 'refresh', 'timeControl',
+                 'playbackOptions',
+                 'autoKeyframe', 'evaluationManager', 'about', 'undoInfo', 'warning', 'error',
+                 'confirmDialog', 'spaceLocator', 'parent', 'duplicate', 'delete',
+                 'parentConstraint',
+                 'pointConstraint', 'orientConstraint', 'window', 'deleteUI', 'rowColumnLayout',
+                 'button', 'evalDeferred', 'progressBar', 'sceneName'):
+        setattr(core, name, getattr(this, name))
+
+    pymel = types.ModuleType('pymel')
+    pymel.core = core
+
+    mel = types.ModuleType('maya.mel')
+    mel.eval = mel_eval
+
+    open_maya = types.ModuleType('maya.api.OpenMaya')
+    for name in ('MObject', 'MFnDependencyNode', 'MSceneMessage', 'MNodeMessage', 'MDGMessage',
+                 'MMessage'):
+        setattr(open_maya, name, getattr(this, name))
+
+    api = types.ModuleType('maya.api')
+    api.OpenMaya = open_maya
+
+    maya = types.ModuleType('maya')
+    maya.mel = mel
+    maya.api = api
+
+    sys.modules.update({
+        'pymel': pymel,
+        'pymel.core': core,
+        'pymel.core.datatypes': datatypes,
+        'maya': maya,
+        'maya.mel': mel,
+        'maya.api': api,
+        'maya.api.OpenMaya': open_maya,
+    })
+
+    return scene
+
+
+def run_deferred(target_scene=None):
+    '''
+    Run what's been queued with evalDeferred, including anything queued while doing so, as Maya
+    would over it's idle events.
+
+    Return value: number of callables run.
+    '''
+
+    target_scene = target_scene or scene
+    count = 0
+    while(target_scene.deferred):
+        target_scene.deferred.pop(0)()
+        count += 1
+
+    return count
+
+
+def new_scene():
+    '''
+    Empty the current scene, as File > New would, firing the scene callbacks.
+    '''
+
+    callbacks = scene.callbacks
+    next_callback_id = scene.next_callback_id
+    scene.__init__()
+    scene.callbacks = callbacks
+    scene.next_callback_id = next_callback_id
+    scene.fire_scene_callbacks()
+
+    return scene
+
+
+# ------------------------------------------------------------------------------------------------
+# Synthetic rigs
+# ------------------------------------------------------------------------------------------------
+
+# Node names for the two naming variants the tools know about.  'shaper' matches constants.py,
+# 'ssc' matches the dicts in ez_switch.py.
+VARIANT_NAMES = {
+    'shaper': {
+        'arm_fk': ('armUprFK_Ctrl', 'armLwrFK_Ctrl', 'armWristFK_Ctrl'),
+        'arm_ik': ('armUprIK_Ctrl', 'ArmElbow_Ctrl', 'armWristIK_Ctrl', 'ArmPV_Ctrl'),
+        'leg_fk': ('legUprFK_Ctrl', 'legLwrFK_Ctrl', 'legAnkleFK_Ctrl'),
+        'leg_ik': ('legUprIK_Ctrl', 'LegKnee_Ctrl', 'legAnkleIK_Ctrl', 'LegPV_Ctrl'),
+        'foot': ('toe_Ctrl', 'ball_Ctrl', 'heel_Ctrl'),
+        'settings': ('ArmSetting_Ctrl', 'LegSetting_Ctrl'),
+    },
+    'ssc': {
+        'arm_fk': ('ArmUprFK_CTRL', 'ArmLwrFK_CTRL', 'ArmWristFK_CTRL'),
+        'arm_ik': ('ArmUprIK_CTRL', 'ArmElbow_CTRL', 'ArmWristIK_CTRL', 'ArmPV_CTRL'),
+        'leg_fk': ('LegUprFK_CTRL', 'LegLwrFK_CTRL', 'LegAnkleFK_CTRL'),
+        'leg_ik': ('LegUprIK_CTRL', 'LegKnee_CTRL', 'LegAnkleIK_CTRL', 'LegPV_CTRL'),
+        'foot': ('toe_CTRL', 'ball_CTRL', 'heel_CTRL'),
+        'settings': ('ArmSetting_CTRL', 'LegSetting_CTRL'),
+    },
+}
+
+ARM_DRV = {
+    'fk': ('armUprFK_drv', 'armLwrFK_drv', 'armWristFK_drv'),
+    'ik': ('armUprIK_drv', 'armLwrIK_drv', 'armWristIK_drv'),
+}
+LEG_DRV = {
+    'fk': ('legUprFK_drv', 'legLwrFK_drv', 'legAnkleFK_drv'),
+    'ik': ('legUprIK_drv', 'legLwrIK_drv', 'legAnkleIK_drv'),
+}
+
+# Rest positions of a left side limb, mirrored in X for the right.
+ARM_POSITIONS = ((15.0, 140.0, 0.0), (40.0, 140.0, -3.0), (65.0, 140.0, 0.0))
+LEG_POSITIONS = ((10.0, 95.0, 0.0), (10.0, 50.0, 3.0), (10.0, 8.0, 0.0))
+
+
+def build_biped(target_scene=None, namespace='', variant='shaper', frames=None, key_step=4):
+    '''
+    Build a synthetic Shaper biped: for each side, fk and ik controls for the arm and leg, the
+    *FK_drv / *IK_drv driver joints following them, settings controls with ikBlend, pole vector
+    space attributes and the HIK duplicate skeleton's root.
+
+    target_scene - Scene to build in, defaults to the installed one.
+    namespace - namespace of the character, without the ':'.
+    variant - 'shaper' or 'ssc' control names, see VARIANT_NAMES.
+    frames - (start, end) to animate the fk controls over, every key_step frames.  None for no
+        animation.
+
+    Return value: dict of useful node names.
+    '''
+
+    target_scene = target_scene or scene
+    names = VARIANT_NAMES[variant]
+    prefix = (namespace + ':') if namespace else ''
+    built = {'namespace': namespace, 'controls': []}
+
+    root = target_scene.add_node(prefix + 'DO_NOT_TOUCH_GRP')
+    target_scene.add_node(prefix + 'trajectory_SHJnt', 'joint', root)
+    cog = target_scene.add_node(prefix + 'Cog_Ctrl', translate=(0, 100, 0))
+    spine = target_scene.add_node(prefix + 'C_SpineFK_02_Ctrl', parent=cog, translate=(0, 20, 0))
+    chest = target_scene.add_node(
+        prefix + 'C_SpineChestFK_Ctrl', parent=spine, translate=(0, 20, 0))
+    built['controls'].extend([cog.name, spine.name, chest.name])
+
+    for side, mirror in (('L_', 1.0), ('R_', -1.0)):
+        for limb, positions, fk_names, ik_names, drv in (
+                ('Arm', ARM_POSITIONS, names['arm_fk'], names['arm_ik'], ARM_DRV),
+                ('Leg', LEG_POSITIONS, names['leg_fk'], names['leg_ik'], LEG_DRV)):
+            positions = [(x * mirror, y, z) for x, y, z in positions]
+            null = target_scene.add_node(prefix + side + limb + '_null')
+            if(limb == 'Arm'):
+                shoulder = target_scene.add_node(
+                    prefix + side + 'shoulder_Ctrl', parent=chest,
+                    translate=(5.0 * mirror, 0.0, 0.0))
+                built['controls'].append(shoulder.name)
+
+            # FK controls in a chain, each under an offset group.
+            fk_nodes = []
+            chain_parent = null
+            previous = (0.0, 0.0, 0.0)
+            for index, name in enumerate(fk_names):
+                offset = tuple(p - q for p, q in zip(positions[index], previous))
+                group = target_scene.add_node(
+                    prefix + side + name + '_grp', parent=chain_parent, translate=offset)
+                ctrl = target_scene.add_node(prefix + side + name, parent=group)
+                fk_nodes.append(ctrl)
+                chain_parent = ctrl
+                previous = positions[index]
+
+            # IK controls, top and end in world, the pole vector in a space group.
+            ik_top = target_scene.add_node(
+                prefix + side + ik_names[0], parent=null, translate=positions[0])
+            ik_mid = target_scene.add_node(
+                prefix + side + ik_names[1], parent=null, translate=positions[1])
+            ik_end = target_scene.add_node(
+                prefix + side + ik_names[2], parent=null, translate=positions[2])
+            pv_space = target_scene.add_node(prefix + side + ik_names[3] + '_space', parent=null)
+            pv = target_scene.add_node(
+                prefix + side + ik_names[3], parent=pv_space,
+                translate=(positions[1][0], positions[1][1], positions[1][2] - 40.0))
+            pv.add_attr('IK_Hand_Crl_space' if limb == 'Arm' else 'IK_Foot_Crl_space', 0.0)
+            for space in ('spineChestTip_Space', 'shoulder_Space', 'cog_Space'):
+                pv.add_attr(space, 0.0)
+            ik_nodes = [ik_top, ik_mid, ik_end]
+
+            if(limb == 'Leg'):
+                for name in names['foot']:
+                    target_scene.add_node(prefix + side + name, parent=ik_end)
+
+            settings = target_scene.add_node(
+                prefix + side + names['settings'][0 if limb == 'Arm' else 1], parent=null)
+            settings.add_attr('ikBlend', 0.0)
+
+            # Driver joints following the controls.
+            for kind, controls in (('fk', fk_nodes), ('ik', ik_nodes)):
+                joint_parent = root
+                for name, ctrl in zip(drv[kind], controls):
+                    joint = target_scene.add_node(prefix + side + name, 'joint', joint_parent)
+                    joint.constraint = Constraint(
+                        target_scene, joint.name + '_follow', 'parent', ctrl, joint)
+                    joint_parent = joint
+
+            built['controls'].extend(n.name for n in fk_nodes + ik_nodes + [pv, settings])
+
+    if(frames is not None):
+        animate(target_scene, [n for n in built['controls'] if 'FK' in n], frames, key_step)
+
+    target_scene.dirty()
+
+    return built
+
+
+def animate(target_scene, node_names, frames, key_step=4):
+    '''
+    Key a gentle swing on the rotate channels of the given nodes, every key_step frames.
+    '''
+
+    start, end = frames
+    for index, name in enumerate(node_names):
+        node = target_scene.nodes[name]
+        frame = start
+        while(frame <= end):
+            phase = (frame - start) * 0.15 + index
+            for axis, channel in enumerate(COMPOUND_CHANNELS['rotate']):
+                target_scene.key(node, channel, frame, 20.0 * math.sin(phase + axis))
+            frame += key_step
+
+    return
+
+
+# HIK joint names the constraint mapping in constants.py targets, with rest positions for the left
+# side.  Centre joints carry no side token.
+HIK_JOINTS = (
+    ('spineHip', None, (0.0, 100.0, 0.0)),
+    ('spineChest', 'spineHip', (0.0, 120.0, 0.0)),
+    ('spineChestTip', 'spineChest', (0.0, 140.0, 0.0)),
+    ('legUpr', 'spineHip', LEG_POSITIONS[0]),
+    ('legAnkle', 'legUpr', LEG_POSITIONS[2]),
+    ('shoulder', 'spineChestTip', (5.0, 140.0, 0.0)),
+    ('armUpr', 'shoulder', ARM_POSITIONS[0]),
+    ('armLwr', 'armUpr', ARM_POSITIONS[1]),
+)
+
+
+def build_hik_skeleton(target_scene=None, prefix='fbIk_', frames=None, key_step=4):
+    '''
+    Build the duplicate HIK skeleton humanik.py bakes from, as if an FBX take had been brought in
+    onto it.  Joints are in world positions, keyed every key_step frames over frames.
+
+    Return value: list of joint names.
+    '''
+
+    target_scene = target_scene or scene
+    names = []
+    for side, mirror in (('', 1.0), ('L_', 1.0), ('R_', -1.0)):
+        for name, parent, position in HIK_JOINTS:
+            centre = name.startswith('spine')
+            if(centre != (side == '')):
+                continue
+            parent_name = None
+            if(parent is not None):
+                parent_side = '' if parent.startswith('spine') else side
+                parent_name = prefix + parent_side + parent
+            world = np.array([position[0] * mirror, position[1], position[2]])
+            if(parent_name is not None):
+                parent_node = target_scene.nodes[parent_name]
+                world = world - parent_node.world_matrix()[3, :3]
+            joint = target_scene.add_node(
+                prefix + side + name, 'joint', parent_name, translate=world)
+            names.append(joint.name)
+
+    if(frames is not None):
+        animate(target_scene, names, frames, key_step)
+
+    return names
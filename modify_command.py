@@ -0,0 +1,150 @@
+'''
+modify_command.py
+Shaper Rigs / Burlington Interactive Solutions
+
+srBipedModify, a Maya command that applies OpenMaya 2 edits as one undo step.
+
+OpenMaya 2 edits made outside of a command can't be undone.  backend.OpenMayaBackend gathers it's
+writes on an Edit instead, plug values on an MDGModifier and key edits recorded on an
+MAnimCurveChange, and runs the Edit through this command, which keeps it to undo and redo.  A
+batch of any size is one command, one pass of dirty propagation and one step on the undo queue.
+
+This file is also the plug-in the command lives in.  run() loads it the first time it's needed.
+
+usage:
+edit = modify_command.Edit()
+edit.modifier.newPlugValueDouble(mplug, 1.0)
+modify_command.run(edit, 'reset_rig')
+'''
+
+import importlib
+import os
+import lazy
+
+om = lazy.module('maya.api.OpenMaya')
+oma = lazy.module('maya.api.OpenMayaAnim')
+cmds = lazy.module('maya.cmds')
+
+
+COMMAND_NAME = 'srBipedModify'
+
+# Edits waiting for the srBipedModify run() is about to call.
+_pending = []
+
+# The MPxCommand subclass, made on first use so importing this module doesn't import Maya.
+_command_class = None
+
+
+def maya_useNewAPI():
+    '''
+    Tells Maya the plug-in uses OpenMaya 2.
+    '''
+
+    pass
+
+
+class Edit(object):
+    '''
+    OpenMaya edits that are done, undone and redone together.
+
+    modifier - An om.MDGModifier to queue plug writes and new nodes on.
+    keys - Functions taking an oma.MAnimCurveChange, called after the modifier is done to make the
+        key edits, ie lambda change: curve.addKeys(times, values, change=change).
+    '''
+
+    def __init__(self):
+        self.modifier = om.MDGModifier()
+        self.keys = []
+        self.change = None
+
+    def do(self):
+        self.modifier.doIt()
+        self.change = oma.MAnimCurveChange()
+        for key_edit in self.keys:
+            key_edit(self.change)
+
+    def undo(self):
+        self.change.undoIt()
+        self.modifier.undoIt()
+
+    def redo(self):
+        self.modifier.doIt()
+        self.change.redoIt()
+
+
+def run(edit, undo_name='sr_biped'):
+    '''
+    Do an Edit as a single srBipedModify command, so one undo takes the whole of it back.
+
+    undo_name - Passed to the command, so the undo queue shows what the step was.
+    '''
+
+    load()
+    _pending.append(edit)
+    try:
+        getattr(cmds, COMMAND_NAME)(undo_name)
+    finally:
+        # Only left behind if the command never ran.
+        if(edit in _pending):
+            _pending.remove(edit)
+
+    return
+
+
+def load():
+    '''
+    Load the plug-in if srBipedModify isn't registered yet.
+    '''
+
+    if(hasattr(cmds, COMMAND_NAME)):
+        return
+
+    cmds.loadPlugin(plugin_path(), quiet=True)
+
+    return
+
+
+def plugin_path():
+    return os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+
+def initializePlugin(plugin):
+    # Maya may load this file as a module of it's own.  The command is taken from the module the
+    # rest of sr_biped imports, so it pops edits from the same queue run() pushes them on.
+    module = importlib.import_module('modify_command')
+    om.MFnPlugin(plugin, 'Shaper Rigs', '1.0').registerCommand(COMMAND_NAME, module.creator)
+
+
+def uninitializePlugin(plugin):
+    om.MFnPlugin(plugin).deregisterCommand(COMMAND_NAME)
+
+
+def creator():
+    global _command_class
+
+    if(_command_class is None):
+        class ModifyCommand(om.MPxCommand):
+            def __init__(self):
+                om.MPxCommand.__init__(self)
+                self.edit = None
+
+            def doIt(self, args):
+                if(not _pending):
+                    raise RuntimeError(
+                        "{} is run by sr_biped, it has nothing to do by itself.".format(
+                            COMMAND_NAME))
+                self.edit = _pending.pop()
+                self.edit.do()
+
+            def undoIt(self):
+                self.edit.undo()
+
+            def redoIt(self):
+                self.edit.redo()
+
+            def isUndoable(self):
+                return True
+
+        _command_class = ModifyCommand
+
+    return _command_class()
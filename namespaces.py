@@ -4,14 +4,22 @@ namespaces.py
 Module for finding/sorting namespaces.
 '''
 
-import pymel.core as pm
+import diagnostics as diag
+import lazy
+import registry
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('namespaces')
 
 
 def from_selection():
     '''
-    Find the namespace as a string component from a selection.
+    Find the namespace as a string component from a selection.  The namespace of the rig the
+    selection belongs to, or failing that, the selected node's own namespace.
 
-    Return value: namespace value plus ':'
+    Return value: namespace value plus ':', or '' for a rig without a namespace.
     '''
 
     if(len(pm.ls(sl=True)) > 0):
@@ -20,18 +28,24 @@ def from_selection():
         pm.error("Can't determine namespace since nothing is selected.")
         return
 
-    try:
-        namestring = selection.name()
-    except:
-        pm.error("Selected object has no name method...")
-        return
+    # The rig registry knows the namespace of every rig, nested ones included.
+    rig = registry.rig_for(selection)
+    if(rig is not None):
+        found_namespace = rig.namespace
 
-    if(':' in namestring):
-        found_namespace = (namestring.split(':')[0] + ':')
     else:
-        pm.error('The selected object has no namespace.')
-
-    print("Namespace string is '{}'.".format(found_namespace))
+        try:
+            namestring = selection.name()
+        except:
+            pm.error("Selected object has no name method...")
+            return
+
+        if(':' in namestring):
+            found_namespace = (namestring.split(':')[0] + ':')
+        else:
+            pm.error('The selected object has no namespace.')
+
+    log.debug("Namespace string is '%s'.", found_namespace)
 
     return found_namespace
 
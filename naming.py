@@ -0,0 +1,353 @@
+'''
+naming.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Naming profiles: the node names of a rig variant, kept as data.  Each profile is a JSON file in
+naming_profiles/, or in any directory listed in the SR_BIPED_NAMING_PATH environment variable, so
+a client's rig variant can be supported by dropping a file in rather than editing code.
+
+A profile is read and validated once.  The names it gives a character are then compiled into one
+flat table keyed by (namespace, side, limb, role), so the switching and baking paths look names up
+instead of building them.  Roles are 'null', 'settings', or a group and key from the profile such
+as 'fk_ctrl.shoulder' or 'ik_bone.wrist'.
+
+Which profile a rig uses is found by probing for a few of each profile's nodes, once per
+namespace.
+
+usage:
+naming.lookup('char01:', 'L', 'arm', 'fk_ctrl.shoulder')   # 'char01:L_ArmUprFK_CTRL'
+naming.profile_for('char01:').name                         # 'ssc'
+'''
+
+import json
+import os
+import callbacks
+import diagnostics as diag
+import lazy
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('naming')
+pm = diag.counted_module(pm)
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'naming_profiles')
+PATH_VARIABLE = 'SR_BIPED_NAMING_PATH'
+
+# Name groups a limb may give, and the dicts of fkik they stand in for.
+ROLE_GROUPS = ('fk_bone', 'ik_bone', 'fk_ctrl', 'ik_ctrl')
+
+# Profile used when probing finds nothing.
+DEFAULT_PROFILE = 'shaper'
+
+_profiles = None
+_detected = {}
+_table = {}
+
+# Namespaces whose names are in _table.
+_compiled = set()
+
+try:
+    _TEXT_TYPES = (str, unicode)
+except NameError:
+    _TEXT_TYPES = (str,)
+
+
+class Profile(object):
+    '''
+    One naming profile, as loaded from it's file.
+
+    name - the profile's name, ie 'shaper'.
+    sides - dict of side letter ('L', 'R', 'C') to the token names start with, ie 'L_'.
+    probes - names, with their side tokens, whose presence marks a rig as using this profile.
+    limbs - dict of limb to it's names: 'null', 'settings' and a dict for each of ROLE_GROUPS.
+    '''
+
+    def __init__(self, data, path=None):
+        _validate(data, path)
+
+        self.name = data['name']
+        self.description = data.get('description', '')
+        self.sides = data['sides']
+        self.probes = data['probes']
+        self.limbs = data['limbs']
+        self.path = path
+        self._role_dicts = {}
+
+    def __repr__(self):
+        return "Profile('{}')".format(self.name)
+
+    def roles(self, limb):
+        '''
+        Every role the profile names for a limb, with the name it gives each, less the side token.
+        '''
+
+        names = self.limbs[limb]
+        roles = {}
+        for role in ['null', 'settings']:
+            if(role in names):
+                roles[role] = names[role]
+        for group in ROLE_GROUPS:
+            for key, name in names.get(group, {}).items():
+                roles[group + '.' + key] = name
+
+        return roles
+
+    def role_dict(self, group):
+        '''
+        Every limb's names for one of ROLE_GROUPS in one dict, in the form fkik takes them, ie
+        role_dict('fk_ctrl') in place of constants.INTERNAL_DEF_FK_CTRLS.
+        '''
+
+        if(group not in self._role_dicts):
+            merged = {}
+            for limb in sorted(self.limbs):
+                merged.update(self.limbs[limb].get(group, {}))
+            self._role_dicts[group] = merged
+
+        return self._role_dicts[group]
+
+    def compile(self, namespace):
+        '''
+        The full name of every role on every side and limb of the character in namespace.
+
+        Return value: dict of (namespace, side, limb, role) to name.
+        '''
+
+        namespace = _with_colon(namespace)
+        table = {}
+        for limb in self.limbs:
+            roles = self.roles(limb)
+            for side, token in self.sides.items():
+                prefix = namespace + token
+                for role, name in roles.items():
+                    table[(namespace, side, limb, role)] = prefix + name
+
+        return table
+
+
+def profiles():
+    '''
+    Every profile, loaded the first time they're asked for.
+
+    Return value: dict of profile name to Profile.
+    '''
+
+    global _profiles
+
+    if(_profiles is None):
+        _profiles = _load_profiles(_profile_dirs())
+
+    return _profiles
+
+
+def get_profile(name):
+    '''
+    The profile of the given name.
+    '''
+
+    loaded = profiles()
+    if(name not in loaded):
+        raise KeyError("No naming profile called '{}', there is: {}".format(
+            name, ', '.join(sorted(loaded))))
+
+    return loaded[name]
+
+
+def detect(namespace):
+    '''
+    Probe the character in namespace for the profile it's named with.  The first profile with all
+    of it's probes present wins, otherwise the one with the most.  Results are kept until the scene
+    changes.
+
+    Return value: Profile, or None if no probe of any profile was found.
+    '''
+
+    namespace = _with_colon(namespace)
+    if(namespace in _detected):
+        return _detected[namespace]
+
+    best = None
+    best_found = 0
+    for name, profile in sorted(profiles().items()):
+        found = 0
+        for probe in profile.probes:
+            if(pm.objExists(namespace + probe)):
+                found += 1
+        if(found > best_found):
+            best = profile
+            best_found = found
+        if(found == len(profile.probes)):
+            break
+
+    log.debug("Namespace '%s' uses naming profile %s.", namespace, best)
+    _detected[namespace] = best
+    callbacks.add_listener(invalidate)
+
+    return best
+
+
+def profile_for(namespace):
+    '''
+    The profile the character in namespace uses, falling back on DEFAULT_PROFILE.
+    '''
+
+    profile = detect(namespace)
+    if(profile is None):
+        profile = get_profile(DEFAULT_PROFILE)
+
+    return profile
+
+
+def lookup(namespace, side, limb, role):
+    '''
+    Full name of a node on a character.
+
+    namespace - with or without it's ':', or '' for none.
+    side - 'L', 'R' or 'C', or anything starting with one, ie 'left' or 'L_'.
+    limb - ie 'arm' or 'revFrleg'.
+    role - 'null', 'settings' or a group and key, ie 'ik_ctrl.elbow_pv'.
+
+    Return value: string, or None if the character's profile has no such name.
+    '''
+
+    key = (_with_colon(namespace), side[:1].upper(), limb, role)
+    name = _table.get(key)
+    if(name is None and key[0] not in _compiled):
+        _table.update(profile_for(key[0]).compile(key[0]))
+        _compiled.add(key[0])
+        name = _table.get(key)
+
+    return name
+
+
+def invalidate(node_name=None):
+    '''
+    Forget detected profiles and compiled names, for callbacks.py.  Probe nodes appearing or going
+    can change a character's profile, anything else is ignored.
+    '''
+
+    if(node_name is None):
+        _detected.clear()
+        _table.clear()
+        _compiled.clear()
+        return
+
+    namespace, _, short_name = node_name.split('|')[-1].rpartition(':')
+    namespace = _with_colon(namespace)
+    if(namespace not in _detected):
+        return
+
+    for profile in profiles().values():
+        if(short_name in profile.probes):
+            _forget(namespace)
+            return
+
+    return
+
+
+def probe_names():
+    '''
+    Every probe of every profile, for anything else that watches for them.
+    '''
+
+    names = set()
+    for profile in profiles().values():
+        names.update(profile.probes)
+
+    return names
+
+
+def _forget(namespace):
+    _detected.pop(namespace, None)
+    _compiled.discard(namespace)
+    for key in [key for key in _table if key[0] == namespace]:
+        del _table[key]
+
+
+def _profile_dirs():
+    dirs = [PROFILE_DIR]
+    extra = os.environ.get(PATH_VARIABLE, '')
+    dirs += [path for path in extra.split(os.pathsep) if path]
+
+    return dirs
+
+
+def _load_profiles(dirs):
+    '''
+    Load every .json profile in the given directories.  A later directory's profile replaces an
+    earlier one of the same name, so a studio can override the shipped profiles.
+    '''
+
+    loaded = {}
+    for directory in dirs:
+        if(not os.path.isdir(directory)):
+            log.warning("Naming profile directory %s doesn't exist.", directory)
+            continue
+        for file_name in sorted(os.listdir(directory)):
+            if(not file_name.endswith('.json')):
+                continue
+            path = os.path.join(directory, file_name)
+            with open(path, 'r') as profile_file:
+                profile = Profile(json.load(profile_file), path)
+            if(profile.name in loaded):
+                log.info("Naming profile %s from %s replaces %s.",
+                         profile.name, path, loaded[profile.name].path)
+            loaded[profile.name] = profile
+
+    log.debug("Naming profiles loaded: %s", sorted(loaded))
+
+    return loaded
+
+
+def _validate(data, path):
+    '''
+    Raise ValueError, naming the file, on anything wrong with a profile's data.
+    '''
+
+    where = path or 'naming profile'
+
+    def check(condition, message):
+        if(not condition):
+            raise ValueError('{}: {}'.format(where, message))
+
+    check(isinstance(data, dict), "a profile must be a JSON object.")
+    for field in ['name', 'sides', 'probes', 'limbs']:
+        check(field in data, "'{}' is missing.".format(field))
+
+    check(_is_name(data['name']), "'name' must be a non-empty string.")
+    check(isinstance(data['sides'], dict) and data['sides'], "'sides' must be an object.")
+    for side, token in data['sides'].items():
+        check(side in ['L', 'R', 'C'], "sides are 'L', 'R' and 'C', not '{}'.".format(side))
+        check(isinstance(token, _TEXT_TYPES) and ':' not in token,
+              "side token '{}' must be a string without ':'.".format(token))
+    check(isinstance(data['probes'], list) and data['probes'], "'probes' must be a list.")
+    for probe in data['probes']:
+        check(_is_name(probe), "probe '{}' isn't a valid node name.".format(probe))
+
+    check(isinstance(data['limbs'], dict) and data['limbs'], "'limbs' must be an object.")
+    for limb, names in data['limbs'].items():
+        check(isinstance(names, dict), "limb '{}' must be an object.".format(limb))
+        for field, value in names.items():
+            if(field in ['null', 'settings']):
+                check(_is_name(value), "{}.{} isn't a valid node name.".format(limb, field))
+            elif(field in ROLE_GROUPS):
+                check(isinstance(value, dict), "{}.{} must be an object.".format(limb, field))
+                for key, name in value.items():
+                    check(_is_name(name), "{}.{}.{} isn't a valid node name.".format(
+                        limb, field, key))
+            else:
+                check(False, "limb '{}' has an unknown field '{}'.".format(limb, field))
+
+    return
+
+
+def _is_name(value):
+    return isinstance(value, _TEXT_TYPES) and value != '' and not any(
+        character in value for character in ' :|')
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
@@ -2,145 +2,265 @@
 pose.py
 
 Module for adopting particular poses for puporses of binding HIK, etc.
+
+controls_to_t_pose() straightens every arm and leg of a character in three steps: the joints and
+the control spaces are read in one query, every control's target is worked out in one call to
+limb_solver, and the controls are moved in one batched, undoable write.  Several characters can
+share one attributes.AttrBatch, so a whole cast goes into T-pose in a single write.
+
+usage:
+pose.controls_to_t_pose(namespace='char01:')                  # T-pose, Y up
+pose.controls_to_t_pose(namespace='char01:', arm_angle=45.0)  # A-pose, arms 45 degrees down
 '''
 
-import pymel.core as pm
-import pymel.core.datatypes as dt
+import math
+import attributes
+import backend
+import diagnostics as diag
+import lazy
+import limb_solver
+import naming
+
+pm = lazy.module('pymel.core')
+np = lazy.module('numpy')
+
+
+log = diag.get_logger('pose')
+pm = diag.counted_module(pm)
+
+# The keys of the arm_targets and leg_targets dicts, in the order top control, pole vector
+# control, end control, top joint, middle joint, end joint.
+ARM_TARGET_KEYS = (
+    'shoulder_ctrl', 'elbow_pv_ctrl', 'wrist_ctrl', 'shoulder_joint', 'elbow_joint', 'wrist_joint')
+LEG_TARGET_KEYS = (
+    'hip_ctrl', 'knee_pv_ctrl', 'ankle_ctrl', 'hip_joint', 'knee_joint', 'ankle_joint')
+
+# Naming roles the target keys default to, in the same order.
+ARM_TARGET_ROLES = (
+    'ik_ctrl.shoulder', 'ik_ctrl.elbow_pv', 'ik_ctrl.wrist',
+    'fk_bone.shoulder', 'fk_bone.elbow', 'fk_bone.wrist')
+LEG_TARGET_ROLES = (
+    'ik_ctrl.hip', 'ik_ctrl.knee_pv', 'ik_ctrl.ankle',
+    'fk_bone.hip', 'fk_bone.knee', 'fk_bone.ankle')
 
+LIMB_TARGETS = {
+    'arm': (ARM_TARGET_KEYS, ARM_TARGET_ROLES),
+    'leg': (LEG_TARGET_KEYS, LEG_TARGET_ROLES),
+}
 
-def controls_to_t_pose(z_up=False, arm_targets=None, leg_targets={}):
+# Which way a left limb points out from the body, +X as in Maya's default.  Right limbs mirror it.
+LATERAL = (1.0, 0.0, 0.0)
+
+
+@diag.operation('t_pose')
+def controls_to_t_pose(z_up=False, arm_targets=None, leg_targets=None, namespace='',
+                       arm_angle=0.0, sides=('L', 'R'), pole_distance=None, batch=None):
     '''
-    Set the rig in-scene to t-pose
+    Set the rig in-scene to t-pose: the ik top controls go back to rest, the arms run straight out
+    to the sides and the legs straight down, each with it's pole vector behind the elbow or in
+    front of the knee.
+
+    z_up - The scene is Z up, the character facing -Y.  Otherwise Y up, facing +Z.
+    arm_targets - dict of ARM_TARGET_KEYS to node names without side token, ie
+        {'wrist_ctrl': 'armWristIK_Ctrl', ...}.  Defaults to the character's naming profile.
+    leg_targets - The same for the legs, with LEG_TARGET_KEYS.
+    namespace - namespace of the character.
+    arm_angle - Degrees to lower the arms from horizontal, ie 45 for an A-pose.
+    sides - Side letters to pose.
+    pole_distance - How far pole vectors sit from the elbows and knees, see
+        limb_solver.straight_limb_positions().
+    batch - An attributes.AttrBatch to add the writes to.  If None they're applied straight away.
+
+    Return value: the number of limbs posed.
     '''
-    # Need to check if there's a rig in the scene.
 
-    # First straighten arms
-    print("Straightening Arms...")
-    straighten_arm(side='L_', z_up=z_up, arm_targets=arm_targets)
-    straighten_arm(side='R_', z_up=z_up, arm_targets=arm_targets)
+    candidates = [(limb, side, limb_targets(limb, side, namespace, targets))
+                  for limb, targets in (('arm', arm_targets), ('leg', leg_targets))
+                  for side in sides]
+    existing = set(str(node) for node in pm.ls(
+        *[name for limb, side, names in candidates for name in names if name is not None]))
 
-    # ... then legs...
+    limbs = []
+    for limb, side, names in candidates:
+        if(not existing.issuperset(names)):
+            log.debug("No %s %s found in '%s', skipping it.", side, limb, namespace)
+            continue
+        limbs.append((limb, side, names))
 
-    return
+    if(not limbs):
+        pm.warning("No limbs were found to put in t-pose in '{}'.".format(namespace))
+        return 0
 
+    writes = batch if batch is not None else attributes.AttrBatch('t_pose')
+    writes.set_many(t_pose_values(limbs, z_up, arm_angle, pole_distance))
+    diag.annotate(limbs=len(limbs), z_up=z_up, arm_angle=arm_angle)
+    if(batch is None):
+        writes.commit()
 
-def limb_measure(first_joint, middle_joint, last_joint):
+    return len(limbs)
+
+
+def limb_targets(limb, side, namespace='', targets=None):
     '''
-    Given the three joints of a limb, get distance vectors between them and add them up to find what
-    the total length of the limb is.  Returns dt.Vector of the total length.
-    
-    first_joint : PyNode of the topmost joint
-    middle_joint : PyNode of the middle joint (elbow or knee joint)
-    last_joint : PyNode of the end joint 
+    Full names of the controls and joints one limb is straightened with.
+
+    limb - 'arm' or 'leg'.
+    side - 'L' or 'R', or a token such as 'L_'.
+    targets - dict of the limb's target keys to names without side token, or None to use the
+        character's naming profile.
+
+    Return value: list of names in the order of the limb's target keys, None for any the naming
+        profile doesn't give.
     '''
 
-    first_pos = dt.Vector(pm.xform(first_joint, q=True, t=True, ws=True))
-    middle_pos = dt.Vector(pm.xform(middle_joint, q=True, t=True, ws=True))
-    last_pos = dt.Vector(pm.xform(last_joint, q=True, t=True, ws=True))
-    limb_length = ((first_pos - middle_pos) + (middle_pos - last_pos))
+    keys, roles = LIMB_TARGETS[limb]
+    side = side[:1].upper()
+    if(targets is None):
+        names = [naming.lookup(namespace, side, limb, role) for role in roles]
+    else:
+        missing = [key for key in keys if key not in targets]
+        if(missing):
+            raise ValueError("The {} targets are missing {}.".format(limb, ', '.join(missing)))
+        token = naming.profile_for(namespace).sides.get(side, side + '_')
+        names = [_with_colon(namespace) + token + targets[key] for key in keys]
 
-    return limb_length.length()
+    return names
 
 
-def straighten_arm(side=None, z_up=False, arm_targets=None):
+def t_pose_values(limbs, z_up=False, arm_angle=0.0, pole_distance=None):
     '''
-    straighten_arm
+    Work out the translate of every control to straighten limbs, from one read of the scene.
 
-    Generally called by 'controls_to_t_pose()' but it's accessible outside.
+    The ik controls' own pivots are taken to be zero, as they are on the rig's controls, so a
+    control's rest position is the origin of it's parent space.
+
+    limbs - list of (limb, side, names), names as given by limb_targets().
+    z_up, arm_angle, pole_distance - See controls_to_t_pose().
+
+    Return value: list of (plug, value) pairs.
     '''
-    if(arm_targets == None):
-        arm_targets = { 
-            'shoulder_ctrl':cns.INTERNAL_DEF_IK_CTRLS['shoulder'],
-            'elbow_pv_ctrl':cns.INTERNAL_DEF_IK_CTRLS['elbow'],
-            'wrist_ctrl':cns.INTERNAL_DEF_IK_CTRLS['wrist'],
-            'shoulder_joint':cns.INTERNAL_DEF_FK_JNTS['shoulder'],
-            'elbow_joint':cns.INTERNAL_DEF_FK_JNTS['elbow'],
-            'wrist_joint':cns.INTERNAL_DEF_FK_JNTS['wrist']
-        }
 
+    scene = backend.get()
+    with diag.span('query'):
+        # Every joint in one read and every control's parent space in another.
+        joints = np.array(
+            [_rows(matrix) for matrix in scene.world_matrices(
+                [name for limb, side, names in limbs for name in names[3:]])],
+            dtype=float)[:, 3, :3].reshape(len(limbs), 3, 3)
+        parents = np.array(
+            [_rows(matrix) for matrix in scene.matrices(
+                [name + '.parentMatrix[0]' for limb, side, names in limbs for name in names[:3]])],
+            dtype=float).reshape(len(limbs), 3, 4, 4)
+
+    with diag.span('solve'):
+        directions, bends = limb_directions(
+            [(limb, side) for limb, side, names in limbs], z_up, arm_angle)
+        roots = parents[:, 0, 3, :3]
+        ends, poles = limb_solver.straight_limb_positions(
+            joints[:, 0], joints[:, 1], joints[:, 2], roots, directions, bends,
+            pole_distance=pole_distance)
+        pole_translate = limb_solver.local_points(poles, parents[:, 1])
+        end_translate = limb_solver.local_points(ends, parents[:, 2])
+
+    values = []
+    for index, (limb, side, names) in enumerate(limbs):
+        values.append((names[0] + '.translate', [0.0, 0.0, 0.0]))
+        values.append((names[1] + '.translate', pole_translate[index].tolist()))
+        values.append((names[2] + '.translate', end_translate[index].tolist()))
+
+    return values
+
+
+def limb_directions(limbs, z_up=False, arm_angle=0.0):
+    '''
+    Which way each limb of a T-pose or A-pose runs, and which way it's pole vector sits.
 
-    if(side == None):
-        pm.error("No arm given to 'straighten_arm()'.")
-        return
+    limbs - list of (limb, side) pairs.
 
-    # PyNodify the joints:
-    shoulder_joint = pm.PyNode(side + arm_targets['shoulder_joint'])
-    elbow_joint = pm.PyNode(side + arm_targets['elbow_joint'])
-    wrist_joint = pm.PyNode(side + arm_targets['wrist_joint'])
+    Return value: tuple of (N, 3) limb directions and (N, 3) pole vector directions.
+    '''
 
-    # Getting total length of the arm:
-    arm_length = limb_measure(shoulder_joint, elbow_joint, wrist_joint)
-    # Flip this if right-side:
-    if(side == 'R_'):
-        arm_length = -arm_length
+    up = np.array((0.0, 0.0, 1.0) if z_up else (0.0, 1.0, 0.0))
+    forward = np.array((0.0, -1.0, 0.0) if z_up else (0.0, 0.0, 1.0))
+    angle = math.radians(arm_angle)
 
+    directions = []
+    bends = []
+    for limb, side in limbs:
+        lateral = np.array(LATERAL) * (-1.0 if side[:1].upper() == 'R' else 1.0)
+        if(limb == 'arm'):
+            directions.append(lateral * math.cos(angle) - up * math.sin(angle))
+            bends.append(-forward)
+        else:
+            directions.append(-up)
+            bends.append(forward)
 
-    # PyNodify the targets
-    elbow_pv = pm.PyNode(side + arm_targets['elbow_pv_ctrl'])
-    wrist_ctrl = pm.PyNode(side + arm_targets['wrist_ctrl'])
-    shoulder_ctrl = pm.PyNode(side + arm_targets['shoulder_ctrl'])
+    return np.array(directions), np.array(bends)
 
-    # Reset shoulder before the remaining calculations
-    shoulder_ctrl.translate.set(0,0,0)
- 
-    # Move controls to align on appropriate axis.
-    if(z_up):
-        # Find the point in space where the wrist should go and move it there.
-        shoulder_pos = dt.Vector(pm.xform(shoulder_joint, q=True, t=True, ws=True))
-        wrist_pos = shoulder_pos + dt.Vector(0, arm_length, 0) # arm_length for Y in Z up.
-        pm.xform(wrist_ctrl, t=wrist_pos, ws=True)
 
-        # todo - align elbow pv.
+def limb_measure(first_joint, middle_joint, last_joint):
+    '''
+    Given the three joints of a limb, add up the lengths of it's two segments to find the total
+    length of the limb.  Returns the length as a float.
 
+    first_joint : PyNode of the topmost joint
+    middle_joint : PyNode of the middle joint (elbow or knee joint)
+    last_joint : PyNode of the end joint
+    '''
 
-    else:
-        # Find the point in space where the wrist should go and move it there.
-        shoulder_pos = dt.Vector(pm.xform(shoulder_joint, q=True, ws=True))
-        wrist_pos = shoulder_pos + dt.Vector(arm_length, 0, 0) # arm_length for Y in Z up.
-        pm.xform(wrist_ctrl, p=wrist_pos, ws=True, t=True)
+    scene = backend.get()
+    positions = np.array(
+        [_rows(matrix) for matrix in scene.world_matrices([first_joint, middle_joint, last_joint])],
+        dtype=float)[:, 3, :3]
 
-    return
+    return float(limb_solver.segment_lengths(*positions).sum())
 
 
-def straighten_leg(side=None, z_up=False, leg_targets=None):
+def straighten_arm(side=None, z_up=False, arm_targets=None, namespace='', arm_angle=0.0):
     '''
-    straighten_leg
+    straighten_arm
 
     Generally called by 'controls_to_t_pose()' but it's accessible outside.
     '''
-    
+
     if(side == None):
         pm.error("No arm given to 'straighten_arm()'.")
         return
 
-    # PyNodify the joints:
-    hip_joint = pm.PyNode(side + leg_targets['shoulder_joint'])
-    knee_joint = pm.PyNode(side + leg_targets['elbow_joint'])
-    ankle_joint = pm.PyNode(side + leg_targets['wrist_joint'])
+    return _straighten('arm', side, z_up, arm_targets, namespace, arm_angle)
+
+
+def straighten_leg(side=None, z_up=False, leg_targets=None, namespace=''):
+    '''
+    straighten_leg
 
-    # Getting total length of the arm:
-    arm_length = limb_measure(hip_joint, knee_joint, ankle_joint)
+    Generally called by 'controls_to_t_pose()' but it's accessible outside.
+    '''
 
-    # PyNodify the targets
-    knee_pv = pm.PyNode(side + leg_targets['elbow_pv_ctrl'])
-    ankle_ctrl = pm.PyNode(side + leg_targets['wrist_ctrl'])
-    hip_ctrl = pm.PyNode(side + leg_targets['shoulder_ctrl'])
+    if(side == None):
+        pm.error("No leg given to 'straighten_leg()'.")
+        return
 
-    # Reset shoulder before the remaining calculations
-    hip_ctrl.translate.set(0,0,0)
-    # Move wrist to the distance vector we identified earlier:
-    ankle_ctrl.translate.set(hip_ctrl.translate.get() + arm_length)
+    return _straighten('leg', side, z_up, leg_targets, namespace)
 
-    # Move controls to align on appropriate axis.
-    if(z_up):
-        # Aligned vertically (Z-up mode)
-        knee_pv.translate.z.set(hip_ctrl.translate.z.get())
-        ankle_ctrl.translate.z.set(hip_ctrl.translate.z.get())
 
-    else:
-        # Aligned vertically (Y-up mode)
-        knee_pv.translate.y.set(hip_ctrl.translate.z.get())
-        ankle_ctrl.translate.y.set(hip_ctrl.translate.z.get())
+def _straighten(limb, side, z_up, targets, namespace, arm_angle=0.0):
+    names = limb_targets(limb, side, namespace, targets)
+    if(any(name is None or not pm.objExists(name) for name in names)):
+        pm.error("sr_biped error: The {} {} wasn't found in '{}'.".format(side, limb, namespace))
+        return
+
+    with attributes.AttrBatch('straighten_' + limb) as batch:
+        batch.set_many(t_pose_values([(limb, side, names)], z_up, arm_angle))
 
     return
 
+
+def _rows(matrix):
+    return [list(row) for row in matrix]
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
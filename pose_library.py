@@ -0,0 +1,356 @@
+'''
+pose_library.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Libraries of whole-rig poses, kept in one compact binary file per rig variant.
+
+Every pose in a library is a row of float32 values laid out by the library's channel table, a
+fixed list of control plugs without namespace, ie 'L_ArmPV_Ctrl.translateX'.  A channel a pose
+doesn't cover holds NaN and is left alone when the pose is applied, so hand or face poses can live
+in the same library as full body ones.
+
+File layout, little endian:
+    64 byte header - magic, format version, channel count, pose count, offset of the index.
+    pose rows      - pose count x channel count float32 values.
+    index          - UTF-8 JSON: the channel table, pose names and the naming profile.
+
+The rows are memory-mapped, so opening a library of thousands of poses only reads the header and
+index.  Applying a pose, or a blend of poses, to any number of characters is one AttrBatch write.
+
+usage:
+library = pose_library.library_for_rig('poses/shaper.srpose', 'char01:')
+pose_library.capture(library, 'idle', 'char01:')
+pose_library.apply(library, {'idle': 0.7, 'crouch': 0.3}, ['char01:', 'char02:'])
+'''
+
+import io
+import json
+import os
+import struct
+import attributes
+import backend
+import diagnostics as diag
+import lazy
+import naming
+
+pm = lazy.module('pymel.core')
+np = lazy.module('numpy')
+
+
+log = diag.get_logger('pose_library')
+pm = diag.counted_module(pm)
+
+MAGIC = b'SRPOSE\x00\x00'
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_FORMAT = '<8sIIIQ'
+DTYPE = '<f4'
+
+
+class PoseLibrary(object):
+    '''
+    An open pose library file.  Make new ones with PoseLibrary.create() or library_for_rig().
+
+    path - the library file.
+    channels - the channel table, list of plugs without namespace.
+    profile - name of the naming profile the channel table was made from, or None.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.channels = []
+        self.profile = None
+        self._names = []
+        self._rows = {}
+        self._data = None
+        self._targets = {}
+        self._read()
+
+    def __repr__(self):
+        return "PoseLibrary('{}', {} poses, {} channels)".format(
+            self.path, len(self._names), len(self.channels))
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    @classmethod
+    def create(cls, path, channels, profile=None):
+        '''
+        Write an empty library with the given channel table, replacing any file at path.
+        '''
+
+        if(len(set(channels)) != len(channels)):
+            raise ValueError("The channel table of a pose library can't repeat a channel.")
+
+        with io.open(path, 'wb') as library_file:
+            library_file.write(_header(len(channels), 0, HEADER_SIZE))
+            library_file.write(_index(list(channels), [], profile))
+
+        return cls(path)
+
+    def names(self):
+        return list(self._names)
+
+    def pose(self, name):
+        '''
+        One pose's values, in channel table order.  NaN where the pose has no value.
+
+        Return value: float array, a read-only view of the file.
+        '''
+
+        if(name not in self._rows):
+            raise KeyError("No pose called '{}' in {}.".format(name, self.path))
+
+        return self._data[self._rows[name]]
+
+    def blend(self, weights):
+        '''
+        Weighted blend of poses.  Each channel is averaged over the poses that have a value for
+        it, so weights are relative: {'a': 1, 'b': 1} is half way between.  Rotations are blended
+        channel by channel, which holds up for poses that aren't far apart.
+
+        weights - dict of pose name to weight.
+
+        Return value: float array in channel table order, NaN where no weighted pose has a value.
+        '''
+
+        names = [name for name, weight in sorted(weights.items()) if weight]
+        if(not names):
+            raise ValueError("A blend needs at least one pose with a weight.")
+
+        rows = np.asarray(self._data[[self._rows[name] for name in names]], dtype=float)
+        if(len(names) == 1):
+            return rows[0]
+
+        scale = np.array([weights[name] for name in names], dtype=float)[:, np.newaxis]
+        valid = ~np.isnan(rows)
+        total = np.where(valid, scale, 0.0).sum(axis=0)
+        summed = np.where(valid, rows * scale, 0.0).sum(axis=0)
+        blended = np.full(len(self.channels), np.nan)
+        np.divide(summed, total, out=blended, where=total != 0.0)
+
+        return blended
+
+    def targets(self, namespace):
+        '''
+        Which of the library's channels a character has, and their plugs.  Worked out once per
+        character and kept for as long as it's controls stay the same.
+
+        Return value: tuple of an int array of channel indices and a list of plugs.
+        '''
+
+        namespace = _with_colon(namespace)
+        controls = attributes.rig_controls(namespace)
+        cached = self._targets.get(namespace)
+        if(cached is None or cached[0] != controls):
+            present = set(_short_name(node) for node in controls)
+            indices = [index for index, channel in enumerate(self.channels)
+                       if channel.split('.')[0] in present]
+            cached = self._targets[namespace] = (
+                controls, np.array(indices, dtype=int),
+                [namespace + self.channels[index] for index in indices])
+
+        return cached[1], cached[2]
+
+    def add(self, name, values):
+        '''
+        Store a pose, replacing any pose of the same name.
+
+        values - one value per channel, in channel table order, NaN for channels not in the pose.
+        '''
+
+        values = np.asarray(values, dtype=DTYPE).reshape(-1)
+        if(len(values) != len(self.channels)):
+            raise ValueError("A pose for {} needs {} values, got {}.".format(
+                self.path, len(self.channels), len(values)))
+
+        # The map is let go first, the file can't be resized under it on Windows.
+        self._data = None
+        row_size = len(self.channels) * np.dtype(DTYPE).itemsize
+        with io.open(self.path, 'r+b') as library_file:
+            if(name in self._rows):
+                library_file.seek(HEADER_SIZE + self._rows[name] * row_size)
+                library_file.write(values.tobytes())
+            else:
+                library_file.seek(HEADER_SIZE + len(self._names) * row_size)
+                library_file.write(values.tobytes())
+                self._names.append(name)
+                index_offset = library_file.tell()
+                library_file.write(_index(self.channels, self._names, self.profile))
+                library_file.truncate()
+                library_file.seek(0)
+                library_file.write(_header(len(self.channels), len(self._names), index_offset))
+
+        self._read()
+
+        return
+
+    def _read(self):
+        with io.open(self.path, 'rb') as library_file:
+            header = library_file.read(HEADER_SIZE)
+            if(len(header) < HEADER_SIZE or header[:8] != MAGIC):
+                raise ValueError("{} isn't a pose library.".format(self.path))
+            magic, version, channel_count, pose_count, index_offset = struct.unpack(
+                HEADER_FORMAT, header[:struct.calcsize(HEADER_FORMAT)])
+            if(version > VERSION):
+                raise ValueError("{} is pose library version {}, this reads up to {}.".format(
+                    self.path, version, VERSION))
+            library_file.seek(index_offset)
+            index = json.loads(library_file.read().decode('utf-8'))
+
+        self.channels = index['channels']
+        self.profile = index.get('profile')
+        self._names = index['poses']
+        self._rows = dict((name, row) for row, name in enumerate(self._names))
+        if(len(self.channels) != channel_count or len(self._names) != pose_count):
+            raise ValueError("{} has a damaged index.".format(self.path))
+
+        if(pose_count and channel_count):
+            self._data = np.memmap(
+                self.path, dtype=DTYPE, mode='r', offset=HEADER_SIZE,
+                shape=(pose_count, channel_count))
+        else:
+            self._data = np.zeros((pose_count, channel_count), dtype=DTYPE)
+
+        return
+
+
+def channel_table(namespace):
+    '''
+    Every keyable channel of every control of the character in namespace, without namespace.
+    Characters of the same rig variant give the same table.
+    '''
+
+    controls = attributes.rig_controls(namespace)
+    table = attributes.default_table(namespace)
+    table.update(namespace, controls)
+
+    channels = []
+    for short_name in sorted(set(_short_name(name) for name in controls)):
+        for attr in sorted(table.defaults[short_name]):
+            channels.append(short_name + '.' + attr)
+
+    return channels
+
+
+def library_for_rig(path, namespace):
+    '''
+    Open the library at path, or make one laid out for the character in namespace if there's no
+    file yet.
+    '''
+
+    if(os.path.exists(path)):
+        return PoseLibrary(path)
+
+    return PoseLibrary.create(
+        path, channel_table(namespace), profile=naming.profile_for(namespace).name)
+
+
+@diag.operation('capture_pose')
+def capture(library, name, namespace, controls=None, time=None):
+    '''
+    Read a character's pose into the library, every channel in one pass.
+
+    library - a PoseLibrary.
+    name - name to store the pose under.
+    namespace - namespace of the character.
+    controls - short control names to limit the pose to, ie just the hands.  If None, every
+        control of the character is captured.
+    time - frame to read the pose on, None for the current frame.
+
+    Return value: the number of channels captured.
+    '''
+
+    namespace = _with_colon(namespace)
+    present = set(_short_name(node) for node in attributes.rig_controls(namespace))
+    if(controls is not None):
+        present &= set(controls)
+
+    indices = [index for index, channel in enumerate(library.channels)
+               if channel.split('.')[0] in present]
+    if(not indices):
+        pm.warning("None of the library's controls were found in '{}'.".format(namespace))
+        return 0
+
+    with diag.span('query'):
+        read = backend.get().get_attrs(
+            [namespace + library.channels[index] for index in indices], time=time)
+
+    values = np.full(len(library.channels), np.nan)
+    values[indices] = [float(value) for value in read]
+    library.add(name, values)
+    log.debug("Captured %s channels of %s as '%s'.", len(indices), namespace, name)
+
+    return len(indices)
+
+
+@diag.operation('apply_pose')
+def apply(library, pose, namespaces, amount=1.0, batch=None):
+    '''
+    Put one or many characters in a pose, in a single batched write.
+
+    library - a PoseLibrary.
+    pose - a pose name, a dict of pose names to weights to blend, or an array of values in the
+        library's channel order.
+    namespaces - namespace of a character, or a list of them.
+    amount - How far to go from each character's current pose towards this one, 0 to 1.
+    batch - An attributes.AttrBatch to add the writes to.  If None they're applied straight away.
+
+    Return value: the number of attributes written.
+    '''
+
+    if(isinstance(pose, dict)):
+        values = library.blend(pose)
+    elif(isinstance(pose, str)):
+        values = library.pose(pose)
+    else:
+        values = np.asarray(pose, dtype=float)
+    if(isinstance(namespaces, str)):
+        namespaces = [namespaces]
+
+    writes = batch if batch is not None else attributes.AttrBatch('apply_pose')
+    count = 0
+    for namespace in namespaces:
+        indices, plugs = library.targets(namespace)
+        targets = np.asarray(values[indices], dtype=float)
+        covered = ~np.isnan(targets)
+        if(not covered.all()):
+            plugs = [plug for plug, kept in zip(plugs, covered) if kept]
+            targets = targets[covered]
+
+        if(amount != 1.0):
+            with diag.span('query'):
+                current = np.asarray(backend.get().get_attrs(plugs), dtype=float)
+            targets = current + (targets - current) * amount
+
+        writes.set_many(zip(plugs, targets.tolist()))
+        count += len(plugs)
+
+    diag.annotate(characters=len(namespaces), attributes=count)
+    if(batch is None):
+        writes.commit()
+
+    return count
+
+
+def _header(channel_count, pose_count, index_offset):
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, channel_count, pose_count, index_offset)
+
+    return header + b'\x00' * (HEADER_SIZE - len(header))
+
+
+def _index(channels, names, profile):
+    return json.dumps({'channels': channels, 'poses': names, 'profile': profile}).encode('utf-8')
+
+
+def _short_name(name):
+    return str(name).split('|')[-1].split(':')[-1]
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
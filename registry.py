@@ -0,0 +1,221 @@
+'''
+registry.py
+Shaper Rigs / Burlington Interactive Solutions
+
+An index of every rig in the scene: it's namespace, root group, type, the limbs it has and the
+naming variant of it's controls.  The scene is scanned once, the first time the registry is asked
+anything.  From then on only the rigs whose nodes are added, renamed or deleted are looked at again
+(see callbacks.py), and opening a scene or loading a reference has it scanned again from scratch.
+
+Tools ask the registry which rig a node belongs to rather than picking apart it's name, and which
+rigs are in the scene rather than listing the whole scene for them.
+
+usage:
+rig = registry.rig_for(pm.selected()[0])
+rig.namespace, rig.rig_type, rig.limbs, rig.variant
+'''
+
+import callbacks
+import constants as cons
+import diagnostics as diag
+import lazy
+import naming
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('registry')
+pm = diag.counted_module(pm)
+
+SIDES = ['L', 'R']
+
+_registry = None
+
+
+class RigInfo(object):
+    '''
+    What the registry knows about one rig.
+
+    namespace - the rig's namespace with it's ':', or '' for none.
+    root - name of the rig's root group.
+    rig_type - 'biped', or 'quad' when it has any of cons.QUAD_LIMBS.
+    limbs - list of (side, limb) tuples, ie ('L', 'arm').
+    variant - name of the naming profile the rig uses, see naming.py, or None if it couldn't be
+        told.
+    '''
+
+    def __init__(self, namespace, root, rig_type, limbs, variant):
+        self.namespace = namespace
+        self.root = root
+        self.rig_type = rig_type
+        self.limbs = limbs
+        self.variant = variant
+
+    def __repr__(self):
+        return "RigInfo('{}', {}, {} limbs, {})".format(
+            self.namespace, self.rig_type, len(self.limbs), self.variant)
+
+    def has_limb(self, side, limb):
+        return (side, limb) in self.limbs
+
+
+class RigRegistry(object):
+    '''
+    Rigs in the scene by namespace.  Kept current through invalidate(), which callbacks.py calls
+    with the name of every node that changes.
+    '''
+
+    def __init__(self):
+        self._rigs = {}
+        self._stale = set()
+        self._built = False
+
+        # Short names of the nodes a rig scan looks at.
+        self._watched = naming.probe_names()
+        for profile in naming.profiles().values():
+            for limb in profile.limbs:
+                for token in profile.sides.values():
+                    self._watched.add(token + profile.limbs[limb].get('null', ''))
+
+    def rigs(self):
+        '''
+        Every rig in the scene, sorted by namespace.
+        '''
+
+        self._update()
+
+        return [self._rigs[namespace] for namespace in sorted(self._rigs)]
+
+    def get(self, namespace):
+        '''
+        The rig in the given namespace, with or without it's ':', or None.
+        '''
+
+        self._update()
+
+        return self._rigs.get(_with_colon(namespace))
+
+    def rig_for(self, node):
+        '''
+        The rig a node belongs to, or None.  A node belongs to the rig in it's own namespace, or
+        failing that the nearest namespace it's nested in, so characters nested in references
+        resolve to themselves.  A rig without a namespace is looked for last.
+        '''
+
+        self._update()
+
+        namespace = str(node).split('|')[-1].lstrip(':').rpartition(':')[0]
+        while(True):
+            rig = self._rigs.get(_with_colon(namespace))
+            if(rig is not None or not namespace):
+                return rig
+            namespace = namespace.rpartition(':')[0]
+
+    def invalidate(self, node_name=None):
+        '''
+        Listener for callbacks.py.  With no name the whole scene is scanned again on the next
+        query.  With a name, only the rig in that node's namespace is, and only if the node is one
+        a scan looks at.
+        '''
+
+        if(node_name is None):
+            self._built = False
+            return
+
+        name = node_name.split('|')[-1]
+        namespace, _, short_name = name.rpartition(':')
+        if(cons.RIG_ROOT in short_name or short_name in self._watched):
+            self._stale.add(_with_colon(namespace))
+
+        return
+
+    def _update(self):
+        if(not self._built):
+            self._build()
+            return
+
+        while(self._stale):
+            namespace = self._stale.pop()
+            rig = self._scan(namespace)
+            if(rig is None):
+                self._rigs.pop(namespace, None)
+            else:
+                self._rigs[namespace] = rig
+
+        return
+
+    def _build(self):
+        with diag.span('registry_build'):
+            self._rigs = {}
+            self._stale = set()
+            for root in pm.ls('*' + cons.RIG_ROOT + '*', recursive=True):
+                namespace = _with_colon(root.name().rpartition(':')[0])
+                if(namespace in self._rigs):
+                    log.warning("More than one rig root in namespace '%s', using %s.",
+                                namespace, self._rigs[namespace].root)
+                    continue
+                self._rigs[namespace] = self._describe(namespace, root.name())
+            self._built = True
+
+        log.debug("Rig registry built: %s", self.rigs())
+
+        return
+
+    def _scan(self, namespace):
+        '''
+        Look at a single namespace again.  Return value: RigInfo, or None if there is no rig there.
+        '''
+
+        roots = [root.name() for root in pm.ls(namespace + cons.RIG_ROOT + '*')]
+        if(not roots):
+            return None
+
+        return self._describe(namespace, roots[0])
+
+    def _describe(self, namespace, root):
+        profile = naming.detect(namespace)
+        limbs = []
+        for side in SIDES:
+            for limb in sorted(naming.profile_for(namespace).limbs):
+                null = naming.lookup(namespace, side, limb, 'null')
+                if(null is not None and pm.objExists(null)):
+                    limbs.append((side, limb))
+
+        rig_type = 'biped'
+        if(any(limb in cons.QUAD_LIMBS for side, limb in limbs)):
+            rig_type = 'quad'
+
+        return RigInfo(
+            namespace, root, rig_type, limbs, profile.name if profile is not None else None)
+
+
+def get_registry():
+    '''
+    The registry for this session, made and hooked up to the scene callbacks on first use.
+    '''
+
+    global _registry
+
+    if(_registry is None):
+        _registry = RigRegistry()
+        callbacks.add_listener(_registry.invalidate)
+
+    return _registry
+
+
+def rigs():
+    return get_registry().rigs()
+
+
+def get(namespace):
+    return get_registry().get(namespace)
+
+
+def rig_for(node):
+    return get_registry().rig_for(node)
+
+
+def _with_colon(namespace):
+    namespace = namespace.rstrip(':')
+
+    return (namespace + ':') if namespace else ''
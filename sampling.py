@@ -0,0 +1,178 @@
+'''
+sampling.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Which frames a bake evaluates and keys.  Every bake in fkik and humanik takes a Sampling:
+
+sampling.every(1)             # Every frame, the default.
+sampling.every(4)             # Every 4th frame.
+sampling.on_keys()            # Only where the source animation has keys.
+sampling.sub_frame(0.25)      # Quarter frames, ie 120fps exports from a 30fps scene.
+sampling.explicit([1, 12, 30])
+
+Ranges are the time slider's: (start, end) with end one past the last highlighted frame, as
+suite.frame_selection() gives them.  The first and last highlighted frames are always sampled, so a
+sparse sampling still holds the pose at both ends of the range.
+
+usage:
+fkik.bake_ik_to_fk(side='L', limb='arm', sampling=sampling.on_keys())
+'''
+
+import diagnostics as diag
+import lazy
+
+pm = lazy.module('pymel.core')
+
+
+log = diag.get_logger('sampling')
+pm = diag.counted_module(pm)
+
+MODES = ('every', 'keys', 'sub_frame', 'explicit')
+
+# Sub-frame times are rounded to this many places, so float steps don't drift.
+TIME_PRECISION = 6
+
+
+class Sampling(object):
+    '''
+    A sampling spec.  Build these with every(), on_keys(), sub_frame() or explicit().
+
+    mode - One of MODES.
+    step - Frames between samples for 'every' and 'sub_frame'.
+    frames - The frames for 'explicit'.
+    sources - Nodes whose keys are used for 'keys'.  When None, the bake supplies it's own source
+        nodes, ie the fk controls for bake_ik_to_fk().
+    '''
+
+    def __init__(self, mode='every', step=1, frames=None, sources=None):
+        if(mode not in MODES):
+            raise ValueError("Sampling mode must be one of {}, got '{}'.".format(MODES, mode))
+        if(mode in ['every', 'sub_frame'] and step <= 0):
+            raise ValueError("Sampling step must be above zero, got {}.".format(step))
+
+        self.mode = mode
+        self.step = step
+        self.frames = frames
+        self.sources = sources
+
+    def __repr__(self):
+        if(self.mode == 'explicit'):
+            return 'Sampling(explicit, {} frames)'.format(len(self.frames or []))
+        if(self.mode == 'keys'):
+            return 'Sampling(keys)'
+        return 'Sampling({}, step={})'.format(self.mode, self.step)
+
+    def resolve(self, frame_range, sources=None):
+        '''
+        The frames to sample over a time slider range.
+
+        frame_range - (start, end) with end one past the last frame, see suite.frame_selection().
+            Not needed for 'explicit'.
+        sources - Source nodes for 'keys' when the spec doesn't name it's own.
+
+        Return value: sorted list of frames, without duplicates.
+        '''
+
+        if(self.mode == 'explicit'):
+            return _unique(self.frames or [])
+
+        first = float(frame_range[0])
+        last = float(frame_range[1]) - 1.0
+        if(last < first):
+            last = first
+
+        if(self.mode in ['every', 'sub_frame']):
+            count = int((last - first) / self.step + 1e-9)
+            frames = [first + index * self.step for index in range(count + 1)]
+
+        else:
+            sources = self.sources if self.sources is not None else sources
+            frames = [first]
+            if(sources):
+                existing = [node for node in sources if pm.objExists(node)]
+                if(existing):
+                    frames += pm.keyframe(existing, q=True, timeChange=True, time=(first, last))
+                else:
+                    log.warning("None of the source nodes exist, only the range ends are sampled.")
+            else:
+                log.warning("No source nodes to sample keys from, only the range ends are sampled.")
+
+        frames.append(last)
+
+        return _unique(frames)
+
+
+def every(step=1):
+    '''
+    Sample every step frames, ie every(2) samples 1, 3, 5...  The last frame is added if the step
+    doesn't land on it.
+    '''
+
+    return Sampling('every', step=step)
+
+
+def on_keys(sources=None):
+    '''
+    Sample only on the frames the source animation has keys on, plus the range ends.
+
+    sources - nodes to read the keys of.  None lets the bake use it's own sources.
+    '''
+
+    return Sampling('keys', sources=sources)
+
+
+def sub_frame(step):
+    '''
+    Sample at sub-frame steps, ie sub_frame(0.25).
+    '''
+
+    return Sampling('sub_frame', step=step)
+
+
+def explicit(frames):
+    '''
+    Sample exactly the given frames, whatever the range.
+    '''
+
+    return Sampling('explicit', frames=list(frames))
+
+
+def uniform_step(frames):
+    '''
+    The step between frames if they are evenly spaced, None otherwise.  A bake can then hand the
+    whole range to bakeResults instead of visiting frames one at a time.
+
+    The last frame may come sooner than the step, as it does when every() adds the end of a range
+    the step doesn't land on.  The step is then the one the frames before it share, and the last
+    frame is left for tail() to give.
+    '''
+
+    if(len(frames) < 2):
+        return 1.0
+
+    step = round(frames[1] - frames[0], TIME_PRECISION)
+    gaps = [round(after - before, TIME_PRECISION) for before, after in zip(frames, frames[1:])]
+    if(any(gap != step for gap in gaps[:-1]) or gaps[-1] > step):
+        return None
+
+    return step
+
+
+def tail(frames, step):
+    '''
+    The frames past the last one a bakeResults from frames[0] every step reaches, ie [50.0] for
+    every(2) over (1, 51).  Those are keyed on their own after the bakeResults call.
+
+    step - As given by uniform_step().
+    '''
+
+    if(step is None or len(frames) < 2):
+        return []
+    if(round(frames[-1] - frames[-2], TIME_PRECISION) == step):
+        return []
+
+    return [frames[-1]]
+
+
+def _unique(frames):
+    return sorted(set(round(float(frame), TIME_PRECISION) for frame in frames))
@@ -8,7 +8,10 @@ sr_biped stuff.  Proper err-checking for things that should be there will make m
 graceful.
 '''
 
-import pymel.core as pm
+import lazy
+import registry
+
+pm = lazy.module('pymel.core')
 
 def rig_in_scene(mode=0):
     '''
@@ -19,7 +22,7 @@ def rig_in_scene(mode=0):
     there's one or more.
     '''
 
-    dnt_groups = pm.ls("*DO_NOT_TOUCH_GRP*")
+    dnt_groups = registry.rigs()
 
     if(mode == 0):
         if(len(dnt_groups) == 1):
@@ -0,0 +1,475 @@
+'''
+scheduler.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Long bakes split into chunks of frames, run one chunk at a time on Maya's idle queue so the UI
+stays responsive in between.  The main progress bar shows how far along a bake is and how long is
+left, and Esc, or cancel(), stops it between chunks.
+
+Every finished chunk is written to a checkpoint file next to the scene.  A bake that was cancelled,
+failed or was lost to a crash picks up from the first unfinished chunk when it's started again
+with the same frames.  The scene is saved before each checkpoint, so the keys of every chunk the
+checkpoint lists are on disk too, and the scene has to have been saved once before a bake starts.
+With save_scene=False nothing is saved, and a bake should only be resumed in the session it was
+started in: after a crash the checkpoint would skip chunks whose keys were never saved.
+
+In batch sessions there's no idle queue, so the chunks run straight through, still checkpointed.
+
+usage:
+bake = scheduler.ik_to_fk_bake(side='L', limb='arm', frame_range=(1, 2001), namespace='char01:')
+bake.start()
+...
+bake.start()    # again after a cancel, or after reopening the scene, to resume
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+from timeit import default_timer as _clock
+
+import diagnostics as diag
+import fkik
+import humanik
+import lazy
+import sampling as smp
+import suite as su
+
+pm = lazy.module('pymel.core')
+mel = lazy.module('maya.mel')
+
+
+log = diag.get_logger('scheduler')
+pm = diag.counted_module(pm)
+
+DEFAULT_CHUNK_SIZE = 50
+
+STATES = ('waiting', 'running', 'cancelled', 'failed', 'done')
+
+# Label to the ChunkedBake running under it.
+_running = {}
+
+
+class ChunkedBake(object):
+    '''
+    A bake over many frames, run in chunks.  Make these with ik_to_fk_bake(), fk_to_ik_bake() or
+    humanik_bake(), or give any function that bakes an explicit list of frames.
+
+    label - Names the bake's checkpoint and progress, ie 'ik_to_fk_char01_L_arm'.  Only one bake
+        runs under a label at a time.
+    bake - Function taking a list of frames and baking them.
+    frames - Every frame to bake, in order.
+    chunk_size - Frames per chunk.
+    checkpoint - Path of the checkpoint file.  Defaults to beside the scene, or the temp directory
+        for an untitled scene.
+    save_scene - Save the scene after every chunk, before it's checkpointed.  Without it, a
+        checkpoint can't be trusted after a crash.
+    on_done - Function called with the bake once every chunk is done.
+    on_start - Function called with the bake each time it starts running chunks, ie to set up what
+        every chunk bakes through.
+    on_stop - Function called with the bake each time it stops running chunks after on_start,
+        whether it's done, cancelled or failed.  Before on_done.
+
+    state is one of STATES.
+    '''
+
+    def __init__(self, label, bake, frames, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint=None,
+                 save_scene=True, on_done=None, on_start=None, on_stop=None):
+        if(chunk_size < 1):
+            raise ValueError("Chunks need at least one frame, got {}.".format(chunk_size))
+
+        self.label = label
+        self.bake = bake
+        self.frames = list(frames)
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.save_scene = save_scene
+        self.on_done = on_done
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.state = 'waiting'
+        self.error = None
+        self.chunks = [self.frames[index:index + chunk_size]
+                       for index in range(0, len(self.frames), chunk_size)]
+        self.done = set()
+        self._cancel = False
+        self._seconds = []
+        self._frames_baked = 0
+        self._progress_bar = None
+        self._started = False
+
+    def __repr__(self):
+        return "ChunkedBake('{}', {}/{} chunks, {})".format(
+            self.label, len(self.done), len(self.chunks), self.state)
+
+    @property
+    def progress(self):
+        '''
+        Fraction of the frames baked, 0 to 1.
+        '''
+
+        if(not self.frames):
+            return 1.0
+
+        return sum(len(self.chunks[index]) for index in self.done) / float(len(self.frames))
+
+    def remaining(self):
+        '''
+        Indices of the chunks still to bake, in order.
+        '''
+
+        return [index for index in range(len(self.chunks)) if index not in self.done]
+
+    def eta(self):
+        '''
+        Estimated seconds left, from the chunks baked so far this run, or None before the first.
+        '''
+
+        if(not self._seconds):
+            return None
+        per_frame = sum(self._seconds) / float(self._frames_baked)
+
+        return per_frame * sum(len(self.chunks[index]) for index in self.remaining())
+
+    def start(self, deferred=None):
+        '''
+        Start, or resume, the bake.  Chunks a checkpoint lists as done are skipped.
+
+        deferred - Run the chunks on the idle queue.  Defaults to True outside batch sessions.
+        '''
+
+        if(self.state == 'running'):
+            pm.warning("{} is already running.".format(self.label))
+            return
+        other = _running.get(self.label)
+        if(other is not None and other is not self and other.state == 'running'):
+            pm.error("sr_biped error: A bake labelled '{}' is already running.".format(self.label))
+            return
+        if(self.save_scene and not pm.sceneName()):
+            # saveFile has nowhere to save an untitled scene, the first chunk would fail on it.
+            pm.error("sr_biped error: {} saves the scene after every chunk, but it's untitled.  "
+                     "Save the scene first, or bake with save_scene=False.".format(self.label))
+            return
+        if(deferred is None):
+            deferred = not pm.about(batch=True)
+
+        self._load_checkpoint()
+        if(not self.remaining()):
+            log.info("%s: every chunk is already baked.", self.label)
+            self._finish()
+            return
+
+        self.state = 'running'
+        self.error = None
+        self._cancel = False
+        self._seconds = []
+        self._frames_baked = 0
+        _running[self.label] = self
+        if(self.done):
+            log.info("%s: resuming, %s of %s chunks already baked.",
+                     self.label, len(self.done), len(self.chunks))
+        if(self.on_start is not None):
+            try:
+                self.on_start(self)
+            except Exception as exc:
+                self.state = 'failed'
+                self.error = exc
+                self._end_progress()
+                raise
+            self._started = True
+
+        if(deferred):
+            self._begin_progress()
+            pm.evalDeferred(self._step, lowestPriority=True)
+            return
+
+        while(self.state == 'running' and not self._cancel):
+            self._run_next()
+        self._end_progress()
+        if(self.state == 'running'):
+            self.state = 'cancelled'
+        elif(self.state == 'failed'):
+            raise self.error
+
+        return
+
+    def cancel(self):
+        '''
+        Stop the bake before it's next chunk.  The chunks done so far stay baked and checkpointed.
+        '''
+
+        self._cancel = True
+
+        return
+
+    def discard_checkpoint(self):
+        '''
+        Forget the chunks done, so the next start() bakes everything again.
+        '''
+
+        path = self.checkpoint_path()
+        if(os.path.exists(path)):
+            os.remove(path)
+        self.done = set()
+
+        return
+
+    def checkpoint_path(self):
+        if(self.checkpoint is not None):
+            return self.checkpoint
+
+        scene_name = str(pm.sceneName() or '')
+        safe_label = ''.join(char if char.isalnum() or char in '-_' else '_'
+                             for char in self.label)
+        if(scene_name):
+            return '{}.{}.bake.json'.format(os.path.splitext(scene_name)[0], safe_label)
+
+        return os.path.join(tempfile.gettempdir(), 'sr_biped_{}.bake.json'.format(safe_label))
+
+    def fingerprint(self):
+        '''
+        Identifies the bake's frames and chunks, so a checkpoint is only resumed by the same bake.
+        '''
+
+        data = json.dumps([self.label, self.frames, self.chunk_size])
+
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def _step(self):
+        # One chunk per idle event.
+        if(self.state != 'running'):
+            return
+        if(self._cancel or self._progress_cancelled()):
+            self.state = 'cancelled'
+            self._end_progress()
+            pm.warning("{} cancelled with {} of {} chunks baked, start it again to resume.".format(
+                self.label, len(self.done), len(self.chunks)))
+            return
+
+        self._run_next()
+        if(self.state == 'running'):
+            self._update_progress()
+            pm.evalDeferred(self._step, lowestPriority=True)
+        else:
+            self._end_progress()
+            if(self.state == 'failed'):
+                pm.warning("{} failed on a chunk, start it again to resume: {}".format(
+                    self.label, self.error))
+
+        return
+
+    def _run_next(self):
+        index = self.remaining()[0]
+        chunk = self.chunks[index]
+        start = _clock()
+        try:
+            self.bake(chunk)
+            if(self.save_scene):
+                pm.saveFile(force=True)
+        except Exception as exc:
+            self.state = 'failed'
+            self.error = exc
+            log.exception("%s: chunk %s, frames %s to %s, failed.",
+                          self.label, index + 1, chunk[0], chunk[-1])
+            return
+
+        self._seconds.append(_clock() - start)
+        self._frames_baked += len(chunk)
+        self.done.add(index)
+        self._write_checkpoint()
+        log.debug("%s: chunk %s of %s baked in %.3fs.",
+                  self.label, index + 1, len(self.chunks), self._seconds[-1])
+
+        if(not self.remaining()):
+            self._finish()
+
+        return
+
+    def _finish(self):
+        self.state = 'done'
+        self._stop()
+        path = self.checkpoint_path()
+        if(os.path.exists(path)):
+            os.remove(path)
+        if(_running.get(self.label) is self):
+            del _running[self.label]
+        log.info("%s: baked %s frames.", self.label, len(self.frames))
+        if(self.on_done is not None):
+            self.on_done(self)
+
+        return
+
+    def _load_checkpoint(self):
+        path = self.checkpoint_path()
+        if(not os.path.exists(path)):
+            return
+
+        try:
+            with open(path, 'r') as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except ValueError:
+            log.warning("Ignoring the unreadable checkpoint %s.", path)
+            return
+
+        if(data.get('fingerprint') != self.fingerprint()):
+            log.warning("The checkpoint %s is for a different bake, starting over.", path)
+            return
+        self.done = set(index for index in data.get('done', []) if index < len(self.chunks))
+
+        return
+
+    def _write_checkpoint(self):
+        path = self.checkpoint_path()
+        data = {
+            'label': self.label,
+            'fingerprint': self.fingerprint(),
+            'chunks': len(self.chunks),
+            'done': sorted(self.done),
+        }
+        # Written aside and moved into place, so a crash mid-write leaves the last checkpoint.
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(data, checkpoint_file)
+        if(os.path.exists(path)):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+        return
+
+    def _stop(self):
+        if(self._started):
+            self._started = False
+            self.on_stop(self)
+
+    def _begin_progress(self):
+        self._progress_bar = mel.eval('$tmpVar=$gMainProgressBar')
+        pm.progressBar(
+            self._progress_bar, edit=True, beginProgress=True, isInterruptable=True,
+            maxValue=len(self.frames), progress=0, status=self._status())
+
+    def _update_progress(self):
+        if(self._progress_bar is None):
+            return
+        pm.progressBar(
+            self._progress_bar, edit=True,
+            progress=sum(len(self.chunks[index]) for index in self.done), status=self._status())
+
+    def _progress_cancelled(self):
+        if(self._progress_bar is None):
+            return False
+
+        return pm.progressBar(self._progress_bar, query=True, isCancelled=True)
+
+    def _end_progress(self):
+        self._stop()
+        if(self._progress_bar is not None):
+            pm.progressBar(self._progress_bar, edit=True, endProgress=True)
+            self._progress_bar = None
+        if(_running.get(self.label) is self):
+            del _running[self.label]
+
+    def _status(self):
+        eta = self.eta()
+        left = '' if eta is None else ', {:.0f}s left'.format(eta)
+
+        return '{}: {:.0f}%{} (Esc to cancel)'.format(self.label, self.progress * 100.0, left)
+
+
+def running():
+    '''
+    The bakes running now.
+    '''
+
+    return [bake for bake in _running.values() if bake.state == 'running']
+
+
+def ik_to_fk_bake(side=None, limb=None, frame_range=None, namespace="", sampling=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, save_scene=True, **bake_args):
+    '''
+    A ChunkedBake of fkik.bake_ik_to_fk().  bake_args go to it, ie sampled=True.
+
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
+    sampling - Which frames to bake, a sampling.Sampling.  Defaults to every frame.
+    '''
+
+    frames = _frames(frame_range, sampling, fkik.bake_sources('ik_to_fk', side, limb, namespace))
+
+    def bake(chunk):
+        fkik.bake_ik_to_fk(
+            side=side, limb=limb, namespace=namespace, sampling=smp.explicit(chunk),
+            frame_range=(chunk[0], chunk[-1] + 1), **bake_args)
+
+    return ChunkedBake(
+        _label('ik_to_fk', namespace, side, limb), bake, frames, chunk_size=chunk_size,
+        save_scene=save_scene)
+
+
+def fk_to_ik_bake(side=None, limb=None, frame_range=None, namespace="", sampling=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, save_scene=True, **bake_args):
+    '''
+    A ChunkedBake of fkik.bake_fk_to_ik(), see ik_to_fk_bake().
+    '''
+
+    frames = _frames(frame_range, sampling, fkik.bake_sources('fk_to_ik', side, limb, namespace))
+
+    def bake(chunk):
+        fkik.bake_fk_to_ik(
+            side=side, limb=limb, namespace=namespace, sampling=smp.explicit(chunk),
+            frame_range=(chunk[0], chunk[-1] + 1), **bake_args)
+
+    return ChunkedBake(
+        _label('fk_to_ik', namespace, side, limb), bake, frames, chunk_size=chunk_size,
+        save_scene=save_scene)
+
+
+def humanik_bake(ns='', frame_range=None, sampling=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 save_scene=True, **bake_args):
+    '''
+    A ChunkedBake of humanik.bake(), see ik_to_fk_bake().  The rig is constrained to the HIK
+    skeleton once when the bake starts, and the constraints deleted when it stops, rather than for
+    every chunk.  The chunks of an evenly spaced sampling are evenly spaced too, and each is keyed
+    in one bakeResults call, plus one for the end of the range on the last chunk.
+    '''
+
+    frames = _frames(frame_range, sampling, humanik.mapped_targets())
+    constraints = []
+
+    def constrain(chunked_bake):
+        constraints.extend(humanik.constrain_skeleton(ns=ns))
+
+    def release(chunked_bake):
+        log.debug("Deleting constraints: %s", constraints)
+        if(constraints):
+            pm.delete(constraints)
+        del constraints[:]
+
+    def bake(chunk):
+        humanik.bake(ns=ns, sampling=smp.explicit(chunk), frame_range=(chunk[0], chunk[-1] + 1),
+                     constraints=constraints, **bake_args)
+
+    return ChunkedBake(
+        _label('humanik', ns), bake, frames, chunk_size=chunk_size, save_scene=save_scene,
+        on_start=constrain, on_stop=release)
+
+
+def _frames(frame_range, sampling, sources):
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return []
+    if(sampling is None):
+        sampling = smp.every(1)
+
+    return sampling.resolve(frame_range, sources=sources)
+
+
+def _label(kind, namespace, side=None, limb=None):
+    parts = [kind, namespace.rstrip(':').replace(':', '_')]
+    if(side):
+        parts.append(side)
+    if(limb):
+        parts.append(limb)
+
+    return '_'.join(part for part in parts if part)
@@ -4,10 +4,31 @@ Matt Riche
 2021
 
 For matching spaces on switching between perceived parent spaces.
+
+A control's spaces are the weight attributes listed in constants.INTERNAL_SPACE_SWITCH_ATTRS that it
+has, with the space it follows weighted 1 and the rest 0.  switch_space() moves a control into
+another space over a whole frame range and keeps it where it was in the world.
+
+usage:
+spaces.switch_space('char01:L_ArmPV_Ctrl', 'cog_Space')    # Over the time slider selection.
 '''
 
-import pymel.core as pm
-import pymel.core.datatypes as dt
+import backend
+import constants as cons
+import diagnostics as diag
+import lazy
+import limb_solver
+import sampling as smp
+import suite as su
+import transforms
+
+pm = lazy.module('pymel.core')
+dt = lazy.module('pymel.core.datatypes')
+np = lazy.module('numpy')
+
+
+log = diag.get_logger('spaces')
+pm = diag.counted_module(pm)
 
 
 def get_world_space(node):
@@ -19,11 +40,13 @@ def get_world_space(node):
     Return value: dt.Vector
     '''
 
-    pos = dt.Vector(pm.xform(node, q=True, t=True, ws=True))
-    rot = dt.Vector(pm.xform(node, q=True, ro=True, ws=True))
+    scene = backend.get()
+    pos = dt.Vector(scene.world_position(node))
+    rot = dt.Vector(scene.world_rotation(node))
     return [pos,rot]
 
 
+@diag.operation('match_and_key')
 def match_and_key(node, pos, rot):
     '''
     Given a node and a vector to match to, match the node to the vector and key it.
@@ -31,10 +54,140 @@ def match_and_key(node, pos, rot):
     node - A transform node.
     '''
 
-    pm.xform(node, ws=True, t=pos)
-    pm.xform(node, ws=True, ro=rot)
-    pm.setKeyframe(node, at=['translate', 'rotate'])
+    scene = backend.get()
+    with diag.span('write'):
+        scene.set_world_position(node, pos)
+        scene.set_world_rotation(node, rot)
+    with diag.span('key'):
+        scene.set_key(node, ['translate', 'rotate'])
+
+    log.debug("%s keyed to %s in worldspace.", node.name(), pos)
+
+    return
+
+
+def space_attrs(node):
+    '''
+    The space attributes from constants.INTERNAL_SPACE_SWITCH_ATTRS that node has.
+
+    Return value: list of attribute names.
+    '''
+
+    found = []
+    for group in sorted(cons.INTERNAL_SPACE_SWITCH_ATTRS):
+        for attr in cons.INTERNAL_SPACE_SWITCH_ATTRS[group]:
+            if(attr not in found and pm.hasAttr(node, attr)):
+                found.append(attr)
+
+    return found
+
+
+def current_space(node, time=None):
+    '''
+    The space attribute weighted highest on node, or None if it has none or all are 0.
+    '''
+
+    scene = backend.get()
+    best = None
+    best_weight = 0.0
+    for attr in space_attrs(node):
+        weight = scene.get_attr(str(node) + '.' + attr, time=time)
+        if(weight > best_weight):
+            best = attr
+            best_weight = weight
+
+    return best
+
+
+@diag.operation('switch_space')
+def switch_space(node, space, frame_range=None, sampling=None, fast=True):
+    '''
+    Switch a control to another space over a frame range, keeping it's world motion.  The world
+    matrix is read for every frame first, then the space weights are keyed over to the new space,
+    and the control's translate and rotate are keyed to land it back where it was, all frames in
+    one pass.  The frame before and the frame after the range are keyed with the weights, translate
+    and rotate the control had there, so the animation outside the range is left as it was.
+
+    usage:
+    switch_space(node='char01:L_ArmPV_Ctrl', space='cog_Space')
+
+    node - The control, a PyNode or name.
+    space - One of the control's space attributes, see space_attrs().
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
+    sampling - Which frames to key, a sampling.Sampling.  Defaults to every frame.  On keys samples
+        where the control is keyed.
+    fast - Run inside a suite.bake_session().
+
+    The control's own pivots, rotate axis and joint orient are taken to be zero, as they are on the
+    rig's controls.
+    '''
+
+    name = str(node)
+    attrs = space_attrs(name)
+    if(space not in attrs):
+        pm.error("sr_biped error: {} has no space '{}', it has: {}".format(
+            name, space, ', '.join(attrs) or 'none'))
+        return
 
-    print("{} keyed to {} in worldspace.".format(node.name(), pos))
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return
+    if(sampling is None):
+        sampling = smp.every(1)
+    frames = sampling.resolve(frame_range, sources=[name])
+    if(not frames):
+        pm.warning("The sampling gave no frames to bake.")
+        return
+    diag.annotate(space=space, frames=len(frames), sampling=repr(sampling))
+
+    # Keys either side of the range hold what was there, else the new weights and the translate
+    # and rotate that go with them would carry on into the animation before and after it.
+    before, after = frames[0] - 1, frames[-1] + 1
+    times = [before] + list(frames) + [after]
+    channels = ['translate' + axis for axis in 'XYZ'] + ['rotate' + axis for axis in 'XYZ']
+
+    scene = backend.get()
+    with su.bake_session('switch_space', frames=len(frames), evaluation=su.BAKE_EVALUATION,
+                         enabled=fast):
+        with diag.span('query'):
+            world = _as_array([scene.world_matrix(name, time=frame) for frame in frames])
+            previous = scene.get_attr(name + '.rotate', time=frames[0])
+            rotate_order = int(scene.get_attr(name + '.rotateOrder'))
+            held = dict(
+                (time, dict(zip(attrs + channels, scene.get_attrs(
+                    [name + '.' + attr for attr in attrs + channels], time=time))))
+                for time in (before, after))
+
+        with diag.span('key'):
+            for attr in attrs:
+                weight = 1.0 if attr == space else 0.0
+                scene.set_keys(name, attr, times,
+                               [held[before][attr]] + [weight] * len(frames) + [held[after][attr]])
+
+        # The parent matrix is read again now the new space drives it.
+        with diag.span('query'):
+            parents = _as_array(
+                [scene.matrix(name + '.parentMatrix[0]', time=frame) for frame in frames])
+
+        with diag.span('solve'):
+            local = limb_solver.local_matrices(world, parents)
+            translate = local[:, 3, :3]
+            rotate = transforms.euler_from_matrices(local, rotate_order, previous=list(previous))
+
+        with diag.span('key'):
+            for index, axis in enumerate('XYZ'):
+                for channel, values in (('translate' + axis, translate[:, index].tolist()),
+                                        ('rotate' + axis, rotate[:, index].tolist())):
+                    scene.set_keys(name, channel, times,
+                                   [held[before][channel]] + values + [held[after][channel]])
+
+    log.debug("%s switched to %s over %s frames.", name, space, len(frames))
 
     return
+
+
+def _as_array(matrices):
+    return np.array([[list(row) for row in matrix] for matrix in matrices], dtype=float)
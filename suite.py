@@ -5,8 +5,27 @@ This module controls and reads the state of the Maya suite for when we need arti
 state-changed, or piggy back on values determined by the suite's UI.
 '''
 
-import pymel.core as pm
-import maya.mel as mel
+from timeit import default_timer as _clock
+
+import diagnostics as diag
+import lazy
+
+pm = lazy.module('pymel.core')
+mel = lazy.module('maya.mel')
+
+
+log = diag.get_logger('suite')
+
+# Evaluation manager mode the bakes run their sessions in.  A bake visits one frame at a time, where
+# serial evaluation skips the scheduling parallel evaluation sets up for every time change.  None
+# leaves the user's mode as it is.
+BAKE_EVALUATION = 'serial'
+
+# Seconds per frame of the last run of each bake, with and without a session, keyed by
+# (label, controlled).  Used to estimate what a session saves.
+_timings = {}
+_depth = 0
+
 
 def frame_selection():
     '''
@@ -21,8 +40,124 @@ def frame_selection():
     # Frame range is found and cast as tuple due to paranoia.
     frame_range = tuple(pm.timeControl(playback_slider, q=True, ra=True))
 
-    print(type(frame_range))
     if(frame_range[1] - frame_range[0] <= 1.0):
         return False
     else:
-        return frame_range
\ No newline at end of file
+        return frame_range
+
+
+class bake_session(object):
+    '''
+    Context manager putting the scene into a fast state for a bake, and putting it back afterwards,
+    even if the bake fails.  Viewport refresh is suspended, autokey is turned off and, if asked
+    for, the evaluation manager is switched to another mode.  On exit the user's time, selection
+    and those settings are restored.  If setting up the session fails, what was already changed is
+    put back before the error is raised.
+
+    Nested sessions do nothing, so bakes can be wrapped in a larger session by a pipeline script.
+
+    usage:
+    with suite.bake_session('bake_ik_to_fk', frames=120, evaluation=suite.BAKE_EVALUATION):
+        ...
+
+    label - Name the timings are kept under.
+    frames - Frame count of the bake, to compare timings between runs of different lengths.
+    evaluation - Evaluation manager mode to bake in: 'parallel', 'serial' or 'off' (DG).  None
+        leaves the user's mode as it is.  The bakes pass BAKE_EVALUATION.
+    enabled - False runs an uncontrolled bake, still timed, to measure what a session saves.
+
+    After the block, .seconds holds how long it took and .saved the estimated seconds saved
+    compared with the last uncontrolled run of the same label (None until there has been one).
+    '''
+
+    def __init__(self, label='bake', frames=None, evaluation=None, enabled=True):
+        self.label = label
+        self.frames = frames
+        self.evaluation = evaluation
+        self.enabled = enabled
+        self.seconds = None
+        self.saved = None
+        self._state = None
+        self._start = None
+
+    def __enter__(self):
+        global _depth
+
+        _depth += 1
+        self._start = _clock()
+        if(not self.enabled or _depth > 1):
+            return self
+
+        try:
+            self._state = {
+                'time': pm.currentTime(q=True),
+                'selection': pm.ls(sl=True),
+                'autokey': pm.autoKeyframe(q=True, state=True),
+                'evaluation': pm.evaluationManager(q=True, mode=True)[0],
+            }
+
+            pm.refresh(suspend=True)
+            pm.autoKeyframe(state=False)
+            if(self._switches_evaluation()):
+                pm.evaluationManager(mode=self.evaluation)
+        except Exception:
+            # __exit__ won't be called, so the session is undone here.
+            _depth -= 1
+            self._restore()
+            raise
+
+        return self
+
+    def __exit__(self, *exc_info):
+        global _depth
+
+        _depth -= 1
+        self._restore()
+
+        self.seconds = _clock() - self._start
+        if(_depth == 0 and exc_info[0] is None):
+            self._report()
+
+        return False
+
+    def _switches_evaluation(self):
+        return self.evaluation is not None and self.evaluation != self._state['evaluation']
+
+    def _restore(self):
+        # Put back the state saved by __enter__, if it got as far as saving it.
+        if(self._state is None):
+            return
+
+        try:
+            if(self._switches_evaluation()):
+                pm.evaluationManager(mode=self._state['evaluation'])
+            pm.autoKeyframe(state=self._state['autokey'])
+            pm.currentTime(self._state['time'], edit=True)
+            if(self._state['selection']):
+                pm.select(self._state['selection'])
+            else:
+                pm.select(clear=True)
+        finally:
+            self._state = None
+            pm.refresh(suspend=False)
+            pm.refresh()
+
+        return
+
+    def _report(self):
+        per_frame = self.seconds / max(1, self.frames or 1)
+        _timings[(self.label, self.enabled)] = per_frame
+
+        reference = _timings.get((self.label, not self.enabled))
+        if(reference is not None):
+            uncontrolled, controlled = (reference, per_frame) if self.enabled else \
+                (per_frame, reference)
+            self.saved = (uncontrolled - controlled) * max(1, self.frames or 1)
+            log.info("%s took %.3fs, %.3fs less than without a bake session.",
+                     self.label, self.seconds, self.saved)
+        else:
+            log.info("%s took %.3fs.", self.label, self.seconds)
+
+        diag.annotate(session_seconds=self.seconds, session_saved=self.saved)
+
+        return
@@ -0,0 +1,140 @@
+'''
+test_curves.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Key reduction held to it's tolerance, and the Euler filter, on curves with known answers.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import curves
+import limb_solver
+
+
+def _error(times, values, keep):
+    # Largest distance from the samples to the straight lines between the kept keys.
+    return np.abs(np.interp(times, times[keep], values[keep]) - values).max()
+
+
+class SimplifyTests(unittest.TestCase):
+    def setUp(self):
+        self.times = np.arange(1.0, 241.0)
+        random = np.random.RandomState(7)
+        self.curves = [
+            np.sin(self.times * 0.11) * 30.0,
+            np.cumsum(random.normal(0.0, 1.0, len(self.times))),
+            np.where(self.times < 120, 0.0, 45.0),
+            np.sin(self.times * 0.9) * 2.0 + self.times * 0.1,
+        ]
+
+    def test_within_tolerance(self):
+        for tolerance in (0.001, 0.01, 0.05, 0.5):
+            for values in self.curves:
+                keep = curves.simplify(self.times, values, tolerance)
+                self.assertLessEqual(_error(self.times, values, keep), tolerance + 1e-9)
+                self.assertTrue(keep[0] and keep[-1])
+
+    def test_reduces(self):
+        # A slow sine needs a key every few frames at most to stay within 0.05.
+        keep = curves.simplify(self.times, np.sin(self.times * 0.03) * 10.0, 0.05)
+        self.assertLess(keep.sum(), len(self.times) / 4)
+
+    def test_straight_line_keeps_ends(self):
+        keep = curves.simplify(self.times, self.times * 2.0 + 1.0, 1e-6)
+        self.assertEqual(list(np.flatnonzero(keep)), [0, len(self.times) - 1])
+
+    def test_channels_have_their_own_tolerance(self):
+        values = np.column_stack(self.curves[:2])
+        keep = curves.simplify(self.times, values, [0.01, 0.5])
+        self.assertEqual(keep.shape, values.shape)
+        for channel, tolerance in enumerate([0.01, 0.5]):
+            self.assertLessEqual(
+                _error(self.times, values[:, channel], keep[:, channel]), tolerance + 1e-9)
+            np.testing.assert_array_equal(
+                keep[:, channel], curves.simplify(self.times, values[:, channel], tolerance))
+
+    def test_uneven_times(self):
+        times = np.cumsum(np.random.RandomState(3).uniform(0.25, 3.0, 200))
+        values = np.sin(times * 0.2) * 10.0
+        keep = curves.simplify(times, values, 0.02)
+        self.assertLessEqual(_error(times, values, keep), 0.02 + 1e-9)
+
+
+class EulerFilterTests(unittest.TestCase):
+    def test_unwraps_whole_turns(self):
+        rotations = [(0, 0, 170), (0, 0, 179), (0, 0, -172), (0, 0, -160)]
+        filtered = curves.euler_filter(rotations)
+        np.testing.assert_allclose(filtered[:, 2], [170, 179, 188, 200])
+
+    def test_same_orientations(self):
+        rotations = np.array([(10, 85, 0), (170, 95, 180), (-170, 80, 5), (30, 100, 200)],
+                             dtype=float)
+        for rotate_order in curves.ROTATE_ORDERS:
+            filtered = curves.euler_filter(rotations, rotate_order)
+            np.testing.assert_allclose(
+                limb_solver.euler_matrices(filtered, rotate_order),
+                limb_solver.euler_matrices(rotations, rotate_order), atol=1e-9)
+            steps = np.abs(np.diff(filtered, axis=0)).sum(axis=1)
+            self.assertTrue(np.all(steps <= np.abs(np.diff(rotations, axis=0)).sum(axis=1)))
+
+
+class OptimizeCurvesTests(unittest.TestCase):
+    def setUp(self):
+        self.scene = mock_maya.new_scene()
+        self.node = self.scene.add_node('ctrl')
+        self.times = np.arange(1.0, 121.0)
+        self.values = np.sin(self.times * 0.15) * 20.0
+        for time, value in zip(self.times, self.values):
+            self.scene.key(self.node, 'translateX', time, value)
+
+        # keyTangent is recorded, the mock's curves are linear already.
+        self.tangents = []
+        pymel_core = sys.modules['pymel.core']
+        key_tangent = pymel_core.keyTangent
+
+        def recording(*args, **kwargs):
+            self.tangents.append(kwargs)
+            return key_tangent(*args, **kwargs)
+
+        pymel_core.keyTangent = recording
+        self.addCleanup(setattr, pymel_core, 'keyTangent', key_tangent)
+
+    def test_kept_keys_hold_tolerance(self):
+        before, after = curves.optimize_curves(['ctrl'], tolerance=0.02, attributes=['translate'])
+        self.assertEqual(before, len(self.times))
+        self.assertLess(after, before)
+
+        curve = self.node.curves['translateX']
+        self.assertEqual(len(curve.times), after)
+        evaluated = np.array([curve.evaluate(time) for time in self.times])
+        self.assertLessEqual(np.abs(evaluated - self.values).max(), 0.02 + 1e-9)
+
+        # The kept keys are made linear, the shape the tolerance was measured against.
+        edits = [kwargs for kwargs in self.tangents if not kwargs.get('q')]
+        self.assertTrue(edits)
+        for kwargs in edits:
+            self.assertEqual(kwargs.get('inTangentType'), 'linear')
+            self.assertEqual(kwargs.get('outTangentType'), 'linear')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+'''
+test_ez_switch.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Switching many limbs at once on the mock scene: the same match as switching them one by one, from
+one read of the scene.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import ez_switch
+import fkik
+import naming
+
+TARGETS = [('', 'L', 'arm'), ('', 'R', 'arm'), ('', 'L', 'leg'), ('', 'R', 'leg')]
+
+
+def _scene():
+    scene = benchmark._fresh_scene(20)
+    scene.set_time(benchmark.START_FRAME + 7)
+
+    return scene
+
+
+def _worlds(scene):
+    # Where every control ends up, rounded for comparing.  Equal turns can read as different angles.
+    return dict(
+        (node.name, [round(float(value), 4) for value in node.world_matrix().flatten()])
+        for node in scene.nodes.values() if node.name.endswith('_Ctrl'))
+
+
+class SwitchTargetsTests(unittest.TestCase):
+    def _one_by_one(self, mode):
+        # Each limb matched on it's own, as the switch used to.
+        scene = _scene()
+        profile = naming.profile_for('')
+        for namespace, side, part in TARGETS:
+            if(mode == 'fk'):
+                fkik.fk_to_ik(side, part, profile.role_dict('ik_bone'),
+                              profile.role_dict('fk_ctrl'), key=False)
+            else:
+                fkik.ik_to_fk(side, part, profile.role_dict('fk_bone'),
+                              profile.role_dict('ik_ctrl'), amp_pv=40, key=False)
+
+        return _worlds(scene)
+
+    def _switch(self, mode):
+        scene = _scene()
+        for namespace, side, part in TARGETS:
+            ez_switch.switch_ik_blend_attr(side, part, 0 if mode == 'ik' else 1, namespace)
+        scene.reset_counts()
+
+        switches = ez_switch.switch_targets(TARGETS, mode=mode)
+        self.assertEqual(len(switches), len(TARGETS))
+        self.assertEqual(scene.calls['backend.matrices'], 1)
+        for namespace, side, part in TARGETS:
+            self.assertEqual(ez_switch.get_ik_blend_attr(side, part, namespace),
+                             1 if mode == 'ik' else 0)
+
+        return _worlds(scene)
+
+    def test_to_fk(self):
+        self.assertEqual(self._switch('fk'), self._one_by_one('fk'))
+
+    def test_to_ik(self):
+        self.assertEqual(self._switch('ik'), self._one_by_one('ik'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+'''
+test_farm.py
+Shaper Rigs / Burlington Interactive Solutions
+
+The farm's pool, records and totals, run with the dry run worker so no Maya is needed.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import constants as cns
+import farm
+import humanik
+
+
+class FarmTests(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp(prefix='sr_biped_farm_test')
+        self.addCleanup(shutil.rmtree, self.out_dir)
+        takes = ['/mocap/walk.fbx', '/mocap/run.fbx', '/mocap/jump.fbx', '/mocap/fall.fbx']
+        self.jobs = farm.jobs_from_lists(['/rigs/hero.ma'], takes, self.out_dir,
+                                         frame_range=(1, 51), step=2)
+        self.jobs[2]['fail'] = True
+
+    def test_jobs_from_lists(self):
+        self.assertEqual([job['job_id'] for job in self.jobs], ['walk', 'run', 'jump', 'fall'])
+        self.assertEqual(set(job['rig'] for job in self.jobs), set(['/rigs/hero.ma']))
+        self.assertEqual(self.jobs[0]['output'], os.path.join(self.out_dir, 'walk.ma'))
+        with self.assertRaises(ValueError):
+            farm.jobs_from_lists(['a.ma', 'b.ma'], ['walk.fbx', 'run.fbx', 'jump.fbx'], '/out')
+
+    def test_dry_run_counts_sampled_frames(self):
+        # 1 to 49 every other frame, and the last frame, 50.
+        self.assertEqual(farm.dry_run_worker(self.jobs[0])['frames'], 26)
+        self.assertEqual(farm.dry_run_worker({'job_id': 'x'})['frames'], 100)
+
+    def test_run_jobs_records_every_job(self):
+        metrics_path = os.path.join(self.out_dir, 'logs', 'metrics.jsonl')
+        results = farm.run_jobs(
+            self.jobs, workers=2, worker=farm.dry_run_worker, metrics_path=metrics_path)
+
+        by_id = dict((record['job_id'], record) for record in results)
+        self.assertEqual(sorted(by_id), ['fall', 'jump', 'run', 'walk'])
+        self.assertEqual(by_id['jump']['status'], 'failed')
+        self.assertIn('Dry run failure for jump', by_id['jump']['error'])
+        self.assertEqual(by_id['jump']['frames'], 0)
+        for job_id in ('walk', 'run', 'fall'):
+            self.assertEqual(by_id[job_id]['status'], 'ok')
+            self.assertEqual(by_id[job_id]['frames'], 26)
+            self.assertGreaterEqual(by_id[job_id]['wall_time'], 0.0)
+
+        # Every record was appended to the metrics file as it finished.
+        written = farm.read_metrics(metrics_path)
+        self.assertEqual(sorted(record['job_id'] for record in written), sorted(by_id))
+
+        summary = farm.summarize(results, elapsed=2.0)
+        self.assertEqual(summary['jobs'], 4)
+        self.assertEqual(summary['succeeded'], 3)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['frames'], 78)
+        self.assertEqual(summary['fps'], 39.0)
+
+    def test_summarize_without_elapsed_sums_jobs(self):
+        records = [
+            {'status': 'ok', 'frames': 10, 'wall_time': 1.0},
+            {'status': 'ok', 'frames': 30, 'wall_time': 3.0, 'limbs_ok': False},
+            {'status': 'failed', 'frames': 0, 'wall_time': 4.0},
+        ]
+        summary = farm.summarize(records)
+        self.assertEqual(summary['elapsed'], 8.0)
+        self.assertEqual(summary['fps'], 5.0)
+        self.assertEqual(summary['limbs_flagged'], 1)
+
+    def test_main_dry_run(self):
+        code = farm.main(['--rig', '/rigs/hero.ma', '--takes', 'walk.fbx', 'run.fbx',
+                          '--out', self.out_dir, '--dry-run', '--workers', '2'])
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            len(farm.read_metrics(os.path.join(self.out_dir, 'metrics.jsonl'))), 2)
+
+
+class JobSetupTests(unittest.TestCase):
+    def test_job_without_namespace(self):
+        # A farm session has nothing selected, a rig without a namespace mustn't go looking there.
+        job = farm.make_job('/rigs/hero.ma', '/mocap/walk.fbx', '/out/walk.ma')
+        self.assertEqual(job['namespace'], '')
+        scene = mock_maya.new_scene()
+        mock_maya.build_biped(scene)
+        scene.add_node('spineHip_SHJnt', 'joint', cns.TOP_JOINT)
+
+        humanik.setup(ns=job['namespace'])
+
+        top = scene.get(cns.HIK_PREFIX + 'trajectory')
+        self.assertEqual([child.name for child in top.children], [cns.HIK_PREFIX + 'spineHip'])
+        self.assertEqual(scene.get('L_ArmSetting_Ctrl').values['ikBlend'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
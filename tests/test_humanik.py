@@ -0,0 +1,55 @@
+'''
+test_humanik.py
+Shaper Rigs / Burlington Interactive Solutions
+
+The HIK bake's constraints on the mock scene: gone after a bake, and after a bake that couldn't
+make all of them.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import humanik
+
+FRAME_RANGE = (1, 21)
+
+
+class ConstraintTests(unittest.TestCase):
+    def setUp(self):
+        self.scene = benchmark._fresh_scene(20, namespace='char01')
+        mock_maya.build_hik_skeleton(self.scene, frames=FRAME_RANGE)
+
+    def test_bake_deletes_constraints(self):
+        humanik.bake(ns='char01:', frame_range=FRAME_RANGE)
+        self.assertEqual(self.scene.constraints, {})
+        self.assertIn('translateX', self.scene.get('char01:Cog_Ctrl').curves)
+
+    def test_failed_constraining_deletes_the_ones_made(self):
+        # The last control the mapping constrains is missing, the others are made before it.
+        self.scene.remove('char01:R_armLwrFK_Ctrl')
+
+        with self.assertRaises(mock_maya.MayaNodeError):
+            humanik.bake(ns='char01:', frame_range=FRAME_RANGE)
+
+        self.assertEqual(self.scene.constraints, {})
+        self.assertNotIn('translateX', self.scene.get('char01:Cog_Ctrl').curves)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+'''
+test_incremental.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Incremental re-bakes on the mock scene: after a source edit, the keys left must be the ones a full
+bake of the edited animation gives.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import fkik
+import incremental
+
+FRAMES = 120
+FRAME_RANGE = (benchmark.START_FRAME, benchmark.START_FRAME + FRAMES)
+
+
+def _keys(scene, names):
+    # Every key on the named nodes, rounded so float noise between two bakes doesn't count.
+    return dict(
+        ((name, channel), [(time, round(value, 5)) for time, value in zip(curve.times, curve.values)])
+        for name in names for channel, curve in sorted(scene.get(name).curves.items()))
+
+
+def _fresh_scene(direction):
+    # The mock biped only animates the fk controls, the ik ones are animated for fk_to_ik.
+    scene = benchmark._fresh_scene(FRAMES)
+    if(direction == 'fk_to_ik'):
+        mock_maya.animate(scene, fkik.bake_sources(direction, 'L', 'arm'), FRAME_RANGE)
+
+    return scene
+
+
+def _edit(direction):
+    # Move one source key in the middle of the range.
+    source = fkik.bake_sources(direction, 'L', 'arm')[1]
+    curve = mock_maya.scene.get(source).curves['rotateZ']
+    curve.values[len(curve.values) // 2] += 20.0
+    mock_maya.scene.dirty()
+
+
+class IncrementalTests(unittest.TestCase):
+    def setUp(self):
+        incremental.forget()
+
+    def _check(self, direction, **bake_args):
+        bake = getattr(incremental, 'bake_' + direction)
+        targets = fkik.bake_targets(direction, 'L', 'arm')
+
+        # Baked in full, edited, then baked again incrementally.
+        scene = _fresh_scene(direction)
+        self.assertEqual(bake(side='L', limb='arm', frame_range=FRAME_RANGE, **bake_args),
+                         FRAMES)
+        _edit(direction)
+        redone = bake(side='L', limb='arm', frame_range=FRAME_RANGE, **bake_args)
+        self.assertGreater(redone, 0)
+        self.assertLess(redone, FRAMES)
+        incremental_keys = _keys(scene, targets)
+
+        # The same edit on a fresh scene, baked in full once.
+        incremental.forget()
+        scene = _fresh_scene(direction)
+        _edit(direction)
+        bake(side='L', limb='arm', frame_range=FRAME_RANGE, full=True, **bake_args)
+
+        self.assertEqual(incremental_keys, _keys(scene, targets))
+
+    def test_ik_to_fk_matches_full_bake(self):
+        self._check('ik_to_fk')
+
+    def test_ik_to_fk_sampled_matches_full_bake(self):
+        self._check('ik_to_fk', sampled=True)
+
+    def test_fk_to_ik_matches_full_bake(self):
+        self._check('fk_to_ik')
+
+    def test_fk_to_ik_sampled_matches_full_bake(self):
+        self._check('fk_to_ik', sampled=True)
+
+    def test_nothing_changed(self):
+        benchmark._fresh_scene(FRAMES)
+        incremental.bake_ik_to_fk(side='L', limb='arm', frame_range=FRAME_RANGE, sampled=True)
+        self.assertEqual(incremental.bake_ik_to_fk(
+            side='L', limb='arm', frame_range=FRAME_RANGE, sampled=True), 0)
+
+    def test_edited_results_bake_in_full(self):
+        scene = benchmark._fresh_scene(FRAMES)
+        incremental.bake_ik_to_fk(side='L', limb='arm', frame_range=FRAME_RANGE, sampled=True)
+        target = fkik.bake_targets('ik_to_fk', 'L', 'arm')[1]
+        scene.get(target).curves['translateX'].values[5] += 1.0
+        self.assertEqual(incremental.bake_ik_to_fk(
+            side='L', limb='arm', frame_range=FRAME_RANGE, sampled=True), FRAMES)
+
+
+class ChangedIntervalsTests(unittest.TestCase):
+    def test_reaches_two_keys_either_side(self):
+        keys = [(float(time), 0.0, None, None) for time in range(0, 100, 10)]
+        edited = list(keys)
+        edited[5] = (50.0, 3.0, None, None)
+        intervals = incremental.changed_intervals({'a.tx': tuple(keys)},
+                                                  {'a.tx': tuple(edited)}, (0.0, 99.0))
+        self.assertEqual(intervals, [(30.0, 70.0)])
+
+    def test_static_change_covers_span(self):
+        intervals = incremental.changed_intervals(
+            {'a.tx': ('static', 0.0)}, {'a.tx': ('static', 1.0)}, (1.0, 50.0))
+        self.assertEqual(intervals, [(1.0, 50.0)])
+
+    def test_overlaps_merge(self):
+        keys = [(float(time), 0.0, None, None) for time in range(0, 100, 10)]
+        edited = list(keys)
+        edited[3] = (30.0, 1.0, None, None)
+        edited[5] = (50.0, 1.0, None, None)
+        intervals = incremental.changed_intervals({'a.tx': tuple(keys)},
+                                                  {'a.tx': tuple(edited)}, (0.0, 99.0))
+        self.assertEqual(intervals, [(10.0, 70.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
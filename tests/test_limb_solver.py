@@ -0,0 +1,125 @@
+'''
+test_limb_solver.py
+Shaper Rigs / Burlington Interactive Solutions
+
+limb_solver and the Euler decomposition in transforms, checked against poses worked out by hand.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import constants as cons
+import limb_solver
+import transforms
+
+
+def _translation(position):
+    matrix = np.identity(4)
+    matrix[3, :3] = position
+    return matrix
+
+
+class PoleVectorTests(unittest.TestCase):
+    def test_bent_limb(self):
+        # Elbow at the origin, shoulder above it and wrist out along x: the pole vector sits
+        # opposite the sum of the two unit directions.
+        pv_pos = limb_solver.pole_vector_positions(
+            [(0, 10, 0)], [(0, 0, 0)], [(10, 0, 0)], amp_pv=1.0)
+        np.testing.assert_allclose(pv_pos, [(-1, -1, 0)])
+
+    def test_pole_direction_flips_side(self):
+        pv_pos = limb_solver.pole_vector_positions(
+            [(0, 10, 0)], [(0, 0, 0)], [(10, 0, 0)], amp_pv=2.0, pole_direction=-1)
+        np.testing.assert_allclose(pv_pos, [(2, 2, 0)])
+
+    def test_frames_are_independent(self):
+        top = [(0, 10, 0), (0, 0, 5)]
+        mid = [(0, 0, 0), (0, 0, 0)]
+        end = [(10, 0, 0), (0, 5, 0)]
+        together = limb_solver.pole_vector_positions(top, mid, end)
+        for index in range(2):
+            alone = limb_solver.pole_vector_positions(top[index], mid[index], end[index])
+            np.testing.assert_allclose(together[index], alone[0])
+
+
+class EndCompensationTests(unittest.TestCase):
+    def test_arms_match_one_to_one(self):
+        self.assertIsNone(limb_solver.end_compensation('arm', cons.INTERNAL_SIDE_TOKENS['left']))
+
+    def test_right_foot_is_flipped(self):
+        left = limb_solver.end_compensation('leg', cons.INTERNAL_SIDE_TOKENS['left'])
+        right = limb_solver.end_compensation('leg', cons.INTERNAL_SIDE_TOKENS['right'])
+        self.assertEqual(left, (0, 0, 90))
+        self.assertEqual(right, (-180, 0, 90))
+
+
+class SolveLimbTests(unittest.TestCase):
+    def test_known_pose(self):
+        end = _translation((10, 0, 0))
+        pv_pos, end_worlds = limb_solver.solve_limb(
+            [(0, 10, 0)], [(0, 0, 0)], [end], amp_pv=1.0, compensation=(0, 0, 90))
+
+        np.testing.assert_allclose(pv_pos, [(-1, -1, 0)])
+        # The counter-rotation turns the control in object space and leaves it where it was.
+        expected = limb_solver.euler_matrices((0, 0, 90))[0]
+        expected[3, :3] = (10, 0, 0)
+        np.testing.assert_allclose(end_worlds[0], expected, atol=1e-12)
+
+    def test_no_compensation_copies(self):
+        end = _translation((1, 2, 3))
+        pv_pos, end_worlds = limb_solver.solve_limb([(0, 1, 0)], [(0, 0, 0)], [end])
+        np.testing.assert_allclose(end_worlds[0], end)
+
+    def test_residuals_of_known_offsets(self):
+        moved = _translation((3, 4, 0))
+        turned = limb_solver.euler_matrices((0, 30, 0))[0]
+        distances, angles = limb_solver.match_residuals(
+            [np.identity(4), moved, turned], [np.identity(4)] * 3)
+        np.testing.assert_allclose(distances, [0, 5, 0], atol=1e-12)
+        np.testing.assert_allclose(angles, [0, 0, 30], atol=1e-6)
+
+
+class EulerTests(unittest.TestCase):
+    def test_quarter_turn_about_z(self):
+        # Maya turns the x axis onto y for rotateZ 90.
+        matrix = limb_solver.euler_matrices((0, 0, 90))[0]
+        np.testing.assert_allclose(matrix[0, :3], (0, 1, 0), atol=1e-12)
+        np.testing.assert_allclose(matrix[1, :3], (-1, 0, 0), atol=1e-12)
+
+    def test_round_trip_every_order(self):
+        angles = np.array([(10, 20, 30), (-45, 60, 170), (0, -80, 5), (120, 10, -100)],
+                          dtype=float)
+        for rotate_order in transforms.ROTATE_ORDERS:
+            matrices = limb_solver.euler_matrices(angles, rotate_order)
+            decomposed = transforms.euler_from_matrices(matrices, rotate_order)
+            # Either solution is fine as long as it gives back the same matrices.
+            np.testing.assert_allclose(
+                limb_solver.euler_matrices(decomposed, rotate_order), matrices, atol=1e-9,
+                err_msg=rotate_order)
+
+    def test_round_trip_keeps_small_angles(self):
+        angles = np.array([(10, 20, 30), (-15, 5, 40)], dtype=float)
+        for rotate_order in transforms.ROTATE_ORDERS:
+            decomposed = transforms.euler_from_matrices(
+                limb_solver.euler_matrices(angles, rotate_order), rotate_order)
+            np.testing.assert_allclose(decomposed, angles, atol=1e-9, err_msg=rotate_order)
+
+    def test_scale_is_divided_out(self):
+        matrix = limb_solver.euler_matrices((10, 20, 30))[0]
+        matrix[:3, :3] *= np.array([[2.0], [0.5], [3.0]])
+        np.testing.assert_allclose(
+            transforms.euler_from_matrices(matrix)[0], (10, 20, 30), atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
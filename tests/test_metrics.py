@@ -0,0 +1,66 @@
+'''
+test_metrics.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Limb length checks on the mock scene, against rest lengths measured on a rest frame only.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import metrics
+
+
+class CheckClipTests(unittest.TestCase):
+    def setUp(self):
+        metrics.forget_rest_lengths()
+        self.scene = mock_maya.new_scene()
+        mock_maya.build_biped(self.scene)
+
+        # The left elbow pulled 10 units out along the arm from frame 5, and the scene left there.
+        elbow = self.scene.get('L_armLwrFK_Ctrl')
+        for frame, offset in ((0, 0.0), (4, 0.0), (5, 10.0), (10, 10.0)):
+            self.scene.key(elbow, 'translateX', frame, offset)
+        self.scene.set_time(8)
+
+    def test_needs_rest_lengths(self):
+        with self.assertRaises(RuntimeError):
+            metrics.check_clip('', frame_range=(0, 11))
+        with self.assertRaises(RuntimeError):
+            metrics.limb_metrics('', [0.0, 1.0])
+
+    def test_rest_time(self):
+        report = metrics.check_clip('', frame_range=(0, 11), rest_time=0)
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['limbs']['L_arm']['stretched'], [5.0, 6.0, 7.0, 8.0, 9.0, 10.0])
+        self.assertTrue(report['limbs']['R_arm']['ok'])
+
+        # Measured on the rest frame, not the stretched one the scene is on.
+        upper, lower = metrics.rest_lengths('')[('L', 'arm')].lengths
+        self.assertAlmostEqual(upper, (25.0 ** 2 + 3.0 ** 2) ** 0.5)
+
+    def test_uses_measured_rest(self):
+        metrics.rest_lengths('', time=0)
+        report = metrics.check_clip('', frame_range=(0, 5))
+        self.assertTrue(report['ok'])
+        self.assertEqual(report['frames'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+'''
+test_registry.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Which rig a node belongs to, with a rig without a namespace in the scene beside namespaced ones.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import registry
+
+
+class RigForTests(unittest.TestCase):
+    def setUp(self):
+        scene = mock_maya.new_scene()
+        for namespace in ('', 'char01', 'set:char02'):
+            mock_maya.build_biped(scene, namespace=namespace)
+        registry.get_registry().invalidate()
+
+    def test_all_rigs_found(self):
+        self.assertEqual([rig.namespace for rig in registry.get_registry().rigs()],
+                         ['', 'char01:', 'set:char02:'])
+
+    def test_own_namespace(self):
+        for name, namespace in (('L_armUprFK_Ctrl', ''),
+                                ('char01:L_armUprFK_Ctrl', 'char01:'),
+                                ('|char01:DO_NOT_TOUCH_GRP|char01:trajectory_SHJnt', 'char01:'),
+                                (':char01:L_armUprFK_Ctrl', 'char01:'),
+                                ('set:char02:Cog_Ctrl', 'set:char02:')):
+            self.assertEqual(registry.rig_for(name).namespace, namespace, name)
+
+    def test_nested_namespace(self):
+        self.assertEqual(registry.rig_for('char01:props:sword').namespace, 'char01:')
+        # set: is no rig, nor in one.
+        self.assertEqual(registry.rig_for('set:light').namespace, '')
+
+    def test_prefix_is_not_a_namespace(self):
+        self.assertEqual(registry.rig_for('char01_L_armUprFK_Ctrl').namespace, '')
+        self.assertEqual(registry.rig_for('char011:L_armUprFK_Ctrl').namespace, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
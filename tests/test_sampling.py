@@ -0,0 +1,94 @@
+'''
+test_sampling.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Which frames the samplings give, and a sparse HIK bake keyed in bakeResults calls rather than
+frame by frame.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import humanik
+import sampling as smp
+
+
+def _keys(scene, names):
+    return dict(
+        ((name, channel), [(time, round(value, 5)) for time, value in zip(curve.times, curve.values)])
+        for name in names for channel, curve in sorted(scene.get(name).curves.items()))
+
+
+class ResolveTests(unittest.TestCase):
+    def test_every_keeps_the_last_frame(self):
+        frames = smp.every(2).resolve((1, 51))
+        self.assertEqual(frames, [float(frame) for frame in range(1, 50, 2)] + [50.0])
+
+    def test_sub_frame(self):
+        self.assertEqual(smp.sub_frame(0.25).resolve((1, 2)), [1.0])
+        self.assertEqual(smp.sub_frame(0.25).resolve((1, 3)), [1.0, 1.25, 1.5, 1.75, 2.0])
+
+    def test_explicit_ignores_the_range(self):
+        self.assertEqual(smp.explicit([12, 1, 30, 12]).resolve((1, 5)), [1.0, 12.0, 30.0])
+
+
+class UniformStepTests(unittest.TestCase):
+    def test_even(self):
+        frames = smp.every(4).resolve((1, 50))
+        self.assertEqual(frames[-1], 49.0)
+        self.assertEqual(smp.uniform_step(frames), 4.0)
+        self.assertEqual(smp.tail(frames, 4.0), [])
+
+    def test_short_last_gap(self):
+        frames = smp.every(2).resolve((1, 51))
+        self.assertEqual(smp.uniform_step(frames), 2.0)
+        self.assertEqual(smp.tail(frames, 2.0), [50.0])
+
+    def test_uneven(self):
+        self.assertIsNone(smp.uniform_step([1.0, 3.0, 4.0, 6.0]))
+        # A last gap longer than the step isn't a tail.
+        self.assertIsNone(smp.uniform_step([1.0, 3.0, 5.0, 9.0]))
+        self.assertEqual(smp.tail([1.0, 3.0, 5.0, 9.0], None), [])
+
+
+class SparseHumanikBakeTests(unittest.TestCase):
+    def _bake(self, **bake_args):
+        scene = benchmark._fresh_scene(60, namespace='char01')
+        mock_maya.build_hik_skeleton(scene, frames=(1, 61))
+        scene.reset_counts()
+        humanik.bake(ns='char01:', frame_range=(1, 61), **bake_args)
+
+        return scene
+
+    def test_step_bakes_in_bake_results(self):
+        scene = self._bake(step=4)
+        # 1 to 57 every 4 frames in one call, then 60 on it's own.
+        self.assertEqual(scene.calls['bakeResults'], 2)
+        # The session reads the time and puts it back, the bake never steps it.
+        self.assertEqual(scene.calls['currentTime'], 2)
+        bulk_keys = _keys(scene, humanik.mapped_controls('char01:'))
+
+        stepped_keys = _keys(self._bake(step=4, bulk=False), humanik.mapped_controls('char01:'))
+        self.assertEqual(bulk_keys, stepped_keys)
+        times = bulk_keys[('char01:Cog_Ctrl', 'translateX')]
+        self.assertEqual([time for time, value in times], list(range(1, 58, 4)) + [60])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+'''
+test_scheduler.py
+Shaper Rigs / Burlington Interactive Solutions
+
+Chunked HIK bakes on the mock scene: constrained once for the whole bake, each chunk keyed in
+bakeResults, and the constraints gone whether the bake finished or failed.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import humanik
+import sampling as smp
+import scheduler
+
+FRAME_RANGE = (1, 61)
+CONSTRAINT_CALLS = ('parentConstraint', 'pointConstraint', 'orientConstraint')
+
+
+def _keys(scene, names):
+    return dict(
+        ((name, channel),
+         [(time, round(value, 5)) for time, value in zip(curve.times, curve.values)])
+        for name in names for channel, curve in sorted(scene.get(name).curves.items()))
+
+
+class HumanikBakeTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sr_biped_test')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _scene(self):
+        scene = benchmark._fresh_scene(FRAME_RANGE[1] - 1, namespace='char01')
+        mock_maya.build_hik_skeleton(scene, frames=FRAME_RANGE)
+        scene.reset_counts()
+
+        return scene
+
+    def _chunked(self, chunk_size=5):
+        bake = scheduler.humanik_bake(
+            ns='char01:', frame_range=FRAME_RANGE, sampling=smp.every(4), chunk_size=chunk_size,
+            save_scene=False)
+        bake.checkpoint = os.path.join(self.directory, 'bake.json')
+
+        return bake
+
+    def test_constrained_once(self):
+        scene = self._scene()
+        humanik.bake(ns='char01:', frame_range=FRAME_RANGE, step=4)
+        constraints_made = sum(scene.calls[name] for name in CONSTRAINT_CALLS)
+        single_keys = _keys(scene, humanik.mapped_controls('char01:'))
+
+        scene = self._scene()
+        bake = self._chunked()
+        bake.start(deferred=False)
+
+        self.assertEqual(bake.state, 'done')
+        self.assertEqual(sum(scene.calls[name] for name in CONSTRAINT_CALLS), constraints_made)
+        self.assertEqual(scene.constraints, {})
+        self.assertEqual(_keys(scene, humanik.mapped_controls('char01:')), single_keys)
+
+    def test_chunks_in_bake_results(self):
+        scene = self._scene()
+        bake = self._chunked(chunk_size=6)
+        # 1 to 57 every 4 frames and 60: 16 frames in 3 chunks, the last ending 49, 53, 57, 60.
+        self.assertEqual(len(bake.chunks), 3)
+        bake.start(deferred=False)
+
+        # One bakeResults a chunk and one more for 60, never stepping the time slider.  The bake
+        # session reads the time and puts it back.
+        self.assertEqual(scene.calls['bakeResults'], len(bake.chunks) + 1)
+        self.assertEqual(scene.calls['currentTime'], 2 * len(bake.chunks))
+
+    def test_failed_chunk_deletes_constraints(self):
+        scene = self._scene()
+        bake = self._chunked()
+        baked = []
+
+        def failing(chunk):
+            if(baked):
+                raise RuntimeError('Chunk failed.')
+            baked.append(chunk)
+            chunk_bake(chunk)
+
+        chunk_bake, bake.bake = bake.bake, failing
+        with self.assertRaises(RuntimeError):
+            bake.start(deferred=False)
+
+        self.assertEqual(bake.state, 'failed')
+        self.assertEqual(bake.done, set([0]))
+        self.assertEqual(scene.constraints, {})
+
+        # Resuming constrains again.
+        bake.bake = chunk_bake
+        bake.start(deferred=False)
+        self.assertEqual(bake.state, 'done')
+        self.assertEqual(scene.constraints, {})
+
+
+class HookTests(unittest.TestCase):
+    def test_start_and_stop_around_the_run(self):
+        mock_maya.new_scene()
+        events = []
+        bake = scheduler.ChunkedBake(
+            'hooks', lambda chunk: events.append('bake'), range(4), chunk_size=2,
+            checkpoint=os.path.join(tempfile.mkdtemp(prefix='sr_biped_test'), 'bake.json'),
+            save_scene=False, on_done=lambda bake: events.append('done'),
+            on_start=lambda bake: events.append('start'),
+            on_stop=lambda bake: events.append('stop'))
+        self.addCleanup(shutil.rmtree, os.path.dirname(bake.checkpoint))
+
+        bake.start(deferred=False)
+        self.assertEqual(events, ['start', 'bake', 'bake', 'stop', 'done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
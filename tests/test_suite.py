@@ -0,0 +1,87 @@
+'''
+test_suite.py
+Shaper Rigs / Burlington Interactive Solutions
+
+The bake session on the mock scene: the bakes run in BAKE_EVALUATION and the user's settings come
+back afterwards, whether or not the bake got to the end.
+
+usage:
+python -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if(PACKAGE_DIR not in sys.path):
+    sys.path.insert(0, PACKAGE_DIR)
+
+import benchmark
+import mock_maya
+
+# Once for all the test modules: a second install would leave the modules already imported with
+# a fake pymel the tests no longer see.
+if('pymel.core' not in sys.modules):
+    benchmark.load_package()
+
+import fkik
+import suite
+
+FRAMES = 24
+FRAME_RANGE = (benchmark.START_FRAME, benchmark.START_FRAME + FRAMES)
+
+
+class BakeSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.scene = benchmark._fresh_scene(FRAMES)
+        self.scene.settings['evaluation'] = 'parallel'
+        self.scene.settings['autoKeyframe'] = True
+
+        # Every mode the evaluation manager is set to, in order.
+        self.modes = []
+        pymel_core = sys.modules['pymel.core']
+        evaluation_manager = pymel_core.evaluationManager
+
+        def recording(*args, **kwargs):
+            if('mode' in kwargs and not (kwargs.get('q') or kwargs.get('query'))):
+                self.modes.append(kwargs['mode'])
+            return evaluation_manager(*args, **kwargs)
+
+        pymel_core.evaluationManager = recording
+        self.addCleanup(setattr, pymel_core, 'evaluationManager', evaluation_manager)
+
+    def test_bakes_switch_mode_and_restore_it(self):
+        for sampled in (False, True):
+            self.modes = []
+            fkik.bake_ik_to_fk(side='L', limb='arm', frame_range=FRAME_RANGE, sampled=sampled)
+            self.assertEqual(self.modes, [suite.BAKE_EVALUATION, 'parallel'])
+            self.assertEqual(self.scene.settings['evaluation'], 'parallel')
+            self.assertTrue(self.scene.settings['autoKeyframe'])
+
+    def test_restored_after_an_error(self):
+        with self.assertRaises(ValueError):
+            with suite.bake_session('failing', evaluation='off'):
+                self.assertEqual(self.scene.settings['evaluation'], 'off')
+                self.assertFalse(self.scene.settings['autoKeyframe'])
+                raise ValueError('Bake failed.')
+
+        self.assertEqual(self.modes, ['off', 'parallel'])
+        self.assertTrue(self.scene.settings['autoKeyframe'])
+
+        # A later session isn't taken for a nested one.
+        with suite.bake_session('after', evaluation='off'):
+            self.assertEqual(self.scene.settings['evaluation'], 'off')
+
+    def test_none_leaves_the_mode(self):
+        with suite.bake_session('untouched', evaluation=None):
+            pass
+        with suite.bake_session('same mode', evaluation='parallel'):
+            pass
+
+        self.assertEqual(self.modes, [])
+        self.assertEqual(self.scene.settings['evaluation'], 'parallel')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,33 @@
 # transforms.py
 # Matt Riche 2021
 # Module for transform related tasks in sr_suite_utilities
+#
+# The maths works on whole clips at once with NumPy, like limb_solver.py: positions are (N, 3)
+# arrays and matrices (N, 4, 4) arrays in Maya's row-vector layout, so a matrix's rows are it's X,
+# Y and Z axes and the translation sits in the last row.  Angles are in degrees.
 
-import pymel.core as pm
-import pymel.core.datatypes as dt
 import math
+import backend
+import curves
+import diagnostics as diag
+import lazy
 
+pm = lazy.module('pymel.core')
+dt = lazy.module('pymel.core.datatypes')
+np = lazy.module('numpy')
+
+
+log = diag.get_logger('transforms')
+pm = diag.counted_module(pm)
+
+AXES = curves.AXES
+ROTATE_ORDERS = curves.ROTATE_ORDERS
+
+# Below this an aim and pole vector are treated as parallel.
+PARALLEL_TOLERANCE = 1e-6
+
+
+@diag.operation('aim_at')
 def aim_at(node, target=None, vec=None, pole_vec=(0,1,0), axis=0, pole=1):
     '''
     Aim's a node's axis at another point in space and a "pole axis" down a normalized vector.
@@ -15,123 +37,194 @@ def aim_at(node, target=None, vec=None, pole_vec=(0,1,0), axis=0, pole=1):
     target - PyNode of object to be aimed at (if vec == None)
     vec - dt.Vector of direction to aim in (if target == None)
     pole_vec - A dt.Vector that aims toward the "pole" of this aim constraint.
-    axis - the axis along which to aim down. (enumated x,y,z where x=0)
-    pole - the "pole" axis, which will aim at the vec (enumerated x,y,z where x=0)
+    axis - the axis along which to aim down, see aim_matrices().
+    pole - the "pole" axis, which will aim at the vec, see aim_matrices().
     '''
-    # FixcZ!
-
 
     # Check for bad args:
-    if(pole == axis):
+    if(_axis(pole)[0] == _axis(axis)[0]):
         pm.error("sr_biped error: Chosen pole and aim axis can't be identical.")
 
-    # Format some vectors into the dt.Vector type
-    pole_vec = dt.Vector(pole_vec)
-    node_pos = dt.Vector(pm.xform(node, q=True, ws=True, t=True))
+    scene = backend.get()
+    node_pos = scene.world_position(node)
 
     # Sort what we are aiming at:
     # If we got a target, use it.
-    if(target != None):
-        target_pos = dt.Vector(pm.xform(target, q=True, ws=True, t=True))
-        target_vec = target_pos - node_pos
-        target_vec.normalize()
-
-        if(vec != None):
+    if(target is not None):
+        target_pos = scene.world_position(target)
+        if(vec is not None):
             pm.warning("Both vec and node are populated.  Node will take precidence.")
+        vectors = None
 
     # If we got a vec, use that instead.
-    elif(vec != None):
-        target_vec = dt.Vector(vec).normal()
+    elif(vec is not None):
+        target_pos = None
+        vectors = [list(vec)]
 
     else:
         pm.error("sr_biped error: Either a vector or a target is required.")
         return
 
-    if(target_vec == pole_vec):
+    try:
+        aimed_matrix = aim_matrices(
+            [node_pos], targets=None if target_pos is None else [target_pos], vectors=vectors,
+            pole_vectors=[list(pole_vec)], axis=axis, pole=pole)[0]
+    except ValueError:
         pm.error("sr_biped error: Target vector and pole vector are identical-- result will be "
             "unsafe.")
+        return
 
-    print(target_vec)
-
-    # Step two, "unconstrained" vec; cross product of normalized vector and normalized pole vector 
-    # is found and stored.
-    last_vec = target_vec.cross(pole_vec)
-
-    # Step three, we "clean" the pole vector by getting the cross product of the aim and the 
-    # "unconstrained" axis vector.
-    clean_pole = target_vec.cross(last_vec)
-
-    # Before we proceed, we shuffle based on the incoming arguments.  Chosen axis to aim...
-    x_axis_vec = y_axis_vec = z_axis_vec = None
-
-    if(axis == 0):
-        x_axis_vec = target_vec
-    elif(axis == 1):
-        y_axis_vec = target_vec
-    elif(axis == 2):
-        z_axis_vec = target_vec
-
-    # And unconstrained.
-    if(pole == 0):
-        x_axis_vec = clean_pole
-    elif(pole == 1):
-        y_axis_vec = clean_pole
-    elif(pole == 2):
-        z_axis_vec = clean_pole
-
-    # TODO  We can pop from a dict to see what values remain instead of doing most of this... look 
-    # into it.  This helps us avoid eval and exec.
-    # Decide which axis gets the "last_vec" applied based on whether it still contains None
-    for last_axis in ['x_axis_vec', 'y_axis_vec', 'z_axis_vec']:
-        if(eval(last_axis + ' == None') == True):
-            exec('{} = last_vec'.format(last_axis))
-            break
-
-    # Turn the axis vectors into lists to slot into the Matrix:
-    m0 = list(x_axis_vec)
-    m1 = list(y_axis_vec)
-    m2 = list(z_axis_vec)
-
-    # Fabricate a bottom row for the scale of the Matrix.
-    m3 = [0, 0, 0, 1.0]
-
-    # Recompose transform data here so it lands inside the matrix correctly.
-    m0.append(node_pos[0])
-    m1.append(node_pos[1])
-    m2.append(node_pos[2])
-
-    # Step four, apply the values of each vector to the correct place in the matrix.
-    aimed_matrix = dt.Matrix(m0, m1, m2, m3)
-
-    # Save the current ws trans, then pop the matrix in, then re-establish worldspace trans because 
-    # it's untrusted from matrices when multi-scale parents are involved.
-    old_trans = pm.xform(node, q=True, ws=True, t=True)
-    pm.xform(node, m=aimed_matrix, ws=False)
-    pm.xform(node, t=old_trans, ws=True)
-
-    print(aimed_matrix.formated())
+    log.debug("Aimed matrix is:\n%s", aimed_matrix)
+
+    # Save the current ws trans, then pop the matrix in, then re-establish worldspace trans because
+    # it's untrusted from matrices when multi-scale parents are involved.  The matrix goes in with
+    # worldSpace=False, in object space, the same as aim_at() has always set it.
+    old_trans = scene.world_position(node)
+    pm.xform(node, matrix=[float(value) for value in aimed_matrix.flatten()], worldSpace=False)
+    scene.set_world_position(node, old_trans)
 
     return
 
 
-def euler_from_matrix(matrix):
+def aim_matrices(positions, targets=None, vectors=None, pole_vectors=(0, 1, 0), axis=0, pole=1):
     '''
-    Given a matrix, extract valid Euler angles from it.
+    Build an aim matrix per frame: the aim axis points at the target (or down the vector) and the
+    pole axis is turned as far towards the pole vector as the aim allows.  The third axis completes
+    a right handed, unscaled matrix.
+
+    positions - (N, 3) positions of the aimed node, which go in the translation row.
+    targets - (N, 3) points to aim at.  Used ahead of vectors if both are given.
+    vectors - (N, 3) directions to aim in.
+    pole_vectors - (3,) or (N, 3) directions for the pole axis.
+    axis - Aim axis, 0, 1 or 2 for x, y or z, or a string such as 'x' or '-y'.
+    pole - Pole axis, in the same form as axis.
+
+    Return value: (N, 4, 4) array.
     '''
 
-    sy = math.sqrt((matrix[0][0] * matrix[0][0]) + (matrix[1][0] * matrix[1][0]))
-
-    singular = sy < 1e-6
+    aim_index, aim_sign = _axis(axis)
+    pole_index, pole_sign = _axis(pole)
+    if(aim_index == pole_index):
+        raise ValueError("The aim and pole axis can't be the same axis.")
 
-    # WARNING-- the indices may need swapping!  Right now it's "row/colum"
-    if not singular:
-        x = math.atan2(matrix[2][1], matrix[2][2])
-        y = math.atan2(-matrix[2][0], sy)
-        z = math.atan2(matrix[1][0], matrix[0][0])
+    positions = np.atleast_2d(np.asarray(positions, dtype=float))
+    if(targets is not None):
+        aims = np.atleast_2d(np.asarray(targets, dtype=float)) - positions
+    elif(vectors is not None):
+        aims = np.atleast_2d(np.asarray(vectors, dtype=float))
     else:
-        x = math.atan2(-matrix[1][2], matrix[1][1])
-        y = math.atan2(-matrix[2,0], sy)
-        z = 0
+        raise ValueError("Either targets or vectors are needed to aim.")
+    count = max(len(positions), len(aims))
+    aims = _unit(np.broadcast_to(aims, (count, 3)))
+    poles = np.broadcast_to(np.atleast_2d(np.asarray(pole_vectors, dtype=float)), (count, 3))
+
+    # The pole vector, less any of it that runs along the aim.
+    perpendicular = poles - aims * np.sum(poles * aims, axis=1, keepdims=True)
+    lengths = np.linalg.norm(perpendicular, axis=1)
+    parallel = np.flatnonzero(lengths <= PARALLEL_TOLERANCE * np.linalg.norm(poles, axis=1))
+    if(len(parallel)):
+        raise ValueError("The aim and pole vector are parallel on frame(s) {}.".format(
+            ', '.join(str(frame) for frame in parallel[:10])))
+    perpendicular = perpendicular / lengths[:, np.newaxis]
+
+    rows = [None, None, None]
+    rows[aim_index] = aims * aim_sign
+    rows[pole_index] = perpendicular * pole_sign
+    third = 3 - aim_index - pole_index
+    # x cross y is z, y cross z is x and z cross x is y.
+    if((pole_index - aim_index) % 3 == 1):
+        rows[third] = np.cross(rows[aim_index], rows[pole_index])
+    else:
+        rows[third] = np.cross(rows[pole_index], rows[aim_index])
+
+    matrices = np.zeros((count, 4, 4))
+    for index in range(3):
+        matrices[:, index, :3] = rows[index]
+    matrices[:, 3, :3] = np.broadcast_to(positions, (count, 3))
+    matrices[:, 3, 3] = 1.0
+
+    return matrices
+
+
+def euler_from_matrices(matrices, rotate_order='XYZ', previous=None):
+    '''
+    Decompose rotations into Euler angles in any of Maya's rotate orders.  Scale is divided out
+    first.  Each frame takes the solution closest to the frame before, so a clip comes out without
+    flips, ready to key.
+
+    matrices - (N, 4, 4) or (N, 3, 3) array, or a single matrix.
+    rotate_order - One of ROTATE_ORDERS, or the value of a rotateOrder attribute.
+    previous - Angles of the frame before the first, to continue on from, or None.
+
+    Return value: (N, 3) array of angles in degrees, ordered x, y, z.
+    '''
+
+    if(not isinstance(rotate_order, str)):
+        rotate_order = ROTATE_ORDERS[int(rotate_order)]
+    first, second, third = [AXES.index(axis) for axis in rotate_order.upper()]
+
+    matrices = np.asarray(matrices, dtype=float)
+    rotations = matrices.reshape((-1,) + matrices.shape[-2:])[:, :3, :3]
+    rotations = rotations / np.linalg.norm(rotations, axis=2, keepdims=True)
+
+    # Maya's rotations act on row vectors; transposed, the order reads right to left as usual.
+    column = np.transpose(rotations, (0, 2, 1))
+    parity = 1.0 if (second - first) % 3 == 1 else -1.0
+
+    sin_second = np.clip(-parity * column[:, third, first], -1.0, 1.0)
+    angles = np.zeros((len(column), 3))
+    angles[:, second] = np.arcsin(sin_second)
+    angles[:, first] = np.arctan2(parity * column[:, third, second], column[:, third, third])
+    angles[:, third] = np.arctan2(parity * column[:, second, first], column[:, first, first])
+
+    # Gimbal lock: the first and third axes line up, so the third takes none of the rotation.
+    locked = np.sqrt(column[:, first, first] ** 2 + column[:, second, first] ** 2) < 1e-6
+    if(np.any(locked)):
+        angles[locked, first] = np.arctan2(
+            -parity * column[locked, second, third], column[locked, second, second])
+        angles[locked, third] = 0.0
+
+    angles = np.degrees(angles)
+    if(previous is None):
+        return curves.euler_filter(angles, rotate_order)
+
+    seeded = np.concatenate([np.asarray(previous, dtype=float).reshape(1, 3), angles])
+
+    return curves.euler_filter(seeded, rotate_order)[1:]
+
+
+def euler_from_matrix(matrix, rotate_order='XYZ'):
+    '''
+    Given a matrix, extract valid Euler angles from it.  matrix is a dt.Matrix or nested list in
+    Maya's row-vector layout.
+
+    Return value: dt.Vector of angles in radians.
+    '''
+
+    angles = euler_from_matrices([[list(row) for row in matrix]], rotate_order)[0]
+
+    return dt.Vector(*[math.radians(angle) for angle in angles])
+
+
+def _axis(value):
+    '''
+    Index and sign of an axis given as 0, 1, 2 or a string such as 'x' or '-z'.
+    '''
+
+    if(isinstance(value, str)):
+        sign = -1.0 if value.startswith('-') else 1.0
+        name = value.lstrip('+-').upper()
+        if(name not in AXES):
+            raise ValueError("'{}' isn't an axis, use x, y or z.".format(value))
+        return AXES.index(name), sign
+
+    if(value not in (0, 1, 2)):
+        raise ValueError("Axis {} isn't one of 0, 1 or 2.".format(value))
+
+    return int(value), 1.0
+
 
-    return dt.Vector(x, y, z)
+def _unit(vectors):
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
 
+    return vectors / np.where(lengths > 0.0, lengths, 1.0)
@@ -0,0 +1,268 @@
+'''
+verify.py
+Shaper Rigs / Burlington Interactive Solutions
+
+How closely a limb's fk and ik chains agree after a match or a bake.
+
+The *FK_drv and *IK_drv driver joints of every limb checked are read together, one read per frame
+of a range, and the position and orientation residual of each joint pair is worked out in one
+vectorized pass.
+A match is only as good as these residuals: ie with the pole vector in IK_Hand_Crl_space,
+ik_to_fk() is known not to be exact, and this says by how much.
+
+usage:
+residuals = verify.limb_residuals(side='L', limb='arm', frames=range(1, 121))
+residuals.max_position, residuals.max_rotation
+report = verify.verify_limbs('char01:', frame_range=(1, 121), strict=True)
+'''
+
+import bindings
+import backend
+import constants as cons
+import diagnostics as diag
+import fkik
+import lazy
+import limb_solver
+import sampling as smp
+import suite as su
+
+pm = lazy.module('pymel.core')
+np = lazy.module('numpy')
+
+
+log = diag.get_logger('verify')
+pm = diag.counted_module(pm)
+
+# Residuals past these fail a limb: scene units for positions, degrees for orientations.
+POSITION_TOLERANCE = 0.01
+ROTATION_TOLERANCE = 0.1
+
+
+class LimbResiduals(object):
+    '''
+    The fk to ik residuals of one limb over a range.
+
+    frames - the frames read.
+    keys - chain keys of the joints compared, ie ['shoulder', 'elbow', 'wrist'].
+    position - (N, J) distance between each fk joint and it's ik joint, per frame.
+    rotation - (N, J) angle between them in degrees, per frame.
+    '''
+
+    def __init__(self, side, limb, frames, keys, position, rotation):
+        self.side = side
+        self.limb = limb
+        self.frames = frames
+        self.keys = keys
+        self.position = position
+        self.rotation = rotation
+
+    def __repr__(self):
+        return "LimbResiduals('{}', '{}', {} frames, {:.4g}, {:.4g})".format(
+            self.side, self.limb, len(self.frames), self.max_position, self.max_rotation)
+
+    @property
+    def max_position(self):
+        return float(self.position.max()) if self.position.size else 0.0
+
+    @property
+    def max_rotation(self):
+        return float(self.rotation.max()) if self.rotation.size else 0.0
+
+    def frame_errors(self):
+        '''
+        The worst position and rotation residual of the limb on each frame.
+
+        Return value: tuple of (N,) arrays.
+        '''
+
+        if(not self.position.size):
+            return np.zeros(len(self.frames)), np.zeros(len(self.frames))
+
+        return self.position.max(axis=1), self.rotation.max(axis=1)
+
+    def failed(self, position_tolerance=POSITION_TOLERANCE, rotation_tolerance=ROTATION_TOLERANCE):
+        '''
+        Frames where any joint is further off than the tolerances.
+        '''
+
+        position, rotation = self.frame_errors()
+        mask = (position > position_tolerance) | (rotation > rotation_tolerance)
+
+        return [self.frames[index] for index in np.flatnonzero(mask)]
+
+    def summary(self, position_tolerance=POSITION_TOLERANCE,
+                rotation_tolerance=ROTATION_TOLERANCE):
+        '''
+        The limb's results as a dict that can be written out as JSON.
+        '''
+
+        position, rotation = self.frame_errors()
+        failed = self.failed(position_tolerance, rotation_tolerance)
+        worst = int(np.argmax(position)) if len(position) else None
+
+        return {
+            'max_position': self.max_position,
+            'max_rotation': self.max_rotation,
+            'worst_frame': self.frames[worst] if worst is not None else None,
+            'failed': failed,
+            'ok': not failed,
+        }
+
+
+def chain_names(side, limb, fk_bones_dict=None, ik_bones_dict=None, namespace=''):
+    '''
+    The fk and ik driver joints of a limb, paired up by chain key.
+
+    Return value: tuple of the keys, the fk joint names and the ik joint names.
+    '''
+
+    # Interally apply the constant due to the "mutable default args problem".
+    if(fk_bones_dict is None):
+        fk_bones_dict = cons.INTERNAL_DEF_FK_JNTS
+    if(ik_bones_dict is None):
+        ik_bones_dict = cons.INTERNAL_DEF_IK_JNTS
+
+    prefix = bindings.name_prefix(namespace, bindings.side_token(side))
+    keys = [key for key in fkik.FK_CHAIN_KEYS.get(limb, [])
+            if key in fk_bones_dict and key in ik_bones_dict]
+
+    return (keys, [prefix + fk_bones_dict[key] for key in keys],
+            [prefix + ik_bones_dict[key] for key in keys])
+
+
+def limb_residuals(side=None, limb=None, frames=None, fk_bones_dict=None, ik_bones_dict=None,
+                   namespace=''):
+    '''
+    Read a limb's fk and ik driver joints on every one of frames and compare them.
+
+    frames - frame numbers, or None for the current frame.
+
+    Return value: LimbResiduals.
+    '''
+
+    keys, fk_names, ik_names = chain_names(side, limb, fk_bones_dict, ik_bones_dict, namespace)
+    if(not keys):
+        raise ValueError("No fk and ik driver joints are known for limb '{}'.".format(limb))
+
+    times = [None] if frames is None else list(frames)
+    with diag.span('query'):
+        matrices = _world_matrices(fk_names + ik_names, times)
+
+    with diag.span('solve'):
+        return _residuals(side, limb, times, keys, matrices)
+
+
+@diag.operation('verify_limbs')
+def verify_limbs(namespace='', sides=('L', 'R'), limbs=('arm', 'leg'), frame_range=None,
+                 sampling=None, fk_bones_dict=None, ik_bones_dict=None,
+                 position_tolerance=POSITION_TOLERANCE, rotation_tolerance=ROTATION_TOLERANCE,
+                 strict=False):
+    '''
+    Check every limb of a character for fk / ik residuals over a range, ie after a bake.
+
+    usage:
+    verify_limbs('char01:', frame_range=(1, 121))
+    Use with a frame range selected, or give frame_range.
+
+    frame_range - (start, end), end one past the last frame.  If None, the time slider's selected
+        range is used.
+    sampling - Which frames to check, a sampling.Sampling.  Defaults to every frame.
+    position_tolerance, rotation_tolerance - See POSITION_TOLERANCE and ROTATION_TOLERANCE.
+    strict - Raise an error when any limb is out of tolerance, or any of sides and limbs wasn't
+        found, so an unattended run stops there rather than carrying on.
+
+    Return value: dict with 'ok', 'frames', 'limbs', a dict of 'L_arm' and so on to each limb's
+        LimbResiduals.summary(), and 'missing', the limbs asked for that weren't found.  'ok' is
+        False if nothing was checked or anything is missing.
+    '''
+
+    if(frame_range is None):
+        frame_range = su.frame_selection()
+        if(frame_range is False):
+            pm.error("Nothing was specified in the frame slider selection.")
+            return
+    if(sampling is None):
+        sampling = smp.every(1)
+    frames = sampling.resolve(frame_range)
+
+    report = {'ok': True, 'frames': len(frames), 'limbs': {}, 'missing': []}
+    if(not frames):
+        report['ok'] = False
+        if(strict):
+            pm.error("sr_biped error: The sampling gave no frames to check.")
+        pm.warning("The sampling gave no frames to check.")
+        return report
+
+    found = []
+    for limb in limbs:
+        for side in sides:
+            keys, fk_names, ik_names = chain_names(
+                side, limb, fk_bones_dict, ik_bones_dict, namespace)
+            if(not keys or not all(pm.objExists(name) for name in fk_names + ik_names)):
+                report['missing'].append('{}_{}'.format(side, limb))
+                continue
+            found.append((side, limb, keys, fk_names + ik_names))
+
+    if(found):
+        # Every limb's joints are read together, one read per frame.
+        names = [name for side, limb, keys, joints in found for name in joints]
+        with diag.span('query'):
+            matrices = _world_matrices(names, frames)
+        start = 0
+        for side, limb, keys, joints in found:
+            with diag.span('solve'):
+                residuals = _residuals(
+                    side, limb, frames, keys, matrices[:, start:start + len(joints)])
+            start += len(joints)
+            summary = residuals.summary(position_tolerance, rotation_tolerance)
+            report['limbs']['{}_{}'.format(side, limb)] = summary
+            report['ok'] = report['ok'] and summary['ok']
+
+    failed = sorted(name for name, summary in report['limbs'].items() if not summary['ok'])
+    diag.annotate(frames=len(frames), limbs=len(report['limbs']), failed=len(failed),
+                  missing=len(report['missing']))
+    if(not report['limbs'] or report['missing']):
+        report['ok'] = False
+        if(not report['limbs']):
+            message = "No limbs were checked in {}, none of {} were found.".format(
+                namespace or 'the scene', ', '.join(report['missing']) or 'them')
+        else:
+            message = "Some limbs weren't found in {}: {}.".format(
+                namespace or 'the scene', ', '.join(report['missing']))
+        if(strict):
+            pm.error("sr_biped error: " + message)
+        pm.warning(message)
+    if(failed):
+        message = "Fk / ik residuals out of tolerance on {}: {}.".format(
+            namespace or 'the scene', ', '.join(
+                '{} ({:.4g} units, {:.4g} degrees)'.format(
+                    name, report['limbs'][name]['max_position'],
+                    report['limbs'][name]['max_rotation']) for name in failed))
+        if(strict):
+            pm.error("sr_biped error: " + message)
+        pm.warning(message)
+
+    return report
+
+
+def _world_matrices(names, times):
+    # (T, len(names), 4, 4) world matrices, every name read in one go on each of times.
+    scene = backend.get()
+
+    return np.array([[_rows(matrix) for matrix in scene.world_matrices(names, time=time)]
+                     for time in times], dtype=float).reshape(len(times), len(names), 4, 4)
+
+
+def _residuals(side, limb, times, keys, matrices):
+    # matrices is (T, 2 * len(keys), 4, 4), the fk joints then the ik joints.
+    count = len(keys)
+    position, rotation = limb_solver.match_residuals(
+        matrices[:, :count].reshape(-1, 4, 4), matrices[:, count:].reshape(-1, 4, 4))
+
+    return LimbResiduals(
+        side, limb, times, keys, position.reshape(len(times), count),
+        rotation.reshape(len(times), count))
+
+
+def _rows(matrix):
+    return [list(row) for row in matrix]